@@ -1,16 +1,22 @@
 
 from flask import Flask, g, request, send_from_directory, session, redirect, url_for, render_template
 from db import get_db, close_db, init_db
+from db_lock import WriteLockTimeout
+from db_writer import WriterBusyError
+from core.responses import error_response
 from sockets import socketio, init_sockets
 from mutations.message_mutations import send_message, edit_message, delete_message
 from mutations.file_mutations import upload_file
 from queries.backfill import backfill_messages
 from queries.unread import unread_count
+import importlib
 import secrets
 import os
 from core import __version__
+from core.startup import LazyBlueprint, StartupTimer
 
 def create_app(test_config=None):
+    timer = StartupTimer()
     app = Flask(__name__)
     
     # Inject version into all templates
@@ -51,6 +57,11 @@ def create_app(test_config=None):
 
     if test_config:
         app.config.from_mapping(test_config)
+    if app.config.get("TESTING"):
+        from config import TESTING_OVERRIDES
+        for key, value in TESTING_OVERRIDES.items():
+            if key not in (test_config or {}):
+                app.config[key] = value
 
     # Security Hardening (Sprint 18)
     from core.security import init_security
@@ -59,12 +70,14 @@ def create_app(test_config=None):
     # Structured Logging (Sprint 27)
     from core.logs import configure_logging
     configure_logging(app)
+    timer.mark('config')
 
     from auth import auth_bp, login_required
     app.register_blueprint(auth_bp)
     
     from routes.profiles import bp as profiles_bp
     app.register_blueprint(profiles_bp)
+    timer.mark('blueprints')
 
     @app.before_request
     def load_user():
@@ -92,6 +105,7 @@ def create_app(test_config=None):
     # Initialize database on app creation
     with app.app_context():
         init_db()
+    timer.mark('database')
 
     @app.teardown_appcontext
     def teardown(e=None):
@@ -133,18 +147,19 @@ def create_app(test_config=None):
     from routes.search import bp as search_bp
     app.register_blueprint(search_bp)
 
-    from routes.admin import bp as admin_bp
-    app.register_blueprint(admin_bp)
-
-    from routes.cats import cats_bp
-    app.register_blueprint(cats_bp)
-
-    from routes.song import bp as song_bp
-    app.register_blueprint(song_bp)
-
     from routes.files import bp as files_bp
     app.register_blueprint(files_bp)
 
+    # Rarely hit: imported on the first request under their prefix
+    deferred = [('routes.admin:bp', '/admin'), ('routes.cats:cats_bp', '/cats'), ('routes.song:bp', '/song')]
+    for import_name, url_prefix in deferred:
+        if app.config.get('LAZY_BLUEPRINTS', True):
+            LazyBlueprint(import_name, url_prefix).register(app)
+        else:
+            module_name, attr = import_name.split(':')
+            app.register_blueprint(getattr(importlib.import_module(module_name), attr))
+    timer.mark('blueprints')
+
     # =============================================
     # ERROR HANDLERS (Cat Error Pages)
     # =============================================
@@ -160,6 +175,12 @@ def create_app(test_config=None):
     def forbidden(e):
         return render_template('errors/403.html'), 403
 
+    @app.errorhandler(WriteLockTimeout)
+    @app.errorhandler(WriterBusyError)
+    def database_busy(e):
+        # A service write missed its write-lock or group-commit deadline; the client may retry
+        return error_response("Database busy, please retry", 503)
+
     @app.after_request
     def add_header(response):
         if request.path.startswith('/static/'):
@@ -170,7 +191,12 @@ def create_app(test_config=None):
             if request.path.startswith('/static/avatars/') or request.path.startswith('/static/uploads/'):
                 response.cache_control.max_age = 31536000
                 response.cache_control.public = True
-                
+
+        # Reads served from the read-only snapshot report how old it was
+        staleness = g.get('snapshot_staleness')
+        if staleness is not None:
+            response.headers['X-Data-Staleness'] = f"{staleness:.3f}"
+
         return response
 
     @app.route('/favicon.ico')
@@ -187,19 +213,332 @@ def create_app(test_config=None):
         if request.path != '/metrics':
             metrics_state['requests'] += 1
 
+    @app.teardown_request
+    def track_query_count(e=None):
+        # Runs for HTTP requests and Socket.IO events alike; the leased
+        # connection counts the statements issued while it was held
+        leased = [conn for conn in (g.get('db'), g.get('snapshot_db')) if conn is not None]
+        if not leased:
+            return
+        from core.telemetry import registry
+        event = getattr(request, 'event', None)
+        if event:
+            scope = f"socket:{event.get('message')}"
+        else:
+            scope = f"http:{request.endpoint or 'unknown'}"
+        registry.record_scope(scope, sum(conn.queries for conn in leased))
+
     @app.route('/metrics')
     def metrics():
-        # Simple request counter only
+        from db import get_pool
+        from db_writer import writer_stats
+        from db_writebehind import write_behind_stats
+        from db_snapshot import snapshot_stats
+        from db_archive import archiver_stats
+        from db_lock import write_lock_stats
+        from db_checkpoint import checkpointer_stats
+        from db_analyze import analyzer_stats
+        from db_recent import recent_stats
+        from socket_bus import bus_stats
+        from core.rate_limit import rate_limit_stats
+        from user_status import user_status_stats
+        from room_registry import room_registry_stats
+        from utils.sanitize import sanitize_stats
+        from services.message_service import message_pipeline_stats
+        from idempotency import idempotency_stats
+        from core.telemetry import registry
+        startup = app.extensions['startup_timing']
+        startup_phases = ''.join(
+            f'neospace_startup_phase_seconds{{phase="{name}"}} {seconds:.6f}\n'
+            for name, seconds in startup['phases'].items()
+        )
+        pool = get_pool().stats()
+        writer = writer_stats() or {'batches': 0, 'operations': 0, 'queue_depth': 0, 'rejected': 0}
+        behind = write_behind_stats() or {'pending': 0, 'applied': 0, 'dropped': 0}
+        snapshot = snapshot_stats() or {'refreshes': 0, 'leases': 0, 'fallbacks': 0, 'staleness_seconds': None}
+        archive = archiver_stats() or {
+            'runs': 0, 'archived_deleted': 0, 'archived_expired': 0, 'pages_reclaimed': 0,
+            'freelist_pages': 0, 'rows_per_second': 0.0,
+        }
+        recent = recent_stats() or {'hits': 0, 'misses': 0, 'seeds': 0, 'cached': 0}
+        analyzer = analyzer_stats() or {'runs': 0, 'tables_analyzed': 0, 'plan_changes': 0}
+        lock = write_lock_stats()
+        lock_metrics = ''
+        if lock:
+            for name, help_text in (('wait', 'Time spent waiting for the database write lock'),
+                                    ('hold', 'Time the database write lock was held')):
+                hist = lock[f'{name}_seconds']
+                lock_metrics += f'# HELP neospace_db_write_lock_{name}_seconds {help_text}\n'
+                lock_metrics += f'# TYPE neospace_db_write_lock_{name}_seconds histogram\n'
+                for le, count in hist['buckets']:
+                    label = '+Inf' if le == float('inf') else f'{le:g}'
+                    lock_metrics += f'neospace_db_write_lock_{name}_seconds_bucket{{le="{label}"}} {count}\n'
+                lock_metrics += f'neospace_db_write_lock_{name}_seconds_sum {hist["sum"]:.6f}\n'
+                lock_metrics += f'neospace_db_write_lock_{name}_seconds_count {hist["count"]}\n'
+        lock_timeouts = lock['timeouts'] if lock else 0
+        checkpointer = checkpointer_stats()
+        checkpoint_metrics = ''
+        if checkpointer:
+            hist = checkpointer['duration_seconds']
+            checkpoint_metrics += '# HELP neospace_db_wal_bytes Size of the -wal file\n'
+            checkpoint_metrics += '# TYPE neospace_db_wal_bytes gauge\n'
+            checkpoint_metrics += f"neospace_db_wal_bytes {checkpointer['wal_bytes']}\n"
+            checkpoint_metrics += '# HELP neospace_db_wal_checkpoint_leader Whether this worker is the host checkpointer\n'
+            checkpoint_metrics += '# TYPE neospace_db_wal_checkpoint_leader gauge\n'
+            checkpoint_metrics += f"neospace_db_wal_checkpoint_leader {int(checkpointer['leader'])}\n"
+            checkpoint_metrics += '# HELP neospace_db_wal_frames_not_checkpointed WAL frames the last checkpoint could not copy back\n'
+            checkpoint_metrics += '# TYPE neospace_db_wal_frames_not_checkpointed gauge\n'
+            checkpoint_metrics += f"neospace_db_wal_frames_not_checkpointed {checkpointer['frames_behind']}\n"
+            checkpoint_metrics += '# HELP neospace_db_wal_checkpoints_total Checkpoints run by mode\n'
+            checkpoint_metrics += '# TYPE neospace_db_wal_checkpoints_total counter\n'
+            for mode, count in checkpointer['checkpoints'].items():
+                checkpoint_metrics += f'neospace_db_wal_checkpoints_total{{mode="{mode.lower()}"}} {count}\n'
+            checkpoint_metrics += '# HELP neospace_db_wal_checkpoint_seconds Checkpoint duration\n'
+            checkpoint_metrics += '# TYPE neospace_db_wal_checkpoint_seconds histogram\n'
+            for le, count in hist['buckets']:
+                label = '+Inf' if le == float('inf') else f'{le:g}'
+                checkpoint_metrics += f'neospace_db_wal_checkpoint_seconds_bucket{{le="{label}"}} {count}\n'
+            checkpoint_metrics += f'neospace_db_wal_checkpoint_seconds_sum {hist["sum"]:.6f}\n'
+            checkpoint_metrics += f'neospace_db_wal_checkpoint_seconds_count {hist["count"]}\n'
+        from sockets import coalescer, presence, typing_tracker
+        frames = coalescer.stats() if coalescer else {'frames': 0, 'messages': 0, 'largest_frame': 0}
+        typing = typing_tracker.stats()
+        online = presence.stats()
+        statuses = user_status_stats() or {'hits': 0, 'misses': 0, 'invalidations': 0, 'entries': 0}
+        sanitized = sanitize_stats()
+        pipeline = message_pipeline_stats()
+        keys = idempotency_stats() or {'claims': 0, 'replays': 0, 'in_progress': 0, 'entries': 0}
+        pipeline_metrics = ''.join(
+            f'neospace_message_pipeline_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}\n'
+            f'neospace_message_pipeline_stage_seconds_count{{stage="{stage}"}} {pipeline["runs"][stage]}\n'
+            for stage, seconds in pipeline['seconds'].items()
+        )
+        rooms = room_registry_stats() or {'hits': 0, 'misses': 0, 'loads': 0, 'rooms': 0}
+        limits = rate_limit_stats() or {'rejections': {}, 'live_keys': 0, 'evictions': 0}
+        rejections = ''.join(
+            f'neospace_rate_limit_rejections_total{{action="{action}"}} {count}\n'
+            for action, count in sorted(limits['rejections'].items())
+        )
+        bus = bus_stats()
+        bus_metrics = ''
+        if bus:
+            bus_metrics += '# HELP neospace_socket_bus_messages_total Cross-worker bus messages by direction\n'
+            bus_metrics += '# TYPE neospace_socket_bus_messages_total counter\n'
+            bus_metrics += f'neospace_socket_bus_messages_total{{direction="published"}} {bus["published"]}\n'
+            bus_metrics += f'neospace_socket_bus_messages_total{{direction="received"}} {bus["received"]}\n'
+            bus_metrics += '# HELP neospace_socket_bus_dropped_total Messages not published because the bus was unreachable\n'
+            bus_metrics += '# TYPE neospace_socket_bus_dropped_total counter\n'
+            bus_metrics += f'neospace_socket_bus_dropped_total {bus["dropped"]}\n'
+            bus_metrics += '# HELP neospace_socket_bus_reconnects_total Times the bus subscription was re-established\n'
+            bus_metrics += '# TYPE neospace_socket_bus_reconnects_total counter\n'
+            bus_metrics += f'neospace_socket_bus_reconnects_total {bus["reconnects"]}\n'
+            bus_metrics += '# HELP neospace_socket_bus_broker Whether this worker serves the built-in broker\n'
+            bus_metrics += '# TYPE neospace_socket_bus_broker gauge\n'
+            bus_metrics += f'neospace_socket_bus_broker {int(bus["broker"])}\n'
+            bus_metrics += '# HELP neospace_socket_bus_peers Other workers heard from on the bus\n'
+            bus_metrics += '# TYPE neospace_socket_bus_peers gauge\n'
+            bus_metrics += f'neospace_socket_bus_peers {bus["peers"]}\n'
+            bus_metrics += '# HELP neospace_socket_bus_peer_sockets Authenticated sockets held by other workers\n'
+            bus_metrics += '# TYPE neospace_socket_bus_peer_sockets gauge\n'
+            bus_metrics += f'neospace_socket_bus_peer_sockets {bus["peer_sockets"]}\n'
+        queries = registry.snapshot(limit=25)['queries']
+        query_count = ''.join(f'neospace_db_query_total{{query="{q["id"]}"}} {q["count"]}\n' for q in queries)
+        query_time = ''.join(f'neospace_db_query_seconds_total{{query="{q["id"]}"}} {q["total_ms"] / 1000:.6f}\n' for q in queries)
+        query_p95 = ''.join(f'neospace_db_query_p95_seconds{{query="{q["id"]}"}} {q["p95_ms"] / 1000:.6f}\n' for q in queries)
         return f'''# HELP neospace_requests_total Total number of HTTP requests
 # TYPE neospace_requests_total counter
 neospace_requests_total {metrics_state['requests']}
 # HELP neospace_info Application info
 # TYPE neospace_info gauge
 neospace_info{{version="{__version__}"}} 1
-''', 200, {'Content-Type': 'text/plain; version=0.0.4'}
-
+# HELP neospace_startup_seconds Time this worker spent in create_app
+# TYPE neospace_startup_seconds gauge
+neospace_startup_seconds {startup['total']:.6f}
+# HELP neospace_startup_phase_seconds create_app time by phase
+# TYPE neospace_startup_phase_seconds gauge
+{startup_phases}# HELP neospace_db_pool_connections Database pool connections by state
+# TYPE neospace_db_pool_connections gauge
+neospace_db_pool_connections{{state="idle"}} {pool['idle']}
+neospace_db_pool_connections{{state="in_use"}} {pool['in_use']}
+neospace_db_pool_connections{{state="overflow"}} {pool['overflow_in_use']}
+# HELP neospace_db_pool_leases_total Connections leased from the pool
+# TYPE neospace_db_pool_leases_total counter
+neospace_db_pool_leases_total {pool['leases']}
+# HELP neospace_db_pool_waits_total Leases that had to wait for a free connection
+# TYPE neospace_db_pool_waits_total counter
+neospace_db_pool_waits_total {pool['waits']}
+# HELP neospace_db_pool_wait_seconds_total Time spent waiting for a free connection
+# TYPE neospace_db_pool_wait_seconds_total counter
+neospace_db_pool_wait_seconds_total {pool['wait_seconds']:.6f}
+# HELP neospace_db_pool_rejected_total Leases rejected after overflow was exhausted
+# TYPE neospace_db_pool_rejected_total counter
+neospace_db_pool_rejected_total {pool['rejected']}
+# HELP neospace_db_pool_recycled_total Connections closed for age or failed health checks
+# TYPE neospace_db_pool_recycled_total counter
+neospace_db_pool_recycled_total {pool['recycled'] + pool['health_failures']}
+# HELP neospace_db_write_batches_total Group-commit transactions
+# TYPE neospace_db_write_batches_total counter
+neospace_db_write_batches_total {writer['batches']}
+# HELP neospace_db_write_operations_total Write operations applied through the writer
+# TYPE neospace_db_write_operations_total counter
+neospace_db_write_operations_total {writer['operations']}
+# HELP neospace_db_write_queue_depth Write operations waiting for the writer
+# TYPE neospace_db_write_queue_depth gauge
+neospace_db_write_queue_depth {writer['queue_depth']}
+# HELP neospace_db_write_rejected_total Writes rejected because the queue was full
+# TYPE neospace_db_write_rejected_total counter
+neospace_db_write_rejected_total {writer['rejected']}
+# HELP neospace_db_write_behind_pending Side-effect writes spooled but not yet applied
+# TYPE neospace_db_write_behind_pending gauge
+neospace_db_write_behind_pending {behind['pending']}
+# HELP neospace_db_write_behind_applied_total Side-effect writes applied by the flusher
+# TYPE neospace_db_write_behind_applied_total counter
+neospace_db_write_behind_applied_total {behind['applied']}
+# HELP neospace_db_write_behind_dropped_total Side-effect writes dropped after a constraint error
+# TYPE neospace_db_write_behind_dropped_total counter
+neospace_db_write_behind_dropped_total {behind['dropped']}
+# HELP neospace_db_snapshot_staleness_seconds Age of the read-only snapshot (-1 when there is none)
+# TYPE neospace_db_snapshot_staleness_seconds gauge
+neospace_db_snapshot_staleness_seconds {-1 if snapshot['staleness_seconds'] is None else round(snapshot['staleness_seconds'], 3)}
+# HELP neospace_db_snapshot_refreshes_total Snapshot copies taken
+# TYPE neospace_db_snapshot_refreshes_total counter
+neospace_db_snapshot_refreshes_total {snapshot['refreshes']}
+# HELP neospace_db_snapshot_leases_total Heavy reads served from the snapshot
+# TYPE neospace_db_snapshot_leases_total counter
+neospace_db_snapshot_leases_total {snapshot['leases']}
+# HELP neospace_db_snapshot_fallbacks_total Heavy reads sent to the primary because no fresh snapshot was available
+# TYPE neospace_db_snapshot_fallbacks_total counter
+neospace_db_snapshot_fallbacks_total {snapshot['fallbacks']}
+# HELP neospace_db_write_lock_timeouts_total Writers that gave up on the write lock (answered 503)
+# TYPE neospace_db_write_lock_timeouts_total counter
+neospace_db_write_lock_timeouts_total {lock_timeouts}
+{lock_metrics}{checkpoint_metrics}{bus_metrics}# HELP neospace_rate_limit_rejections_total Requests and socket events refused by the rate limiter, per action
+# TYPE neospace_rate_limit_rejections_total counter
+{rejections}# HELP neospace_rate_limit_keys Keys holding rate-limit state at the last sweep
+# TYPE neospace_rate_limit_keys gauge
+neospace_rate_limit_keys {limits['live_keys']}
+# HELP neospace_rate_limit_evictions_total Active keys dropped because their bucket was full
+# TYPE neospace_rate_limit_evictions_total counter
+neospace_rate_limit_evictions_total {limits['evictions']}
+# HELP neospace_socket_message_frames_total Batched "messages" frames sent to rooms
+# TYPE neospace_socket_message_frames_total counter
+neospace_socket_message_frames_total {frames['frames']}
+# HELP neospace_socket_framed_messages_total Chat messages delivered inside frames
+# TYPE neospace_socket_framed_messages_total counter
+neospace_socket_framed_messages_total {frames['messages']}
+# HELP neospace_socket_largest_frame_messages Most messages coalesced into one frame
+# TYPE neospace_socket_largest_frame_messages gauge
+neospace_socket_largest_frame_messages {frames['largest_frame']}
+# HELP neospace_socket_typing_updates_total typing/stop_typing events recorded
+# TYPE neospace_socket_typing_updates_total counter
+neospace_socket_typing_updates_total {typing['updates']}
+# HELP neospace_socket_typing_states_total typing_state diffs emitted to rooms
+# TYPE neospace_socket_typing_states_total counter
+neospace_socket_typing_states_total {typing['emits']}
+# HELP neospace_presence_users Users online (showing their status) across workers
+# TYPE neospace_presence_users gauge
+neospace_presence_users {online['users']}
+# HELP neospace_presence_sockets Authenticated sockets across workers
+# TYPE neospace_presence_sockets gauge
+neospace_presence_sockets {online['sockets']}
+# HELP neospace_presence_diffs_total presence_diff events pushed to subscribers
+# TYPE neospace_presence_diffs_total counter
+neospace_presence_diffs_total {online['diffs']}
+# HELP neospace_presence_snapshots_total Presence snapshots built (one per version requested)
+# TYPE neospace_presence_snapshots_total counter
+neospace_presence_snapshots_total {online['snapshots']}
+# HELP neospace_user_status_lookups_total Socket auth checks by cache result
+# TYPE neospace_user_status_lookups_total counter
+neospace_user_status_lookups_total{{result="hit"}} {statuses['hits']}
+neospace_user_status_lookups_total{{result="miss"}} {statuses['misses']}
+# HELP neospace_user_status_invalidations_total Ban, unban, delete and visibility invalidations received
+# TYPE neospace_user_status_invalidations_total counter
+neospace_user_status_invalidations_total {statuses['invalidations']}
+# HELP neospace_user_status_entries Users in the socket auth cache
+# TYPE neospace_user_status_entries gauge
+neospace_user_status_entries {statuses['entries']}
+# HELP neospace_room_registry_lookups_total Room name lookups by registry result
+# TYPE neospace_room_registry_lookups_total counter
+neospace_room_registry_lookups_total{{result="hit"}} {rooms['hits']}
+neospace_room_registry_lookups_total{{result="miss"}} {rooms['misses']}
+# HELP neospace_room_registry_loads_total Full loads of the rooms table
+# TYPE neospace_room_registry_loads_total counter
+neospace_room_registry_loads_total {rooms['loads']}
+# HELP neospace_room_registry_rooms Rooms in the registry
+# TYPE neospace_room_registry_rooms gauge
+neospace_room_registry_rooms {rooms['rooms']}
+# HELP neospace_sanitize_calls_total HTML sanitizer calls by how they were served
+# TYPE neospace_sanitize_calls_total counter
+neospace_sanitize_calls_total{{path="fast"}} {sanitized['fast_path']}
+neospace_sanitize_calls_total{{path="memo"}} {sanitized['memo_hits']}
+neospace_sanitize_calls_total{{path="parsed"}} {sanitized['parsed']}
+# HELP neospace_messages_total Chat messages through the ingest pipeline by outcome
+# TYPE neospace_messages_total counter
+neospace_messages_total{{outcome="accepted"}} {pipeline['accepted']}
+neospace_messages_total{{outcome="replayed"}} {pipeline['replayed']}
+neospace_messages_total{{outcome="invalid"}} {pipeline['rejected']['invalid']}
+neospace_messages_total{{outcome="busy"}} {pipeline['rejected']['busy']}
+neospace_messages_total{{outcome="in_progress"}} {pipeline['rejected']['in_progress']}
+neospace_messages_total{{outcome="error"}} {pipeline['rejected']['error']}
+# HELP neospace_message_pipeline_stage_seconds Time spent in each message pipeline stage
+# TYPE neospace_message_pipeline_stage_seconds summary
+{pipeline_metrics}# HELP neospace_idempotency_requests_total Keyed creates by result (replayed: a retry got the stored result)
+# TYPE neospace_idempotency_requests_total counter
+neospace_idempotency_requests_total{{result="claimed"}} {keys['claims']}
+neospace_idempotency_requests_total{{result="replayed"}} {keys['replays']}
+neospace_idempotency_requests_total{{result="in_progress"}} {keys['in_progress']}
+# HELP neospace_idempotency_entries Finished keyed results cached in memory
+# TYPE neospace_idempotency_entries gauge
+neospace_idempotency_entries {keys['entries']}
+# HELP neospace_db_archive_runs_total Archiver passes completed
+# TYPE neospace_db_archive_runs_total counter
+neospace_db_archive_runs_total {archive['runs']}
+# HELP neospace_db_archive_rows_total Messages moved into messages_archive
+# TYPE neospace_db_archive_rows_total counter
+neospace_db_archive_rows_total{{reason="deleted"}} {archive['archived_deleted']}
+neospace_db_archive_rows_total{{reason="expired"}} {archive['archived_expired']}
+# HELP neospace_db_archive_rows_per_second Archiver throughput during its last pass
+# TYPE neospace_db_archive_rows_per_second gauge
+neospace_db_archive_rows_per_second {archive['rows_per_second']:.1f}
+# HELP neospace_db_archive_pages_reclaimed_total Pages returned to the filesystem by incremental_vacuum
+# TYPE neospace_db_archive_pages_reclaimed_total counter
+neospace_db_archive_pages_reclaimed_total {archive['pages_reclaimed']}
+# HELP neospace_db_freelist_pages Free pages left in the database file after the last archiver pass
+# TYPE neospace_db_freelist_pages gauge
+neospace_db_freelist_pages {archive['freelist_pages']}
+# HELP neospace_backfill_pages_total Socket backfill pages by source
+# TYPE neospace_backfill_pages_total counter
+neospace_backfill_pages_total{{source="ring"}} {recent['hits']}
+neospace_backfill_pages_total{{source="database"}} {recent['misses']}
+# HELP neospace_backfill_ring_seeds_total Room rings loaded from the database
+# TYPE neospace_backfill_ring_seeds_total counter
+neospace_backfill_ring_seeds_total {recent['seeds']}
+# HELP neospace_backfill_ring_messages Messages held in the per-room rings
+# TYPE neospace_backfill_ring_messages gauge
+neospace_backfill_ring_messages {recent['cached']}
+# HELP neospace_db_analyze_runs_total Planner statistics drift checks
+# TYPE neospace_db_analyze_runs_total counter
+neospace_db_analyze_runs_total {analyzer['runs']}
+# HELP neospace_db_analyze_tables_total Tables re-analyzed after their row counts drifted
+# TYPE neospace_db_analyze_tables_total counter
+neospace_db_analyze_tables_total {analyzer['tables_analyzed']}
+# HELP neospace_db_query_plan_changes_total Hot-query plans that changed after an ANALYZE
+# TYPE neospace_db_query_plan_changes_total counter
+neospace_db_query_plan_changes_total {analyzer['plan_changes']}
+# HELP neospace_db_query_total Executions per statement fingerprint (top 25 by time; see /admin/queries)
+# TYPE neospace_db_query_total counter
+{query_count}# HELP neospace_db_query_seconds_total Time spent per statement fingerprint
+# TYPE neospace_db_query_seconds_total counter
+{query_time}# HELP neospace_db_query_p95_seconds 95th percentile latency per statement fingerprint
+# TYPE neospace_db_query_p95_seconds gauge
+{query_p95}''', 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+    timer.mark('routes')
 
     init_sockets(app)
+    timer.mark('sockets')
+    app.extensions['startup_timing'] = timer.finish()
     return app
 
 # Reload trigger 2026-01-10
@@ -38,10 +38,13 @@ def register():
         hash_val = ord(char) + ((hash_val << 5) - hash_val)
     color_class = f"user-color-{abs(hash_val) % 8}"
 
+    # Hash outside the write lock; it's deliberately slow
+    password_hash = generate_password_hash(password)
+
     def do_register():
         db.execute(
             "INSERT INTO users (username, password_hash, avatar_color) VALUES (?, ?, ?)",
-            (username, generate_password_hash(password), color_class),
+            (username, password_hash, color_class),
         )
         db.commit()
 
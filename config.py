@@ -6,6 +6,51 @@ class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev_secret_key_DO_NOT_USE_IN_PROD")
     FLASK_ENV = os.environ.get("FLASK_ENV", "development")
     DATABASE = os.environ.get("DATABASE", "neospace.db")
+
+    # Connection pool (per worker process)
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 16))
+    DB_POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 8))
+    DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 3600))
+
+    # Group commit writer (single write connection per worker process)
+    DB_GROUP_COMMIT = os.environ.get("DB_GROUP_COMMIT", "1") == "1"
+    DB_WRITE_BATCH_WINDOW_MS = float(os.environ.get("DB_WRITE_BATCH_WINDOW_MS", 2))
+    DB_WRITE_QUEUE_SIZE = int(os.environ.get("DB_WRITE_QUEUE_SIZE", 10000))
+
+    # Write lock: how long a writer may wait before failing with a 503
+    DB_WRITE_LOCK_TIMEOUT_MS = float(os.environ.get("DB_WRITE_LOCK_TIMEOUT_MS", 2000))
+
+    # Write-behind for side-effect writes (audit log, cat memories, notifications)
+    WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "1") == "1"
+    WRITE_BEHIND_MAX_LAG_MS = float(os.environ.get("WRITE_BEHIND_MAX_LAG_MS", 250))
+
+    # Read-only snapshot for @read_only_heavy reads (admin, search, backfill)
+    DB_SNAPSHOT_ENABLED = os.environ.get("DB_SNAPSHOT_ENABLED", "0") == "1"
+    DB_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get("DB_SNAPSHOT_REFRESH_SECONDS", 5))
+    DB_SNAPSHOT_MAX_STALENESS_SECONDS = float(os.environ.get("DB_SNAPSHOT_MAX_STALENESS_SECONDS", 30))
+
+    # Message partitions: months kept in the main database before rolling
+    MESSAGE_HOT_MONTHS = int(os.environ.get("MESSAGE_HOT_MONTHS", 2))
+
+    # Message archiver: default per-room retention in the hot table
+    ARCHIVE_ENABLED = os.environ.get("ARCHIVE_ENABLED", "1") == "1"
+    ARCHIVE_RETENTION_DAYS = int(os.environ.get("ARCHIVE_RETENTION_DAYS", 30))
+    ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("ARCHIVE_INTERVAL_SECONDS", 300))
+
+    # WAL checkpoints: one elected process per host checkpoints in the background
+    # (request connections run with wal_autocheckpoint=0 while enabled)
+    DB_CHECKPOINT_ENABLED = os.environ.get("DB_CHECKPOINT_ENABLED", "1") == "1"
+    DB_CHECKPOINT_INTERVAL_SECONDS = float(os.environ.get("DB_CHECKPOINT_INTERVAL_SECONDS", 1))
+    DB_WAL_RESTART_MB = float(os.environ.get("DB_WAL_RESTART_MB", 64))
+    DB_WAL_TRUNCATE_MB = float(os.environ.get("DB_WAL_TRUNCATE_MB", 256))
+
+    # Planner statistics: targeted ANALYZE when table row counts drift
+    DB_ANALYZE_ENABLED = os.environ.get("DB_ANALYZE_ENABLED", "1") == "1"
+    DB_ANALYZE_INTERVAL_SECONDS = float(os.environ.get("DB_ANALYZE_INTERVAL_SECONDS", 3600))
+    DB_ANALYZE_DRIFT = float(os.environ.get("DB_ANALYZE_DRIFT", 0.2))
+
+    # Startup: import admin/song/cats blueprints on their first request
+    LAZY_BLUEPRINTS = os.environ.get("LAZY_BLUEPRINTS", "1") == "1"
     
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
@@ -19,8 +64,20 @@ class Config:
         "http://localhost:5000,http://127.0.0.1:5000"
     ).split(",")
     
+    # Rate limiting (core/rate_limit.py): GCRA in a table shared by every worker
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "gcra")
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", None)  # Default: neospace://<table>
+    RATELIMIT_TABLE_PATH = os.environ.get("RATELIMIT_TABLE_PATH", None)  # Default: <DATABASE>.ratelimit
+
     # SocketIO
     SOCKETIO_ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE", None)
+    # Cross-worker bus: unix (built-in broker), redis://host:port, local, off
+    SOCKETIO_BUS = os.environ.get("SOCKETIO_BUS", "unix")
+    SOCKETIO_BUS_PATH = os.environ.get("SOCKETIO_BUS_PATH", None)  # Default: <DATABASE>.bus.sock
+    # Window for batched "messages" frames (clients opt in on join_room); 0 disables
+    SOCKETIO_COALESCE_MS = int(os.environ.get("SOCKETIO_COALESCE_MS", 25))
+    # Interval between typing_state diffs (250 = 4 Hz)
+    SOCKETIO_TYPING_TICK_MS = int(os.environ.get("SOCKETIO_TYPING_TICK_MS", 250))
 
     # Storage
     STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
@@ -62,6 +119,15 @@ class ProductionConfig(Config):
         'temp_store': 'MEMORY'
     }
 
+# Under TESTING these stay off unless the test's own config turns them on:
+# each would leave a thread, socket or file next to DATABASE that outlives
+# the test (WAL checkpointer, bus broker, shared rate-limit table)
+TESTING_OVERRIDES = {
+    "DB_CHECKPOINT_ENABLED": False,
+    "SOCKETIO_BUS": "off",
+    "RATELIMIT_STORAGE_URI": "neospace://",  # Process-local table
+}
+
 # Config selector
 config = {
     "development": DevelopmentConfig,
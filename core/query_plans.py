@@ -0,0 +1,473 @@
+"""
+Query Plan Checks.
+Collects the SQL statements in the codebase, runs EXPLAIN QUERY PLAN on
+them and flags full table scans and temp B-tree sorts, with a suggested
+index for each finding.
+
+Plans are taken against an empty copy of the schema carrying
+representative sqlite_stat1 statistics (TABLE_ROWS, COLUMN_DISTINCT),
+so the planner weighs indexes the way it does on an analyzed
+production database; scripts/explain_queries.py --db plans against a
+real one instead.
+
+Findings that are understood and deliberately left alone are listed in
+ACCEPTED_FINDINGS, keyed by the statement's telemetry fingerprint id, so
+editing one of those queries puts it back under review.
+
+Usage:
+    from core.query_plans import build_database, collect_statements, check_statements
+    conn = build_database()
+    findings, errors = check_statements(conn, collect_statements())
+"""
+import ast
+import os
+import re
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from core.telemetry import fingerprint, fingerprint_id
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Where the request-path SQL lives
+DEFAULT_SOURCES = ("queries", "services", "sockets.py", "db_partitions.py", "db_archive.py")
+
+_SQL_START = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b", re.IGNORECASE)
+_NAMED_PARAM = re.compile(r"(?<![:\w]):(\w+)")
+_TABLE_REF = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|LEFT|INNER|CROSS|ORDER|GROUP|LIMIT|SET|VALUES|USING)\b)(\w+))?",
+    re.IGNORECASE,
+)
+_SCAN = re.compile(r"^SCAN (\w+)(?! USING (?:COVERING )?INDEX| USING INTEGER PRIMARY KEY)")
+_TEMP_BTREE = re.compile(r"USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)")
+
+# Tables small enough that a scan is the right plan
+SMALL_TABLES = {
+    "rooms", "cat_personalities", "cat_factions", "cat_states", "sqlite_master",
+    "message_partitions", "messages_archive_rooms",
+}
+
+# Planner statistics for build_database(): rows per table on a site
+# with about USERS accounts. Unlisted tables get DEFAULT_ROWS, and
+# SMALL_TABLES get SMALL_ROWS.
+USERS = 20_000
+TABLE_ROWS = {
+    "messages": 1_000_000,
+    "messages_archive": 5_000_000,
+    "direct_messages": 500_000,
+    "notifications": 500_000,
+    "profile_posts": 200_000,
+    "friends": 200_000,
+    "cat_memories": 100_000,
+    "idempotency_keys": 100_000,
+    "users": USERS,
+    "profiles": USERS,
+}
+DEFAULT_ROWS = 10_000
+SMALL_ROWS = 20
+# Distinct values of a column. Other *_id columns get USERS, and the rest are unique.
+COLUMN_DISTINCT = {
+    "room_id": 50,
+    "user": USERS,
+    "is_read": 2,
+    "is_bot": 2,
+    "status": 4,
+    "type": 6,
+    "module_type": 10,
+    "top8_position": 9,
+}
+PARTIAL_INDEX_SHARE = 0.01  # Rows a partial index covers (e.g. only deleted messages)
+
+# fingerprint id -> why the plan is acceptable
+ACCEPTED_FINDINGS = {
+    # db_archive._move: per-room counts of one archiver chunk
+    "a11ea00f53e2": "groups at most ARCHIVE_CHUNK rows picked by primary key",
+    # db_partitions.count_live_messages: COUNT(*) over live messages in the main file
+    "fd8a5e070f9a": "counts the hot months only; rolled months come from the manifest",
+    # queries/feed.py: posts of all followed profiles merged by created_at_ms
+    "fe28b52732f0": "fan-in over followed profiles; sort is bounded by LIMIT and the before_id cursor",
+    # queries/friends.py get_top8
+    "76fcde1bd6a0": "sorts at most 8 rows",
+    # queries/search.py search_users: LIKE '%term%'
+    "0219396e80e6": "leading-wildcard LIKE cannot use an index",
+    # services/dm_service.py get_conversations: latest message per conversation
+    "05790ff0cb59": "GROUP BY conversation over one user's DMs only",
+    # services/moderation_service.py: staff-only script takedown
+    "22e916fb6de9": "staff action, runs a handful of times a day",
+    # services/moderation_service.py delete_user: references to the deleted user
+    "254125fcc21c": "staff action; an actor_id index would tax every notification insert",
+    "15727ec08389": "staff action; one scan per account deletion",
+    "beacd6e4cd5a": "staff action; one scan per account deletion",
+    "5ede83e81a6c": "staff action; one scan per account deletion",
+    "ab5840f0ab1f": "staff action; reports stays small",
+    # services/script_service.py list_user_scripts
+    "56a66d66a8fd": "sorts one user's scripts",
+}
+
+
+@dataclass
+class Statement:
+    """A SQL statement found in source."""
+    sql: str
+    location: str  # "path:line"
+    fragment: bool = False  # Literal part of SQL assembled at runtime (f-string or +)
+
+
+@dataclass
+class Finding:
+    """A plan problem for one statement."""
+    statement: Statement
+    kind: str  # "scan" or "temp_btree"
+    table: Optional[str]
+    detail: str
+    suggestion: Optional[str] = None
+
+    @property
+    def statement_id(self) -> str:
+        return fingerprint_id(fingerprint(self.statement.sql))
+
+    @property
+    def accepted(self) -> bool:
+        return self.statement_id in ACCEPTED_FINDINGS
+
+
+# =============================================================================
+# Collection
+# =============================================================================
+def _is_sql(value) -> bool:
+    return isinstance(value, str) and bool(_SQL_START.match(value))
+
+
+class _Collector(ast.NodeVisitor):
+    """
+    Picks up SQL string literals, and stitches together queries built up
+    with `query = "..."` / `query += "..."` inside one function (the
+    result includes every optional clause, i.e. the widest variant).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.statements: List[Statement] = []
+        self._built: Dict[str, Statement] = {}
+        self._consumed = set()
+
+    def visit_FunctionDef(self, node):
+        outer = self._built
+        self._built = {}
+        self.generic_visit(node)
+        self.statements.extend(self._built.values())
+        self._built = outer
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node):
+        if (len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Constant) and _is_sql(node.value.value)):
+            self._built[node.targets[0].id] = Statement(node.value.value, f"{self.path}:{node.lineno}")
+            self._consumed.add(id(node.value))
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if (isinstance(node.op, ast.Add) and isinstance(node.target, ast.Name)
+                and node.target.id in self._built
+                and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)):
+            self._built[node.target.id].sql += node.value.value
+            self._consumed.add(id(node.value))
+        self.generic_visit(node)
+
+    def _fragment(self, node):
+        if isinstance(node, ast.Constant) and _is_sql(node.value):
+            self.statements.append(Statement(node.value, f"{self.path}:{node.lineno}", fragment=True))
+            self._consumed.add(id(node))
+
+    def visit_JoinedStr(self, node):
+        for value in node.values:
+            self._fragment(value)
+        self.generic_visit(node)
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, ast.Add):
+            self._fragment(node.left)
+            self._fragment(node.right)
+        self.generic_visit(node)
+
+    def visit_Expr(self, node):
+        # Bare string expressions are docstrings, not queries
+        if not isinstance(node.value, ast.Constant):
+            self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        if id(node) not in self._consumed and _is_sql(node.value):
+            self.statements.append(Statement(node.value, f"{self.path}:{node.lineno}"))
+
+
+def collect_statements(sources=DEFAULT_SOURCES, root=ROOT) -> List[Statement]:
+    """Collect SQL statements from the given files/packages (relative to root)."""
+    files = []
+    for source in sources:
+        path = os.path.join(root, source)
+        if os.path.isdir(path):
+            for dirpath, _, names in os.walk(path):
+                files.extend(os.path.join(dirpath, n) for n in sorted(names) if n.endswith(".py"))
+        elif os.path.exists(path):
+            files.append(path)
+
+    statements = []
+    seen = set()
+    for filename in sorted(files):
+        with open(filename, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename)
+        collector = _Collector(os.path.relpath(filename, root))
+        collector.visit(tree)
+        for stmt in collector.statements:
+            key = " ".join(stmt.sql.split())
+            if key not in seen:
+                seen.add(key)
+                statements.append(stmt)
+    return statements
+
+
+# =============================================================================
+# Plans
+# =============================================================================
+def _placeholders(sql):
+    names = _NAMED_PARAM.findall(sql)
+    if names:
+        return {name: None for name in names}
+    return (None,) * sql.count("?")
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines (parameters bound to NULL)."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", _placeholders(sql)).fetchall()
+    return [row[3] for row in rows]
+
+
+def _aliases(sql) -> Dict[str, str]:
+    """Map alias (and bare table name) -> table for FROM/JOIN clauses."""
+    mapping = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        mapping[table] = table
+        if alias:
+            mapping[alias] = table
+    return mapping
+
+
+def _columns_for(sql, alias, table, clause_re):
+    """Columns of one table used in a clause (WHERE equality / ORDER BY)."""
+    match = clause_re.search(sql)
+    if not match:
+        return []
+    text = match.group(1)
+    prefixes = {alias, table}
+    cols = []
+    for prefix, col in re.findall(r"(?:(\w+)\.)?(\w+)\s*(?:=|\bIS\b|\bDESC\b|\bASC\b|,|$)", text, re.IGNORECASE):
+        if col.upper() in {"AND", "OR", "NOT", "NULL", "DESC", "ASC", "LIMIT"}:
+            continue
+        if prefix and prefix not in prefixes:
+            continue
+        if col not in cols:
+            cols.append(col)
+    return cols
+
+
+_WHERE_EQ = re.compile(r"\bWHERE\b(.*?)(?:\bORDER BY\b|\bGROUP BY\b|\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+_ORDER_BY = re.compile(r"\bORDER BY\b(.*?)(?:\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+
+
+def suggest_index(sql: str, alias: str, table: str, conn=None) -> Optional[str]:
+    """
+    Propose an index: equality columns from WHERE, then ORDER BY columns.
+    Only columns that exist on the table are used.
+    """
+    where = [c for c in _columns_for(sql, alias, table, _WHERE_EQ)]
+    order = [c for c in _columns_for(sql, alias, table, _ORDER_BY)]
+    cols = []
+    for col in where + order:
+        if col not in cols:
+            cols.append(col)
+    if conn is not None:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        cols = [c for c in cols if c in existing]
+    if not cols:
+        return None
+    name = f"idx_{table}_{'_'.join(cols)}"
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(cols)})"
+
+
+def check_statement(conn: sqlite3.Connection, stmt: Statement) -> List[Finding]:
+    """Explain one statement and return its plan problems."""
+    details = explain(conn, stmt.sql)
+    aliases = _aliases(stmt.sql)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    findings = []
+
+    for detail in details:
+        scan = _SCAN.match(detail)
+        if scan:
+            alias = scan.group(1)
+            table = aliases.get(alias, alias)
+            if table in tables and table not in SMALL_TABLES:
+                findings.append(Finding(
+                    stmt, "scan", table, detail,
+                    suggest_index(stmt.sql, alias, table, conn)
+                ))
+        elif _TEMP_BTREE.search(detail):
+            # Attribute the sort to the table named in ORDER BY, if any
+            order = _ORDER_BY.search(stmt.sql)
+            alias = None
+            if order:
+                prefixed = re.search(r"(\w+)\.\w+", order.group(1))
+                alias = prefixed.group(1) if prefixed else None
+            if alias is None and len(set(aliases.values())) == 1:
+                alias = next(iter(aliases))
+            table = aliases.get(alias) if alias else None
+            if table in SMALL_TABLES:
+                continue
+            findings.append(Finding(
+                stmt, "temp_btree", table, detail,
+                suggest_index(stmt.sql, alias, table, conn) if table else None
+            ))
+    return findings
+
+
+def check_statements(conn: sqlite3.Connection, statements: List[Statement]) -> Tuple[List[Finding], List[Tuple[Statement, str]]]:
+    """
+    Check every statement. Returns (findings, errors); errors are statements
+    that could not be planned, such as references to missing tables or
+    SQL that doesn't parse. Fragments of SQL assembled at runtime are
+    planned when they happen to parse and skipped otherwise.
+    """
+    findings, errors = [], []
+    for stmt in statements:
+        try:
+            findings.extend(check_statement(conn, stmt))
+        except sqlite3.Error as e:
+            if not stmt.fragment:
+                errors.append((stmt, str(e)))
+    return findings, errors
+
+
+def _distinct(column, rows):
+    if column is None:  # Expression
+        return rows
+    if column in COLUMN_DISTINCT:
+        return min(rows, COLUMN_DISTINCT[column])
+    if column.endswith("_id"):
+        return min(rows, USERS)
+    return rows
+
+
+def _table_rows(table):
+    if table in SMALL_TABLES:
+        return SMALL_ROWS
+    return TABLE_ROWS.get(table, DEFAULT_ROWS)
+
+
+def load_statistics(conn: sqlite3.Connection):
+    """
+    Fill sqlite_stat1 from TABLE_ROWS / COLUMN_DISTINCT, as if ANALYZE
+    had run on a production-sized database, and make the planner use it.
+    An empty schema has no statistics, so every index would look equally
+    selective and plans could differ from the ones db_analyze leads to.
+    """
+    conn.execute("ANALYZE")  # Creates sqlite_stat1
+    conn.execute("DELETE FROM sqlite_stat1")
+    indexes = conn.execute(
+        "SELECT tbl_name, name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    tables = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )}
+    stats = [(table, None, str(_table_rows(table))) for table in sorted(tables)]
+    for table, name, sql in indexes:
+        rows = _table_rows(table)
+        if sql and re.search(r"\bWHERE\b", sql, re.IGNORECASE):
+            rows = max(1, int(rows * PARTIAL_INDEX_SHARE))
+        unique = conn.execute(f"PRAGMA index_list({table})").fetchall()
+        unique = any(row[1] == name and row[2] for row in unique)
+        columns = [row[2] for row in conn.execute(f"PRAGMA index_info({name})")]
+        per_value, distinct = [], 1
+        for column in columns:
+            distinct = min(rows, distinct * _distinct(column, rows))
+            per_value.append(max(1, round(rows / distinct)))
+        if unique:
+            per_value[-1] = 1
+        stats.append((table, name, " ".join(str(n) for n in [rows] + per_value)))
+    conn.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)", stats)
+    conn.execute("ANALYZE sqlite_master")  # Reload the statistics
+    conn.commit()
+
+
+def build_database(path: str = ":memory:") -> sqlite3.Connection:
+    """
+    Create the schema to plan against: db.SCHEMA plus the tables that only
+    exist through migrations (taken from db_schema), with representative
+    statistics from load_statistics(). The tables themselves stay empty.
+    """
+    from sqlalchemy.dialects import sqlite as sqlite_dialect
+    from sqlalchemy.schema import CreateIndex, CreateTable
+
+    import db
+    import db_schema
+
+    conn = sqlite3.connect(path)
+    conn.executescript(db.SCHEMA)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    dialect = sqlite_dialect.dialect()
+    for table in db_schema.metadata.sorted_tables:
+        if table.name in existing:
+            continue
+        conn.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in table.indexes:
+            conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+    conn.commit()
+    load_statistics(conn)
+    return conn
+
+
+# =============================================================================
+# Alembic output
+# =============================================================================
+_CREATE_INDEX = re.compile(r"CREATE INDEX IF NOT EXISTS (\w+) ON (\w+)\(([^)]*)\)")
+
+
+def render_migration(suggestions: List[str], revision: str, down_revision: str, message: str = "add advised indexes") -> str:
+    """Render an Alembic revision that creates the suggested indexes."""
+    ups, downs = [], []
+    for sql in sorted(set(suggestions)):
+        match = _CREATE_INDEX.match(sql)
+        if not match:
+            continue
+        name, table, cols = match.groups()
+        col_list = ", ".join(repr(c.strip()) for c in cols.split(","))
+        ups.append(f"    op.create_index({name!r}, {table!r}, [{col_list}], unique=False, if_not_exists=True)")
+        downs.append(f"    op.drop_index({name!r}, table_name={table!r}, if_exists=True)")
+
+    return f'''"""{message}
+
+Revision ID: {revision}
+Revises: {down_revision}
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = {revision!r}
+down_revision: Union[str, None] = {down_revision!r}
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+{chr(10).join(ups) or "    pass"}
+
+
+def downgrade() -> None:
+{chr(10).join(reversed(downs)) or "    pass"}
+'''
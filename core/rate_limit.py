@@ -0,0 +1,357 @@
+"""
+Rate Limiting.
+One GCRA limiter for socket events and Flask-Limiter, shared by every worker.
+
+State lives in a fixed-size table in a memory-mapped file (default
+<DATABASE>.ratelimit; point RATELIMIT_TABLE_PATH at /dev/shm to keep it
+off disk). A key costs one 24-byte slot holding its theoretical arrival
+time (GCRA), so memory is bounded by the table whatever the traffic:
+
+- keys hash to a bucket of SLOTS_PER_BUCKET slots; a full bucket reuses
+  its stalest slot (counted as an eviction)
+- a slot whose key is fully replenished is free; a sweeper clears them
+  every SWEEP_INTERVAL so the live-key gauge stays honest
+- each bucket is guarded by a byte-range lock on the file (workers) and
+  a thread lock (threads of one worker)
+
+Flask-Limiter uses it through the "neospace://<path>" storage and the
+"gcra" strategy (registered below); sockets call check_rate_limit.
+Rejections are counted per action for /metrics.
+
+Usage:
+    from core.rate_limit import get_limit_table
+    allowed = get_limit_table(path).hit("ws:message:7", limit=60, period=60)
+"""
+import atexit
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+
+import structlog
+from limits.storage import Storage
+from limits.strategies import STRATEGIES, RateLimiter
+from limits.util import WindowStats
+
+from process_registry import ProcessRegistry
+
+BUCKETS = 16384  # Buckets in the table (x SLOTS_PER_BUCKET keys, 24 bytes each: 3 MB)
+SLOTS_PER_BUCKET = 8
+SWEEP_INTERVAL = 60.0  # Seconds between sweeps of replenished keys
+SWEEP_CHUNK = 256  # Buckets cleared per lock hold
+
+SLOT = struct.Struct("<Qdd")  # key hash, value (GCRA: arrival time; counter: count), expires at
+BUCKET_BYTES = SLOT.size * SLOTS_PER_BUCKET
+
+logger = structlog.get_logger(__name__)
+
+
+def _key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+class LimitTable:
+    """Fixed-size GCRA / counter table, shared by every process mapping the same file."""
+
+    def __init__(self, path=None, buckets=BUCKETS):
+        self.path = path
+        self.buckets = buckets
+        size = buckets * BUCKET_BYTES
+        if path is None:  # Process-local (":memory:" databases)
+            self._fd = None
+            self._map = mmap.mmap(-1, size)
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)  # Sparse: pages are allocated as keys land on them
+            self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+        self._stats = {"evictions": 0, "live_keys": 0, "sweeps": 0}
+        self._rejections = Counter()
+
+    # --- locking -------------------------------------------------------------
+    def _locked(self, first, count=1):
+        return _BucketLock(self, first, count)
+
+    # --- slots ---------------------------------------------------------------
+    def _find(self, bucket, key_hash, now):
+        """(offset of the key's slot, or of a free slot, or None if the bucket is full; found)."""
+        base = bucket * BUCKET_BYTES
+        free = None
+        for offset in range(base, base + BUCKET_BYTES, SLOT.size):
+            slot_key, _, expires = SLOT.unpack_from(self._map, offset)
+            if slot_key == key_hash and expires > now:
+                return offset, True
+            if free is None and (slot_key == 0 or expires <= now):
+                free = offset
+        return free, False
+
+    def _claim(self, bucket, key_hash, now):
+        """Slot to write a key into: its own, a free one, or the stalest (an eviction)."""
+        offset, found = self._find(bucket, key_hash, now)
+        if offset is None:
+            base = bucket * BUCKET_BYTES
+            offset = min(range(base, base + BUCKET_BYTES, SLOT.size),
+                         key=lambda o: SLOT.unpack_from(self._map, o)[2])
+            self._stats["evictions"] += 1  # Under self._lock via _BucketLock
+        return offset, found
+
+    def gcra(self, key, limit, period, cost=1, consume=True, now=None):
+        """
+        Generic cell rate algorithm: `limit` per `period` seconds, bursting
+        up to `limit`. Returns (allowed, remaining, arrival time), the
+        arrival time being when the key is fully replenished.
+        """
+        now = time.time() if now is None else now
+        interval = period / limit
+        key_hash = _key_hash(key)
+        bucket = key_hash % self.buckets
+        writing = consume and cost
+        with self._locked(bucket):
+            offset, found = (self._claim if writing else self._find)(bucket, key_hash, now)
+            tat = max(SLOT.unpack_from(self._map, offset)[1], now) if found else now
+            new_tat = tat + interval * cost
+            allowed = new_tat - now <= period + 1e-9
+            if allowed and writing:
+                SLOT.pack_into(self._map, offset, key_hash, new_tat, new_tat)
+                tat = new_tat
+        remaining = max(0, int((period - (tat - now)) / interval + 1e-9))
+        return allowed, remaining, tat
+
+    def hit(self, key, limit, period, action=None):
+        """Consume one unit; False (and a rejection for `action`) when limited."""
+        allowed = self.gcra(key, limit, period)[0]
+        if not allowed and action:
+            self.reject(action)
+        return allowed
+
+    def reject(self, action):
+        with self._lock:
+            self._rejections[action] += 1
+
+    def incr(self, key, expiry, amount=1):
+        """Fixed-window counter (lets the standard "fixed-window" strategy use the table)."""
+        now = time.time()
+        key_hash = _key_hash(key)
+        bucket = key_hash % self.buckets
+        with self._locked(bucket):
+            offset, found = self._claim(bucket, key_hash, now)
+            _, value, expires = SLOT.unpack_from(self._map, offset) if found else (0, 0.0, now + expiry)
+            value += amount
+            SLOT.pack_into(self._map, offset, key_hash, value, expires)
+        return int(value)
+
+    def get(self, key):
+        """(value, expires at) of a live key, or (0, now)."""
+        now = time.time()
+        key_hash = _key_hash(key)
+        bucket = key_hash % self.buckets
+        with self._locked(bucket):
+            offset, found = self._find(bucket, key_hash, now)
+            if not found:
+                return 0.0, now
+            _, value, expires = SLOT.unpack_from(self._map, offset)
+        return value, expires
+
+    def clear(self, key=None):
+        """Forget one key, or (None) every key in the table."""
+        if key is None:
+            with self._locked(0, self.buckets):
+                self._map[:] = bytes(len(self._map))
+            return
+        key_hash = _key_hash(key)
+        bucket = key_hash % self.buckets
+        with self._locked(bucket):
+            offset, found = self._find(bucket, key_hash, time.time())
+            if found:
+                SLOT.pack_into(self._map, offset, 0, 0.0, 0.0)
+
+    def sweep(self, now=None):
+        """Zero every replenished slot. Returns the number of live keys."""
+        now = time.time() if now is None else now
+        live = 0
+        empty = bytes(SLOT.size)
+        for first in range(0, self.buckets, SWEEP_CHUNK):
+            count = min(SWEEP_CHUNK, self.buckets - first)
+            with self._locked(first, count):
+                start = first * BUCKET_BYTES
+                for offset in range(start, start + count * BUCKET_BYTES, SLOT.size):
+                    slot_key, _, expires = SLOT.unpack_from(self._map, offset)
+                    if not slot_key:
+                        continue
+                    if expires <= now:
+                        self._map[offset:offset + SLOT.size] = empty
+                    else:
+                        live += 1
+        with self._lock:
+            self._stats["live_keys"] = live
+            self._stats["sweeps"] += 1
+        return live
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "rejections": dict(self._rejections)}
+
+    def close(self):
+        self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+
+
+class _BucketLock:
+    """Thread lock plus a byte-range lock over buckets [first, first + count)."""
+
+    __slots__ = ("table", "start", "length")
+
+    def __init__(self, table, first, count):
+        self.table = table
+        self.start = first * BUCKET_BYTES
+        self.length = count * BUCKET_BYTES
+
+    def __enter__(self):
+        self.table._lock.acquire()
+        if self.table._fd is not None:
+            try:
+                fcntl.lockf(self.table._fd, fcntl.LOCK_EX, self.length, self.start)
+            except BaseException:
+                self.table._lock.release()
+                raise
+
+    def __exit__(self, *exc):
+        try:
+            if self.table._fd is not None:
+                fcntl.lockf(self.table._fd, fcntl.LOCK_UN, self.length, self.start)
+        finally:
+            self.table._lock.release()
+
+
+# =============================================================================
+# Flask-Limiter integration
+# =============================================================================
+class SharedTableStorage(Storage):
+    """limits storage over a LimitTable: "neospace:///path/to/table" ("neospace://" = process-local)."""
+
+    STORAGE_SCHEME = ["neospace"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        path = uri.split("://", 1)[1] if uri else ""
+        # A process-local table starts empty for each app; outside tests
+        # there is one app per process, and a shared table is never reset
+        self.table = get_limit_table(path) if path else get_limit_table(fresh=True)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def incr(self, key, expiry, amount=1):
+        return self.table.incr(key, expiry, amount)
+
+    def get(self, key):
+        return int(self.table.get(key)[0])
+
+    def get_expiry(self, key):
+        return self.table.get(key)[1]
+
+    def check(self):
+        return True
+
+    def reset(self):
+        self.table.clear()
+        return None
+
+    def clear(self, key):
+        self.table.clear(key)
+
+
+class GCRARateLimiter(RateLimiter):
+    """limits strategy "gcra": smooth GCRA over a SharedTableStorage."""
+
+    def hit(self, item, *identifiers, cost=1):
+        return self.storage.table.gcra(item.key_for(*identifiers), item.amount, item.get_expiry(), cost)[0]
+
+    def test(self, item, *identifiers, cost=1):
+        return self.storage.table.gcra(item.key_for(*identifiers), item.amount, item.get_expiry(),
+                                       cost, consume=False)[0]
+
+    def get_window_stats(self, item, *identifiers):
+        period = item.get_expiry()
+        _, remaining, tat = self.storage.table.gcra(item.key_for(*identifiers), item.amount, period, cost=0)
+        if remaining == 0:
+            return WindowStats(tat - period + period / item.amount, 0)  # When the next request fits
+        return WindowStats(tat, remaining)
+
+
+STRATEGIES["gcra"] = GCRARateLimiter  # limits has no registration hook for strategies
+
+
+def table_path(app):
+    """Where the shared table for this app lives (None: process-local)."""
+    path = app.config.get("RATELIMIT_TABLE_PATH")
+    if path:
+        return path
+    database = app.config.get("DATABASE", ":memory:")
+    return None if database == ":memory:" else f"{os.path.abspath(database)}.ratelimit"
+
+
+# =============================================================================
+# Process-wide tables (one per path, recreated after fork)
+# =============================================================================
+_tables = ProcessRegistry()
+_sweeper = {"thread": None, "stop": threading.Event(), "pid": None}
+
+
+def get_limit_table(path=None, fresh=False):
+    """
+    The LimitTable for a path in this process (None: a process-local
+    table). fresh=True replaces the one this process has with an empty one.
+    """
+    def create():
+        table = LimitTable(path)
+        _start_sweeper()
+        return table
+
+    if fresh:
+        table = create()
+        _tables.swap(path, table)
+        return table
+    return _tables.get_or_create(path, create)
+
+
+def _start_sweeper():
+    if _sweeper["pid"] == os.getpid() and _sweeper["thread"].is_alive():
+        return
+    _sweeper["stop"] = threading.Event()
+    _sweeper["pid"] = os.getpid()
+    _sweeper["thread"] = threading.Thread(target=_sweep_forever, args=(_sweeper["stop"],),
+                                          name="rate-limit-sweeper", daemon=True)
+    _sweeper["thread"].start()
+
+
+def _sweep_forever(stop):
+    while not stop.wait(SWEEP_INTERVAL):
+        for table in _tables.values():
+            try:
+                table.sweep()
+            except (OSError, ValueError) as e:  # Closed by shutdown_limit_tables
+                logger.warning("rate_limit_sweep_failed", error=str(e))
+
+
+def rate_limit_stats():
+    """Counters for this process's most recently opened table, if any."""
+    table = _tables.latest()
+    return table.stats() if table else None
+
+
+def shutdown_limit_tables():
+    """Stop the sweeper and unmap this process's tables."""
+    _sweeper["stop"].set()
+    for table in _tables.pop_all():
+        table.close()
+
+
+atexit.register(shutdown_limit_tables)
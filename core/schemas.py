@@ -27,6 +27,7 @@ class BackfillResponse(msgspec.Struct):
 class SendMessageRequest(msgspec.Struct):
     """Request payload for sending a message."""
     content: str
+    room: Optional[str] = None  # Room name; general if omitted
 
 
 class UpdateMessageRequest(msgspec.Struct):
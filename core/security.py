@@ -5,12 +5,26 @@ from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from flask import request
+
+from core.rate_limit import table_path
 
 csrf = CSRFProtect()
 talisman = Talisman()
+
+
+def _count_breach(request_limit):
+    """Count HTTP rejections per endpoint next to the socket actions."""
+    table = getattr(limiter.storage, "table", None)
+    if table is not None:
+        table.reject(f"http:{request.endpoint}")
+
+
+# Storage and strategy come from RATELIMIT_STORAGE_URI / RATELIMIT_STRATEGY
+# (init_security defaults them to the shared GCRA table)
 limiter = Limiter(
     key_func=get_remote_address,
-    storage_uri="memory://"
+    on_breach=_count_breach
 )
 
 def init_security(app):
@@ -47,5 +61,8 @@ def init_security(app):
         force_https=False # Disabled for local dev/proxy handling. Caddy handles HTTPS.
     )
     
-    # Rate Limiting
+    # Rate Limiting: GCRA over a table shared by every worker (core/rate_limit.py)
+    app.config.setdefault("RATELIMIT_STRATEGY", "gcra")
+    if not app.config.get("RATELIMIT_STORAGE_URI"):
+        app.config["RATELIMIT_STORAGE_URI"] = f"neospace://{table_path(app) or ''}"
     limiter.init_app(app)
@@ -0,0 +1,110 @@
+"""
+Worker Startup.
+Per-phase timing for create_app and lazily registered blueprints.
+
+Every gunicorn worker runs create_app, so its cost is paid on each boot
+and each restart. StartupTimer records how long each phase took (config,
+database, blueprints, sockets) and logs one startup_timing event; the
+breakdown is also exported on /metrics.
+
+Rarely used blueprints (admin, song, cats) are not imported at startup.
+LazyBlueprint puts catch-all rules on their URL prefix instead; the first
+request under it imports the module and expands its routes. Flask forbids
+register_blueprint after the first request, so the routes are matched on
+a private url map, and the matched rule replaces the catch-all before any
+before_request hook runs: request.endpoint is the real one ("admin.
+dashboard", not "lazy_admin") for rate limits, CSRF exemptions and the
+per-endpoint query metrics, as with an eagerly registered blueprint.
+"""
+import importlib
+import threading
+import time
+
+import structlog
+from flask import Flask, current_app, request
+from werkzeug.exceptions import NotFound
+
+logger = structlog.get_logger(__name__)
+
+LAZY_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE"]
+
+
+class StartupTimer:
+    """Wall-clock seconds per create_app phase, taken as laps between marks."""
+
+    def __init__(self):
+        self.phases = {}
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """Charge the time since the previous mark to `phase` (repeat marks add up)."""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def finish(self):
+        """Log the breakdown and return {"total": s, "phases": {...}}."""
+        total = time.perf_counter() - self._started
+        logger.info(
+            "startup_timing",
+            total_ms=round(total * 1000, 1),
+            **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+        )
+        return {"total": total, "phases": dict(self.phases)}
+
+
+class LazyBlueprint:
+    """A blueprint imported on the first request under its URL prefix."""
+
+    def __init__(self, import_name, url_prefix):
+        self.import_name = import_name  # "routes.admin:bp"
+        self.url_prefix = url_prefix.rstrip("/")
+        self.name = import_name.split(":")[0].rsplit(".", 1)[-1]
+        self.endpoint = f"lazy_{self.name}"
+        self.loaded = False
+        self._map = None
+        self._views = None
+        self._lock = threading.Lock()
+
+    def register(self, app):
+        app.add_url_rule(f"{self.url_prefix}/", self.endpoint, self.dispatch,
+                         methods=LAZY_METHODS, strict_slashes=False)
+        app.add_url_rule(f"{self.url_prefix}/<path:subpath>", self.endpoint, self.dispatch,
+                         methods=LAZY_METHODS)
+        # URL value preprocessors run before every before_request hook
+        app.url_value_preprocessor(self.resolve)
+
+    def load(self):
+        """Import the blueprint and build its url map (once per process)."""
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            start = time.perf_counter()
+            module_name, attr = self.import_name.split(":")
+            blueprint = getattr(importlib.import_module(module_name), attr)
+            # A throwaway app expands the blueprint's deferred route setup
+            shell = Flask(module_name, static_folder=None)
+            shell.register_blueprint(blueprint)
+            self._map, self._views = shell.url_map, shell.view_functions
+            self.loaded = True
+            logger.info("lazy_blueprint_loaded", blueprint=self.name,
+                        ms=round((time.perf_counter() - start) * 1000, 1))
+
+    def resolve(self, endpoint, values):
+        """Swap the catch-all rule for the blueprint's own matching rule."""
+        if endpoint != self.endpoint:
+            return
+        self.load()
+        # Raises NotFound/MethodNotAllowed/RequestRedirect like the main map would
+        rule, args = self._map.bind_to_environ(request.environ).match(return_rule=True)
+        views = current_app.view_functions
+        if rule.endpoint not in views:
+            # Not add_url_rule: the app has already started serving
+            views.update(self._views)
+        request.url_rule, request.view_args = rule, args
+
+    def dispatch(self, subpath=""):
+        # resolve() has always replaced the rule by the time Flask dispatches
+        raise NotFound()
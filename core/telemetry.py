@@ -0,0 +1,243 @@
+"""
+Query Telemetry.
+Per-statement timing registry fed by the pooled connection layer.
+
+SQL is normalized into a fingerprint (literals -> ?, whitespace collapsed)
+and every execution records its latency and row count against it. Each
+request or socket event also records how many queries it issued, which
+is what makes N+1 patterns stand out.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+import structlog
+
+SLOW_QUERY_MS = 100.0  # Log statements slower than this
+SAMPLES_PER_QUERY = 512  # Latency samples kept per fingerprint for percentiles
+
+logger = structlog.get_logger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """Normalize SQL so executions of the same statement share a key."""
+    text = _STRING_RE.sub("?", sql)
+    text = _NUMBER_RE.sub("?", text)
+    text = _SPACE_RE.sub(" ", text).strip()
+    text = _IN_LIST_RE.sub("(?...)", text)
+    return text
+
+
+@lru_cache(maxsize=4096)
+def fingerprint_id(fp: str) -> str:
+    """Short stable identifier for a fingerprint (used as a metric label)."""
+    return hashlib.sha1(fp.encode("utf-8")).hexdigest()[:12]  # nosec B324
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _QueryStats:
+    __slots__ = ("count", "total", "rows", "retries", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.retries = 0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES_PER_QUERY)
+
+
+class _ScopeStats:
+    __slots__ = ("count", "queries", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.queries = 0
+        self.max = 0
+
+
+class QueryRegistry:
+    """Thread-safe per-fingerprint and per-scope counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._scopes = {}
+
+    def record(self, sql: str, elapsed: float, rows: int = 0):
+        fp = fingerprint(sql)
+        with self._lock:
+            stats = self._queries.get(fp)
+            if stats is None:
+                stats = self._queries[fp] = _QueryStats()
+            stats.count += 1
+            stats.total += elapsed
+            stats.rows += rows
+            stats.samples.append(elapsed)
+            if elapsed > stats.max:
+                stats.max = elapsed
+        if elapsed * 1000 > SLOW_QUERY_MS:
+            logger.warning("slow_query", duration_ms=round(elapsed * 1000, 2), sql=fp[:200])
+
+    def record_retry(self, sql: str):
+        fp = fingerprint(sql)
+        with self._lock:
+            stats = self._queries.get(fp)
+            if stats is None:
+                stats = self._queries[fp] = _QueryStats()
+            stats.retries += 1
+
+    def record_scope(self, scope: str, queries: int):
+        """Record how many queries one request or socket event issued."""
+        with self._lock:
+            stats = self._scopes.get(scope)
+            if stats is None:
+                stats = self._scopes[scope] = _ScopeStats()
+            stats.count += 1
+            stats.queries += queries
+            if queries > stats.max:
+                stats.max = queries
+
+    def snapshot(self, limit: int = None):
+        """Statements ordered by total time, plus per-scope query counts."""
+        with self._lock:
+            queries = [
+                (fp, s.count, s.total, s.rows, s.retries, s.max, sorted(s.samples))
+                for fp, s in self._queries.items()
+            ]
+            scopes = [(name, s.count, s.queries, s.max) for name, s in self._scopes.items()]
+
+        queries.sort(key=lambda q: q[2], reverse=True)
+        if limit:
+            queries = queries[:limit]
+
+        return {
+            "queries": [
+                {
+                    "id": fingerprint_id(fp),
+                    "sql": fp,
+                    "count": count,
+                    "total_ms": round(total * 1000, 3),
+                    "p50_ms": round(_percentile(samples, 50) * 1000, 3),
+                    "p95_ms": round(_percentile(samples, 95) * 1000, 3),
+                    "p99_ms": round(_percentile(samples, 99) * 1000, 3),
+                    "max_ms": round(peak * 1000, 3),
+                    "rows": rows,
+                    "busy_retries": retries,
+                }
+                for fp, count, total, rows, retries, peak, samples in queries
+            ],
+            "scopes": sorted(
+                (
+                    {
+                        "scope": name,
+                        "count": count,
+                        "queries": total,
+                        "avg_queries": round(total / count, 2) if count else 0,
+                        "max_queries": peak,
+                    }
+                    for name, count, total, peak in scopes
+                ),
+                key=lambda s: s["avg_queries"],
+                reverse=True,
+            ),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._scopes.clear()
+
+
+registry = QueryRegistry()
+
+
+class TelemetryCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement to the registry.
+
+    SQLite does most of a SELECT's work while stepping rows, so a statement
+    that returns rows is recorded on its first fetch (execute + fetch time).
+    Statements without a result set, or cursors that are only iterated,
+    are recorded with the execute time alone.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._finish()
+            self._pending = (sql, elapsed)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._finish()
+            registry.record(sql, time.perf_counter() - start)
+        return self
+
+    def _finish(self, extra=0.0, rows=0):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            registry.record(pending[0], pending[1] + extra, rows)
+
+    def fetchone(self):
+        if self._pending is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._finish(time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchall(self):
+        if self._pending is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._finish(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        if self._pending is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._finish(time.perf_counter() - start, len(rows))
+        return rows
+
+    def __iter__(self):
+        self._finish()
+        return super().__iter__()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
@@ -1,24 +1,50 @@
 
+import hashlib
+import re
 import sqlite3
 import time
 import functools
 import threading
 import queue
+import logging
 from contextlib import contextmanager
 from flask import g, current_app
+from core.telemetry import TelemetryCursor, registry as query_registry
+from db_lock import WriteLockTimeout, get_write_lock, hold_write_lock, shutdown_write_locks
 
 DB_PATH = "neospace.db"
 
+logger = logging.getLogger(__name__)
+
 # =============================================================================
 # Concurrency Settings
 # =============================================================================
-BUSY_TIMEOUT_MS = 30000  # 30 seconds - SQLite will retry internally
-MAX_RETRIES = 5
-RETRY_DELAY_BASE = 0.05  # 50ms base delay, exponential backoff
+# Writers queue on db_lock's write lock with a deadline. Every request
+# handler writes through it (db_retry, hold_write_lock, db_writer);
+# busy_timeout is only the backstop for scripts and migrations
+BUSY_TIMEOUT_MS = 5000
 
 # Connection Pool Settings
 POOL_SIZE = 10  # Number of connections to maintain
 POOL_TIMEOUT = 30.0  # Seconds to wait for a connection
+POOL_MAX_OVERFLOW = 10  # Temporary connections allowed once the pool is drained
+POOL_MAX_LIFETIME = 3600.0  # Recycle connections after an hour
+POOL_HEALTHCHECK_IDLE = 30.0  # Ping connections idle longer than this on lease
+OPTIMIZE_MIN_AGE = 600.0  # Connections older than this run PRAGMA optimize on close
+OPTIMIZE_LOCK_TIMEOUT = 0.5  # Skip the optimize rather than wait longer for the write lock
+
+# Conservative defaults, overridden by config.SQLITE_PRAGMAS
+DEFAULT_PRAGMAS = {
+    'busy_timeout': BUSY_TIMEOUT_MS,
+    'auto_vacuum': 'INCREMENTAL',  # Only takes effect on a new database (see db_archive)
+    'journal_mode': 'WAL',
+    'wal_autocheckpoint': 1000,  # 0 when db_checkpoint's manager checkpoints instead
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'mmap_size': 268435456,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY'
+}
 
 
 # =============================================================================
@@ -31,6 +57,7 @@ CREATE TABLE IF NOT EXISTS messages (
     content TEXT,
     room_id INTEGER DEFAULT 1,
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    created_at_ms INTEGER,  -- Epoch milliseconds (see db_epoch)
     edited_at TEXT,
     deleted_at TEXT
 );
@@ -105,6 +132,7 @@ CREATE TABLE IF NOT EXISTS direct_messages (
     
     -- Metadata (unencrypted for queries)
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    created_at_ms INTEGER,
     read_at TEXT,
     
     -- Per-user soft delete
@@ -112,7 +140,7 @@ CREATE TABLE IF NOT EXISTS direct_messages (
     deleted_by_recipient INTEGER DEFAULT 0
 );
 
-CREATE INDEX IF NOT EXISTS idx_dm_conversation ON direct_messages(conversation_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_dm_conversation_id ON direct_messages(conversation_id, id);
 CREATE INDEX IF NOT EXISTS idx_dm_recipient ON direct_messages(recipient_id, read_at);
 CREATE INDEX IF NOT EXISTS idx_dm_sender ON direct_messages(sender_id);
 
@@ -174,12 +202,12 @@ CREATE TABLE IF NOT EXISTS profile_posts (
     display_order INTEGER NOT NULL DEFAULT 0,
     
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    created_at_ms INTEGER,
     updated_at TEXT
 );
 CREATE INDEX IF NOT EXISTS idx_posts_profile ON profile_posts(profile_id, display_order);
 
 -- Additional performance indexes
-CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at);
 CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user);
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 
@@ -192,8 +220,11 @@ CREATE TABLE IF NOT EXISTS friends (
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(follower_id, following_id)
 );
-CREATE INDEX IF NOT EXISTS idx_friends_follower ON friends(follower_id);
-CREATE INDEX IF NOT EXISTS idx_friends_following ON friends(following_id);
+CREATE INDEX IF NOT EXISTS idx_friends_follower_created ON friends(follower_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_friends_following_created ON friends(following_id, created_at);
+-- Prefixes of the two above: older databases still have them
+DROP INDEX IF EXISTS idx_friends_follower;
+DROP INDEX IF EXISTS idx_friends_following;
 
 -- Sprint 15: Notifications (Live Wire)
 CREATE TABLE IF NOT EXISTS notifications (
@@ -205,9 +236,9 @@ CREATE TABLE IF NOT EXISTS notifications (
     link TEXT,           -- URL to navigate on click
     actor_id INTEGER REFERENCES users(id),
     is_read INTEGER DEFAULT 0,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    created_at_ms INTEGER
 );
-CREATE INDEX IF NOT EXISTS idx_notif_user ON notifications(user_id, is_read);
 
 -- Sprint 9: Rooms
 CREATE TABLE IF NOT EXISTS rooms (
@@ -217,9 +248,11 @@ CREATE TABLE IF NOT EXISTS rooms (
     room_type TEXT DEFAULT 'text',
     is_default INTEGER DEFAULT 0,
     created_by INTEGER REFERENCES users(id),
+    retention_days INTEGER,  -- Days messages stay in the hot table (NULL: ARCHIVE_RETENTION_DAYS)
     created_at TEXT DEFAULT CURRENT_TIMESTAMP
 );
-CREATE INDEX IF NOT EXISTS idx_messages_room ON messages(room_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages(room_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_deleted ON messages(id) WHERE deleted_at IS NOT NULL;
 
 -- Cat System Tables
 CREATE TABLE IF NOT EXISTS cat_factions (
@@ -261,7 +294,9 @@ CREATE TABLE IF NOT EXISTS cat_memories (
     target_user_id INTEGER REFERENCES users(id),
     memory_type TEXT,
     opinion_modifier REAL,
-    expires_at TEXT
+    expires_at TEXT,
+    created_at_ms INTEGER,
+    expires_at_ms INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS cat_relationships (
@@ -284,126 +319,469 @@ CREATE TABLE IF NOT EXISTS admin_ops (
 );
 CREATE INDEX IF NOT EXISTS idx_admin_ops_admin ON admin_ops(admin_id);
 CREATE INDEX IF NOT EXISTS idx_admin_ops_created ON admin_ops(created_at);
+
+-- Archived messages (db_archive): moved out of the hot table past retention
+CREATE TABLE IF NOT EXISTS messages_archive (
+    id INTEGER PRIMARY KEY,  -- Original message id
+    user TEXT NOT NULL,
+    content TEXT,
+    room_id INTEGER,
+    created_at TEXT,
+    created_at_ms INTEGER,
+    edited_at TEXT,
+    deleted_at TEXT,
+    archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_archive_room ON messages_archive(room_id);
+CREATE INDEX IF NOT EXISTS idx_archive_created_ms ON messages_archive(created_at_ms);
+
+CREATE TABLE IF NOT EXISTS messages_archive_rooms (
+    room_id INTEGER PRIMARY KEY,
+    live_rows INTEGER DEFAULT 0,
+    horizon_id INTEGER  -- Newest archived live message id
+);
+
+-- Startup bookkeeping: fingerprint of the SCHEMA last applied (see init_db)
+CREATE TABLE IF NOT EXISTS schema_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Planner statistics (db_analyze): exact row counts at each table's last ANALYZE
+CREATE TABLE IF NOT EXISTS table_row_stats (
+    tbl TEXT PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    analyzed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Rolled message months (db_partitions): one shard file per month
+CREATE TABLE IF NOT EXISTS message_partitions (
+    month TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    min_id INTEGER,
+    max_id INTEGER,
+    live_rows INTEGER DEFAULT 0,
+    rolled_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Idempotency keys (idempotency.py): the result of a keyed create,
+-- replayed to retries of the same request; status NULL while in flight
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status INTEGER,
+    response BLOB,
+    created_at_ms INTEGER NOT NULL,
+    PRIMARY KEY (scope, owner, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_idempotency_created_ms ON idempotency_keys(created_at_ms);
+
+-- Epoch-millisecond timestamps (db_epoch): indexes, plus triggers that
+-- fill the integer column for writers that only set the TEXT one
+CREATE INDEX IF NOT EXISTS idx_messages_created_ms ON messages(created_at_ms);
+CREATE INDEX IF NOT EXISTS idx_messages_room_created_ms ON messages(room_id, created_at_ms);
+CREATE INDEX IF NOT EXISTS idx_dm_conversation_ms ON direct_messages(conversation_id, created_at_ms);
+CREATE INDEX IF NOT EXISTS idx_posts_type_created_ms ON profile_posts(module_type, created_at_ms);
+CREATE INDEX IF NOT EXISTS idx_notif_user_unread_ms ON notifications(user_id, is_read, created_at_ms);
+CREATE INDEX IF NOT EXISTS idx_notif_user_created_ms ON notifications(user_id, created_at_ms);
+DROP INDEX IF EXISTS idx_notif_user;  -- Prefix of idx_notif_user_unread_ms
+CREATE INDEX IF NOT EXISTS idx_cat_memories_pair_ms ON cat_memories(source_cat_id, target_user_id, expires_at_ms);
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_created_ms AFTER INSERT ON messages
+WHEN NEW.created_at_ms IS NULL BEGIN
+    UPDATE messages SET created_at_ms = CAST(ROUND((julianday(COALESCE(NEW.created_at, 'now')) - 2440587.5) * 86400000) AS INTEGER)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_dm_created_ms AFTER INSERT ON direct_messages
+WHEN NEW.created_at_ms IS NULL BEGIN
+    UPDATE direct_messages SET created_at_ms = CAST(ROUND((julianday(COALESCE(NEW.created_at, 'now')) - 2440587.5) * 86400000) AS INTEGER)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_posts_created_ms AFTER INSERT ON profile_posts
+WHEN NEW.created_at_ms IS NULL BEGIN
+    UPDATE profile_posts SET created_at_ms = CAST(ROUND((julianday(COALESCE(NEW.created_at, 'now')) - 2440587.5) * 86400000) AS INTEGER)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_notif_created_ms AFTER INSERT ON notifications
+WHEN NEW.created_at_ms IS NULL BEGIN
+    UPDATE notifications SET created_at_ms = CAST(ROUND((julianday(COALESCE(NEW.created_at, 'now')) - 2440587.5) * 86400000) AS INTEGER)
+    WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_cat_memories_ms AFTER INSERT ON cat_memories
+WHEN NEW.created_at_ms IS NULL OR (NEW.expires_at_ms IS NULL AND NEW.expires_at IS NOT NULL) BEGIN
+    UPDATE cat_memories SET
+        created_at_ms = COALESCE(NEW.created_at_ms, CAST(ROUND((julianday('now') - 2440587.5) * 86400000) AS INTEGER)),
+        expires_at_ms = COALESCE(NEW.expires_at_ms, CAST(ROUND((julianday(NEW.expires_at) - 2440587.5) * 86400000) AS INTEGER))
+    WHERE id = NEW.id;
+END;
 '''
 
 
 # =============================================================================
 # Connection Pool
 # =============================================================================
+class PoolExhaustedError(sqlite3.OperationalError):
+    """
+    Raised when the pool and its overflow allowance are both saturated.
+    Subclasses OperationalError so existing handlers map it to a 503.
+    """
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3.Connection that remembers its owning pool and age.
+    Statements run through TelemetryCursor so every query is timed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.is_overflow = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.queries = 0  # Statements issued during the current lease
+        self.generation = 0  # Pool generation it was opened in (see ConnectionPool.recycle)
+
+    def cursor(self, factory=TelemetryCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        self.queries += 1
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.queries += 1
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _apply_pragmas(conn, pragmas):
+    """Apply connection-level PRAGMAs (values come from trusted config)."""
+    conn.execute(f"PRAGMA busy_timeout = {pragmas.get('busy_timeout', 30000)};")
+    # Before journal_mode: switching to WAL initializes an empty file
+    conn.execute(f"PRAGMA auto_vacuum = {pragmas.get('auto_vacuum', 'INCREMENTAL')};")
+    conn.execute(f"PRAGMA journal_mode = {pragmas.get('journal_mode', 'WAL')};")
+    conn.execute(f"PRAGMA wal_autocheckpoint = {pragmas.get('wal_autocheckpoint', 1000)};")
+    conn.execute(f"PRAGMA synchronous = {pragmas.get('synchronous', 'NORMAL')};")
+    conn.execute(f"PRAGMA mmap_size = {pragmas.get('mmap_size', 268435456)};")
+    conn.execute(f"PRAGMA cache_size = {pragmas.get('cache_size', -64000)};")
+    conn.execute(f"PRAGMA temp_store = {pragmas.get('temp_store', 'MEMORY')};")
+    conn.execute(f"PRAGMA foreign_keys = {pragmas.get('foreign_keys', 'ON')};")
+
+
+def open_connection(path, pragmas=None):
+    """Open an autocommit connection with the standard PRAGMAs applied."""
+    conn = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        timeout=15.0,  # JUICED: 15s allows client retry rather than indefinite hang
+        isolation_level=None,  # Autocommit mode
+        factory=PooledConnection
+    )
+    conn.row_factory = sqlite3.Row
+    
+    # Skip PRAGMAs for in-memory databases
+    if path != ":memory:":
+        _apply_pragmas(conn, pragmas if pragmas is not None else DEFAULT_PRAGMAS)
+        
+    return conn
+
+
 class ConnectionPool:
     """
     Thread-safe SQLite connection pool.
     Maintains a pool of pre-configured connections for reuse.
+
+    Connections are created lazily up to ``pool_size``. When every pooled
+    connection is leased, callers wait up to ``timeout`` seconds and then
+    fall back to at most ``max_overflow`` temporary connections; past that
+    a PoolExhaustedError is raised instead of opening more files.
     """
     
-    def __init__(self, db_path, pool_size=POOL_SIZE):
+    def __init__(self, db_path, pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 max_lifetime=POOL_MAX_LIFETIME, pragmas=None):
         self.db_path = db_path
         self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.max_lifetime = max_lifetime
+        self.pragmas = pragmas if pragmas is not None else DEFAULT_PRAGMAS
         self._pool = queue.Queue(maxsize=pool_size)
         self._lock = threading.Lock()
         self._initialized = False
+        self._created = 0    # Pooled connections currently alive
+        self._overflow = 0   # Temporary connections currently leased
+        self._generation = 0  # Bumped by recycle(); older connections are retired
+        self._stats = {
+            "leases": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "overflow_created": 0,
+            "rejected": 0,
+            "recycled": 0,
+            "health_failures": 0,
+        }
         
     def _create_connection(self):
         """Create and configure a new database connection."""
-        conn = sqlite3.connect(
-            self.db_path,
-            check_same_thread=False,
-            timeout=30.0,
-            isolation_level=None  # Autocommit mode
-        )
-        conn.row_factory = sqlite3.Row
-        
-        # Skip PRAGMAs for in-memory databases
-        if self.db_path != ":memory:":
-            # Busy timeout
-            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
-            # WAL mode for concurrent reads
-            conn.execute("PRAGMA journal_mode = WAL;")
-            # Balanced synchronization
-            conn.execute("PRAGMA synchronous = NORMAL;")
-            # Memory-mapped I/O (256MB)
-            conn.execute("PRAGMA mmap_size = 268435456;")
-            # Large page cache (64MB)
-            conn.execute("PRAGMA cache_size = -64000;")
-            # Temp store in memory
-            conn.execute("PRAGMA temp_store = MEMORY;")
-            # Foreign keys
-            conn.execute("PRAGMA foreign_keys = ON;")
-            # Read uncommitted for non-blocking reads (optional, for high-read scenarios)
-            conn.execute("PRAGMA read_uncommitted = ON;")
-            
+        conn = open_connection(self.db_path, self.pragmas)
+        conn.pool = self
+        conn.generation = self._generation
         return conn
+
+    def _optimize(self, conn):
+        """
+        PRAGMA optimize before closing a long-lived connection: it has seen
+        enough of the workload to know which tables' statistics are stale.
+        """
+        if self.db_path == ":memory:" or time.monotonic() - conn.created_at < OPTIMIZE_MIN_AGE:
+            return
+        try:
+            with get_write_lock(self.db_path).hold(timeout=OPTIMIZE_LOCK_TIMEOUT):
+                conn.execute("PRAGMA analysis_limit = 1000")
+                conn.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+
+    def _discard(self, conn):
+        """Close a pooled connection and free its slot."""
+        with self._lock:
+            self._created -= 1
+        try:
+            self._optimize(conn)
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _expired(self, conn, now):
+        """Past max lifetime, or opened before the last recycle()."""
+        return conn.generation != self._generation or (
+            self.max_lifetime and now - conn.created_at > self.max_lifetime
+        )
+
+    def _is_healthy(self, conn):
+        """Recycle expired connections; ping ones idle for a while."""
+        now = time.monotonic()
+        if self._expired(conn, now):
+            with self._lock:
+                self._stats["recycled"] += 1
+            return False
+        if now - conn.last_used > POOL_HEALTHCHECK_IDLE:
+            try:
+                conn.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                with self._lock:
+                    self._stats["health_failures"] += 1
+                return False
+        return True
+
+    def _new_pooled(self):
+        """Reserve a pool slot and open a connection for it, or return None."""
+        with self._lock:
+            if self._created >= self.pool_size:
+                return None
+            self._created += 1
+        try:
+            return self._create_connection()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
     
     def initialize(self):
         """Pre-populate the connection pool."""
         with self._lock:
             if self._initialized:
                 return
-            for _ in range(self.pool_size):
-                try:
-                    conn = self._create_connection()
-                    self._pool.put_nowait(conn)
-                except queue.Full:
-                    break
             self._initialized = True
+        for _ in range(self.pool_size):
+            conn = self._new_pooled()
+            if conn is None:
+                break
+            self._pool.put_nowait(conn)
     
     def get_connection(self, timeout=POOL_TIMEOUT):
         """Get a connection from the pool."""
+        with self._lock:
+            self._stats["leases"] += 1
+
+        # Fast path: reuse an idle connection, or grow the pool lazily.
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+        conn = self._new_pooled()
+        if conn is not None:
+            return conn
+
+        # Slow path: every pooled connection is leased, wait for one.
+        start = time.monotonic()
+        deadline = start + timeout
         try:
-            return self._pool.get(timeout=timeout)
+            while True:
+                conn = self._pool.get(timeout=max(0.0, deadline - time.monotonic()))
+                if self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+                conn = self._new_pooled()
+                if conn is not None:
+                    return conn
         except queue.Empty:
-            # Pool exhausted, create a new connection
-            import logging
-            logging.getLogger(__name__).warning(
-                "Connection pool exhausted (size=%d) - creating temporary connection", 
-                self.pool_size
-            )
-            return self._create_connection()
+            pass
+        finally:
+            with self._lock:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - start
+
+        with self._lock:
+            if self._overflow >= self.max_overflow:
+                self._stats["rejected"] += 1
+                raise PoolExhaustedError(
+                    f"Connection pool exhausted (size={self.pool_size}, overflow={self.max_overflow})"
+                )
+            self._overflow += 1
+            self._stats["overflow_created"] += 1
+
+        # Pool exhausted, create a bounded temporary connection
+        logger.warning(
+            "Connection pool exhausted (size=%d) - creating temporary connection", 
+            self.pool_size
+        )
+        try:
+            conn = self._create_connection()
+        except Exception:
+            with self._lock:
+                self._overflow -= 1
+            raise
+        conn.is_overflow = True
+        return conn
     
     def return_connection(self, conn):
         """Return a connection to the pool."""
+        # Never hand a half-finished transaction to the next caller
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+
+        if getattr(conn, "is_overflow", False):
+            with self._lock:
+                self._overflow -= 1
+            conn.close()
+            return
+
+        conn.last_used = time.monotonic()
+        if self._expired(conn, conn.last_used):
+            with self._lock:
+                self._stats["recycled"] += 1
+            self._discard(conn)
+            return
+
         try:
             self._pool.put_nowait(conn)
         except queue.Full:
             # Pool is full, close the connection
-            conn.close()
+            self._discard(conn)
+
+    def stats(self):
+        """Snapshot of pool saturation counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["size"] = self.pool_size
+            snapshot["open"] = self._created
+            snapshot["overflow_in_use"] = self._overflow
+        idle = self._pool.qsize()
+        snapshot["idle"] = idle
+        snapshot["in_use"] = max(0, snapshot["open"] - idle) + snapshot["overflow_in_use"]
+        return snapshot
     
+    def recycle(self):
+        """
+        Retire every connection open now: idle ones are closed at once,
+        leased ones when they are returned. For callers that change what
+        a connection may be holding on to, e.g. an ATTACHed file that is
+        about to be deleted or moved.
+        """
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._stats["recycled"] += 1
+            self._discard(conn)
+
     def close_all(self):
         """Close all pooled connections."""
         while not self._pool.empty():
             try:
                 conn = self._pool.get_nowait()
+                self._optimize(conn)
                 conn.close()
+                with self._lock:
+                    self._created -= 1
             except queue.Empty:
                 break
         self._initialized = False
 
 
-# Global connection pool (lazy initialized)
-_connection_pool = None
+# Global connection pools, one per database path (lazy initialized)
+_pools = {}
 _pool_lock = threading.Lock()
 
 
-def _get_pool():
-    """Get or create the global connection pool."""
-    global _connection_pool
-    if _connection_pool is None:
+def _resolve_path():
+    """Database path from the Flask config if available."""
+    try:
+        return current_app.config.get("DATABASE", DB_PATH)
+    except RuntimeError:
+        return DB_PATH
+
+
+def _resolve_pool_settings():
+    """Pool sizing and PRAGMAs from the Flask config, with module defaults."""
+    try:
+        cfg = current_app.config
+    except RuntimeError:
+        return {"pragmas": DEFAULT_PRAGMAS}
+    pragmas = {**DEFAULT_PRAGMAS, **cfg.get("SQLITE_PRAGMAS", {})}
+    if cfg.get("DB_CHECKPOINT_ENABLED", True):
+        # Commits no longer checkpoint; db_checkpoint's manager does it off-request
+        pragmas["wal_autocheckpoint"] = 0
+    return {
+        "pool_size": cfg.get("DB_POOL_SIZE", POOL_SIZE),
+        "max_overflow": cfg.get("DB_POOL_MAX_OVERFLOW", POOL_MAX_OVERFLOW),
+        "max_lifetime": cfg.get("DB_POOL_MAX_LIFETIME", POOL_MAX_LIFETIME),
+        "pragmas": pragmas,
+    }
+
+
+def get_pool(path=None):
+    """Get or create the connection pool for a database path."""
+    if path is None:
+        path = _resolve_path()
+    pool = _pools.get(path)
+    if pool is None:
         with _pool_lock:
-            if _connection_pool is None:
-                # Determine path from Flask context if available
-                try:
-                    path = current_app.config.get("DATABASE", DB_PATH)
-                except RuntimeError:
-                    path = DB_PATH
-                _connection_pool = ConnectionPool(path)
-                _connection_pool.initialize()
-    return _connection_pool
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path, **_resolve_pool_settings())
+                _pools[path] = pool
+    return pool
 
 
 @contextmanager
 def get_pooled_connection():
     """Context manager for using a pooled connection."""
-    pool = _get_pool()
+    pool = get_pool()
     conn = pool.get_connection()
     try:
         yield conn
@@ -412,159 +790,171 @@ def get_pooled_connection():
 
 
 # =============================================================================
-# Retry Decorator
+# Write Lock Helpers (names kept from the old sleep-and-retry versions)
 # =============================================================================
 def with_retry(func):
     """
-    Decorator that retries database operations on lock errors.
-    Uses exponential backoff to avoid thundering herd.
+    Decorator that runs a write operation holding the database write lock.
+    Raises WriteLockTimeout (-> 503) if the lock isn't free within
+    DB_WRITE_LOCK_TIMEOUT_MS instead of sleeping and retrying.
     """
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        last_error = None
-        for attempt in range(MAX_RETRIES):
-            try:
-                return func(*args, **kwargs)
-            except sqlite3.OperationalError as e:
-                if "locked" in str(e).lower() or "busy" in str(e).lower():
-                    last_error = e
-                    delay = RETRY_DELAY_BASE * (2 ** attempt)
-                    time.sleep(delay)
-                else:
-                    raise
-        raise last_error
+        with hold_write_lock():
+            return func(*args, **kwargs)
     return wrapper
 
 
-def db_retry(operation):
+def db_retry(operation, timeout=None):
     """
-    Execute a database operation with retry on lock.
+    Execute a write operation holding the database write lock.
     For inline usage - wraps an operation callable.
     
     Usage:
         db_retry(lambda: db.execute(...))
     """
-    last_error = None
-    for attempt in range(MAX_RETRIES):
-        try:
-            return operation()
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e).lower() or "busy" in str(e).lower():
-                last_error = e
-                time.sleep(RETRY_DELAY_BASE * (2 ** attempt))
-            else:
-                raise
-    raise last_error
+    with hold_write_lock(timeout=timeout):
+        return operation()
 
 
 # =============================================================================
-# Flask Integration (per-request connections)
+# Flask Integration (per-request leases from the pool)
 # =============================================================================
-def _configure_connection(db, path):
-    """Apply optimal SQLite settings for high concurrency."""
-    db.row_factory = sqlite3.Row
-    
-    if path == ":memory:":
-        return
-        
-    # Load PRAGMAs from config or fall back to conservative defaults
-    try:
-        pragmas = current_app.config.get('SQLITE_PRAGMAS', {})
-    except RuntimeError:
-        # Fallback if outside app context
-        pragmas = {
-            'busy_timeout': 30000,
-            'journal_mode': 'WAL',
-            'synchronous': 'NORMAL',
-            'foreign_keys': 'ON',
-            'mmap_size': 268435456,
-            'cache_size': -64000,
-            'temp_store': 'MEMORY'
-        }
-    
-    # Apply settings
-    db.execute(f"PRAGMA busy_timeout = {pragmas.get('busy_timeout', 30000)};")
-    db.execute(f"PRAGMA journal_mode = {pragmas.get('journal_mode', 'WAL')};")
-    db.execute(f"PRAGMA synchronous = {pragmas.get('synchronous', 'NORMAL')};")
-    db.execute(f"PRAGMA mmap_size = {pragmas.get('mmap_size', 268435456)};")
-    db.execute(f"PRAGMA cache_size = {pragmas.get('cache_size', -64000)};")
-    db.execute(f"PRAGMA temp_store = {pragmas.get('temp_store', 'MEMORY')};")
-    db.execute(f"PRAGMA foreign_keys = {pragmas.get('foreign_keys', 'ON')};")
-
-
 def get_db():
-    """Get database connection for current request context."""
+    """
+    Get database connection for current request context.
+    Leases a pre-configured connection from the pool; close_db returns it.
+    """
+    if g.get("read_only_heavy"):
+        # Inside @read_only_heavy: serve from the snapshot when one is usable
+        from db_snapshot import get_snapshot_db
+        snapshot = get_snapshot_db()
+        if snapshot is not None:
+            return snapshot
     if "db" not in g:
-        path = current_app.config.get("DATABASE", DB_PATH)
-        db = sqlite3.connect(
-            path, 
-            check_same_thread=False,
-            timeout=15.0,  # JUICED: 15s allows client retry rather than indefinite hang
-            isolation_level=None
-        )
-        _configure_connection(db, path)
+        db = get_pool().get_connection()
+        db.queries = 0
         g.db = db
     return g.db
 
 
-def execute_with_retry(sql, params=(), fetchone=False, fetchall=False):
+_READ_PREFIXES = ("SELECT", "PRAGMA", "EXPLAIN", "VALUES")
+_WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _is_read(sql):
+    head = sql.lstrip().upper()
+    if head.startswith(_READ_PREFIXES):
+        return True
+    return head.startswith("WITH") and not _WRITE_KEYWORDS.search(sql)
+
+
+def execute_with_retry(sql, params=(), fetchone=False, fetchall=False, timeout=None):
     """
-    Execute SQL with automatic retry on lock.
+    Execute SQL on the request connection. Writes run holding the write
+    lock and raise WriteLockTimeout (-> 503) when it isn't free in time;
+    reads never need it under WAL.
     """
     db = get_db()
-    last_error = None
-    
-    for attempt in range(MAX_RETRIES):
-        try:
-            start_time = time.time()
-            cursor = db.execute(sql, params)
-            duration = time.time() - start_time
-            
-            # Sentinel: Performance Benchmarking
-            if duration > 0.1:  # 100ms threshold
-                import logging
-                logging.getLogger(__name__).warning(
-                    "SLOW QUERY: %.2fms | SQL: %s", 
-                    duration * 1000, 
-                    sql.strip()[:100] + "..." if len(sql) > 100 else sql
-                )
-            
-            if fetchone:
-                return cursor.fetchone()
-            elif fetchall:
-                return cursor.fetchall()
-            return cursor
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e).lower() or "busy" in str(e).lower():
-                last_error = e
-                delay = RETRY_DELAY_BASE * (2 ** attempt)
-                time.sleep(delay)
-            else:
-                raise
-    
-    raise last_error
+
+    def run():
+        # Timing and slow-query logging happen in core.telemetry
+        cursor = db.execute(sql, params)
+        if fetchone:
+            return cursor.fetchone()
+        elif fetchall:
+            return cursor.fetchall()
+        return cursor
+
+    if _is_read(sql):
+        return run()
+    try:
+        with hold_write_lock(timeout=timeout):
+            return run()
+    except WriteLockTimeout:
+        query_registry.record_retry(sql)
+        raise
+
+
+def schema_fingerprint():
+    """sha256 of SCHEMA; changes whenever the DDL in this file does."""
+    return hashlib.sha256(SCHEMA.encode()).hexdigest()
+
+
+def schema_is_current(db):
+    """True when schema_meta records that this exact SCHEMA was applied."""
+    try:
+        row = db.execute("SELECT value FROM schema_meta WHERE key = 'schema_hash'").fetchone()
+    except sqlite3.OperationalError:  # Database predates schema_meta
+        return False
+    return row is not None and row[0] == schema_fingerprint()
 
 
 def init_db():
-    """Initialize database schema."""
+    """
+    Initialize database schema.
+
+    Every worker boot used to replay all of SCHEMA's CREATE ... IF NOT
+    EXISTS statements and probe every table for epoch columns. The
+    fingerprint check skips that DDL when the database was already brought
+    up to this SCHEMA. Delete the schema_meta row to force a replay.
+    """
+    from db_analyze import start_analyzer
+    from db_archive import start_archiver
+    from db_checkpoint import start_checkpointer
+    from db_epoch import add_epoch_columns, start_backfill
+    from room_registry import forget_room_registry
     db = get_db()
-    db.executescript(SCHEMA)
-    db.commit()
-    
-    # Initialize connection pool
-    _get_pool()
+    forget_room_registry()  # A new file may have replaced the database at this path
+    if not schema_is_current(db):
+        # Existing tables need the epoch columns before SCHEMA indexes them
+        add_epoch_columns(db)
+        db.executescript(SCHEMA)
+        db.execute(
+            "INSERT OR REPLACE INTO schema_meta (key, value, updated_at) "
+            "VALUES ('schema_hash', ?, CURRENT_TIMESTAMP)",
+            (schema_fingerprint(),),
+        )
+        db.commit()
+        logger.info("Applied database schema %s", schema_fingerprint()[:12])
+    start_backfill(get_pool().db_path)
+    start_archiver(get_pool().db_path)
+    start_checkpointer(get_pool().db_path)
+    start_analyzer(get_pool().db_path)
 
 
 def close_db(e=None):
-    """Close database connection."""
-    db = g.pop("db", None)
-    if db:
-        db.close()
+    """Return the request's connections to their pools."""
+    for key in ("db", "snapshot_db"):
+        db = g.pop(key, None)
+        if db:
+            if db.pool is not None:
+                db.pool.return_connection(db)
+            else:
+                db.close()
 
 
 def shutdown_pool():
-    """Shutdown the connection pool (for graceful termination)."""
-    global _connection_pool
-    if _connection_pool:
-        _connection_pool.close_all()
-        _connection_pool = None
+    """Shutdown all connection pools (for graceful termination)."""
+    # Drain queued writes before their connections go away
+    from db_analyze import shutdown_analyzers
+    from db_archive import shutdown_archivers
+    from db_checkpoint import shutdown_checkpointers
+    from db_recent import shutdown_recent
+    from db_snapshot import shutdown_snapshots
+    from db_writebehind import shutdown_write_behind
+    from db_writer import shutdown_writers
+    shutdown_analyzers()
+    shutdown_archivers()
+    shutdown_checkpointers()
+    shutdown_recent()
+    shutdown_snapshots()
+    shutdown_write_behind()
+    shutdown_writers()
+
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()  # May still take the write lock for PRAGMA optimize
+    shutdown_write_locks()
@@ -0,0 +1,253 @@
+"""
+Planner Statistics - db_analyze.py
+
+The query planner picks indexes from sqlite_stat1, which only ANALYZE
+writes. Without it every index looks equally selective, and tables like
+friends, profile_posts and direct_messages change shape a lot as the
+site grows. A background job keeps the statistics current:
+
+- row counts are compared against the exact counts recorded in
+  table_row_stats at the last ANALYZE (sqlite_stat1's own counts are
+  estimates once analysis_limit applies); tables that drifted by more
+  than DRIFT_RATIO (and at least MIN_ROW_DELTA rows), or were never
+  analyzed, get a targeted ANALYZE
+- ANALYZE samples at most ANALYSIS_LIMIT rows per index, one table per
+  write-lock hold, so writers never wait long behind it
+- the hottest statements from the query registry are planned before and
+  after, and every plan that changed is logged (query_plan_changed)
+
+Pooled connections that lived longer than OPTIMIZE_MIN_AGE also run
+PRAGMA optimize when they are closed (see db.ConnectionPool).
+
+ANALYZE bumps the schema cookie, so every other connection reloads the
+new statistics on its next statement.
+
+Usage:
+    from db_analyze import start_analyzer
+    start_analyzer(get_pool().db_path)   # Called by db.init_db
+"""
+import atexit
+import fcntl
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+import structlog
+from flask import current_app
+
+from core.query_plans import explain
+from core.telemetry import registry as query_registry
+from db import get_pool, open_connection
+from db_lock import BACKGROUND_TIMEOUT, get_write_lock
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+ANALYZE_INTERVAL = 3600  # Seconds between drift checks
+ANALYZE_STARTUP_DELAY = 60  # First check soon after boot: new tables have no statistics
+DRIFT_RATIO = 0.2  # Re-analyze when the row count moved by more than this fraction
+MIN_ROW_DELTA = 100  # ...and by at least this many rows (small tables stay quiet)
+ANALYSIS_LIMIT = 1000  # Rows sampled per index (PRAGMA analysis_limit)
+HOT_QUERIES = 25  # Statements from the query registry whose plans are compared
+
+logger = structlog.get_logger(__name__)
+
+
+# =============================================================================
+# Drift
+# =============================================================================
+def analyzed_rows(conn):
+    """Row counts as of each table's last ANALYZE: {table: rows}."""
+    try:
+        return dict(conn.execute("SELECT tbl, row_count FROM table_row_stats").fetchall())
+    except sqlite3.OperationalError:  # Database predates table_row_stats
+        return {}
+
+
+def user_tables(conn):
+    return [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+
+
+def drifted_tables(conn, drift=DRIFT_RATIO, min_delta=MIN_ROW_DELTA):
+    """[(table, rows at last ANALYZE or None, rows now)] for tables due for ANALYZE."""
+    baseline = analyzed_rows(conn)
+    due = []
+    for table in user_tables(conn):
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]  # nosec B608 - name from sqlite_master
+        before = baseline.get(table)
+        delta = abs(rows - (before or 0))
+        if delta < min_delta:
+            continue
+        if before is None or delta > drift * max(before, 1):
+            due.append((table, before, rows))
+    return due
+
+
+# =============================================================================
+# Plans
+# =============================================================================
+def hot_statements(limit=HOT_QUERIES):
+    """(id, sql) of the most expensive SELECTs seen by this process."""
+    queries = query_registry.snapshot(limit=limit)["queries"]
+    return [(q["id"], q["sql"]) for q in queries if q["sql"].lstrip().upper().startswith(("SELECT", "WITH"))]
+
+
+def capture_plans(conn, statements):
+    """{id: plan detail lines}; statements that don't plan here are skipped."""
+    plans = {}
+    for statement_id, sql in statements:
+        try:
+            plans[statement_id] = explain(conn, sql)
+        except sqlite3.Error:  # "(?...)" IN-list fingerprints, attached shards
+            continue
+    return plans
+
+
+def analyze_tables(conn, counts, lock=None):
+    """ANALYZE each table of {table: rows} in its own short write-lock hold."""
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    for table, rows in counts.items():
+        with lock.hold(timeout=BACKGROUND_TIMEOUT) if lock else nullcontext():
+            conn.execute(f'ANALYZE "{table}"')
+            conn.execute(
+                "INSERT OR REPLACE INTO table_row_stats (tbl, row_count, analyzed_at) "
+                "VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (table, rows),
+            )
+
+
+def refresh_statistics(conn, drift=DRIFT_RATIO, min_delta=MIN_ROW_DELTA, statements=None, lock=None):
+    """
+    ANALYZE the tables whose row counts drifted and report plan changes.
+    Returns {"analyzed": [table, ...], "plan_changes": [{"id", "sql", "before", "after"}, ...]}.
+    """
+    due = drifted_tables(conn, drift, min_delta)
+    if not due:
+        return {"analyzed": [], "plan_changes": []}
+    if statements is None:
+        statements = hot_statements()
+    before = capture_plans(conn, statements)
+    analyze_tables(conn, {table: rows for table, _, rows in due}, lock)
+    after = capture_plans(conn, statements)
+
+    for table, old, new in due:
+        logger.info("table_analyzed", table=table, rows_before=old, rows=new)
+    changes = []
+    for statement_id, sql in statements:
+        if statement_id in before and before[statement_id] != after.get(statement_id):
+            change = {"id": statement_id, "sql": sql, "before": before[statement_id], "after": after.get(statement_id)}
+            changes.append(change)
+            logger.warning("query_plan_changed", query=statement_id, sql=sql[:200],
+                           before=change["before"], after=change["after"])
+    return {"analyzed": [table for table, _, _ in due], "plan_changes": changes}
+
+
+class StatisticsMaintainer:
+    """
+    Runs refresh_statistics every `interval` seconds. Across worker
+    processes only the holder of <db>.analyze.lock does the work.
+    """
+
+    def __init__(self, db_path, interval=ANALYZE_INTERVAL, drift=DRIFT_RATIO,
+                 startup_delay=ANALYZE_STARTUP_DELAY):
+        self.db_path = db_path
+        self.interval = interval
+        self.drift = drift
+        self.startup_delay = min(startup_delay, interval)
+        self._lock = threading.Lock()  # Guards _stats
+        self._wake = threading.Event()
+        self._stopping = False
+        self._stats = {
+            "runs": 0, "failed_runs": 0, "tables_analyzed": 0, "plan_changes": 0,
+            "last_run_seconds": 0.0, "last_run_at": None,
+        }
+        self._thread = threading.Thread(target=self._run, name="db-analyzer", daemon=True)
+        self._thread.start()
+
+    def run_once(self):
+        """One drift check. Returns refresh_statistics' result, or None if another process holds the lock."""
+        with open(f"{self.db_path}.analyze.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            conn = open_connection(self.db_path, get_pool(self.db_path).pragmas)
+            try:
+                started = time.monotonic()
+                result = refresh_statistics(conn, drift=self.drift, lock=get_write_lock(self.db_path))
+            finally:
+                conn.close()
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["tables_analyzed"] += len(result["analyzed"])
+            self._stats["plan_changes"] += len(result["plan_changes"])
+            self._stats["last_run_seconds"] = time.monotonic() - started
+            self._stats["last_run_at"] = time.time()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(5.0)
+
+    def _run(self):
+        delay = self.startup_delay
+        while not self._stopping:
+            self._wake.wait(delay)
+            delay = self.interval
+            if self._stopping:
+                break
+            try:
+                self.run_once()
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._stats["failed_runs"] += 1
+                logger.warning("analyze_failed", error=str(e))
+
+
+# =============================================================================
+# Process-wide maintainers (one per database path, recreated after fork)
+# =============================================================================
+_analyzers = ProcessRegistry()
+
+
+def start_analyzer(path=None):
+    """Start the statistics maintainer for a database path in this process, if enabled."""
+    pool = get_pool(path)
+    if pool.db_path == ":memory:":
+        return None
+    try:
+        cfg = current_app.config
+    except RuntimeError:
+        return None
+    if not cfg.get("DB_ANALYZE_ENABLED", True):
+        return None
+    return _analyzers.get_or_create(pool.db_path, lambda: StatisticsMaintainer(
+        pool.db_path,
+        interval=cfg.get("DB_ANALYZE_INTERVAL_SECONDS", ANALYZE_INTERVAL),
+        drift=cfg.get("DB_ANALYZE_DRIFT", DRIFT_RATIO),
+    ))
+
+
+def analyzer_stats():
+    """Counters for this process's most recently started statistics maintainer, if any."""
+    analyzer = _analyzers.latest()
+    return analyzer.stats() if analyzer else None
+
+
+def shutdown_analyzers():
+    """Stop every statistics maintainer started by this process."""
+    for analyzer in _analyzers.pop_all():
+        analyzer.stop()
+
+
+atexit.register(shutdown_analyzers)
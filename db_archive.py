@@ -0,0 +1,316 @@
+"""
+Message Archive - db_archive.py
+
+Keeps the hot messages table down to each room's retention window.
+A background archiver moves older messages into messages_archive in
+small chunks, one short BEGIN IMMEDIATE transaction each, so a chat
+writer never waits behind it for more than a chunk. Soft-deleted
+messages are moved out first, whatever their age: nothing reads them
+from the hot table.
+
+Retention is rooms.retention_days, or ARCHIVE_RETENTION_DAYS for rooms
+without an override. Pages freed by the moves are handed back to the
+filesystem with PRAGMA incremental_vacuum when the database uses
+auto_vacuum=INCREMENTAL (new databases do; convert an existing one once
+with scripts/archive_messages.py --convert).
+
+messages_archive_rooms keeps, per room, the live archived row count and
+the newest archived id (the horizon). Readers only look at the archive
+once they page below the horizon (see db_partitions.page_messages), and
+unread counts add the stored counts instead of scanning the archive.
+
+Usage:
+    from db_archive import start_archiver
+    start_archiver(get_pool().db_path)   # Called by db.init_db
+"""
+import atexit
+import fcntl
+import json
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+import structlog
+from flask import current_app
+
+from db import get_pool, open_connection
+from db_epoch import now_ms as _now_ms
+from db_lock import BACKGROUND_TIMEOUT, get_write_lock
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+RETENTION_DAYS = 30  # Default per-room retention window in the hot table
+ARCHIVE_INTERVAL = 300  # Seconds between archiver runs
+ARCHIVE_CHUNK = 500  # Rows moved per transaction
+ARCHIVE_PAUSE = 0.05  # Seconds between chunks, leaves room for other writers
+VACUUM_PAGES = 2000  # Pages reclaimed per run (incremental_vacuum step)
+
+DAY_MS = 86_400_000
+
+ARCHIVE_COLUMNS = "id, user, content, room_id, created_at, created_at_ms, edited_at, deleted_at"
+
+logger = structlog.get_logger(__name__)
+
+
+# =============================================================================
+# Reading
+# =============================================================================
+def archive_horizon(db, room_id=None):
+    """Newest archived live message id (for a room, or any room), or None."""
+    if room_id is None:
+        row = db.execute("SELECT MAX(horizon_id) FROM messages_archive_rooms").fetchone()
+    else:
+        row = db.execute(
+            "SELECT horizon_id FROM messages_archive_rooms WHERE room_id = ?", (room_id,)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def count_archived(db):
+    """Live messages held in the archive."""
+    return db.execute("SELECT COALESCE(SUM(live_rows), 0) FROM messages_archive_rooms").fetchone()[0]
+
+
+# =============================================================================
+# Moving
+# =============================================================================
+def _deleted_ids(conn, limit):
+    rows = conn.execute(
+        "SELECT id FROM main.messages WHERE deleted_at IS NOT NULL LIMIT ?", (limit,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def _expired_ids(conn, now_ms, retention_days, limit):
+    """Ids past their room's retention window, per-room overrides first."""
+    overrides = conn.execute(
+        "SELECT id, retention_days FROM rooms WHERE retention_days IS NOT NULL"
+    ).fetchall()
+    ids = []
+    for room_id, days in overrides:
+        rows = conn.execute(
+            "SELECT id FROM main.messages WHERE room_id = ? AND created_at_ms < ? LIMIT ?",
+            (room_id, now_ms - days * DAY_MS, limit - len(ids)),
+        ).fetchall()
+        ids.extend(r[0] for r in rows)
+        if len(ids) >= limit:
+            return ids
+    rows = conn.execute(
+        "SELECT id FROM main.messages WHERE created_at_ms < ? "
+        "AND (room_id IS NULL OR room_id NOT IN (SELECT value FROM json_each(?))) LIMIT ?",
+        (now_ms - retention_days * DAY_MS, json.dumps([r[0] for r in overrides]), limit - len(ids)),
+    ).fetchall()
+    ids.extend(r[0] for r in rows)
+    return ids
+
+
+def _move(conn, ids):
+    """Copy rows into the archive, update the per-room counts, delete them. Caller holds the transaction."""
+    payload = json.dumps(ids)
+    conn.execute(
+        f"INSERT OR REPLACE INTO main.messages_archive ({ARCHIVE_COLUMNS}) "  # nosec B608
+        f"SELECT {ARCHIVE_COLUMNS} FROM main.messages WHERE id IN (SELECT value FROM json_each(?))",
+        (payload,),
+    )
+    per_room = conn.execute(
+        "SELECT COALESCE(room_id, 0), COUNT(*), MAX(id) FROM main.messages "
+        "WHERE id IN (SELECT value FROM json_each(?)) AND deleted_at IS NULL GROUP BY 1",
+        (payload,),
+    ).fetchall()
+    conn.executemany(
+        """INSERT INTO messages_archive_rooms (room_id, live_rows, horizon_id) VALUES (?, ?, ?)
+           ON CONFLICT(room_id) DO UPDATE SET
+               live_rows = live_rows + excluded.live_rows,
+               horizon_id = MAX(COALESCE(horizon_id, 0), excluded.horizon_id)""",
+        per_room,
+    )
+    return conn.execute(
+        "DELETE FROM main.messages WHERE id IN (SELECT value FROM json_each(?))", (payload,)
+    ).rowcount
+
+
+def _drain(conn, select_ids, chunk_size, pause, should_stop, lock):
+    moved = 0
+    while not should_stop():
+        with lock.hold(timeout=BACKGROUND_TIMEOUT) if lock else nullcontext():
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = select_ids(chunk_size)
+                count = _move(conn, ids) if ids else 0
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        moved += count
+        if len(ids) < chunk_size:
+            break
+        time.sleep(pause)
+    return moved
+
+
+def archive_messages(conn, now_ms=None, retention_days=RETENTION_DAYS, chunk_size=ARCHIVE_CHUNK,
+                     pause=ARCHIVE_PAUSE, should_stop=lambda: False, lock=None):
+    """
+    Move soft-deleted messages, then messages past their room's retention
+    window, into messages_archive. Returns {"deleted": n, "expired": n}.
+    Each chunk holds `lock` (a db_lock.WriteLock) when one is given.
+    """
+    now_ms = now_ms if now_ms is not None else _now_ms()
+    deleted = _drain(conn, lambda limit: _deleted_ids(conn, limit), chunk_size, pause, should_stop, lock)
+    expired = _drain(
+        conn, lambda limit: _expired_ids(conn, now_ms, retention_days, limit),
+        chunk_size, pause, should_stop, lock,
+    )
+    return {"deleted": deleted, "expired": expired}
+
+
+def reclaim_pages(conn, max_pages=VACUUM_PAGES):
+    """
+    Return up to max_pages free pages to the filesystem. A no-op (returns 0)
+    unless the database uses auto_vacuum=INCREMENTAL.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not before:
+        return 0
+    # executescript steps the pragma to completion; execute() frees one page per step
+    conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def convert_to_incremental(conn):
+    """Switch an existing database to auto_vacuum=INCREMENTAL (rewrites the file once)."""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+# =============================================================================
+# Background archiver
+# =============================================================================
+class MessageArchiver:
+    """
+    Runs archive_messages + reclaim_pages every `interval` seconds. Across
+    worker processes only the holder of <db>.archiver.lock does the work.
+    """
+
+    def __init__(self, db_path, retention_days=RETENTION_DAYS, interval=ARCHIVE_INTERVAL,
+                 chunk_size=ARCHIVE_CHUNK, pause=ARCHIVE_PAUSE, vacuum_pages=VACUUM_PAGES):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self._lock = threading.Lock()  # Guards _stats
+        self._wake = threading.Event()
+        self._stopping = False
+        self._stats = {
+            "runs": 0, "failed_runs": 0, "archived_deleted": 0, "archived_expired": 0,
+            "pages_reclaimed": 0, "freelist_pages": 0, "last_run_rows": 0,
+            "last_run_seconds": 0.0, "rows_per_second": 0.0, "last_run_at": None,
+        }
+        self._thread = threading.Thread(target=self._run, name="db-archiver", daemon=True)
+        self._thread.start()
+
+    def run_once(self, now_ms=None):
+        """One archive + reclaim pass. Returns rows moved, or None if another process holds the lock."""
+        with open(f"{self.db_path}.archiver.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            lock = get_write_lock(self.db_path)
+            conn = open_connection(self.db_path, get_pool(self.db_path).pragmas)
+            try:
+                started = time.monotonic()
+                moved = archive_messages(
+                    conn, now_ms=now_ms, retention_days=self.retention_days,
+                    chunk_size=self.chunk_size, pause=self.pause,
+                    should_stop=lambda: self._stopping, lock=lock,
+                )
+                with lock.hold(timeout=BACKGROUND_TIMEOUT):
+                    reclaimed = reclaim_pages(conn, self.vacuum_pages)
+                freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            finally:
+                conn.close()
+
+        elapsed = time.monotonic() - started
+        rows = moved["deleted"] + moved["expired"]
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["archived_deleted"] += moved["deleted"]
+            self._stats["archived_expired"] += moved["expired"]
+            self._stats["pages_reclaimed"] += reclaimed
+            self._stats["freelist_pages"] = freelist
+            self._stats["last_run_rows"] = rows
+            self._stats["last_run_seconds"] = elapsed
+            self._stats["rows_per_second"] = rows / elapsed if elapsed > 0 else 0.0
+            self._stats["last_run_at"] = time.time()
+        if rows or reclaimed:
+            logger.info("messages_archived", rows=rows, pages_reclaimed=reclaimed, seconds=round(elapsed, 3), **moved)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(5.0)
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            if self._stopping:
+                break
+            try:
+                self.run_once()
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._stats["failed_runs"] += 1
+                logger.warning("message_archive_failed", error=str(e))
+
+
+# =============================================================================
+# Process-wide archivers (one per database path, recreated after fork)
+# =============================================================================
+_archivers = ProcessRegistry()
+
+
+def start_archiver(path=None):
+    """Start the archiver for a database path in this process, if enabled."""
+    pool = get_pool(path)
+    if pool.db_path == ":memory:":
+        return None
+    try:
+        cfg = current_app.config
+    except RuntimeError:
+        return None
+    if not cfg.get("ARCHIVE_ENABLED", True):
+        return None
+    return _archivers.get_or_create(pool.db_path, lambda: MessageArchiver(
+        pool.db_path,
+        retention_days=cfg.get("ARCHIVE_RETENTION_DAYS", RETENTION_DAYS),
+        interval=cfg.get("ARCHIVE_INTERVAL_SECONDS", ARCHIVE_INTERVAL),
+    ))
+
+
+def archiver_stats():
+    """Counters for this process's most recently started archiver, if any."""
+    archiver = _archivers.latest()
+    return archiver.stats() if archiver else None
+
+
+def shutdown_archivers():
+    """Stop every archiver started by this process."""
+    for archiver in _archivers.pop_all():
+        archiver.stop()
+
+
+atexit.register(shutdown_archivers)
@@ -0,0 +1,246 @@
+"""
+WAL Checkpoints - db_checkpoint.py
+
+In WAL mode SQLite checkpoints on whichever commit pushes the WAL past
+wal_autocheckpoint pages, so a random chat send pays for copying the
+WAL back into the database. A reader that stays open across that point
+also stops the WAL from being reset, and the -wal file keeps growing.
+
+With the checkpoint manager enabled, request connections run with
+wal_autocheckpoint=0 and one elected process per host (the holder of
+<db>.checkpoint.lock) checkpoints from a background thread:
+
+- PASSIVE once the database has gone a tick without commits (idle),
+  or after PASSIVE_MAX_DEFER busy ticks; it never blocks anyone
+- RESTART when the WAL in use passes RESTART_BYTES, so the next writer
+  starts again at the top of the file instead of appending
+- TRUNCATE when the WAL in use or the -wal file passes TRUNCATE_BYTES,
+  which also gives the disk space back
+
+RESTART and TRUNCATE wait for readers to move off the old WAL; they
+take the write lock first so request writers queue on its deadline
+instead of stalling inside SQLite. Durations and WAL sizes are exported
+on /metrics.
+
+Usage:
+    from db_checkpoint import start_checkpointer
+    start_checkpointer(get_pool().db_path)   # Called by db.init_db
+"""
+import atexit
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+
+import structlog
+from flask import current_app
+
+from db import get_pool, open_connection
+from db_lock import BACKGROUND_TIMEOUT, Histogram, get_write_lock
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+CHECKPOINT_INTERVAL = 1.0  # Seconds between checks
+PASSIVE_MAX_DEFER = 10  # Busy ticks a PASSIVE checkpoint may wait for an idle one
+RESTART_BYTES = 64 * 1024 * 1024  # WAL in use before escalating to RESTART
+TRUNCATE_BYTES = 256 * 1024 * 1024  # WAL in use (or -wal file size) before TRUNCATE
+CHECKPOINT_BUSY_MS = 1000  # How long RESTART/TRUNCATE wait for readers
+
+MODES = ("PASSIVE", "RESTART", "TRUNCATE")
+
+logger = structlog.get_logger(__name__)
+
+
+def wal_size(db_path):
+    """Size of the -wal file in bytes (0 when there is none)."""
+    try:
+        return os.path.getsize(f"{db_path}-wal")
+    except OSError:
+        return 0
+
+
+def checkpoint(conn, mode="PASSIVE"):
+    """Run one checkpoint. Returns (busy, wal_frames, checkpointed_frames)."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    busy, frames, done = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return busy, frames, done
+
+
+class CheckpointManager:
+    """
+    Checkpoints one database every `interval` seconds. Across worker
+    processes only the holder of <db>.checkpoint.lock does the work; the
+    others retry the election each tick.
+    """
+
+    def __init__(self, db_path, interval=CHECKPOINT_INTERVAL, restart_bytes=RESTART_BYTES,
+                 truncate_bytes=TRUNCATE_BYTES, passive_max_defer=PASSIVE_MAX_DEFER):
+        self.db_path = db_path
+        self.interval = interval
+        self.restart_bytes = restart_bytes
+        self.truncate_bytes = truncate_bytes
+        self.passive_max_defer = passive_max_defer
+        self.duration_seconds = Histogram()
+        self._lock = threading.Lock()  # Guards _stats
+        self._wake = threading.Event()
+        self._stopping = False
+        self._lock_file = None
+        self._conn = None
+        self._page_size = 4096
+        self._data_version = None
+        self._dirty = True  # Unknown WAL state at startup: checkpoint once
+        self._busy_ticks = 0
+        self._stats = {
+            "leader": False, "checkpoints": dict.fromkeys(MODES, 0), "busy": 0,
+            "failed": 0, "wal_frames": 0, "frames_behind": 0, "last_mode": None,
+            "last_checkpoint_at": None,
+        }
+        self._thread = threading.Thread(target=self._run, name="db-checkpointer", daemon=True)
+        self._thread.start()
+
+    def _elect(self):
+        """Try to become this host's checkpointer. Leadership is kept until stop()."""
+        if self._conn is not None:
+            return True
+        lock_file = open(f"{self.db_path}.checkpoint.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._conn = open_connection(self.db_path, get_pool(self.db_path).pragmas)
+        self._conn.execute(f"PRAGMA busy_timeout = {CHECKPOINT_BUSY_MS}")
+        self._page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            self._stats["leader"] = True
+        logger.info("wal_checkpointer_elected", db=self.db_path, pid=os.getpid())
+        return True
+
+    def _checkpoint(self, mode):
+        start = time.monotonic()
+        if mode == "PASSIVE":
+            busy, frames, done = checkpoint(self._conn, mode)
+        else:
+            with get_write_lock(self.db_path).hold(timeout=BACKGROUND_TIMEOUT):
+                busy, frames, done = checkpoint(self._conn, mode)
+        elapsed = time.monotonic() - start
+        self.duration_seconds.observe(elapsed)
+        behind = max(frames - done, 0) if frames >= 0 else 0
+        with self._lock:
+            self._stats["checkpoints"][mode] += 1
+            self._stats["busy"] += busy
+            self._stats["wal_frames"] = max(frames, 0)
+            self._stats["frames_behind"] = behind
+            self._stats["last_mode"] = mode
+            self._stats["last_checkpoint_at"] = time.time()
+        if not busy and not behind:
+            self._dirty = False
+            self._busy_ticks = 0
+        if mode != "PASSIVE":
+            logger.info("wal_checkpoint", mode=mode, busy=busy, frames=frames,
+                        checkpointed=done, ms=round(elapsed * 1000, 1))
+        return busy, frames, done
+
+    def run_once(self):
+        """One tick. Returns the modes run, or None when another process is the checkpointer."""
+        if not self._elect():
+            return None
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        idle = version == self._data_version
+        self._data_version = version
+        if not idle:
+            self._dirty = True
+            self._busy_ticks += 1
+
+        ran, escalate = [], None
+        if self._dirty and (idle or self._busy_ticks >= self.passive_max_defer):
+            _, frames, _ = self._checkpoint("PASSIVE")
+            ran.append("PASSIVE")
+            in_use = max(frames, 0) * self._page_size
+            if in_use >= self.truncate_bytes:
+                escalate = "TRUNCATE"
+            elif in_use >= self.restart_bytes:
+                escalate = "RESTART"
+        if escalate is None and wal_size(self.db_path) >= self.truncate_bytes:
+            escalate = "TRUNCATE"  # A file left bloated by an earlier long reader
+        if escalate:
+            self._checkpoint(escalate)
+            ran.append(escalate)
+        return ran
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["checkpoints"] = dict(self._stats["checkpoints"])
+        snapshot["wal_bytes"] = wal_size(self.db_path)
+        snapshot["duration_seconds"] = self.duration_seconds.snapshot()
+        return snapshot
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(5.0)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the flock; another worker takes over
+            self._lock_file = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            if self._stopping:
+                break
+            try:
+                self.run_once()
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._stats["failed"] += 1
+                logger.warning("wal_checkpoint_failed", error=str(e))
+
+
+# =============================================================================
+# Process-wide checkpointers (one per database path, recreated after fork)
+# =============================================================================
+_checkpointers = ProcessRegistry()
+
+
+def start_checkpointer(path=None):
+    """Start the checkpoint manager for a database path in this process, if enabled."""
+    pool = get_pool(path)
+    if pool.db_path == ":memory:":
+        return None
+    try:
+        cfg = current_app.config
+    except RuntimeError:
+        return None
+    if not cfg.get("DB_CHECKPOINT_ENABLED", True):
+        return None
+    return _checkpointers.get_or_create(pool.db_path, lambda: CheckpointManager(
+        pool.db_path,
+        interval=cfg.get("DB_CHECKPOINT_INTERVAL_SECONDS", CHECKPOINT_INTERVAL),
+        restart_bytes=int(cfg.get("DB_WAL_RESTART_MB", RESTART_BYTES >> 20) * 1024 * 1024),
+        truncate_bytes=int(cfg.get("DB_WAL_TRUNCATE_MB", TRUNCATE_BYTES >> 20) * 1024 * 1024),
+    ))
+
+
+def checkpointer_stats():
+    """Counters for this process's most recently started checkpoint manager, if any."""
+    manager = _checkpointers.latest()
+    return manager.stats() if manager else None
+
+
+def shutdown_checkpointers():
+    """Stop every checkpoint manager started by this process."""
+    for manager in _checkpointers.pop_all():
+        manager.stop()
+
+
+atexit.register(shutdown_checkpointers)
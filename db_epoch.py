@@ -0,0 +1,232 @@
+"""
+Epoch Timestamps - db_epoch.py
+
+Time-ordered tables carry INTEGER epoch-millisecond columns alongside
+their TEXT timestamps. Indexes and ORDER BY clauses use the integer
+columns: they're smaller, compare as plain integers, and make range
+scans (archival, TTL expiry) cheap.
+
+Dual-write: hot insert paths pass created_at_ms themselves; an AFTER
+INSERT trigger (see db.SCHEMA) derives it from the TEXT column for any
+other writer. Rows written before the columns existed are filled by a
+chunked background backfill, so no single UPDATE holds the write lock
+for long.
+
+Reads switch over only once the backfill is done: until then epoch_sql()
+turns a statement's created_at_ms back into created_at, so rows that
+have no integer timestamp yet still sort correctly. When the backfill
+finishes it drops the TEXT indexes the integer ones replace (those kept
+the fallback reads fast meanwhile) and records 'epoch_backfill' in
+schema_meta, so later boots skip the probe for unfilled rows.
+
+Usage:
+    from db_epoch import epoch_sql, now_ms
+    write("INSERT INTO notifications (..., created_at_ms) VALUES (..., ?)", (..., now_ms()))
+    db.execute(epoch_sql("SELECT ... ORDER BY created_at_ms DESC"))
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+import structlog
+
+from db import get_db, get_pool
+from db_lock import BACKGROUND_TIMEOUT, get_write_lock
+
+# table -> {epoch column: TEXT column it is derived from}
+EPOCH_COLUMNS = {
+    "messages": {"created_at_ms": "created_at"},
+    "messages_archive": {"created_at_ms": "created_at"},
+    "profile_posts": {"created_at_ms": "created_at"},
+    "notifications": {"created_at_ms": "created_at"},
+    "direct_messages": {"created_at_ms": "created_at"},
+    "cat_memories": {"created_at_ms": "created_at", "expires_at_ms": "expires_at"},
+}
+
+# SQLite expression: TEXT datetime -> epoch milliseconds
+EPOCH_MS_SQL = "CAST(ROUND((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+
+BACKFILL_CHUNK = 5000  # Rows per backfill transaction
+BACKFILL_PAUSE = 0.05  # Seconds between chunks, leaves room for other writers
+READY_RECHECK = 5.0  # Seconds between schema_meta checks while the backfill runs
+
+BACKFILL_DONE_KEY = "epoch_backfill"  # schema_meta row written when the backfill finishes
+
+# TEXT-timestamp indexes replaced by the *_ms ones; dropped when the backfill finishes
+LEGACY_INDEXES = (
+    "idx_messages_created",
+    "idx_messages_room",
+    "idx_dm_conversation",
+    "idx_posts_type_created",
+    "idx_notif_user_unread",
+    "idx_notif_user_created",
+    "idx_cat_memories_pair",
+)
+
+_EPOCH_COLUMN = re.compile(r"\bcreated_at_ms\b")
+
+logger = structlog.get_logger(__name__)
+
+
+def now_ms() -> int:
+    """Current time in epoch milliseconds."""
+    return time.time_ns() // 1_000_000
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_epoch_columns(conn):
+    """
+    Add missing epoch columns to existing tables. ADD COLUMN only touches
+    the schema, so this is instant regardless of table size.
+    """
+    for table, columns in EPOCH_COLUMNS.items():
+        existing = _columns(conn, table)
+        if not existing:
+            continue  # Created fresh by SCHEMA
+        for column in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+
+
+def _pending(conn):
+    """(table, epoch column, source column) pairs that still have rows to fill."""
+    pending = []
+    for table, columns in EPOCH_COLUMNS.items():
+        existing = _columns(conn, table)
+        for column, source in columns.items():
+            if column not in existing or source not in existing:
+                continue
+            row = conn.execute(
+                f"SELECT 1 FROM {table} WHERE {column} IS NULL AND {source} IS NOT NULL LIMIT 1"  # nosec B608
+            ).fetchone()
+            if row:
+                pending.append((table, column, source))
+    return pending
+
+
+def backfill_epoch_columns(conn, chunk_size=BACKFILL_CHUNK, pause=BACKFILL_PAUSE, lock=None):
+    """
+    Fill epoch columns from their TEXT counterparts, chunk_size rows per
+    transaction (holding `lock`, a db_lock.WriteLock, when given).
+    Returns the number of rows updated.
+    """
+    total = 0
+    for table, column, source in _pending(conn):
+        sql = (
+            f"UPDATE {table} SET {column} = {EPOCH_MS_SQL.format(source)} "  # nosec B608
+            f"WHERE rowid IN (SELECT rowid FROM {table} "
+            f"WHERE {column} IS NULL AND {source} IS NOT NULL LIMIT ?)"
+        )
+        while True:
+            with lock.hold(timeout=BACKGROUND_TIMEOUT) if lock else nullcontext():
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    updated = conn.execute(sql, (chunk_size,)).rowcount
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+            total += updated
+            if updated < chunk_size:
+                break
+            time.sleep(pause)
+        logger.info("epoch_backfill_done", table=table, column=column)
+    return total
+
+
+def backfill_done(conn):
+    """True when schema_meta records a finished backfill."""
+    try:
+        row = conn.execute("SELECT value FROM schema_meta WHERE key = ?", (BACKFILL_DONE_KEY,)).fetchone()
+    except sqlite3.OperationalError:  # Database predates schema_meta
+        return False
+    return row is not None
+
+
+def finish_backfill(conn, lock=None):
+    """Drop the TEXT indexes the epoch ones replace and record that reads may switch over."""
+    with lock.hold(timeout=BACKGROUND_TIMEOUT) if lock else nullcontext():
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name in LEGACY_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_meta (key, value, updated_at) "
+                "VALUES (?, 'done', CURRENT_TIMESTAMP)",
+                (BACKFILL_DONE_KEY,),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+
+# =============================================================================
+# Read switch-over (one flag per database per process)
+# =============================================================================
+_ready = {}  # (pid, path) -> True once done, else monotonic time of the last check
+
+
+def epoch_reads_ready(path=None):
+    """True once the backfill is done and reads may order and filter on *_ms columns."""
+    if path is None:
+        path = get_pool().db_path
+    key = (os.getpid(), path)
+    state = _ready.get(key)
+    if state is True:
+        return True
+    if state is not None and time.monotonic() - state < READY_RECHECK:
+        return False
+    ready = backfill_done(get_db())
+    _ready[key] = True if ready else time.monotonic()
+    return ready
+
+
+def epoch_sql(sql):
+    """sql as written once the backfill is done; on the TEXT created_at columns until then."""
+    if epoch_reads_ready():
+        return sql
+    return _EPOCH_COLUMN.sub("created_at", sql)
+
+
+def start_backfill(db_path):
+    """Backfill in a background thread if any rows still need it."""
+    if db_path == ":memory:":
+        return None
+    key = (os.getpid(), db_path)
+    _ready.pop(key, None)  # A new file may have replaced the database at this path
+    # Opened here, used by the backfill thread
+    conn = sqlite3.connect(db_path, timeout=15.0, isolation_level=None, check_same_thread=False)
+    if backfill_done(conn):
+        conn.close()
+        _ready[key] = True
+        return None
+    if not _pending(conn):
+        try:
+            finish_backfill(conn, lock=get_write_lock(db_path))
+            _ready[key] = True
+        finally:
+            conn.close()
+        return None
+
+    def run():
+        try:
+            lock = get_write_lock(db_path)
+            rows = backfill_epoch_columns(conn, lock=lock)
+            finish_backfill(conn, lock=lock)
+            _ready[key] = True
+            logger.info("epoch_backfill_finished", rows=rows)
+        except sqlite3.Error as e:
+            logger.warning("epoch_backfill_failed", error=str(e))
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=run, name="db-epoch-backfill", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,229 @@
+"""
+Write Lock - db_lock.py
+
+SQLite allows one writer at a time. Instead of letting writers collide
+on SQLITE_BUSY and sleep-retry, every write path takes this lock first:
+
+- in-process: a FIFO lock, so threads get the database in arrival order
+- cross-process: an exclusive flock on <db>.write.lock, so gunicorn
+  workers (and the archiver, partition roller, epoch backfill) queue
+  behind each other instead of spinning on busy_timeout
+
+Acquisition is deadline-aware. A caller that cannot get the lock before
+its deadline gets WriteLockTimeout (an OperationalError, so existing
+handlers answer 503) instead of pinning a worker thread. Wait and hold
+times are recorded in histograms exported on /metrics.
+
+Usage:
+    from db_lock import hold_write_lock
+    with hold_write_lock(timeout=2.0):
+        db.execute("UPDATE ...")
+"""
+import fcntl
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+from flask import current_app
+
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+LOCK_TIMEOUT = 2.0  # Default seconds a request may wait for the write lock
+BACKGROUND_TIMEOUT = 30.0  # Archiver, partition roller, epoch backfill: no user is waiting
+FLOCK_POLL_MIN = 0.0005  # First cross-process poll interval (flock has no timeout)
+FLOCK_POLL_MAX = 0.005  # Poll interval cap; only the head of the in-process queue polls
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class WriteLockTimeout(sqlite3.OperationalError):
+    """
+    Raised when the write lock can't be acquired before the caller's deadline.
+    Subclasses OperationalError so existing handlers map it to a 503.
+    """
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus layout)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, seconds)] += 1
+            self._sum += seconds
+
+    def snapshot(self):
+        """{"buckets": [(le, cumulative count), ...], "sum": s, "count": n}"""
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, running = [], 0
+        for le, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append((le, running))
+        return {"buckets": cumulative, "sum": total, "count": running}
+
+
+class WriteLock:
+    """Fair in-process lock plus a cross-process flock for one database file."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock_path = f"{db_path}.write.lock"
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._owner = None
+        self._depth = 0
+        self._acquired_at = 0.0
+        self._file = open(self.lock_path, "a")
+        self.wait_seconds = Histogram()
+        self.hold_seconds = Histogram()
+        self._stats = {"acquired": 0, "timeouts": 0}
+
+    def held_by_current_thread(self):
+        return self._owner == threading.get_ident()
+
+    def _acquire_local(self, deadline):
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+            while self._owner is not None or self._waiters[0] is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()  # We may have been blocking the next in line
+                    return False
+                self._cond.wait(remaining)
+            self._waiters.popleft()
+            self._owner = threading.get_ident()
+            return True
+
+    def _release_local(self):
+        with self._cond:
+            self._owner = None
+            self._cond.notify_all()
+
+    def _acquire_file(self, deadline):
+        interval = FLOCK_POLL_MIN
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, FLOCK_POLL_MAX)
+
+    def acquire(self, deadline):
+        """Take the lock by `deadline` (time.monotonic()) or raise WriteLockTimeout. Reentrant."""
+        if self.held_by_current_thread():
+            self._depth += 1
+            return
+        start = time.monotonic()
+        acquired = self._acquire_local(deadline)
+        if acquired and not self._acquire_file(deadline):
+            self._release_local()
+            acquired = False
+        waited = time.monotonic() - start
+        self.wait_seconds.observe(waited)
+        if not acquired:
+            with self._cond:
+                self._stats["timeouts"] += 1
+            raise WriteLockTimeout(f"Database write lock not acquired within {waited:.3f}s")
+        self._depth = 1
+        self._acquired_at = time.monotonic()
+        with self._cond:
+            self._stats["acquired"] += 1
+
+    def release(self):
+        if not self.held_by_current_thread():
+            raise RuntimeError("Write lock released by a thread that does not hold it")
+        self._depth -= 1
+        if self._depth:
+            return
+        self.hold_seconds.observe(time.monotonic() - self._acquired_at)
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._release_local()
+
+    @contextmanager
+    def hold(self, timeout=None, deadline=None):
+        """Hold the lock for a block. deadline wins over timeout; default LOCK_TIMEOUT."""
+        if deadline is None:
+            deadline = time.monotonic() + (lock_timeout() if timeout is None else timeout)
+        self.acquire(deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["waiting"] = len(self._waiters)
+        snapshot["wait_seconds"] = self.wait_seconds.snapshot()
+        snapshot["hold_seconds"] = self.hold_seconds.snapshot()
+        return snapshot
+
+    def close(self):
+        self._file.close()
+
+
+# =============================================================================
+# Process-wide locks (one per database path, recreated after fork)
+# =============================================================================
+_locks = ProcessRegistry()
+
+
+def lock_timeout():
+    """Configured default wait in seconds (DB_WRITE_LOCK_TIMEOUT_MS)."""
+    try:
+        return current_app.config.get("DB_WRITE_LOCK_TIMEOUT_MS", LOCK_TIMEOUT * 1000) / 1000.0
+    except RuntimeError:
+        return LOCK_TIMEOUT
+
+
+def get_write_lock(path=None):
+    """Get the write lock for a database path in this process."""
+    if path is None:
+        from db import get_pool
+        path = get_pool().db_path
+    return _locks.get_or_create(path, lambda: WriteLock(path))
+
+
+@contextmanager
+def hold_write_lock(path=None, timeout=None, deadline=None):
+    """
+    Hold the database's write lock for a block. :memory: databases are
+    per-connection, so there is nothing to serialize.
+    """
+    from db import get_pool
+    if get_pool(path).db_path == ":memory:":
+        yield
+        return
+    with get_write_lock(path).hold(timeout=timeout, deadline=deadline):
+        yield
+
+
+def write_lock_stats():
+    """Counters and histograms for this process's most recently created lock, if any."""
+    lock = _locks.latest()
+    return lock.stats() if lock else None
+
+
+def shutdown_write_locks():
+    """Close this process's lock files (the files stay; other workers may hold them)."""
+    for lock in _locks.pop_all():
+        lock.close()
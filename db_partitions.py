@@ -0,0 +1,421 @@
+"""
+Message Partitions - db_partitions.py
+
+Recent chat history stays in the main database; older months are rolled
+into one database file per month (<db>.messages-YYYY-MM.db) that readers
+ATTACH on demand. The main file - and with it the page cache working
+set - stays the size of the last few months however long the service
+runs, and dropping or moving a month is a file operation.
+
+The message_partitions table in the main database is the manifest: one
+row per rolled month with its file and id range. Message ids are
+assigned in time order, so months are disjoint id ranges and paging
+by id walks the partitions in manifest order and then the main table.
+Rolling takes a month from messages_archive (see db_archive) as well,
+so the archive only ever holds months that are still hot.
+
+Rolling a month copies a chunk into the shard and commits it there
+first, then deletes it from main and updates the manifest in a second
+transaction. A crash in between leaves duplicate rows (never lost
+ones); readers skip them because each source is read past the last id
+already returned, and the next roll removes them.
+
+Usage:
+    from db_partitions import page_messages
+    rows = page_messages(get_db(), room_id=1, after_id=last_seen)
+"""
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import structlog
+
+from db import get_pool, open_connection
+from db_archive import archive_horizon, count_archived
+from db_lock import BACKGROUND_TIMEOUT, get_write_lock
+
+# =============================================================================
+# Settings
+# =============================================================================
+HOT_MONTHS = 2  # Current month plus the previous one stay in the main file
+ROLL_CHUNK = 5000  # Rows moved per transaction
+ROLL_PAUSE = 0.05  # Seconds between chunks, leaves room for other writers
+MAX_ATTACHED = 8  # Partitions attached per connection (SQLite's limit is 10)
+
+MESSAGE_COLUMNS = "id, user, content, room_id, created_at, created_at_ms, edited_at, deleted_at"
+
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {schema}.messages (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    content TEXT,
+    room_id INTEGER DEFAULT 1,
+    created_at TEXT,
+    created_at_ms INTEGER,
+    edited_at TEXT,
+    deleted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS {schema}.idx_messages_room_id ON messages(room_id, id);
+"""
+
+logger = structlog.get_logger(__name__)
+
+
+def schema_name(month):
+    """ATTACH name for a month ('2024-01' -> 'p_2024_01')."""
+    return "p_" + month.replace("-", "_")
+
+
+def partition_path(db_path, month):
+    """Shard file for a month, next to the main database."""
+    return f"{os.path.splitext(db_path)[0]}.messages-{month}.db"
+
+
+def _resolve(db_path, filename):
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), filename)
+
+
+def month_bounds(month):
+    """[start, end) of a 'YYYY-MM' month in epoch milliseconds (UTC)."""
+    year, mon = (int(part) for part in month.split("-"))
+    start = datetime(year, mon, 1, tzinfo=timezone.utc)
+    end = datetime(year + (mon == 12), mon % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def _month_of(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m")
+
+
+def _shift_month(month, delta):
+    year, mon = (int(part) for part in month.split("-"))
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+# =============================================================================
+# Reading
+# =============================================================================
+def list_partitions(db):
+    """Manifest rows, oldest first."""
+    return db.execute(
+        "SELECT month, filename, min_id, max_id, live_rows FROM message_partitions ORDER BY min_id"
+    ).fetchall()
+
+
+def attach(db, partition, db_path=None):
+    """ATTACH a partition to this connection if needed; returns its schema name."""
+    name = schema_name(partition["month"])
+    path = _resolve(db_path or get_pool().db_path, partition["filename"])
+    attached = {row[1]: row[2] for row in db.execute("PRAGMA database_list")}
+    if name in attached:
+        if os.path.abspath(attached[name]) == os.path.abspath(path):
+            return name
+        db.execute(f"DETACH DATABASE {name}")  # File was moved since
+        del attached[name]
+
+    # Make room: detach partitions beyond the per-connection budget
+    others = [n for n in attached if n.startswith("p_")]
+    for stale in others[: max(0, len(others) - MAX_ATTACHED + 1)]:
+        try:
+            db.execute(f"DETACH DATABASE {stale}")
+        except sqlite3.OperationalError:
+            pass  # Still in use by an open statement
+
+    db.execute("ATTACH DATABASE ? AS " + name, (path,))
+    return name
+
+
+def _select(db, table, clauses, params, cursor, newer, limit):
+    op, order = (">", "") if newer else ("<", " DESC")
+    sql = (
+        f"SELECT {MESSAGE_COLUMNS} FROM {table} "  # nosec B608
+        f"WHERE {' AND '.join(clauses)} AND id {op} ? ORDER BY id{order}"
+    )
+    args = params + [cursor]
+    if limit is not None:
+        sql += " LIMIT ?"
+        args.append(limit)
+    return db.execute(sql, args).fetchall()
+
+
+def _select_hot(db, room_id, clauses, params, cursor, newer, limit):
+    """
+    The main table, merged with messages_archive only when the page
+    reaches below the archive horizon (see db_archive).
+    """
+    rows = _select(db, "main.messages", clauses, params, cursor, newer, limit)
+    horizon = archive_horizon(db, room_id)
+    if horizon is None:
+        return rows
+    if newer:
+        needed = horizon > cursor
+    else:
+        needed = limit is None or len(rows) < limit or horizon > rows[-1]["id"]
+    if not needed:
+        return rows
+    archived = _select(db, "main.messages_archive", clauses, params, cursor, newer, limit)
+    merged = sorted(rows + archived, key=lambda r: r["id"], reverse=not newer)
+    return merged if limit is None else merged[:limit]
+
+
+def page_messages(db, room_id=None, after_id=None, before_id=None, limit=None, db_path=None):
+    """
+    Live messages across the hot table, the archive and every partition,
+    ascending by id.
+
+    after_id: messages newer than this id (oldest first, up to limit).
+    before_id: the `limit` messages just older than this id.
+    """
+    clauses, params = ["deleted_at IS NULL"], []
+    if room_id is not None:
+        clauses.append("room_id = ?")
+        params.append(room_id)
+
+    partitions = list_partitions(db)
+    sources = [(p, p["min_id"], p["max_id"]) for p in partitions] + [(None, None, None)]
+    newer = before_id is None
+    if not newer:
+        sources.reverse()  # Newest first until the page is full, then flip
+
+    rows = []
+    cursor = (after_id or 0) if newer else before_id
+    for partition, min_id, max_id in sources:
+        if newer and max_id is not None and max_id <= cursor:
+            continue
+        if not newer and min_id is not None and min_id >= cursor:
+            continue
+        remaining = None if limit is None else limit - len(rows)
+        if partition is None:
+            batch = _select_hot(db, room_id, clauses, params, cursor, newer, remaining)
+        else:
+            table = f"{attach(db, partition, db_path)}.messages"
+            batch = _select(db, table, clauses, params, cursor, newer, remaining)
+        rows.extend(batch)
+        if batch:
+            cursor = batch[-1]["id"]
+        if limit is not None and len(rows) >= limit:
+            break
+    if not newer:
+        rows.reverse()
+    return rows
+
+
+def count_live_messages(db):
+    """Live (not deleted) messages in the hot table, the archive and every partition."""
+    main = db.execute("SELECT COUNT(*) FROM messages WHERE deleted_at IS NULL").fetchone()[0]
+    rolled = db.execute("SELECT COALESCE(SUM(live_rows), 0) FROM message_partitions").fetchone()[0]
+    return main + count_archived(db) + rolled
+
+
+def find_message(db, message_id, db_path=None):
+    """
+    Locate a live message in the hot table, the archive or its partition.
+    Returns (table, row) where table is the qualified table name to
+    update, or (None, None).
+    """
+    for table in ("main.messages", "main.messages_archive"):
+        row = db.execute(
+            f"SELECT id, user, room_id FROM {table} WHERE id = ? AND deleted_at IS NULL",  # nosec B608
+            (message_id,),
+        ).fetchone()
+        if row:
+            return table, row
+    partition = db.execute(
+        "SELECT month, filename, min_id, max_id, live_rows FROM message_partitions "
+        "WHERE ? BETWEEN min_id AND max_id",
+        (message_id,),
+    ).fetchone()
+    if partition is None:
+        return None, None
+    table = f"{attach(db, partition, db_path)}.messages"
+    row = db.execute(
+        f"SELECT id, user, room_id FROM {table} WHERE id = ? AND deleted_at IS NULL",  # nosec B608
+        (message_id,),
+    ).fetchone()
+    return (table, row) if row else (None, None)
+
+
+def note_deleted(db, table, row):
+    """
+    Keep the live row counts in step after a soft delete of `row` (as
+    returned by find_message) in the archive or a partition.
+    """
+    if table == "main.messages_archive":
+        db.execute(
+            "UPDATE messages_archive_rooms SET live_rows = live_rows - 1 WHERE room_id = ?",
+            (row["room_id"] or 0,),
+        )
+    elif table.startswith("p_"):
+        month = table[2:9].replace("_", "-")
+        db.execute("UPDATE message_partitions SET live_rows = live_rows - 1 WHERE month = ?", (month,))
+
+
+# =============================================================================
+# Rolling / dropping
+# =============================================================================
+ROLL_SOURCES = ("main.messages", "main.messages_archive")
+
+
+def _roll_chunk(conn, name, source, month, filename, where, args, lock):
+    # 1. Copy into the shard (commits only the shard file)
+    conn.execute("BEGIN")
+    conn.execute(
+        f"INSERT OR IGNORE INTO {name}.messages ({MESSAGE_COLUMNS}) "  # nosec B608
+        f"SELECT {MESSAGE_COLUMNS} FROM {source} WHERE {where}",
+        args,
+    )
+    conn.execute("COMMIT")
+
+    # 2. Remove from main and publish the range (commits only main)
+    with lock.hold(timeout=BACKGROUND_TIMEOUT):
+        conn.execute("BEGIN IMMEDIATE")
+        if source == "main.messages_archive":
+            # Rolled rows no longer count towards the archive
+            per_room = conn.execute(
+                f"SELECT COUNT(*), COALESCE(room_id, 0) FROM {source} "  # nosec B608
+                f"WHERE {where} AND deleted_at IS NULL GROUP BY 2",
+                args,
+            ).fetchall()
+            conn.executemany(
+                "UPDATE messages_archive_rooms SET live_rows = live_rows - ? WHERE room_id = ?", per_room
+            )
+        deleted = conn.execute(f"DELETE FROM {source} WHERE {where}", args).rowcount  # nosec B608
+        min_id, max_id, live = conn.execute(
+            f"SELECT MIN(id), MAX(id), COALESCE(SUM(deleted_at IS NULL), 0) FROM {name}.messages"  # nosec B608
+        ).fetchone()
+        if min_id is not None:
+            conn.execute(
+                """INSERT INTO message_partitions (month, filename, min_id, max_id, live_rows)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(month) DO UPDATE SET
+                       min_id = excluded.min_id, max_id = excluded.max_id,
+                       live_rows = excluded.live_rows, rolled_at = CURRENT_TIMESTAMP""",
+                (month, filename, min_id, max_id, live),
+            )
+        conn.execute("COMMIT")
+    return deleted
+
+
+def _roll_month(conn, db_path, month, chunk_size, pause, lock):
+    """Move a month from the hot table and the archive into its shard."""
+    start, end = month_bounds(month)
+    path = partition_path(db_path, month)
+    name = schema_name(month)
+    conn.execute("ATTACH DATABASE ? AS " + name, (path,))
+    try:
+        conn.executescript(PARTITION_SCHEMA.format(schema=name))
+        moved = 0
+        for source in ROLL_SOURCES:
+            while True:
+                bound = conn.execute(
+                    f"SELECT id FROM {source} WHERE created_at_ms >= ? AND created_at_ms < ? "  # nosec B608
+                    "ORDER BY id LIMIT 1 OFFSET ?",
+                    (start, end, chunk_size - 1),
+                ).fetchone()
+                high = bound[0] if bound else None
+                where = "created_at_ms >= ? AND created_at_ms < ?" + ("" if high is None else " AND id <= ?")
+                args = (start, end) if high is None else (start, end, high)
+                moved += _roll_chunk(conn, name, source, month, os.path.basename(path), where, args, lock)
+                if high is None:
+                    break
+                time.sleep(pause)
+        return moved
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.execute(f"DETACH DATABASE {name}")
+
+
+def _oldest_before(conn, cutoff):
+    """Oldest created_at_ms before cutoff still in the main file, or None."""
+    found = [
+        conn.execute(
+            f"SELECT MIN(created_at_ms) FROM {source} WHERE created_at_ms < ?", (cutoff,)  # nosec B608
+        ).fetchone()[0]
+        for source in ROLL_SOURCES
+    ]
+    found = [ms for ms in found if ms is not None]
+    return min(found) if found else None
+
+
+def roll_partitions(db_path=None, hot_months=HOT_MONTHS, now_ms=None, chunk_size=ROLL_CHUNK, pause=ROLL_PAUSE):
+    """
+    Move every month older than the newest `hot_months` out of the main
+    file (hot table and archive) into its partition file.
+    Returns {month: rows moved}.
+    """
+    db_path = db_path or get_pool().db_path
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    cutoff, _ = month_bounds(_shift_month(_month_of(now_ms), -(hot_months - 1)))
+
+    conn = open_connection(db_path, get_pool(db_path).pragmas)
+    try:
+        moved = {}
+        while True:
+            # Next month that still has rows in main (rolled ones no longer do)
+            oldest = _oldest_before(conn, cutoff)
+            if oldest is None or _month_of(oldest) in moved:
+                break
+            month = _month_of(oldest)
+            moved[month] = _roll_month(conn, db_path, month, chunk_size, pause, get_write_lock(db_path))
+            logger.info("message_partition_rolled", month=month, rows=moved[month])
+        return moved
+    finally:
+        conn.close()
+
+
+def drop_partition(month, db_path=None):
+    """Forget a month and delete its file. Its messages are gone for good."""
+    db_path = db_path or get_pool().db_path
+    conn = open_connection(db_path, get_pool(db_path).pragmas)
+    try:
+        with get_write_lock(db_path).hold(timeout=BACKGROUND_TIMEOUT):
+            row = conn.execute("SELECT filename FROM message_partitions WHERE month = ?", (month,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM message_partitions WHERE month = ?", (month,))
+    finally:
+        conn.close()
+    # Pooled connections may still have it attached: retire them so the file is released
+    get_pool(db_path).recycle()
+    os.unlink(_resolve(db_path, row["filename"]))
+    return True
+
+
+def move_partition(month, dest_dir, db_path=None):
+    """Move a month's file (e.g. to cheaper storage) and repoint the manifest."""
+    db_path = db_path or get_pool().db_path
+    conn = open_connection(db_path, get_pool(db_path).pragmas)
+    try:
+        row = conn.execute("SELECT filename FROM message_partitions WHERE month = ?", (month,)).fetchone()
+        if row is None:
+            return None
+        source = _resolve(db_path, row["filename"])
+        target = os.path.join(os.path.abspath(dest_dir), os.path.basename(source))
+        # Copy, repoint, then remove: readers never see a missing file
+        shutil.copy2(source, target)
+        with get_write_lock(db_path).hold(timeout=BACKGROUND_TIMEOUT):
+            moved = conn.execute(
+                "UPDATE message_partitions SET filename = ? WHERE month = ? AND filename = ?",
+                (target, month, row["filename"]),
+            ).rowcount
+            # Dropped or moved while we copied; our copy is garbage unless a move put it there too
+            orphan = not moved and conn.execute(
+                "SELECT 1 FROM message_partitions WHERE filename = ?", (target,)
+            ).fetchone() is None
+    finally:
+        conn.close()
+    if not moved:
+        if orphan:
+            os.unlink(target)
+        return None
+    # Connections that attached the old path detach it on their next attach(); pooled
+    # ones are retired so none keeps the unlinked file open
+    get_pool(db_path).recycle()
+    os.unlink(source)
+    return target
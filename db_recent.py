@@ -0,0 +1,245 @@
+"""
+Recent Messages - db_recent.py
+
+Every socket client asks for backfill when it joins a room, so a deploy
+(all clients reconnecting at once) used to turn into one full history
+read per client. Backfill is now cursor-paged with a hard cap, and each
+room's newest RING_SIZE messages are kept in a process-local ring:
+
+- handle_send and POST /send publish each insert, edit and delete on
+  the socket bus, and every worker (this one included) applies it to
+  its own ring, in id order
+- a cold or expired ring is seeded with one LIMIT query; concurrent
+  misses for the same room wait for that seed instead of each querying
+- pages reaching below the ring's floor go to page_messages
+
+Like every bus topic, changes published while a worker is reconnecting
+are lost, so rings still expire after RING_TTL seconds and are re-seeded
+from the database; that bounds how stale a backfill page can be.
+
+Usage:
+    from db_recent import backfill_page, remember
+    rows, has_more = backfill_page(db, room_id, after_id=0)
+    remember(row)   # After inserting a message
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+from db import get_pool
+from db_partitions import page_messages
+from process_registry import ProcessRegistry
+from socket_bus import publish, subscribe
+
+# =============================================================================
+# Settings
+# =============================================================================
+RING_SIZE = 200  # Newest messages cached per room
+RING_TTL = 60.0  # Seconds before a ring is re-seeded (catches bus messages lost in a reconnect)
+BACKFILL_LIMIT = 50  # Default page size
+BACKFILL_MAX = 200  # Hard cap on any page, whatever the client asks for
+
+RECENT_TOPIC = "recent_messages"  # Socket bus topic for inserts, edits and deletes
+
+LATEST = 2 ** 62  # before_id that pages back from the newest message
+
+FIELDS = ("id", "user", "content", "created_at", "room_id", "edited_at")
+
+
+def clamp_limit(limit):
+    """Page size between 1 and BACKFILL_MAX (BACKFILL_LIMIT when unset)."""
+    if not limit:
+        return BACKFILL_LIMIT
+    return max(1, min(int(limit), BACKFILL_MAX))
+
+
+class _Ring:
+    __slots__ = ("messages", "floor", "seeded_at", "seed_lock")
+
+    def __init__(self):
+        self.messages = deque(maxlen=RING_SIZE)
+        self.floor = None  # Every live message of the room with id > floor is cached; None = cold
+        self.seeded_at = 0.0
+        self.seed_lock = threading.Lock()
+
+
+class RecentMessages:
+    """Per-room rings of the newest messages for one database."""
+
+    def __init__(self, db_path, ring_size=RING_SIZE, ttl=RING_TTL):
+        self.db_path = db_path
+        self.ring_size = ring_size
+        self.ttl = ttl
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "seeds": 0}
+
+    def _ring(self, room_id):
+        with self._lock:
+            ring = self._rings.get(room_id)
+            if ring is None:
+                ring = self._rings[room_id] = _Ring()
+            return ring
+
+    def _warm(self, ring):
+        return ring.floor is not None and time.monotonic() - ring.seeded_at < self.ttl
+
+    def _seed(self, db, room_id, ring):
+        with ring.seed_lock:
+            if self._warm(ring):
+                return  # Another caller seeded it while we waited
+            rows = page_messages(db, room_id=room_id, before_id=LATEST, limit=self.ring_size)
+            with self._lock:
+                seeded = [{k: r[k] for k in FIELDS} for r in rows]
+                newest = seeded[-1]["id"] if seeded else 0
+                # Keep sends remembered while the seed query was running
+                seeded.extend(m for m in ring.messages if m["id"] > newest)
+                ring.messages = deque(seeded, maxlen=self.ring_size)
+                # Remembered sends may have pushed the oldest seeded rows out
+                full = len(ring.messages) == self.ring_size
+                ring.floor = ring.messages[0]["id"] - 1 if full else 0
+                ring.seeded_at = time.monotonic()
+                self._stats["seeds"] += 1
+
+    def page(self, db, room_id, after_id=None, before_id=None, limit=None):
+        """
+        One page of live messages, ascending by id. Returns (rows, has_more).
+
+        after_id: messages newer than the cursor; has_more means newer remain.
+        before_id: messages just older than the cursor; has_more means older remain.
+        Neither (or after_id=0): the newest page; has_more means older remain.
+        """
+        limit = clamp_limit(limit)
+        if not after_id and before_id is None:
+            before_id = LATEST
+        ring = self._ring(room_id)
+        if not self._warm(ring):
+            self._seed(db, room_id, ring)
+
+        with self._lock:
+            cached = list(ring.messages)
+            floor = ring.floor
+        if after_id:
+            if floor is not None and after_id >= floor:
+                newer = [m for m in cached if m["id"] > after_id]
+                self._hit(True)
+                return newer[:limit], len(newer) > limit
+        else:
+            older = [m for m in cached if m["id"] < before_id]
+            if floor is not None and (len(older) >= limit or floor == 0):
+                self._hit(True)
+                return older[-limit:], len(older) > limit or floor > 0
+
+        self._hit(False)
+        rows = page_messages(db, room_id=room_id, after_id=after_id or None,
+                             before_id=None if after_id else before_id, limit=limit + 1)
+        rows = [{k: r[k] for k in FIELDS} for r in rows]
+        if len(rows) <= limit:
+            return rows, False
+        return (rows[:limit], True) if after_id else (rows[1:], True)
+
+    def _hit(self, hit):
+        with self._lock:
+            self._stats["hits" if hit else "misses"] += 1
+
+    def remember(self, row):
+        """
+        Add a just-inserted message to its room's ring (if the ring is warm),
+        in id order: concurrent sends can commit and arrive out of order.
+        """
+        message = {k: row[k] if k in row.keys() else None for k in FIELDS}
+        ring = self._ring(message["room_id"])
+        with self._lock:
+            if ring.floor is None or message["id"] <= ring.floor:
+                return  # Cold, or below what the ring covers: the database has it
+            ids = [m["id"] for m in ring.messages]
+            pos = bisect.bisect_left(ids, message["id"])
+            if pos < len(ids) and ids[pos] == message["id"]:
+                return  # Already seeded from the database
+            if len(ring.messages) == ring.messages.maxlen:
+                if pos == 0:
+                    ring.floor = message["id"]  # Older than everything kept
+                    return
+                ring.floor = ring.messages.popleft()["id"]  # The oldest entry falls off
+                pos -= 1
+            ring.messages.insert(pos, message)
+
+    def update(self, message_id, content=None, deleted=False):
+        """Apply an edit (new content) or a delete to any cached copy."""
+        with self._lock:
+            for ring in self._rings.values():
+                for i, message in enumerate(ring.messages):
+                    if message["id"] != message_id:
+                        continue
+                    if deleted:
+                        del ring.messages[i]
+                    else:
+                        edited_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+                        ring.messages[i] = {**message, "content": content, "edited_at": edited_at}
+                    return
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["rooms"] = len(self._rings)
+            snapshot["cached"] = sum(len(r.messages) for r in self._rings.values())
+        return snapshot
+
+
+# =============================================================================
+# Process-wide caches (one per database path, recreated after fork)
+# =============================================================================
+_caches = ProcessRegistry()
+
+
+def get_recent(path=None):
+    """Get the recent-message cache for a database path in this process."""
+    if path is None:
+        path = get_pool().db_path
+    return _caches.get_or_create(path, lambda: RecentMessages(path))
+
+
+def backfill_page(db, room_id, after_id=None, before_id=None, limit=None):
+    """A capped page of a room's history, from the ring when it covers the page."""
+    return get_recent().page(db, room_id, after_id=after_id, before_id=before_id, limit=limit)
+
+
+def remember(row):
+    """Call after inserting a message: adds it to its room's ring on every worker."""
+    message = {k: row[k] if k in row.keys() else None for k in FIELDS}
+    publish(RECENT_TOPIC, {"path": get_pool().db_path, "message": message})
+
+
+def forget(message_id):
+    """Call after deleting a message: drops it from every worker's rings."""
+    publish(RECENT_TOPIC, {"path": get_pool().db_path, "id": message_id, "deleted": True})
+
+
+def note_edited(message_id, content):
+    """Call after editing a message: updates every worker's cached copy."""
+    publish(RECENT_TOPIC, {"path": get_pool().db_path, "id": message_id, "content": content})
+
+
+def _apply(payload):
+    cache = _caches.get(payload["path"])
+    if cache is None:
+        return  # No backfill served here yet: the first one seeds from the database
+    if "message" in payload:
+        cache.remember(payload["message"])
+    else:
+        cache.update(payload["id"], content=payload.get("content"), deleted=payload.get("deleted", False))
+
+
+subscribe(RECENT_TOPIC, _apply)
+
+
+def recent_stats():
+    """Counters for this process's most recently created cache, if any."""
+    cache = _caches.latest()
+    return cache.stats() if cache else None
+
+
+def shutdown_recent():
+    """Drop this process's caches (the database they mirror is going away)."""
+    _caches.pop_all()
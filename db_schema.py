@@ -34,7 +34,6 @@ reports = Table(
     Column("updated_at", Text),
 )
 Index("idx_reports_reporter", reports.c.reporter_id)
-Index("idx_reports_reporter", reports.c.reporter_id)
 Index("idx_reports_status", reports.c.status)
 
 # Admin Operations Audit Log
@@ -62,12 +61,59 @@ messages = Table(
     Column("content", Text),
     Column("room_id", Integer, server_default="1"),
     Column("created_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+    Column("created_at_ms", Integer),
     Column("edited_at", Text),
     Column("deleted_at", Text),
 )
-Index("idx_messages_created", messages.c.created_at)
+Index("idx_messages_created_ms", messages.c.created_at_ms)
 Index("idx_messages_user", messages.c.user)
-Index("idx_messages_room", messages.c.room_id, messages.c.created_at)
+Index("idx_messages_room_created_ms", messages.c.room_id, messages.c.created_at_ms)
+Index("idx_messages_room_id", messages.c.room_id, messages.c.id)
+Index("idx_messages_deleted", messages.c.id, sqlite_where=messages.c.deleted_at.isnot(None))
+
+# Schema fingerprint (db.init_db skips DDL when it matches)
+schema_meta = Table(
+    "schema_meta",
+    metadata,
+    Column("key", Text, primary_key=True),
+    Column("value", Text, nullable=False),
+    Column("updated_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+)
+
+# Row counts at each table's last ANALYZE (see db_analyze)
+table_row_stats = Table(
+    "table_row_stats",
+    metadata,
+    Column("tbl", Text, primary_key=True),
+    Column("row_count", Integer, nullable=False),
+    Column("analyzed_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+)
+
+# Idempotency keys (see idempotency.py): replayed results of keyed creates
+idempotency_keys = Table(
+    "idempotency_keys",
+    metadata,
+    Column("scope", Text, primary_key=True),
+    Column("owner", Text, primary_key=True),
+    Column("key", Text, primary_key=True),
+    Column("status", Integer),  # NULL while the first request is in flight
+    Column("response", LargeBinary),
+    Column("created_at_ms", Integer, nullable=False),
+    sqlite_with_rowid=False,
+)
+Index("idx_idempotency_created_ms", idempotency_keys.c.created_at_ms)
+
+# Message Partitions (rolled months, see db_partitions)
+message_partitions = Table(
+    "message_partitions",
+    metadata,
+    Column("month", Text, primary_key=True),
+    Column("filename", Text, nullable=False),
+    Column("min_id", Integer),
+    Column("max_id", Integer),
+    Column("live_rows", Integer, server_default="0"),
+    Column("rolled_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+)
 
 # Messages Archive Table (Cold Storage)
 messages_archive = Table(
@@ -78,11 +124,23 @@ messages_archive = Table(
     Column("content", Text),
     Column("room_id", Integer),
     Column("created_at", Text),
+    Column("created_at_ms", Integer),
+    Column("edited_at", Text),
+    Column("deleted_at", Text),
     Column("archived_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
 )
-Index("idx_archive_created", messages_archive.c.created_at)
+Index("idx_archive_created_ms", messages_archive.c.created_at_ms)
 Index("idx_archive_room", messages_archive.c.room_id)
 
+# Per-room archive counts and horizon (see db_archive)
+messages_archive_rooms = Table(
+    "messages_archive_rooms",
+    metadata,
+    Column("room_id", Integer, primary_key=True),
+    Column("live_rows", Integer, server_default="0"),
+    Column("horizon_id", Integer),
+)
+
 # Profiles Table
 profiles = Table(
     "profiles",
@@ -123,11 +181,13 @@ direct_messages = Table(
     Column("content_iv", LargeBinary, nullable=False),
     Column("content_tag", LargeBinary, nullable=False),
     Column("created_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+    Column("created_at_ms", Integer),
     Column("read_at", Text),
     Column("deleted_by_sender", Integer, server_default="0"),
     Column("deleted_by_recipient", Integer, server_default="0"),
 )
-Index("idx_dm_conversation", direct_messages.c.conversation_id, direct_messages.c.created_at)
+Index("idx_dm_conversation_ms", direct_messages.c.conversation_id, direct_messages.c.created_at_ms)
+Index("idx_dm_conversation_id", direct_messages.c.conversation_id, direct_messages.c.id)
 Index("idx_dm_recipient", direct_messages.c.recipient_id, direct_messages.c.read_at)
 Index("idx_dm_sender", direct_messages.c.sender_id)
 
@@ -194,9 +254,11 @@ profile_posts = Table(
     Column("style_payload", Text),
     Column("display_order", Integer, nullable=False, server_default="0"),
     Column("created_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+    Column("created_at_ms", Integer),
     Column("updated_at", Text),
 )
 Index("idx_posts_profile", profile_posts.c.profile_id, profile_posts.c.display_order)
+Index("idx_posts_type_created_ms", profile_posts.c.module_type, profile_posts.c.created_at_ms)
 
 # Friends Table
 friends = Table(
@@ -209,8 +271,8 @@ friends = Table(
     Column("created_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
     UniqueConstraint("follower_id", "following_id"),
 )
-Index("idx_friends_follower", friends.c.follower_id)
-Index("idx_friends_following", friends.c.following_id)
+Index("idx_friends_follower_created", friends.c.follower_id, friends.c.created_at)
+Index("idx_friends_following_created", friends.c.following_id, friends.c.created_at)
 
 # Notifications Table
 notifications = Table(
@@ -225,8 +287,10 @@ notifications = Table(
     Column("actor_id", Integer, ForeignKey("users.id")),
     Column("is_read", Integer, server_default="0"),
     Column("created_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
+    Column("created_at_ms", Integer),
 )
-Index("idx_notif_user", notifications.c.user_id, notifications.c.is_read)
+Index("idx_notif_user_unread_ms", notifications.c.user_id, notifications.c.is_read, notifications.c.created_at_ms)
+Index("idx_notif_user_created_ms", notifications.c.user_id, notifications.c.created_at_ms)
 
 # Rooms Table
 rooms = Table(
@@ -238,6 +302,7 @@ rooms = Table(
     Column("room_type", Text, server_default="text"),
     Column("is_default", Integer, server_default="0"),
     Column("created_by", Integer, ForeignKey("users.id")),
+    Column("retention_days", Integer),
     Column("created_at", Text, server_default=sa.text("CURRENT_TIMESTAMP")),
 )
 
@@ -308,7 +373,10 @@ cat_memories = Table(
     Column("opinion_modifier", Float, server_default="0.0"),
     Column("created_at", sa.TIMESTAMP, server_default=sa.text("CURRENT_TIMESTAMP")),
     Column("expires_at", sa.TIMESTAMP),
+    Column("created_at_ms", Integer),
+    Column("expires_at_ms", Integer),
 )
+Index("idx_cat_memories_pair_ms", cat_memories.c.source_cat_id, cat_memories.c.target_user_id, cat_memories.c.expires_at_ms)
 
 # Cat States
 cat_states = Table(
@@ -0,0 +1,407 @@
+"""
+Read-Only Snapshot - db_snapshot.py
+
+Heavy reads (admin counts, search LIKE scans, full backfills) don't need
+up-to-the-millisecond data, but on the primary they hold a WAL read
+snapshot for as long as they run, which stops checkpoints from
+completing while chat keeps writing. Functions marked @read_only_heavy
+read from a copy instead.
+
+One process per host (the holder of <db>.snapshot.lock) refreshes the
+copy with the sqlite3 backup API in a background thread and publishes
+it in <db>.snapshot; every other worker reads the same file rather than
+taking its own copy. A refresh is skipped when PRAGMA data_version shows
+no commits since the last one, and when a copy takes long enough that
+repeating it every interval would keep the primary busy, the next copy
+waits COPY_COST_RATIO times as long as that copy took. Each refresh
+writes a new immutable file and swaps it in; leases on the previous copy
+keep reading it until they are returned.
+
+Every lease carries a staleness bound (seconds since the primary was
+last known to match the copy). Requests that read from the snapshot get
+it in the X-Data-Staleness response header. When the copy is older than
+DB_SNAPSHOT_MAX_STALENESS_SECONDS, reads fall back to the primary.
+
+Usage:
+    from db_snapshot import read_only_heavy
+
+    @read_only_heavy
+    def search_posts(query):
+        return get_db().execute(...).fetchall()
+"""
+import atexit
+import functools
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import structlog
+from flask import current_app, g, has_app_context
+
+from db import PooledConnection, get_pool
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+REFRESH_INTERVAL = 5.0  # Seconds between refresh checks
+MAX_STALENESS = 30.0  # Older snapshots are not served
+POOL_SIZE = 8  # Idle connections kept per snapshot file
+COPY_COST_RATIO = 10  # Copies are at least this many times their duration apart
+
+logger = structlog.get_logger(__name__)
+
+
+class _Generation:
+    """One snapshot file and the connections reading it."""
+
+    def __init__(self, path, fresh_as_of):
+        self.path = path
+        self.fresh_as_of = fresh_as_of  # Wall-clock time the copy matched the primary
+        self.retired = False
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def get_connection(self):
+        """Idle or new connection, or None once this generation is retired."""
+        with self._lock:
+            if self.retired:
+                return None
+            if self._idle:
+                return self._idle.pop()
+            # immutable=1: the file never changes, so SQLite skips locking
+            try:
+                conn = sqlite3.connect(
+                    f"file:{self.path}?mode=ro&immutable=1",
+                    uri=True,
+                    check_same_thread=False,
+                    factory=PooledConnection,
+                )
+            except sqlite3.OperationalError:
+                # Removed by the refresher before this process saw the next copy
+                self.retired = True
+                return None
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        return conn
+
+    def return_connection(self, conn):
+        """Same contract as ConnectionPool.return_connection (used by close_db)."""
+        with self._lock:
+            if not self.retired and len(self._idle) < POOL_SIZE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def retire(self):
+        """Close idle connections; leased ones finish first. The refresher removes the file."""
+        with self._lock:
+            self.retired = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class SnapshotReplica:
+    """
+    Read-only copy of a database shared by the workers on a host. Only
+    the holder of <db>.snapshot.lock copies; the others follow the copy
+    it publishes in <db>.snapshot and retry the election each interval.
+    """
+
+    def __init__(self, db_path, refresh_interval=REFRESH_INTERVAL, max_staleness=MAX_STALENESS):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self._pointer = f"{db_path}.snapshot"
+        self._prefix = f"{db_path}.snapshot-{os.getpid()}"
+        self._counter = 0
+        self._current = None
+        self._version = None
+        self._source = None
+        self._lock_file = None
+        self._next_copy_at = 0.0  # Monotonic time before which copies are deferred
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()  # Guards _stats
+        self._stopping = threading.Event()
+        self._stats = {"leader": False, "refreshes": 0, "adopted": 0, "skipped": 0, "deferred": 0,
+                       "failed": 0, "leases": 0, "fallbacks": 0, "refresh_seconds": 0.0}
+        self._thread = threading.Thread(
+            target=self._run, name="db-snapshot", daemon=True
+        )
+        self._thread.start()
+
+    def _elect(self):
+        """Try to become this host's refresher. Leadership is kept until stop()."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.db_path}.snapshot.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        with self._lock:
+            self._stats["leader"] = True
+        logger.info("snapshot_refresher_elected", db=self.db_path, pid=os.getpid())
+        return True
+
+    def _read_pointer(self):
+        try:
+            with open(self._pointer) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, path, fresh_as_of):
+        """Point every worker at `path`, then remove copies none of them should open."""
+        previous = self._read_pointer()
+        tmp = f"{self._pointer}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"path": path, "fresh_as_of": fresh_as_of}, f)
+        os.replace(tmp, self._pointer)
+        if previous is not None and previous.get("path") == path:
+            return
+        # The previous copy stays until the next one: workers that haven't
+        # read the pointer yet still open it. Open connections outlive the unlink.
+        keep = {path, previous and previous.get("path")}
+        for stale in glob.glob(f"{glob.escape(self.db_path)}.snapshot-*.db"):
+            if stale not in keep:
+                try:
+                    os.unlink(stale)
+                except OSError:
+                    pass
+
+    def _adopt(self):
+        """Follow the copy published by the refresher. Returns True on a switch."""
+        published = self._read_pointer()
+        if published is None:
+            return False
+        current = self._current
+        if current is not None and current.path == published["path"]:
+            current.fresh_as_of = published["fresh_as_of"]
+            return False
+        self._current = _Generation(published["path"], published["fresh_as_of"])
+        with self._lock:
+            self._stats["adopted"] += 1
+        if current is not None:
+            current.retire()
+        return True
+
+    def refresh(self, force=False):
+        """
+        Bring the copy up to date. Returns True if this process moved to a
+        new copy (taken here as the refresher, or published by it).
+        """
+        with self._refresh_lock:
+            if not self._elect():
+                return self._adopt()
+            if self._source is None:
+                self._source = sqlite3.connect(self.db_path, timeout=15.0, check_same_thread=False)
+            started = time.time()
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            current = self._current
+            if current is not None and not force:
+                if version == self._version:
+                    current.fresh_as_of = started
+                    self._publish(current.path, started)
+                    with self._lock:
+                        self._stats["skipped"] += 1
+                    return False
+                if time.monotonic() < self._next_copy_at:
+                    with self._lock:
+                        self._stats["deferred"] += 1
+                    return False
+
+            self._counter += 1
+            path = f"{self._prefix}-{self._counter}.db"
+            copy_started = time.monotonic()
+            dest = sqlite3.connect(path)
+            try:
+                # One step: the read snapshot on the primary lasts only as
+                # long as the page copy, and concurrent commits can't force
+                # the backup to restart.
+                self._source.backup(dest)
+                dest.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                dest.close()
+            elapsed = time.monotonic() - copy_started
+            # A copy that would take more than 1/COPY_COST_RATIO of the
+            # interval stretches the time until the next one instead
+            if elapsed * COPY_COST_RATIO > self.refresh_interval:
+                self._next_copy_at = copy_started + elapsed * COPY_COST_RATIO
+            else:
+                self._next_copy_at = 0.0
+
+            self._publish(path, started)
+            self._current = _Generation(path, started)
+            self._version = version
+            with self._lock:
+                self._stats["refreshes"] += 1
+                self._stats["refresh_seconds"] += elapsed
+        if current is not None:
+            current.retire()
+        return True
+
+    def staleness(self):
+        """Seconds since the copy last matched the primary (None before the first copy)."""
+        current = self._current
+        if current is None:
+            return None
+        return max(time.time() - current.fresh_as_of, 0.0)
+
+    def _follow(self):
+        """After a failed open: switch to the refresher's newer copy, if there is one."""
+        if self._lock_file is not None:
+            return False
+        with self._refresh_lock:
+            return self._adopt()
+
+    def lease(self):
+        """
+        Lease a snapshot connection. Returns (conn, staleness_seconds), or
+        None when there is no copy yet or it is too stale to serve.
+        """
+        while True:
+            current = self._current
+            staleness = None if current is None else max(time.time() - current.fresh_as_of, 0.0)
+            if staleness is None or staleness > self.max_staleness:
+                with self._lock:
+                    self._stats["fallbacks"] += 1
+                return None
+            conn = current.get_connection()
+            if conn is not None:
+                break
+            if self._current is current and not self._follow():
+                with self._lock:
+                    self._stats["fallbacks"] += 1
+                return None
+            # Swapped out by a refresh in the meantime; take the new copy
+
+        with self._lock:
+            self._stats["leases"] += 1
+        conn.queries = 0
+        return conn, staleness
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["staleness_seconds"] = self.staleness()
+        return snapshot
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join(5.0)
+        with self._refresh_lock:
+            current, self._current = self._current, None
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+            if self._lock_file is not None:
+                # Removed before the flock is released so the next refresher's
+                # files are never touched; open leases keep reading theirs
+                for path in [self._pointer, *glob.glob(f"{glob.escape(self.db_path)}.snapshot-*.db")]:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                self._lock_file.close()
+                self._lock_file = None
+        if current is not None:
+            current.retire()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+            except (sqlite3.Error, OSError) as e:
+                with self._lock:
+                    self._stats["failed"] += 1
+                logger.warning("snapshot_refresh_failed", db=self.db_path, error=str(e))
+            self._stopping.wait(self.refresh_interval)
+
+
+# =============================================================================
+# Process-wide replicas (one per database path, recreated after fork)
+# =============================================================================
+_replicas = ProcessRegistry()
+
+
+def snapshot_enabled(path):
+    if path == ":memory:":
+        return False
+    try:
+        return current_app.config.get("DB_SNAPSHOT_ENABLED", False)
+    except RuntimeError:
+        return False
+
+
+def get_snapshot(path=None):
+    """Get or start the snapshot replica for a database path in this process."""
+    pool = get_pool(path)
+
+    def create():
+        try:
+            cfg = current_app.config
+            interval = cfg.get("DB_SNAPSHOT_REFRESH_SECONDS", REFRESH_INTERVAL)
+            max_staleness = cfg.get("DB_SNAPSHOT_MAX_STALENESS_SECONDS", MAX_STALENESS)
+        except RuntimeError:
+            interval, max_staleness = REFRESH_INTERVAL, MAX_STALENESS
+        return SnapshotReplica(pool.db_path, refresh_interval=interval, max_staleness=max_staleness)
+
+    return _replicas.get_or_create(pool.db_path, create)
+
+
+def get_snapshot_db():
+    """
+    Snapshot connection for the current request, or None when snapshots
+    are disabled or too stale (callers then use the primary).
+    """
+    if "snapshot_db" in g:
+        return g.snapshot_db
+    path = get_pool().db_path
+    if not snapshot_enabled(path):
+        return None
+    leased = get_snapshot(path).lease()
+    if leased is None:
+        return None
+    g.snapshot_db, g.snapshot_staleness = leased
+    return g.snapshot_db
+
+
+def read_only_heavy(func):
+    """
+    Route get_db() inside the decorated function to the read-only snapshot.
+    Only for functions that never write.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not has_app_context():
+            return func(*args, **kwargs)
+        previous = g.get("read_only_heavy", False)
+        g.read_only_heavy = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            g.read_only_heavy = previous
+    return wrapper
+
+
+def snapshot_stats():
+    """Counters for this process's most recently started replica, if any."""
+    replica = _replicas.latest()
+    return replica.stats() if replica else None
+
+
+def shutdown_snapshots():
+    """Stop every replica started by this process; the refresher also removes the shared copy."""
+    for replica in _replicas.pop_all():
+        replica.stop()
+
+
+atexit.register(shutdown_snapshots)
@@ -0,0 +1,309 @@
+"""
+Write-Behind Queue - db_writebehind.py
+
+For side-effect writes nobody reads back on the same request (audit log
+rows, cat memories, follow notifications). Callers enqueue SQL + params
+and return immediately; a background flusher applies the backlog through
+the group-commit writer every few hundred milliseconds, grouping runs of
+the same statement into executemany calls.
+
+Durability: every entry is appended to the queue's spool file
+(<db>.wb-<pid>-<token>.log, unique per queue so a restarted worker that
+reuses a PID never adopts a dead one's spool) before enqueue returns.
+After each flush the spool is rewritten to hold only unapplied entries,
+through a fsynced temp file and os.replace, so a crash mid-rewrite
+leaves the old or the new spool, never a truncated one. If a worker
+dies, the next worker to start on the same database replays its spool.
+Delivery is at-least-once: a crash between COMMIT and the spool rewrite
+replays that batch.
+
+Usage:
+    from db_writebehind import write_behind
+    write_behind("INSERT INTO admin_ops (admin_id, action) VALUES (?, ?)", (1, "ban"))
+"""
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+import structlog
+from flask import current_app
+
+from db import get_pool
+from db_writer import get_writer, write, group_commit_enabled
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+MAX_LAG = 0.25  # Seconds an entry may wait before it is flushed
+MAX_BATCH = 1000  # Entries that trigger an early flush
+
+logger = structlog.get_logger(__name__)
+
+_live_spools = set()  # Spool paths of this process's running queues
+
+
+def _spool_name(db_path):
+    return f"{db_path}.wb-{os.getpid()}-{uuid.uuid4().hex[:12]}.log"
+
+
+def _fsync_dir(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _apply_batch(conn, batch):
+    """
+    Apply entries in order, grouping consecutive identical statements.
+    Falls back to one SAVEPOINT per entry if the fast path hits a bad row,
+    so a single constraint failure only drops that row.
+    """
+    conn.execute("SAVEPOINT write_behind")
+    try:
+        start = 0
+        while start < len(batch):
+            sql = batch[start][0]
+            end = start
+            while end < len(batch) and batch[end][0] == sql:
+                end += 1
+            conn.executemany(sql, [params for _, params in batch[start:end]])
+            start = end
+        conn.execute("RELEASE write_behind")
+        return 0
+    except sqlite3.OperationalError:
+        # Lock/IO trouble: let the whole batch be retried later
+        conn.execute("ROLLBACK TO write_behind")
+        conn.execute("RELEASE write_behind")
+        raise
+    except sqlite3.DatabaseError:
+        conn.execute("ROLLBACK TO write_behind")
+        conn.execute("RELEASE write_behind")
+
+    dropped = 0
+    for sql, params in batch:
+        conn.execute("SAVEPOINT write_behind_row")
+        try:
+            conn.execute(sql, params)
+            conn.execute("RELEASE write_behind_row")
+        except sqlite3.OperationalError:
+            conn.execute("ROLLBACK TO write_behind_row")
+            conn.execute("RELEASE write_behind_row")
+            raise
+        except sqlite3.DatabaseError as e:
+            conn.execute("ROLLBACK TO write_behind_row")
+            conn.execute("RELEASE write_behind_row")
+            dropped += 1
+            logger.warning("write_behind_dropped", sql=sql[:200], error=str(e))
+    return dropped
+
+
+class WriteBehindQueue:
+    """Per-process spooled queue flushed through the group-commit writer."""
+
+    def __init__(self, db_path, max_lag=MAX_LAG, max_batch=MAX_BATCH):
+        self.db_path = db_path
+        self.max_lag = max_lag
+        self.max_batch = max_batch
+        self.spool_path = _spool_name(db_path)
+        self._lock = threading.Lock()  # Guards _pending and the spool file
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._wake = threading.Event()
+        self._stopping = False
+        self._pending = []
+        self._stats = {"enqueued": 0, "applied": 0, "dropped": 0, "flushes": 0, "failed_flushes": 0}
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+        _live_spools.add(self.spool_path)
+        self._replay_orphans()
+        self._thread = threading.Thread(
+            target=self._run, name="db-write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def _replay_orphans(self):
+        """Adopt spool files left behind by queues that are no longer running."""
+        prefix = f"{self.db_path}.wb-"
+        for path in glob.glob(f"{glob.escape(prefix)}*.log"):
+            try:
+                pid = int(path[len(prefix):-len(".log")].split("-")[0])
+            except ValueError:
+                continue
+            if path in _live_spools:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue  # Another worker's live queue
+            # Renamed to a spool name of our own: if we die mid-replay it is an orphan again
+            claimed = _spool_name(self.db_path)
+            try:
+                os.rename(path, claimed)  # Atomic: only one worker wins
+            except OSError:
+                continue
+            with open(claimed, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            for sql, params in entries:
+                self._append(sql, params)
+            os.unlink(claimed)
+            logger.info("write_behind_replayed", spool=path, entries=len(entries))
+
+    def _append(self, sql, params):
+        line = json.dumps([sql, params], separators=(",", ":"))
+        with self._lock:
+            self._spool.write(line + "\n")
+            self._spool.flush()
+            self._pending.append((sql, params))
+            self._stats["enqueued"] += 1
+            backlog = len(self._pending)
+        if backlog >= self.max_batch:
+            self._wake.set()
+
+    def enqueue(self, sql, params=()):
+        """Spool a write and return without waiting for it to be applied."""
+        self._append(sql, list(params) if isinstance(params, tuple) else params)
+
+    def flush(self):
+        """Apply everything queued so far. Returns the number of entries applied."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                dropped = get_writer(self.db_path).run(lambda conn: _apply_batch(conn, batch))
+            except Exception as e:
+                with self._lock:
+                    self._pending = batch + self._pending
+                    self._stats["failed_flushes"] += 1
+                logger.warning("write_behind_flush_failed", entries=len(batch), error=str(e))
+                return 0
+
+            with self._lock:
+                # Keep only entries that arrived while we were flushing
+                self._rewrite_spool()
+                self._stats["flushes"] += 1
+                self._stats["applied"] += len(batch) - dropped
+                self._stats["dropped"] += dropped
+            return len(batch) - dropped
+
+    def _rewrite_spool(self):
+        """Replace the spool with the pending entries (caller holds _lock)."""
+        tmp = f"{self.spool_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for sql, params in self._pending:
+                f.write(json.dumps([sql, params], separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.spool_path)
+        _fsync_dir(self.spool_path)
+        self._spool.close()
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+
+    def lag(self):
+        """Entries waiting to be applied."""
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["pending"] = len(self._pending)
+        return snapshot
+
+    def stop(self):
+        """Flush what is left and remove the spool if it is empty."""
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(5.0)
+        self.flush()
+        with self._lock:
+            empty = not self._pending
+            self._spool.close()
+        _live_spools.discard(self.spool_path)
+        if empty:
+            try:
+                os.unlink(self.spool_path)
+            except OSError:
+                pass
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.max_lag)
+            self._wake.clear()
+            if self._pending:
+                self.flush()
+
+
+# =============================================================================
+# Process-wide queues (one per database path, recreated after fork)
+# =============================================================================
+_queues = ProcessRegistry()
+
+
+def get_write_behind(path=None):
+    """Get or start the write-behind queue for a database path in this process."""
+    pool = get_pool(path)
+
+    def create():
+        try:
+            max_lag = current_app.config.get("WRITE_BEHIND_MAX_LAG_MS", MAX_LAG * 1000) / 1000.0
+        except RuntimeError:
+            max_lag = MAX_LAG
+        return WriteBehindQueue(pool.db_path, max_lag=max_lag)
+
+    return _queues.get_or_create(pool.db_path, create)
+
+
+def _write_behind_enabled(path):
+    if not group_commit_enabled(path):
+        return False
+    try:
+        return current_app.config.get("WRITE_BEHIND_ENABLED", True)
+    except RuntimeError:
+        return True
+
+
+def write_behind(sql, params=()):
+    """
+    Queue a non-critical write. Applied within WRITE_BEHIND_MAX_LAG_MS;
+    written synchronously when write-behind or group commit is disabled.
+    """
+    path = get_pool().db_path
+    if not _write_behind_enabled(path):
+        write(sql, params)
+        return
+    get_write_behind(path).enqueue(sql, params)
+
+
+def flush_write_behind():
+    """Apply every queued write for this process now (tests, shutdown)."""
+    return sum(wbq.flush() for wbq in _queues.values())
+
+
+def write_behind_stats():
+    """Counters for this process's most recently started queue, if any."""
+    wbq = _queues.latest()
+    return wbq.stats() if wbq else None
+
+
+def shutdown_write_behind():
+    """Flush and stop every queue started by this process."""
+    for wbq in _queues.pop_all():
+        wbq.stop()
+
+
+atexit.register(shutdown_write_behind)
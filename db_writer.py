@@ -0,0 +1,393 @@
+"""
+Group Commit Writer - db_writer.py
+
+One write connection per process. Callers hand write operations to a
+queue; a background thread folds everything that arrives within a few
+milliseconds into a single BEGIN IMMEDIATE ... COMMIT, so a chat burst
+costs one lock acquisition and one fsync per batch instead of one per
+message. Each operation runs inside its own SAVEPOINT, so one failing
+statement never poisons the rest of the batch.
+
+A caller whose deadline passes before its operation starts gets
+WriterBusyError and nothing was written. One whose operation is already
+inside the committing batch gets WriteOutcomeUnknown instead: the write
+may still land, so it must not be retried as if it hadn't. If the writer
+thread dies (it can't open its connection, the lock file fails), queued
+callers are failed at once and the next write() starts a new writer.
+
+Usage:
+    from db_writer import write, write_transaction
+    row = write("INSERT INTO messages(user, content) VALUES (?, ?) RETURNING id",
+                (username, content), fetch="one")
+    write_transaction(lambda conn: (conn.execute(...), conn.execute(...)))  # Commit together
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import structlog
+from flask import current_app, g, has_app_context
+
+from db import get_db, get_pool, open_connection
+from db_lock import LOCK_TIMEOUT, WriteLockTimeout, get_write_lock, hold_write_lock, lock_timeout
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+BATCH_WINDOW = 0.002  # Seconds to keep collecting after the first queued write
+MAX_BATCH = 256  # Operations per transaction
+MAX_QUEUE = 10000  # Pending operations before callers get backpressure
+WRITE_TIMEOUT = 10.0  # Seconds a caller waits for its operation to commit
+
+# Result for writes that don't fetch rows
+WriteResult = namedtuple("WriteResult", ["lastrowid", "rowcount"])
+
+logger = structlog.get_logger(__name__)
+
+
+class WriterBusyError(sqlite3.OperationalError):
+    """
+    Raised when the write queue is full or an operation misses its deadline.
+    Subclasses OperationalError so existing handlers map it to a 503.
+    """
+
+
+class WriteOutcomeUnknown(WriterBusyError):
+    """
+    The deadline passed while the operation was in a batch being
+    committed: it may or may not have been written. Still a 503, but
+    callers must not treat it as "not written" (e.g. release a claim).
+    """
+
+
+def _statement(sql, params, fetch):
+    """Build a write operation for a single SQL statement."""
+    def op(conn):
+        cursor = conn.execute(sql, params)
+        if fetch == "one":
+            return cursor.fetchone()
+        if fetch == "all":
+            return cursor.fetchall()
+        return WriteResult(cursor.lastrowid, cursor.rowcount)
+    return op
+
+
+class GroupCommitWriter:
+    """
+    Per-process single writer with group commit.
+    Operations are callables taking the write connection; their return
+    value resolves the caller's future once the batch has committed.
+    """
+
+    def __init__(self, db_path, pragmas=None, batch_window=BATCH_WINDOW,
+                 max_batch=MAX_BATCH, max_queue=MAX_QUEUE, lock_timeout=None):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.write_lock = get_write_lock(db_path)
+        self.lock_timeout = lock_timeout if lock_timeout is not None else LOCK_TIMEOUT
+        self.max_queue = max_queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._stats = {
+            "batches": 0,
+            "operations": 0,
+            "failed_operations": 0,
+            "failed_batches": 0,
+            "rejected": 0,
+            "max_batch_size": 0,
+            "commit_seconds": 0.0,
+        }
+        self._thread = threading.Thread(
+            target=self._run, name="db-writer", daemon=True
+        )
+        self._thread.start()
+
+    # -------------------------------------------------------------------------
+    # Caller side
+    # -------------------------------------------------------------------------
+    def submit(self, op):
+        """Queue a write operation. Returns a Future for its result."""
+        future = Future()
+        if self._stopping:
+            raise WriterBusyError("Database writer is shutting down")
+        try:
+            self._queue.put_nowait((op, future))
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise WriterBusyError("Database write queue is full")
+        return future
+
+    def run(self, op, timeout=WRITE_TIMEOUT):
+        """Queue a write operation and block until it has committed."""
+        future = self.submit(op)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():  # Never started: nothing was written
+                raise WriterBusyError("Database write timed out")
+        if not future.done():
+            raise WriteOutcomeUnknown("Database write timed out while committing")
+        return future.result()
+
+    def execute(self, sql, params=(), fetch=None, timeout=WRITE_TIMEOUT):
+        """Run a single statement through the writer."""
+        return self.run(_statement(sql, params, fetch), timeout=timeout)
+
+    def depth(self):
+        """Number of operations waiting to be written."""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Snapshot of batching counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self.depth()
+        return snapshot
+
+    def stop(self, timeout=5.0):
+        """Flush pending writes and stop the writer thread."""
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # -------------------------------------------------------------------------
+    # Writer thread
+    # -------------------------------------------------------------------------
+    def _collect(self, first):
+        """Gather operations arriving within the batch window."""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown sentinel: finish this batch, then exit
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _fail(self, batch, error):
+        with self._lock:
+            self._stats["failed_batches"] += 1
+        for op, future in batch:
+            if future.done():
+                continue
+            if future.running() or future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def _commit(self, conn, batch):
+        """Apply one batch inside a single transaction, holding the write lock."""
+        try:
+            self.write_lock.acquire(time.monotonic() + self.lock_timeout)
+        except WriteLockTimeout as e:
+            # Another worker holds the database: fail fast rather than queue up
+            self._fail(batch, e)
+            return
+        try:
+            self._commit_locked(conn, batch)
+        finally:
+            self.write_lock.release()
+
+    def _commit_locked(self, conn, batch):
+        outcomes = []
+        start = time.monotonic()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = op(conn)
+                    conn.execute("RELEASE op")
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self._fail(batch, e)
+            return
+
+        elapsed = time.monotonic() - start
+        failed = 0
+        # Resolve only after COMMIT so callers never observe uncommitted rows
+        for future, result, error in outcomes:
+            if error is not None:
+                failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["operations"] += len(outcomes)
+            self._stats["failed_operations"] += failed
+            self._stats["commit_seconds"] += elapsed
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+
+    def _run(self):
+        conn = None
+        try:
+            conn = open_connection(self.db_path, self.pragmas)
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch = self._collect(first)
+                try:
+                    self._commit(conn, batch)
+                except BaseException as e:
+                    self._fail(batch, e)
+                    raise
+        except Exception as e:
+            logger.exception("db_writer_died", db=self.db_path)
+            self._abandon(WriterBusyError(f"Database writer stopped: {e}"))
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _abandon(self, error):
+        """Refuse new work, fail everything queued and let get_writer() start a replacement."""
+        self._stopping = True
+        _writers.discard(self.db_path, self)
+        pending = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                pending.append(item)
+        if pending:
+            self._fail(pending, error)
+
+
+# =============================================================================
+# Process-wide writers (one per database path, recreated after fork)
+# =============================================================================
+_writers = ProcessRegistry()
+
+
+def group_commit_enabled(path):
+    if path == ":memory:":
+        # Every connection to :memory: is a separate database
+        return False
+    try:
+        return current_app.config.get("DB_GROUP_COMMIT", True)
+    except RuntimeError:
+        return True
+
+
+def get_writer(path=None):
+    """Get or start the writer for a database path in this process."""
+    pool = get_pool(path)
+
+    def create():
+        try:
+            cfg = current_app.config
+            window = cfg.get("DB_WRITE_BATCH_WINDOW_MS", BATCH_WINDOW * 1000) / 1000.0
+            max_queue = cfg.get("DB_WRITE_QUEUE_SIZE", MAX_QUEUE)
+        except RuntimeError:
+            window, max_queue = BATCH_WINDOW, MAX_QUEUE
+        return GroupCommitWriter(
+            pool.db_path, pool.pragmas, batch_window=window, max_queue=max_queue,
+            lock_timeout=lock_timeout(),
+        )
+
+    return _writers.get_or_create(pool.db_path, create)
+
+
+def _queue_direct(path):
+    # Inside db_retry the caller already holds the lock; queueing behind
+    # it would wait on ourselves
+    return not group_commit_enabled(path) or get_write_lock(path).held_by_current_thread()
+
+
+def _run_queued(op, timeout):
+    try:
+        return get_writer().run(op, timeout=timeout)
+    except WriteOutcomeUnknown:
+        if has_app_context():
+            g.write_outcome_unknown = True  # See write_outcome_unknown()
+        raise
+
+
+def write(sql, params=(), fetch=None, timeout=WRITE_TIMEOUT):
+    """
+    Execute a write statement through the group-commit writer.
+
+    fetch="one"/"all" returns rows (e.g. from RETURNING); otherwise a
+    WriteResult(lastrowid, rowcount). Falls back to the request connection,
+    under the write lock, when group commit is disabled or the database is
+    in-memory.
+    """
+    if _queue_direct(get_pool().db_path):
+        with hold_write_lock(timeout=timeout):
+            return _statement(sql, params, fetch)(get_db())
+    return _run_queued(_statement(sql, params, fetch), timeout)
+
+
+def write_transaction(op, timeout=WRITE_TIMEOUT):
+    """
+    Run op(conn) through the group-commit writer: the statements it issues
+    commit together or not at all. Returns op's result. Same fallback as
+    write().
+    """
+    if not _queue_direct(get_pool().db_path):
+        return _run_queued(op, timeout)
+    conn = get_db()
+    with hold_write_lock(timeout=timeout):
+        conn.execute("SAVEPOINT op")
+        try:
+            result = op(conn)
+        except BaseException:
+            conn.execute("ROLLBACK TO op")
+            conn.execute("RELEASE op")
+            raise
+        conn.execute("RELEASE op")
+    return result
+
+
+def write_outcome_unknown():
+    """True once a write in this app context raised WriteOutcomeUnknown (it may still commit)."""
+    return has_app_context() and g.get("write_outcome_unknown", False)
+
+
+def write_pressure(path=None):
+    """How full (0.0 - 1.0) this process's write queue for a database is; 0.0 if no writer runs."""
+    writer = _writers.get(get_pool(path).db_path)
+    if writer is None:
+        return 0.0
+    return writer.depth() / writer.max_queue
+
+
+def writer_stats():
+    """Batching counters for this process's most recently started writer, if any."""
+    writer = _writers.latest()
+    return writer.stats() if writer else None
+
+
+def shutdown_writers():
+    """Flush and stop every writer started by this process."""
+    for writer in _writers.pop_all():
+        writer.stop()
+
+
+atexit.register(shutdown_writers)
@@ -0,0 +1,194 @@
+"""
+Idempotency Keys - idempotency.py
+
+ChatSocket.js reconnects with backoff and the HTTP mutations get
+retried after lock errors, but neither side could tell whether the
+first attempt had landed: a flaky network meant duplicate rows and
+duplicate broadcasts. Clients now send a key with each create (the
+Idempotency-Key header, or "idempotency_key" on send_message) and the
+server runs each (scope, owner, key) once:
+
+- begin() claims the key with INSERT OR IGNORE into idempotency_keys
+  (status NULL); a retry arriving while the first attempt is still in
+  flight gets IN_PROGRESS (409) instead of a second write
+- finish() records the result; repeats get it back as it was, from an
+  LRU of recent results, or from the table on another worker. record()
+  writes the result on the caller's connection instead, in the same
+  transaction as the row it describes, so the two commit together
+- abort() releases the key when the attempt failed, so the retry runs;
+  a write whose outcome is unknown (db_writer.WriteOutcomeUnknown) keeps
+  its claim, and retries get IN_PROGRESS until PENDING_TIMEOUT
+- claims left by a crashed worker are taken over after PENDING_TIMEOUT;
+  rows older than KEY_TTL are purged every PURGE_EVERY finishes
+
+Usage:
+    from idempotency import IN_PROGRESS, get_idempotency_store
+    store = get_idempotency_store()
+    replay = store.begin("wall_post", owner, key)   # None: run it
+    store.finish("wall_post", owner, key, 200, body)
+"""
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from db_epoch import now_ms
+from process_registry import ProcessRegistry
+
+# =============================================================================
+# Settings
+# =============================================================================
+KEY_TTL = 24 * 3600.0  # Seconds a key is remembered
+PENDING_TIMEOUT = 30.0  # Seconds before an unfinished claim may be taken over
+MAX_ENTRIES = 4096  # Results kept in memory (the table keeps the rest)
+MAX_KEY_LENGTH = 128  # Longer keys are rejected
+PURGE_EVERY = 500  # Finishes between purges of expired rows
+HEADER = "Idempotency-Key"  # HTTP request header carrying the key
+
+IN_PROGRESS = object()  # begin(): the first attempt has not finished
+
+
+class Replay:
+    """A finished attempt: its HTTP status and response body."""
+
+    __slots__ = ("status", "body", "expires_ms")
+
+    def __init__(self, status, body, expires_ms):
+        self.status = status
+        self.body = body
+        self.expires_ms = expires_ms
+
+
+class IdempotencyStore:
+    """Claims and results of keyed requests; write(sql, params) runs a statement."""
+
+    def __init__(self, read, write, ttl=KEY_TTL, max_entries=MAX_ENTRIES):
+        self._read = read
+        self._write = write
+        self.ttl_ms = int(ttl * 1000)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()  # Guards everything below
+        self._results = OrderedDict()  # (scope, owner, key) -> Replay, least recently used first
+        self._finishes = 0
+        self._stats = {"claims": 0, "replays": 0, "in_progress": 0, "aborts": 0, "purged": 0}
+
+    def begin(self, scope, owner, key):
+        """None if this caller runs the request, else a Replay or IN_PROGRESS."""
+        ident = (scope, str(owner), key)
+        now = now_ms()
+        with self._lock:
+            replay = self._results.get(ident)
+            if replay is not None and replay.expires_ms > now:
+                self._results.move_to_end(ident)
+                self._stats["replays"] += 1
+                return replay
+        claimed = self._write(
+            "INSERT OR IGNORE INTO idempotency_keys (scope, owner, key, created_at_ms) VALUES (?, ?, ?, ?)",
+            (*ident, now),
+        ).rowcount
+        if not claimed:
+            # Finished, in flight, expired, or abandoned by a crashed worker
+            claimed = self._write(
+                "UPDATE idempotency_keys SET status = NULL, response = NULL, created_at_ms = ? "
+                "WHERE scope = ? AND owner = ? AND key = ? AND "
+                "(created_at_ms < ? OR (status IS NULL AND created_at_ms < ?))",
+                (now, *ident, now - self.ttl_ms, now - int(PENDING_TIMEOUT * 1000)),
+            ).rowcount
+        if claimed:
+            with self._lock:
+                self._stats["claims"] += 1
+            return None
+        row = self._read(
+            "SELECT status, response, created_at_ms FROM idempotency_keys "
+            "WHERE scope = ? AND owner = ? AND key = ?",
+            ident,
+        )
+        with self._lock:
+            if row is None or row["status"] is None:
+                self._stats["in_progress"] += 1
+                return IN_PROGRESS  # (row None: released between our statements; the client retries)
+            replay = Replay(row["status"], row["response"], row["created_at_ms"] + self.ttl_ms)
+            self._remember(ident, replay)
+            self._stats["replays"] += 1
+            return replay
+
+    def record(self, conn, scope, owner, key, status, body):
+        """Write the result on conn, inside the transaction of the write it describes."""
+        conn.execute(
+            "UPDATE idempotency_keys SET status = ?, response = ?, created_at_ms = ? "
+            "WHERE scope = ? AND owner = ? AND key = ?",
+            (status, body, now_ms(), scope, str(owner), key),
+        )
+
+    def finish(self, scope, owner, key, status, body, recorded=False):
+        """Record the result of a claimed request (recorded: record() already wrote it)."""
+        ident = (scope, str(owner), key)
+        now = now_ms()
+        if not recorded:
+            self._write(
+                "UPDATE idempotency_keys SET status = ?, response = ?, created_at_ms = ? "
+                "WHERE scope = ? AND owner = ? AND key = ?",
+                (status, body, now, *ident),
+            )
+        with self._lock:
+            self._remember(ident, Replay(status, body, now + self.ttl_ms))
+            self._finishes += 1
+            purge = self._finishes % PURGE_EVERY == 0
+        if purge:
+            purged = self._write(
+                "DELETE FROM idempotency_keys WHERE created_at_ms < ?", (now - self.ttl_ms,)
+            ).rowcount
+            with self._lock:
+                self._stats["purged"] += purged
+
+    def abort(self, scope, owner, key):
+        """Release a claim whose request failed, so a retry runs it."""
+        self._write(
+            "DELETE FROM idempotency_keys WHERE scope = ? AND owner = ? AND key = ? AND status IS NULL",
+            (scope, str(owner), key),
+        )
+        with self._lock:
+            self._stats["aborts"] += 1
+
+    def _remember(self, ident, replay):
+        self._results[ident] = replay
+        self._results.move_to_end(ident)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._results)}
+
+
+def valid_key(key):
+    """True for a usable client key (non-empty, at most MAX_KEY_LENGTH, printable ASCII)."""
+    return isinstance(key, str) and 0 < len(key) <= MAX_KEY_LENGTH and key.isascii() and key.isprintable()
+
+
+def _read(sql, params):
+    from db import get_db
+    return get_db().execute(sql, params).fetchone()
+
+
+def _write(sql, params):
+    from db_writer import write
+    return write(sql, params)
+
+
+# =============================================================================
+# Process-wide stores (one per database, recreated after fork)
+# =============================================================================
+_stores = ProcessRegistry()
+
+
+def get_idempotency_store(path=None):
+    """The store for a database in this process (default: the current app's)."""
+    return _stores.get_or_create(path or current_app.config["DATABASE"],
+                                 lambda: IdempotencyStore(_read, _write))
+
+
+def idempotency_stats():
+    """Counters for this process's most recently created store, if any."""
+    store = _stores.latest()
+    return store.stats() if store else None
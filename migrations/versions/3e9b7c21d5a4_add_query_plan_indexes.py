@@ -0,0 +1,46 @@
+"""Add query plan indexes
+
+Revision ID: 3e9b7c21d5a4
+Revises: c04b1fbdddc9
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e9b7c21d5a4'
+down_revision: Union[str, None] = 'c04b1fbdddc9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('idx_cat_memories_pair', 'cat_memories', ['source_cat_id', 'target_user_id'], unique=False, if_not_exists=True)
+    op.create_index('idx_dm_conversation_id', 'direct_messages', ['conversation_id', 'id'], unique=False, if_not_exists=True)
+    op.create_index('idx_friends_follower_created', 'friends', ['follower_id', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('idx_friends_following_created', 'friends', ['following_id', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('idx_messages_room_id', 'messages', ['room_id', 'id'], unique=False, if_not_exists=True)
+    op.create_index('idx_notif_user_created', 'notifications', ['user_id', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('idx_notif_user_unread', 'notifications', ['user_id', 'is_read', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('idx_posts_type_created', 'profile_posts', ['module_type', 'created_at'], unique=False, if_not_exists=True)
+    # Prefixes of the indexes above (and of UNIQUE(follower_id, following_id)): only cost writes
+    op.drop_index('idx_notif_user', table_name='notifications', if_exists=True)
+    op.drop_index('idx_friends_following', table_name='friends', if_exists=True)
+    op.drop_index('idx_friends_follower', table_name='friends', if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index('idx_friends_follower', 'friends', ['follower_id'], unique=False, if_not_exists=True)
+    op.create_index('idx_friends_following', 'friends', ['following_id'], unique=False, if_not_exists=True)
+    op.create_index('idx_notif_user', 'notifications', ['user_id', 'is_read'], unique=False, if_not_exists=True)
+    op.drop_index('idx_posts_type_created', table_name='profile_posts', if_exists=True)
+    op.drop_index('idx_notif_user_unread', table_name='notifications', if_exists=True)
+    op.drop_index('idx_notif_user_created', table_name='notifications', if_exists=True)
+    op.drop_index('idx_messages_room_id', table_name='messages', if_exists=True)
+    op.drop_index('idx_friends_following_created', table_name='friends', if_exists=True)
+    op.drop_index('idx_friends_follower_created', table_name='friends', if_exists=True)
+    op.drop_index('idx_dm_conversation_id', table_name='direct_messages', if_exists=True)
+    op.drop_index('idx_cat_memories_pair', table_name='cat_memories', if_exists=True)
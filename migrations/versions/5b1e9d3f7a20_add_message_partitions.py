@@ -0,0 +1,38 @@
+"""Add message partition manifest
+
+Revision ID: 5b1e9d3f7a20
+Revises: 8d2f4a6c1e07
+
+One row per month of chat history rolled out of the main messages table
+into its own database file (see db_partitions).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e9d3f7a20'
+down_revision: Union[str, None] = '8d2f4a6c1e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'message_partitions',
+        sa.Column('month', sa.Text(), nullable=False),
+        sa.Column('filename', sa.Text(), nullable=False),
+        sa.Column('min_id', sa.Integer(), nullable=True),
+        sa.Column('max_id', sa.Integer(), nullable=True),
+        sa.Column('live_rows', sa.Integer(), server_default='0', nullable=True),
+        sa.Column('rolled_at', sa.Text(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('month'),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('message_partitions', if_exists=True)
@@ -0,0 +1,107 @@
+"""Add epoch-millisecond timestamp columns
+
+Revision ID: 8d2f4a6c1e07
+Revises: 3e9b7c21d5a4
+
+Adds INTEGER *_ms columns next to the TEXT timestamps of the time-ordered
+tables, triggers that fill them for writers that only set the TEXT
+column, and moves the time-ordered indexes onto them. ADD COLUMN and
+CREATE TRIGGER only touch the schema; existing rows are backfilled in
+chunks by the app on startup (db_epoch.start_backfill).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f4a6c1e07'
+down_revision: Union[str, None] = '3e9b7c21d5a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EPOCH_MS = "CAST(ROUND((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+
+COLUMNS = [
+    ('messages', 'created_at_ms'),
+    ('profile_posts', 'created_at_ms'),
+    ('notifications', 'created_at_ms'),
+    ('direct_messages', 'created_at_ms'),
+    ('cat_memories', 'created_at_ms'),
+    ('cat_memories', 'expires_at_ms'),
+]
+
+OLD_INDEXES = [
+    ('idx_messages_created', 'messages', ['created_at']),
+    ('idx_messages_room', 'messages', ['room_id', 'created_at']),
+    ('idx_dm_conversation', 'direct_messages', ['conversation_id', 'created_at']),
+    ('idx_posts_type_created', 'profile_posts', ['module_type', 'created_at']),
+    ('idx_notif_user_unread', 'notifications', ['user_id', 'is_read', 'created_at']),
+    ('idx_notif_user_created', 'notifications', ['user_id', 'created_at']),
+    ('idx_cat_memories_pair', 'cat_memories', ['source_cat_id', 'target_user_id']),
+]
+
+NEW_INDEXES = [
+    ('idx_messages_created_ms', 'messages', ['created_at_ms']),
+    ('idx_messages_room_created_ms', 'messages', ['room_id', 'created_at_ms']),
+    ('idx_dm_conversation_ms', 'direct_messages', ['conversation_id', 'created_at_ms']),
+    ('idx_posts_type_created_ms', 'profile_posts', ['module_type', 'created_at_ms']),
+    ('idx_notif_user_unread_ms', 'notifications', ['user_id', 'is_read', 'created_at_ms']),
+    ('idx_notif_user_created_ms', 'notifications', ['user_id', 'created_at_ms']),
+    ('idx_cat_memories_pair_ms', 'cat_memories', ['source_cat_id', 'target_user_id', 'expires_at_ms']),
+]
+
+CREATED_TRIGGERS = [
+    ('trg_messages_created_ms', 'messages'),
+    ('trg_dm_created_ms', 'direct_messages'),
+    ('trg_posts_created_ms', 'profile_posts'),
+    ('trg_notif_created_ms', 'notifications'),
+]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    for table, column in COLUMNS:
+        existing = {c['name'] for c in sa.inspect(bind).get_columns(table)}
+        if column not in existing:
+            op.add_column(table, sa.Column(column, sa.Integer(), nullable=True))
+
+    for name, table in CREATED_TRIGGERS:
+        op.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER INSERT ON {table}
+            WHEN NEW.created_at_ms IS NULL BEGIN
+                UPDATE {table} SET created_at_ms = {EPOCH_MS.format("COALESCE(NEW.created_at, 'now')")}
+                WHERE id = NEW.id;
+            END
+        """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_cat_memories_ms AFTER INSERT ON cat_memories
+        WHEN NEW.created_at_ms IS NULL OR (NEW.expires_at_ms IS NULL AND NEW.expires_at IS NOT NULL) BEGIN
+            UPDATE cat_memories SET
+                created_at_ms = COALESCE(NEW.created_at_ms, {EPOCH_MS.format("'now'")}),
+                expires_at_ms = COALESCE(NEW.expires_at_ms, {EPOCH_MS.format("NEW.expires_at")})
+            WHERE id = NEW.id;
+        END
+    """)
+
+    for name, table, columns in NEW_INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+    # OLD_INDEXES keep serving the TEXT-ordered reads until the app's
+    # background backfill finishes; db_epoch.finish_backfill drops them then
+
+
+def downgrade() -> None:
+    for name, table, columns in OLD_INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+    for name, table, _ in NEW_INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+    op.execute("DROP TRIGGER IF EXISTS trg_cat_memories_ms")
+    for name, _ in CREATED_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+    for table, column in reversed(COLUMNS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
@@ -0,0 +1,36 @@
+"""Add table_row_stats for planner statistics drift
+
+Revision ID: 9c4e2a7b5f13
+Revises: e2b6f0c4d8a1
+
+db_analyze records each table's exact row count when it runs ANALYZE
+and re-analyzes tables whose counts drift from it. The table starts
+empty, so every table with rows is analyzed once by the first pass.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e2a7b5f13'
+down_revision: Union[str, None] = 'e2b6f0c4d8a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'table_row_stats',
+        sa.Column('tbl', sa.Text(), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('analyzed_at', sa.Text(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('tbl'),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('table_row_stats', if_exists=True)
@@ -0,0 +1,44 @@
+"""Add idempotency_keys for client-supplied Idempotency-Key replays
+
+Revision ID: a22634f5b5e9
+Revises: 9c4e2a7b5f13
+
+idempotency.py stores the result of each keyed create (message, wall
+post, DM, sticker) so a retried request gets the same response instead
+of a duplicate row. status is NULL while the first request is in
+flight; rows older than the store's TTL are pruned by created_at_ms.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a22634f5b5e9'
+down_revision: Union[str, None] = '9c4e2a7b5f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('scope', sa.Text(), nullable=False),
+        sa.Column('owner', sa.Text(), nullable=False),
+        sa.Column('key', sa.Text(), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('response', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at_ms', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'owner', 'key'),
+        sqlite_with_rowid=False,
+        if_not_exists=True,
+    )
+    op.create_index('idx_idempotency_created_ms', 'idempotency_keys', ['created_at_ms'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_idempotency_created_ms', table_name='idempotency_keys', if_exists=True)
+    op.drop_table('idempotency_keys', if_exists=True)
@@ -0,0 +1,63 @@
+"""Message archiver columns and per-room archive counts
+
+Revision ID: a7c3e1f9b2d4
+Revises: 5b1e9d3f7a20
+
+Gives messages_archive every messages column (epoch timestamp, edit and
+delete markers), a per-room retention override on rooms, the
+messages_archive_rooms counts/horizon table and a partial index that
+finds soft-deleted messages without scanning (see db_archive).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e1f9b2d4'
+down_revision: Union[str, None] = '5b1e9d3f7a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = [
+    ('messages_archive', 'created_at_ms', sa.Integer()),
+    ('messages_archive', 'edited_at', sa.Text()),
+    ('messages_archive', 'deleted_at', sa.Text()),
+    ('rooms', 'retention_days', sa.Integer()),
+]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    for table, column, type_ in COLUMNS:
+        existing = {c['name'] for c in sa.inspect(bind).get_columns(table)}
+        if column not in existing:
+            op.add_column(table, sa.Column(column, type_, nullable=True))
+
+    op.create_table(
+        'messages_archive_rooms',
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('live_rows', sa.Integer(), server_default='0', nullable=True),
+        sa.Column('horizon_id', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('room_id'),
+        if_not_exists=True,
+    )
+    op.create_index('idx_archive_created_ms', 'messages_archive', ['created_at_ms'], unique=False, if_not_exists=True)
+    op.drop_index('idx_archive_created', table_name='messages_archive', if_exists=True)
+    op.create_index(
+        'idx_messages_deleted', 'messages', ['id'], unique=False, if_not_exists=True,
+        sqlite_where=sa.text('deleted_at IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_messages_deleted', table_name='messages', if_exists=True)
+    op.create_index('idx_archive_created', 'messages_archive', ['created_at'], unique=False, if_not_exists=True)
+    op.drop_index('idx_archive_created_ms', table_name='messages_archive', if_exists=True)
+    op.drop_table('messages_archive_rooms', if_exists=True)
+
+    for table, column, _ in reversed(COLUMNS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
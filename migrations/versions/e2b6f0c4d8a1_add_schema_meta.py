@@ -0,0 +1,36 @@
+"""Add schema_meta for the startup schema fingerprint
+
+Revision ID: e2b6f0c4d8a1
+Revises: a7c3e1f9b2d4
+
+db.init_db stores a hash of db.SCHEMA here and skips replaying the DDL
+on worker boot while it matches. The table starts empty, so the first
+boot after this migration applies SCHEMA once and records the hash.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b6f0c4d8a1'
+down_revision: Union[str, None] = 'a7c3e1f9b2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'schema_meta',
+        sa.Column('key', sa.Text(), nullable=False),
+        sa.Column('value', sa.Text(), nullable=False),
+        sa.Column('updated_at', sa.Text(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('key'),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('schema_meta', if_exists=True)
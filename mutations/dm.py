@@ -4,9 +4,11 @@ Handles sending, reading, and deleting encrypted DMs.
 """
 
 from flask import request, g, jsonify
+from utils.decorators import idempotent
 from core.security import limiter
 
 @limiter.limit("20/minute")
+@idempotent("dm")
 def send_dm():
     """
     Send an encrypted direct message.
@@ -15,6 +17,9 @@ def send_dm():
         recipient_id: int - ID of the recipient user
         content: str - Message content (will be encrypted)
     
+    Headers:
+        Idempotency-Key: optional; a retry with the same key gets the first response
+    
     Returns:
         JSON with message ID on success
     """
@@ -1,6 +1,10 @@
 
 from flask import request, g, jsonify
 from db import get_db, db_retry
+from db_partitions import find_message, note_deleted
+from db_recent import forget, note_edited
+from services.message_service import send_message_logic
+from idempotency import HEADER as IDEMPOTENCY_HEADER
 from utils.sanitize import clean_html
 from utils.decorators import mutation_handler
 import sqlite3
@@ -17,36 +21,21 @@ from core.schemas import SendMessageRequest, UpdateMessageRequest, DeleteMessage
 def send_message():
     """
     Send a chat message with msgspec-based parsing.
-    Automatic validation + 10-80x faster than request.json.
+    Validation, sanitizing, the insert and the broadcast to the room's
+    sockets run in services.message_service, as for socket sends.
     """
-    db = get_db()
-    
     try:
-        # Fast msgspec decoding with automatic validation
         req = msgspec.json.decode(request.get_data(), type=SendMessageRequest)
-        
-        # Semantic validation
-        v_err = validate_content_length(req.content, 10000)
-        if v_err: return error_response(v_err)
-        
-        content = clean_html(req.content)
     except msgspec.ValidationError as e:
         return error_response(f"Invalid request: {e}")
     
     username = g.user['username'] if g.user else 'anonymous'
     
-    def do_insert():
-        row = db.execute(
-            "INSERT INTO messages(user,content) VALUES (?,?) RETURNING id", 
-            (username, content)
-        ).fetchone()
-        db.commit()
-        return row
-    
-    # db_retry is still useful for the retry logic itself, 
-    # but the outer exception handling is now done by the decorator
-    row = db_retry(do_insert)
-    return success_response(id=row['id'])
+    result = send_message_logic(username, req.content, room_name=(req.room or "general").lower().strip(),
+                                idempotency_key=request.headers.get(IDEMPOTENCY_HEADER))
+    if not result.success:
+        return error_response(result.error, result.status)
+    return success_response(id=result.data["message"].id)
 
 
 @limiter.limit("20/minute")
@@ -66,8 +55,8 @@ def edit_message():
     except msgspec.ValidationError as e:
         return error_response(f"Invalid request: {e}")
     
-    # Verify message exists and belongs to user
-    row = db.execute("SELECT user FROM messages WHERE id=? AND deleted_at IS NULL", (req.id,)).fetchone()
+    # Verify message exists and belongs to user (it may live in a rolled partition)
+    table, row = find_message(db, req.id)
     if not row:
         return error_response("Message not found", 404)
         
@@ -78,12 +67,13 @@ def edit_message():
     
     def do_update():
         db.execute(
-            "UPDATE messages SET content=?, edited_at=datetime('now') WHERE id=?",
+            f"UPDATE {table} SET content=?, edited_at=datetime('now') WHERE id=?",  # nosec B608
             (content, req.id)
         )
         db.commit()
     
     db_retry(do_update)
+    note_edited(req.id, content)
     return success_response(id=req.id)
 
 
@@ -98,8 +88,8 @@ def delete_message():
     except msgspec.ValidationError as e:
         return error_response(f"Invalid request: {e}")
     
-    # Verify message exists and belongs to user
-    row = db.execute("SELECT user FROM messages WHERE id=? AND deleted_at IS NULL", (req.id,)).fetchone()
+    # Verify message exists and belongs to user (it may live in a rolled partition)
+    table, row = find_message(db, req.id)
     if not row:
         return error_response("Message not found", 404)
         
@@ -110,11 +100,13 @@ def delete_message():
     
     def do_delete():
         db.execute(
-            "UPDATE messages SET deleted_at=datetime('now') WHERE id=?",
+            f"UPDATE {table} SET deleted_at=datetime('now') WHERE id=?",  # nosec B608
             (req.id,)
         )
+        note_deleted(db, table, row)
         db.commit()
     
     db_retry(do_delete)
+    forget(req.id)
     return success_response(id=req.id)
 
@@ -38,7 +38,7 @@ def resolve_report():
         return jsonify({"error": "Unauthorized"}), 401
         
     # Check if user is staff
-    if not g.user.get('is_staff'):
+    if not g.user['is_staff']:
         return jsonify({"error": "Forbidden"}), 403
         
     try:
@@ -53,3 +53,25 @@ def resolve_report():
         
     return jsonify({"success": True})
 
+def set_user_banned(user_id):
+    """POST bans the user, DELETE unbans them."""
+    if not g.user or not g.user['is_staff']:
+        return jsonify({"error": "Forbidden"}), 403
+        
+    result = moderation_service.set_user_banned(g.user['id'], user_id, request.method == 'POST')
+    
+    if not result.success:
+        return jsonify({"error": result.error}), result.status
+        
+    return jsonify({"success": True})
+
+def delete_user(user_id):
+    if not g.user or not g.user['is_staff']:
+        return jsonify({"error": "Forbidden"}), 403
+        
+    result = moderation_service.delete_user(g.user['id'], user_id)
+    
+    if not result.success:
+        return jsonify({"error": result.error}), result.status
+        
+    return jsonify({"success": True})
@@ -4,8 +4,10 @@ Delegates to sticker_service.
 """
 
 from flask import request, jsonify, g
+from utils.decorators import idempotent
 from services import sticker_service
 
+@idempotent("wall_sticker")
 def add_sticker():
     """
     POST /wall/sticker/add
@@ -16,6 +18,8 @@ def add_sticker():
         sticker_type: 'image' | 'text'
         image: file (if type='image')
         text_content: str (if type='text')
+    Headers:
+        Idempotency-Key: optional; a retry with the same key gets the first response
     """
     if g.user is None:
         return jsonify(error="Authentication required"), 401
@@ -4,6 +4,7 @@ Delegates to wall_service.
 """
 
 from flask import request, jsonify, g
+from utils.decorators import idempotent
 from core.security import limiter
 
 def get_wall_posts(profile_id, limit=20, offset=0):
@@ -15,6 +16,7 @@ def get_wall_posts(profile_id, limit=20, offset=0):
     return wall_service.get_posts_for_profile(profile_id, limit, offset)
 
 @limiter.limit("10/minute")
+@idempotent("wall_post")
 def add_wall_post():
     if g.user is None:
         return jsonify(error="Auth required"), 401
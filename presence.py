@@ -0,0 +1,217 @@
+"""
+Presence - presence.py
+
+The lobby used to poll /lobby/users every 5 seconds, and each poll
+walked every authenticated socket to dedupe users. PresenceRegistry
+keeps one compact record per online user instead, refcounted by their
+sockets (tabs) on every worker, and fed by the same announcements the
+socket bus already carries (set / del / sync / gone, see socket_bus).
+
+Each change that is visible to others bumps a version and produces one
+diff, pushed to the "presence" Socket.IO room:
+
+    {"version": 42, "joined": [{"id": 7, "username": "ana", "room": "general"}],
+     "left": [9], "moved": [{"id": 3, "username": "bo", "room": "music"}]}
+
+Clients fetch a snapshot ({"version", "users"}) once and apply diffs
+whose version follows theirs; a gap means they missed one and refetch.
+Versions are per worker, so the snapshot and the diffs come over the
+same socket. Users with profiles.show_online_status = 0 are left out
+of snapshots and diffs (opening a second tab or switching rooms is
+not a change anyone sees).
+
+Usage:
+    from presence import PresenceRegistry
+    registry = PresenceRegistry(emit_diff)
+    registry.apply(None, {"op": "set", "sid": sid, "info": info})  # None: this worker
+    registry.snapshot()
+"""
+import threading
+import time
+from collections import Counter
+
+# =============================================================================
+# Settings
+# =============================================================================
+PRESENCE_ROOM = "presence"  # Socket.IO room of clients that get presence diffs
+PRESENCE_TTL = 45.0  # A worker silent for this long is dropped (socket_bus.PRESENCE_TTL)
+
+
+class UserPresence:
+    """One online user: their sockets (sid -> room, most recently moved last)."""
+
+    __slots__ = ("user_id", "username", "visible", "rooms")
+
+    def __init__(self, user_id, username, visible=True):
+        self.user_id = user_id
+        self.username = username
+        self.visible = visible
+        self.rooms = {}
+
+    @property
+    def sessions(self):
+        return len(self.rooms)
+
+    @property
+    def room(self):
+        return next(reversed(self.rooms.values()))
+
+    def public(self):
+        """What other users see, or None for users hiding their online status."""
+        if not self.visible:
+            return None
+        return {"id": self.user_id, "username": self.username, "room": self.room}
+
+
+class PresenceRegistry:
+    """Online users across workers; emit(diff) for every change others can see."""
+
+    def __init__(self, emit=None, ttl=PRESENCE_TTL):
+        self.emit = emit
+        self.ttl = ttl
+        self._lock = threading.Lock()  # Guards everything below (and orders emits)
+        self._hosts = {}  # worker host_id (None: this worker) -> {sid: user_id}
+        self._heard = {}  # peer host_id -> monotonic time last heard
+        self._users = {}  # user_id -> UserPresence
+        self._room_users = Counter()  # room name -> users with a socket in it (hidden ones too)
+        self._snapshot = None  # Cached snapshot of the current version
+        self.version = 0
+        self._stats = {"diffs": 0, "snapshots": 0}
+
+    def apply(self, host_id, update):
+        """Apply a socket_bus presence update from a worker. Returns the diff, if any."""
+        op = update.get("op")
+        with self._lock:
+            before = {}
+            now = time.monotonic()
+            self._expire(now, before)
+            if op == "gone":
+                self._drop_host(host_id, before)
+                self._heard.pop(host_id, None)
+            else:
+                if op == "sync":
+                    sockets = update.get("sockets") or {}
+                    for sid in [sid for sid in self._hosts.get(host_id, ()) if sid not in sockets]:
+                        self._del(host_id, sid, before)
+                    for sid, info in sockets.items():
+                        self._set(host_id, sid, info, before)
+                elif op == "set":
+                    self._set(host_id, update["sid"], update["info"], before)
+                elif op == "del":
+                    self._del(host_id, update["sid"], before)
+                if host_id is not None:
+                    self._heard[host_id] = now
+            return self._publish(before)
+
+    def snapshot(self):
+        """{"version", "users"}: every visible online user (shared, do not modify)."""
+        with self._lock:
+            before = {}
+            self._expire(time.monotonic(), before)
+            self._publish(before)
+            if self._snapshot is None:
+                users = [user.public() for user in self._users.values() if user.visible]
+                self._snapshot = {"version": self.version, "users": users}
+                self._stats["snapshots"] += 1
+            return self._snapshot
+
+    def room_members(self):
+        """{room name: online users in it} (counts only: includes users hiding their status)."""
+        with self._lock:
+            return dict(self._room_users)
+
+    def is_online(self, user_id):
+        """True if the user has a socket on any worker and shows their online status."""
+        user = self._users.get(user_id)
+        return user is not None and user.visible
+
+    # --- internals (under self._lock) ----------------------------------------
+    def _view(self, user_id):
+        user = self._users.get(user_id)
+        return user.public() if user else None
+
+    def _remember(self, before, user_id):
+        if user_id not in before:
+            before[user_id] = self._view(user_id)
+
+    def _set(self, host_id, sid, info, before):
+        sockets = self._hosts.setdefault(host_id, {})
+        user_id = info["user_id"]
+        if sockets.get(sid, user_id) != user_id:
+            self._del(host_id, sid, before)
+        self._remember(before, user_id)
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = UserPresence(user_id, info["username"])
+        user.username = info["username"]
+        user.visible = info.get("visible", True)  # The latest announcement wins
+        sockets[sid] = user_id
+        room = info["room_name"]
+        if user.rooms.get(sid) != room:
+            rooms = set(user.rooms.values())
+            user.rooms.pop(sid, None)
+            user.rooms[sid] = room
+            self._recount(rooms, user.rooms)
+
+    def _del(self, host_id, sid, before):
+        user_id = self._hosts.get(host_id, {}).pop(sid, None)
+        if user_id is None:
+            return
+        self._remember(before, user_id)
+        user = self._users[user_id]
+        rooms = set(user.rooms.values())
+        user.rooms.pop(sid, None)
+        self._recount(rooms, user.rooms)
+        if not user.rooms:
+            del self._users[user_id]
+
+    def _recount(self, before, rooms):
+        after = set(rooms.values())
+        for room in before - after:
+            self._room_users[room] -= 1
+            if not self._room_users[room]:
+                del self._room_users[room]
+        for room in after - before:
+            self._room_users[room] += 1
+
+    def _drop_host(self, host_id, before):
+        for sid in list(self._hosts.get(host_id, ())):
+            self._del(host_id, sid, before)
+        self._hosts.pop(host_id, None)
+
+    def _expire(self, now, before):
+        cutoff = now - self.ttl
+        for host_id in [h for h, heard in self._heard.items() if heard < cutoff]:
+            self._drop_host(host_id, before)
+            del self._heard[host_id]
+
+    def _publish(self, before):
+        joined, left, moved = [], [], []
+        for user_id, was in before.items():
+            now = self._view(user_id)
+            if was == now:
+                continue
+            if was is None:
+                joined.append(now)
+            elif now is None:
+                left.append(user_id)
+            else:
+                moved.append(now)
+        if not (joined or left or moved):
+            return None
+        self.version += 1
+        self._snapshot = None
+        self._stats["diffs"] += 1
+        diff = {"version": self.version, "joined": joined, "left": left, "moved": moved}
+        if self.emit is not None:
+            self.emit(diff)
+        return diff
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "version": self.version,
+                "users": sum(1 for user in self._users.values() if user.visible),
+                "sockets": sum(len(sockets) for sockets in self._hosts.values()),
+            }
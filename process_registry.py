@@ -0,0 +1,81 @@
+"""
+Per-Process Registries - process_registry.py
+
+Writers, queues, caches, lock files and background threads belong to
+one worker process: a child forked by gunicorn must start its own
+rather than reuse handles and threads that only exist in the parent.
+ProcessRegistry keeps one object per key (usually a database path) per
+process, keyed by (os.getpid(), key), so a fork simply misses and
+creates a fresh one.
+
+Usage:
+    from process_registry import ProcessRegistry
+    _writers = ProcessRegistry()
+
+    writer = _writers.get_or_create(path, lambda: GroupCommitWriter(path))
+    _writers.get(path)                # None if this process has none
+    _writers.latest()                 # Most recently created, for *_stats()
+    for writer in _writers.pop_all():
+        writer.stop()
+"""
+import os
+import threading
+
+
+class ProcessRegistry:
+    """{key: object} for the current process; entries of other pids are never returned."""
+
+    def __init__(self):
+        self._items = {}  # (pid, key) -> object, in creation order
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._items.get((os.getpid(), key))
+
+    def get_or_create(self, key, factory):
+        """This process's object for key, calling factory() (once) to create it."""
+        ident = (os.getpid(), key)
+        item = self._items.get(ident)
+        if item is None:
+            with self._lock:
+                item = self._items.get(ident)
+                if item is None:
+                    item = self._items[ident] = factory()
+        return item
+
+    def swap(self, key, item):
+        """Store item under key (None: remove it). Returns the object it replaced."""
+        ident = (os.getpid(), key)
+        with self._lock:
+            previous = self._items.pop(ident, None)
+            if item is not None:
+                self._items[ident] = item
+        return previous
+
+    def discard(self, key, item=None):
+        """Remove key's object; with item given, only if it is still that object."""
+        ident = (os.getpid(), key)
+        with self._lock:
+            if item is None or self._items.get(ident) is item:
+                return self._items.pop(ident, None)
+        return None
+
+    def items(self):
+        """[(key, object)] of this process, oldest first."""
+        pid = os.getpid()
+        return [(key, item) for (owner, key), item in list(self._items.items()) if owner == pid]
+
+    def values(self):
+        return [item for _, item in self.items()]
+
+    def latest(self):
+        """The most recently created object of this process, or None."""
+        values = self.values()
+        return values[-1] if values else None
+
+    def pop_all(self):
+        """Forget every entry; returns this process's objects for the caller to close."""
+        with self._lock:
+            items, self._items = self._items, {}
+        pid = os.getpid()
+        return [item for (owner, _), item in items.items() if owner == pid]
@@ -5,8 +5,10 @@ Provides secure, paginated user listing with privacy controls.
 
 from flask import request, g, jsonify
 from db import get_db
+from db_snapshot import read_only_heavy
 
 
+@read_only_heavy
 def list_users():
     """
     List public user profiles for directory.
@@ -5,6 +5,7 @@ Fetch time-ordered feed of posts from followed users.
 """
 
 from db import get_db
+from db_epoch import epoch_sql
 import msgspec
 
 
@@ -40,10 +41,10 @@ def get_feed(user_id: int, limit: int = 20, before_id: int = None) -> list:
         query += " AND post.id < ?"
         params.append(before_id)
         
-    query += " ORDER BY post.created_at DESC LIMIT ?"
+    query += " ORDER BY post.created_at_ms DESC LIMIT ?"
     params.append(limit)
     
-    rows = db.execute(query, params).fetchall()
+    rows = db.execute(epoch_sql(query), params).fetchall()
     
     posts = []
     for row in rows:
@@ -5,10 +5,13 @@ Search users and content.
 """
 
 from db import get_db
+from db_epoch import epoch_sql
+from db_snapshot import read_only_heavy
 import json
 from queries.friends import is_following
 
 
+@read_only_heavy
 def search_users(query: str, current_user_id: int = None, limit: int = 20) -> list:
     """
     Search users by username or display name.
@@ -56,6 +59,7 @@ def search_users(query: str, current_user_id: int = None, limit: int = 20) -> li
     return results
 
 
+@read_only_heavy
 def search_posts(query: str, limit: int = 20) -> list:
     """
     Search generic text posts.
@@ -78,7 +82,7 @@ def search_posts(query: str, limit: int = 20) -> list:
     # SQLite JSON search is limited without JSON1 extension guaranteed, 
     # but we store payload as text.
     
-    rows = db.execute(
+    rows = db.execute(epoch_sql(
         """SELECT 
             post.id, post.module_type, post.content_payload, post.created_at,
             p.display_name as author_name, p.avatar_path as author_avatar, 
@@ -88,8 +92,8 @@ def search_posts(query: str, limit: int = 20) -> list:
            JOIN users u ON p.user_id = u.id
            WHERE post.module_type = 'text' 
              AND post.content_payload LIKE ?
-           ORDER BY post.created_at DESC
-           LIMIT ?""",
+           ORDER BY post.created_at_ms DESC
+           LIMIT ?"""),
         (term, limit)
     ).fetchall()
     
@@ -1,7 +1,9 @@
 
 from flask import jsonify
 from db import get_db
+from db_partitions import count_live_messages
+from db_snapshot import read_only_heavy
 
+@read_only_heavy
 def unread_count():
-    row = get_db().execute("SELECT COUNT(*) as c FROM messages WHERE deleted_at IS NULL").fetchone()
-    return jsonify(count=row["c"])
+    return jsonify(count=count_live_messages(get_db()))
@@ -0,0 +1,211 @@
+"""
+Room Registry - room_registry.py
+
+Every join_room resolved its room with up to two SELECTs on rooms (the
+name, then the 'general' fallback), and every sidebar render listed the
+rooms again through /rooms. Rooms are few and almost never change, so
+RoomRegistry loads the table once per worker and answers both from
+memory:
+
+- create_room_logic() calls room_created() after its commit; it is
+  published on the socket bus and every worker (this one included)
+  adds the room, bumping the registry's version
+- a load that started before a version bump is returned but not stored,
+  so a reload racing a new room never drops it
+- a name that is not known triggers a reload at most every
+  RELOAD_INTERVAL seconds, which heals a worker that missed a bus
+  message (or a room inserted by hand) without a query per join
+- listed() also carries how many users are online in each room, read
+  from the presence registry the socket bus already keeps up to date
+
+Usage:
+    from room_registry import get_room_registry, room_created
+    get_room_registry().resolve_id("music")   # general's id if unknown
+    get_room_registry().listed()               # the sidebar's rooms
+    room_created(room)                         # after committing an INSERT
+"""
+import threading
+import time
+
+from flask import current_app
+
+from process_registry import ProcessRegistry
+from socket_bus import publish, subscribe
+
+# =============================================================================
+# Settings
+# =============================================================================
+RELOAD_INTERVAL = 5.0  # Seconds between reloads triggered by unknown names
+ROOMS_TOPIC = "rooms"  # Socket bus topic of room creations
+PINNED_ROOMS = ("general", "announcements")  # Listed first, in this order
+FALLBACK_ROOM = "general"  # Unknown names resolve to this room
+FALLBACK_ROOM_ID = 1  # ...or to this id when even general does not exist
+
+
+class Room:
+    """One row of rooms."""
+
+    __slots__ = ("id", "name", "description", "room_type", "is_default")
+
+    def __init__(self, id, name, description, room_type, is_default):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.room_type = room_type
+        self.is_default = is_default
+
+    def public(self):
+        return {"id": self.id, "name": self.name, "description": self.description,
+                "room_type": self.room_type}
+
+
+def _sort_key(room):
+    pinned = PINNED_ROOMS.index(room.name) if room.name in PINNED_ROOMS else len(PINNED_ROOMS)
+    return pinned, room.name
+
+
+class RoomRegistry:
+    """Rooms by name; load() returns rooms rows, members() {room name: online users}."""
+
+    def __init__(self, load, members=None, reload_interval=RELOAD_INTERVAL):
+        self._load = load
+        self.members = members
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()  # Guards everything below
+        self._rooms = None  # name -> Room, None until loaded
+        self._listed = None  # Cached listed() rows of the current version
+        self._reloaded = 0.0  # monotonic time of the last load
+        self.version = 0  # Bumped by every change
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "stale_loads": 0}
+
+    def get(self, name):
+        """The Room called name, or None."""
+        with self._lock:
+            rooms = self._rooms
+            room = rooms.get(name) if rooms is not None else None
+            if room is not None:
+                self._stats["hits"] += 1
+                return room
+            self._stats["misses"] += 1
+            if rooms is not None and time.monotonic() - self._reloaded < self.reload_interval:
+                return None
+        return self.reload().get(name)
+
+    def resolve_id(self, name):
+        """Id of the room called name, falling back to general's (join_room's rule)."""
+        room = self.get(name) or self.get(FALLBACK_ROOM)
+        return room.id if room is not None else FALLBACK_ROOM_ID
+
+    def listed(self):
+        """Default rooms, general and announcements first, each with its "members" online."""
+        with self._lock:
+            rows = self._listed
+        if rows is None:
+            rows = self._list()
+        counts = self.members() if self.members is not None else {}
+        return [{**row, "members": counts.get(row["name"], 0)} for row in rows]
+
+    def reload(self):
+        """Load every room from the database now (and keep them unless changed meanwhile)."""
+        with self._lock:
+            version = self.version
+            self._reloaded = time.monotonic()
+            self._stats["loads"] += 1
+        rooms = {row["name"]: Room(row["id"], row["name"], row["description"], row["room_type"],
+                                   bool(row["is_default"]))
+                 for row in self._load()}
+        with self._lock:
+            if self.version != version:
+                self._stats["stale_loads"] += 1
+                return rooms
+            self._rooms = rooms
+            self._listed = None
+            self.version += 1
+        return rooms
+
+    def add(self, room):
+        """Register a room created on any worker."""
+        with self._lock:
+            if self._rooms is None:
+                return  # Not loaded yet: the first load will read it
+            self._rooms[room.name] = room
+            self._listed = None
+            self.version += 1
+
+    def invalidate(self):
+        """Forget every room; the next lookup reloads."""
+        with self._lock:
+            self._rooms = None
+            self._listed = None
+            self.version += 1
+
+    def _list(self):
+        with self._lock:
+            rooms = self._rooms
+        if rooms is None:
+            rooms = self.reload()
+        rows = [room.public() for room in sorted(rooms.values(), key=_sort_key) if room.is_default]
+        with self._lock:
+            if self._rooms is rooms:
+                self._listed = rows
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "rooms": len(self._rooms or ()), "version": self.version}
+
+
+def _load_rooms():
+    from db import get_db
+    return get_db().execute(
+        "SELECT id, name, description, room_type, is_default FROM rooms"
+    ).fetchall()
+
+
+# =============================================================================
+# Process-wide registries (one per database, recreated after fork)
+# =============================================================================
+_registries = ProcessRegistry()
+_members = None  # Online users per room, see count_members_with()
+
+
+def get_room_registry(path=None):
+    """The registry for a database in this process (default: the current app's)."""
+    return _registries.get_or_create(path or current_app.config["DATABASE"],
+                                     lambda: RoomRegistry(_load_rooms, _members))
+
+
+def forget_room_registry(path=None):
+    """Drop the registry for a database (init_db: the file may be a new one)."""
+    _registries.discard(path or current_app.config["DATABASE"])
+
+
+def count_members_with(members):
+    """Use members() ({room name: online users}) for the counts in listed()."""
+    global _members
+    _members = members
+    for registry in _registries.values():
+        registry.members = members
+
+
+def room_created(room):
+    """Call after committing a new room (a public() dict): registers it on every worker."""
+    publish(ROOMS_TOPIC, {"path": current_app.config["DATABASE"],
+                          "room": {**room, "is_default": True}})
+
+
+def _add(payload):
+    registry = _registries.get(payload["path"])
+    if registry is not None:
+        room = payload["room"]
+        registry.add(Room(room["id"], room["name"], room["description"], room["room_type"],
+                          room["is_default"]))
+
+
+subscribe(ROOMS_TOPIC, _add)
+
+
+def room_registry_stats():
+    """Counters for this process's most recently created registry, if any."""
+    registry = _registries.latest()
+    return registry.stats() if registry else None
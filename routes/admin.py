@@ -1,7 +1,12 @@
 import functools
-from flask import Blueprint, g, render_template, abort
+from flask import Blueprint, g, render_template, abort, jsonify, request
 from db import get_db
-from mutations.moderation import resolve_report, submit_report as submit_report_mutation
+from db_snapshot import read_only_heavy
+from core.telemetry import registry as query_registry
+from mutations.moderation import (
+    delete_user as delete_user_mutation, resolve_report, set_user_banned,
+    submit_report as submit_report_mutation,
+)
 from utils.decorators import log_admin_action
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -24,6 +29,7 @@ def staff_required(view):
 
 @bp.route('/')
 @staff_required
+@read_only_heavy
 def dashboard():
     db = get_db()
     pending_count = db.execute("SELECT COUNT(*) as c FROM reports WHERE status = 'pending'").fetchone()['c']
@@ -41,3 +47,22 @@ def dashboard():
 @log_admin_action("resolve_report")
 def resolve():
     return resolve_report()
+
+@bp.route('/users/<int:user_id>/ban', methods=['POST', 'DELETE'])
+@staff_required
+@log_admin_action("ban_user")
+def ban_user(user_id):
+    return set_user_banned(user_id)
+
+@bp.route('/users/<int:user_id>', methods=['DELETE'])
+@staff_required
+@log_admin_action("delete_user")
+def delete_user(user_id):
+    return delete_user_mutation(user_id)
+
+@bp.route('/queries')
+@staff_required
+def queries():
+    """Per-statement and per-endpoint query telemetry for this worker."""
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify(query_registry.snapshot(limit=limit))
@@ -95,20 +95,11 @@ def lobby_users():
     if g.user is None:
          return {"error": "Unauthorized"}, 401
     
-    from sockets import authenticated_sockets
-    
-    # Deduplicate users (one user might have multiple tabs/sockets)
-    unique_users = {}
-    for sid, info in authenticated_sockets.items():
-        uid = info['user_id']
-        if uid not in unique_users:
-            unique_users[uid] = {
-                'id': uid,
-                'username': info['username'],
-                'room': info['room_name']
-            }
-    
-    return {"users": list(unique_users.values())}
+    from sockets import presence
+
+    # One record per user (however many tabs, on any worker); the lobby
+    # fetches this once and then follows presence_diff over its socket
+    return presence.snapshot()
 
 
 @bp.route("/internals")
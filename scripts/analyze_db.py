@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Refresh planner statistics now (the app also does this in the background).
+
+Runs a targeted ANALYZE on every table whose row count drifted since the
+last one (see db_analyze). --all analyzes every table regardless.
+
+    python scripts/analyze_db.py
+    python scripts/analyze_db.py --all
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from db import get_pool, open_connection  # noqa: E402
+from db_analyze import refresh_statistics  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="Analyze every table that has rows")
+    args = parser.parse_args()
+
+    app = create_app({"DB_ANALYZE_ENABLED": False})
+    with app.app_context():
+        pool = get_pool()
+        conn = open_connection(pool.db_path, pool.pragmas)
+        try:
+            if args.all:
+                result = refresh_statistics(conn, drift=0, min_delta=1, statements=[])
+            else:
+                result = refresh_statistics(conn, drift=app.config["DB_ANALYZE_DRIFT"], statements=[])
+        finally:
+            conn.close()
+    print(f"Analyzed {len(result['analyzed'])} table(s): {', '.join(result['analyzed']) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Run one message archiver pass now (the app also runs it in the background).
+
+Moves soft-deleted messages and messages past their room's retention
+window into messages_archive, then reclaims free pages (see db_archive).
+
+    python scripts/archive_messages.py
+    python scripts/archive_messages.py --convert   # one-off: enable incremental_vacuum on an existing database
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from db import get_pool, open_connection  # noqa: E402
+from db_archive import archive_messages, convert_to_incremental, reclaim_pages  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--convert", action="store_true",
+                        help="Switch the database to auto_vacuum=INCREMENTAL (runs VACUUM; stop the app first)")
+    args = parser.parse_args()
+
+    app = create_app({"ARCHIVE_ENABLED": False})
+    with app.app_context():
+        pool = get_pool()
+        conn = open_connection(pool.db_path, pool.pragmas)
+        try:
+            if args.convert:
+                ok = convert_to_incremental(conn)
+                print("auto_vacuum=INCREMENTAL" if ok else "Conversion failed")
+                return 0 if ok else 1
+            moved = archive_messages(conn, retention_days=app.config["ARCHIVE_RETENTION_DAYS"])
+            pages = reclaim_pages(conn)
+            print(f"Archived {moved['deleted']} deleted and {moved['expired']} expired message(s), "
+                  f"reclaimed {pages} page(s)")
+        finally:
+            conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN QUERY PLAN check for NeoSpace.
+Plans every SQL statement in queries/, services/, sockets.py,
+db_partitions.py and db_archive.py and lists full table scans and temp
+B-tree sorts with a suggested index.
+
+    python scripts/explain_queries.py                # empty schema, representative statistics
+    python scripts/explain_queries.py --db neospace.db
+    python scripts/explain_queries.py --migration    # write an Alembic revision
+
+Exits non-zero when there are findings not listed in ACCEPTED_FINDINGS.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.query_plans import (  # noqa: E402
+    ROOT, build_database, check_statements, collect_statements, render_migration,
+)
+
+
+def current_head():
+    """Newest Alembic revision (the one no other revision points back to)."""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory.from_config(Config(os.path.join(ROOT, "alembic.ini")))
+    return script.get_current_head()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Plan against an existing (analyzed) database instead of the representative statistics")
+    parser.add_argument("--all", action="store_true", help="Also list accepted findings")
+    parser.add_argument("--migration", action="store_true", help="Write an Alembic migration for the suggested indexes")
+    args = parser.parse_args()
+
+    if args.db:
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    else:
+        conn = build_database()
+
+    findings, errors = check_statements(conn, collect_statements())
+    open_findings = [f for f in findings if not f.accepted]
+
+    for finding in findings:
+        if finding.accepted and not args.all:
+            continue
+        tag = "accepted" if finding.accepted else finding.kind
+        print(f"[{tag}] {finding.statement.location} ({finding.statement_id}): {finding.detail}")
+        if finding.suggestion:
+            print(f"    -> {finding.suggestion}")
+    for stmt, error in errors:
+        print(f"[error] {stmt.location}: {error}")
+
+    print(f"{len(open_findings)} finding(s), {len(findings) - len(open_findings)} accepted, {len(errors)} error(s)")
+
+    if args.migration:
+        suggestions = [f.suggestion for f in open_findings if f.suggestion]
+        if not suggestions:
+            print("Nothing to migrate.")
+        else:
+            revision = uuid.uuid4().hex[:12]
+            path = os.path.join(ROOT, "migrations", "versions", f"{revision}_add_advised_indexes.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render_migration(suggestions, revision, current_head()))
+            print(f"Wrote {os.path.relpath(path, ROOT)}")
+
+    return 1 if open_findings or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Roll old chat history into monthly partition files.
+
+Moves every month older than MESSAGE_HOT_MONTHS out of the main messages
+table into <db>.messages-YYYY-MM.db (see db_partitions). Run it daily from
+cron; a month that is already rolled is a no-op.
+
+    python scripts/roll_message_partitions.py
+    python scripts/roll_message_partitions.py --drop 2023-01          # delete a month
+    python scripts/roll_message_partitions.py --move 2023-01 /mnt/cold  # relocate a month
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from db_partitions import drop_partition, move_partition, roll_partitions  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drop", metavar="MONTH", help="Delete a rolled month (YYYY-MM) and its file")
+    parser.add_argument("--move", nargs=2, metavar=("MONTH", "DIR"), help="Move a rolled month's file to DIR")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.drop:
+            if not drop_partition(args.drop):
+                print(f"No partition for {args.drop}")
+                return 1
+            print(f"Dropped {args.drop}")
+        elif args.move:
+            target = move_partition(*args.move)
+            if target is None:
+                print(f"No partition for {args.move[0]}")
+                return 1
+            print(f"Moved {args.move[0]} -> {target}")
+        else:
+            moved = roll_partitions(hot_months=app.config["MESSAGE_HOT_MONTHS"])
+            for month, rows in moved.items():
+                print(f"Rolled {month}: {rows} message(s)")
+            if not moved:
+                print("Nothing to roll")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,54 @@ Handles DB interactions for Cat Personalities, States, and Relationships.
 from typing import List, Dict, Optional, Any
 import json
 import time
-from db import get_db, execute_with_retry
+from db import get_db, execute_with_retry, hold_write_lock
+from db_writer import write
+from db_writebehind import write_behind
+from db_epoch import epoch_reads_ready, now_ms
+
+# Affinity = active memories + faction compatibility, clamped to [-100, 100].
+# A single statement so it can be queued write-behind after add_memory.
+RELATIONSHIP_UPSERT = """
+INSERT INTO cat_relationships (source_cat_id, target_user_id, affinity, compatibility, last_updated)
+SELECT
+    :cat_id, :user_id,
+    MAX(-100, MIN(100, COALESCE((
+        SELECT SUM(opinion_modifier)
+        FROM cat_memories
+        WHERE source_cat_id = :cat_id AND target_user_id = :user_id AND expires_at_ms > :now_ms
+    ), 0.0) + compat.value)),
+    compat.value,
+    CURRENT_TIMESTAMP
+FROM (
+    SELECT CASE
+        WHEN src.faction_id IS NULL OR tgt.faction_id IS NULL THEN 0.0
+        WHEN src.faction_id = tgt.faction_id THEN 30.0   -- Same Faction Bonus
+        ELSE -10.0                                       -- Rival Faction (Generic)
+    END AS value
+    FROM (SELECT (SELECT faction_id FROM cat_personalities WHERE id = :cat_id) AS faction_id) src,
+         (SELECT (
+            SELECT cp.faction_id
+            FROM users u
+            JOIN cat_personalities cp ON u.bot_personality_id = cp.id
+            WHERE u.id = :user_id
+         ) AS faction_id) tgt
+) compat
+WHERE 1
+ON CONFLICT(source_cat_id, target_user_id) DO UPDATE SET
+    affinity = excluded.affinity,
+    compatibility = excluded.compatibility,
+    last_updated = CURRENT_TIMESTAMP
+"""
+
+# Until the epoch backfill is done, older memories only have the TEXT expiry
+RELATIONSHIP_UPSERT_TEXT = RELATIONSHIP_UPSERT.replace(
+    "expires_at_ms > :now_ms", "expires_at > datetime(:now_ms / 1000.0, 'unixepoch')"
+)
+
+
+def _relationship_upsert():
+    return RELATIONSHIP_UPSERT if epoch_reads_ready() else RELATIONSHIP_UPSERT_TEXT
+
 
 class CatStore:
     @staticmethod
@@ -45,23 +92,24 @@ class CatStore:
     def seed_personalities(base_cats: List[Dict]):
         """Insert default cat personalities."""
         db = get_db()
-        for cat in base_cats:
-            db.execute('''
-                INSERT OR IGNORE INTO cat_personalities 
-                (name, priority, triggers, mode, silence_bias, global_observer, 
-                 pleasure_weight, arousal_weight, dominance_weight, avatar_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                cat["name"],
-                cat["priority"],
-                json.dumps(cat["triggers"]),
-                "cute",
-                cat["silence_bias"],
-                1 if cat.get("global_observer") else 0,
-                1.0, 0.5, 1.0, 
-                f"/static/images/cats/{cat['name']}.png"
-            ))
-        db.commit()
+        with hold_write_lock():
+            for cat in base_cats:
+                db.execute('''
+                    INSERT OR IGNORE INTO cat_personalities 
+                    (name, priority, triggers, mode, silence_bias, global_observer, 
+                     pleasure_weight, arousal_weight, dominance_weight, avatar_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    cat["name"],
+                    cat["priority"],
+                    json.dumps(cat["triggers"]),
+                    "cute",
+                    cat["silence_bias"],
+                    1 if cat.get("global_observer") else 0,
+                    1.0, 0.5, 1.0, 
+                    f"/static/images/cats/{cat['name']}.png"
+                ))
+            db.commit()
 
     @staticmethod
     def seed_bot_users(base_cats: List[Dict]):
@@ -71,54 +119,55 @@ class CatStore:
         
         db = get_db()
         
-        for cat in base_cats:
-            # Check if user exists
-            existing = db.execute(
-                "SELECT id FROM users WHERE username = ?",
-                (cat["name"],)
-            ).fetchone()
+        with hold_write_lock():
+            for cat in base_cats:
+                # Check if user exists
+                existing = db.execute(
+                    "SELECT id FROM users WHERE username = ?",
+                    (cat["name"],)
+                ).fetchone()
             
-            if existing:
-                # Update existing bot status and personality link
-                user_id = existing["id"]
-                db.execute("UPDATE users SET is_bot = 1 WHERE id = ?", (user_id,))
-            else:
-                # Create new bot user
-                password_hash = generate_password_hash(secrets.token_hex(32))
-                cursor = db.execute('''
-                    INSERT INTO users (username, password_hash, is_bot, avatar_color, created_at)
-                    VALUES (?, ?, 1, ?, CURRENT_TIMESTAMP)
-                ''', (cat["name"], password_hash, "#" + secrets.token_hex(3)[:6]))
-                user_id = cursor.lastrowid
+                if existing:
+                    # Update existing bot status and personality link
+                    user_id = existing["id"]
+                    db.execute("UPDATE users SET is_bot = 1 WHERE id = ?", (user_id,))
+                else:
+                    # Create new bot user
+                    password_hash = generate_password_hash(secrets.token_hex(32))
+                    cursor = db.execute('''
+                        INSERT INTO users (username, password_hash, is_bot, avatar_color, created_at)
+                        VALUES (?, ?, 1, ?, CURRENT_TIMESTAMP)
+                    ''', (cat["name"], password_hash, "#" + secrets.token_hex(3)[:6]))
+                    user_id = cursor.lastrowid
             
-            # Link Personality (Always update)
-            personality = db.execute(
-                "SELECT id FROM cat_personalities WHERE name = ?",
-                (cat["name"],)
-            ).fetchone()
+                # Link Personality (Always update)
+                personality = db.execute(
+                    "SELECT id FROM cat_personalities WHERE name = ?",
+                    (cat["name"],)
+                ).fetchone()
             
-            if personality:
-                db.execute(
-                    "UPDATE users SET bot_personality_id = ? WHERE id = ?",
-                    (personality["id"], user_id)
-                )
+                if personality:
+                    db.execute(
+                        "UPDATE users SET bot_personality_id = ? WHERE id = ?",
+                        (personality["id"], user_id)
+                    )
             
-            # Update/Create profile (Sync display name & bio)
-            # We use INSERT OR REPLACE logic or explicit UPDATE
-            db.execute('''
-                INSERT INTO profiles (user_id, display_name, bio, theme_preset)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    display_name = excluded.display_name,
-                    bio = excluded.bio
-            ''', (
-                user_id,
-                cat["name"].upper(),
-                f"🐱 SYSTEM BIT: {cat['name'].upper()}",
-                "term"
-            ))
+                # Update/Create profile (Sync display name & bio)
+                # We use INSERT OR REPLACE logic or explicit UPDATE
+                db.execute('''
+                    INSERT INTO profiles (user_id, display_name, bio, theme_preset)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        display_name = excluded.display_name,
+                        bio = excluded.bio
+                ''', (
+                    user_id,
+                    cat["name"].upper(),
+                    f"🐱 SYSTEM BIT: {cat['name'].upper()}",
+                    "term"
+                ))
         
-        db.commit()
+            db.commit()
 
     @staticmethod
     def update_cat_state(cat_id: int, pad: tuple, last_deed_id: str = None):
@@ -143,15 +192,21 @@ class CatStore:
     def add_memory(cat_id: int, user_id: int, memory_type: str, impact: float, duration_hours: int = 24):
         """
         Log a memory.
+        Queued write-behind together with the relationship recalculation,
+        so /cats/speak doesn't wait on either write.
         """
         query = """
-        INSERT INTO cat_memories (source_cat_id, target_user_id, memory_type, opinion_modifier, expires_at)
-        VALUES (?, ?, ?, ?, datetime('now', ?))
+        INSERT INTO cat_memories (source_cat_id, target_user_id, memory_type, opinion_modifier,
+                                  expires_at, created_at_ms, expires_at_ms)
+        VALUES (?, ?, ?, ?, datetime(? / 1000.0, 'unixepoch'), ?, ?)
         """
-        execute_with_retry(query, (cat_id, user_id, memory_type, impact, f'+{duration_hours} hours'))
+        # Timestamps are taken now, not when the write-behind queue flushes
+        created = now_ms()
+        expires = created + duration_hours * 3600 * 1000
+        write_behind(query, (cat_id, user_id, memory_type, impact, expires, created, expires))
         
-        # Trigger recalculation of relationship
-        CatStore.recalculate_relationship(cat_id, user_id)
+        # Trigger recalculation of relationship (applied after the insert)
+        write_behind(_relationship_upsert(), {"cat_id": cat_id, "user_id": user_id, "now_ms": created})
 
     @staticmethod
     def recalculate_relationship(cat_id: int, user_id: int):
@@ -159,56 +214,7 @@ class CatStore:
         Sum up active memories to determine affinity.
         Also calculates Faction Compatibility if target is a Cat Bot.
         """
-        db = get_db()
-        
-        # 1. Sum Memories
-        query_sum = """
-        SELECT SUM(opinion_modifier) 
-        FROM cat_memories 
-        WHERE source_cat_id = ? AND target_user_id = ? AND expires_at > datetime('now')
-        """
-        row = execute_with_retry(query_sum, (cat_id, user_id), fetchone=True)
-        affinity_memories = row[0] if row and row[0] else 0.0
-
-        # 2. Get Compatibility (Faction Based)
-        compatibility = 0.0
-        
-        try:
-            # Check source faction
-            src_row = db.execute("SELECT faction_id FROM cat_personalities WHERE id = ?", (cat_id,)).fetchone()
-            
-            # Check target faction (is it a bot with a personality?)
-            tgt_row = db.execute("""
-                SELECT cp.faction_id 
-                FROM users u 
-                JOIN cat_personalities cp ON u.bot_personality_id = cp.id 
-                WHERE u.id = ?
-            """, (user_id,)).fetchone()
-            
-            if src_row and tgt_row and src_row[0] and tgt_row[0]:
-                if src_row[0] == tgt_row[0]:
-                    compatibility = 30.0 # Same Faction Bonus
-                else:
-                    compatibility = -10.0 # Rival Faction (Generic)
-        except Exception as e:
-            # Filter expected errors (e.g. missing tables during initial seed)
-            # Otherwise log the issue
-            if "no such table" not in str(e).lower():
-                import logging
-                logging.warning(f"Failed to calculate cat compatibility: {e}")
-        
-        # 3. Update Table
-        total_affinity = max(-100, min(100, affinity_memories + compatibility))
-        
-        update_query = """
-        INSERT INTO cat_relationships (source_cat_id, target_user_id, affinity, compatibility, last_updated)
-        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ON CONFLICT(source_cat_id, target_user_id) DO UPDATE SET
-            affinity = excluded.affinity,
-            compatibility = excluded.compatibility,
-            last_updated = CURRENT_TIMESTAMP
-        """
-        execute_with_retry(update_query, (cat_id, user_id, total_affinity, compatibility))
+        write(_relationship_upsert(), {"cat_id": cat_id, "user_id": user_id, "now_ms": now_ms()})
 
     @staticmethod
     def get_relationship(cat_id: int, user_id: int) -> float:
@@ -7,7 +7,8 @@ import html
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Any
 
-from db import get_db
+from db import get_db, hold_write_lock
+from db_epoch import epoch_sql, now_ms
 from core.types import ServiceResult
 from core.crypto import (
     get_dm_key, 
@@ -63,11 +64,11 @@ def send_message(sender_id: int, recipient_id: int, content: str) -> ServiceResu
     # Check "mutuals" policy
     if profile and profile["dm_policy"] == "mutuals":
         sender_follows = db.execute(
-            "SELECT 1 FROM follows WHERE follower_id = ? AND followed_id = ?",
+            "SELECT 1 FROM friends WHERE follower_id = ? AND following_id = ?",
             (sender_id, recipient_id)
         ).fetchone()
         recipient_follows = db.execute(
-            "SELECT 1 FROM follows WHERE follower_id = ? AND followed_id = ?",
+            "SELECT 1 FROM friends WHERE follower_id = ? AND following_id = ?",
             (recipient_id, sender_id)
         ).fetchone()
         
@@ -84,15 +85,16 @@ def send_message(sender_id: int, recipient_id: int, content: str) -> ServiceResu
     ciphertext, iv, tag = encrypt_message(safe_content, conversation_key)
     
     # Store encrypted message
-    db.execute(
-        """INSERT INTO direct_messages 
-           (conversation_id, sender_id, recipient_id, content_encrypted, content_iv, content_tag)
-           VALUES (?, ?, ?, ?, ?, ?)""",
-        (conversation_id, sender_id, recipient_id, ciphertext, iv, tag)
-    )
-    db.commit()
+    with hold_write_lock():
+        cursor = db.execute(
+            """INSERT INTO direct_messages 
+               (conversation_id, sender_id, recipient_id, content_encrypted, content_iv, content_tag, created_at_ms)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (conversation_id, sender_id, recipient_id, ciphertext, iv, tag, now_ms())
+        )
+        db.commit()
     
-    msg_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+    msg_id = cursor.lastrowid
     
     return ServiceResult(success=True, data={
         "id": msg_id, 
@@ -191,13 +193,14 @@ def mark_messages_read(user_id: int, message_id: int) -> ServiceResult:
     """
     db = get_db()
     
-    db.execute(
-        """UPDATE direct_messages 
-           SET read_at = datetime('now')
-           WHERE id <= ? AND recipient_id = ? AND read_at IS NULL""",
-        (message_id, user_id)
-    )
-    db.commit()
+    with hold_write_lock():
+        db.execute(
+            """UPDATE direct_messages 
+               SET read_at = datetime('now')
+               WHERE id <= ? AND recipient_id = ? AND read_at IS NULL""",
+            (message_id, user_id)
+        )
+        db.commit()
     
     return ServiceResult(success=True)
 
@@ -225,20 +228,21 @@ def delete_message(user_id: int, message_id: int) -> ServiceResult:
     if not row:
         return ServiceResult(success=False, error="Message not found", status=404)
     
-    if row["sender_id"] == user_id:
-        db.execute(
-            "UPDATE direct_messages SET deleted_by_sender = 1 WHERE id = ?",
-            (message_id,)
-        )
-    elif row["recipient_id"] == user_id:
-        db.execute(
-            "UPDATE direct_messages SET deleted_by_recipient = 1 WHERE id = ?",
-            (message_id,)
-        )
-    else:
-        return ServiceResult(success=False, error="Not authorized", status=403)
-    
-    db.commit()
+    with hold_write_lock():
+        if row["sender_id"] == user_id:
+            db.execute(
+                "UPDATE direct_messages SET deleted_by_sender = 1 WHERE id = ?",
+                (message_id,)
+            )
+        elif row["recipient_id"] == user_id:
+            db.execute(
+                "UPDATE direct_messages SET deleted_by_recipient = 1 WHERE id = ?",
+                (message_id,)
+            )
+        else:
+            return ServiceResult(success=False, error="Not authorized", status=403)
+        
+        db.commit()
     return ServiceResult(success=True)
 
 
@@ -274,10 +278,10 @@ def list_user_conversations(user_id: int) -> ServiceResult:
                OR (recipient_id = ? AND deleted_by_recipient = 0)
             GROUP BY conversation_id
         ) latest ON dm.id = latest.max_id
-        ORDER BY dm.created_at DESC
+        ORDER BY dm.created_at_ms DESC
     """
     
-    rows = db.execute(query, (user_id, user_id, user_id)).fetchall()
+    rows = db.execute(epoch_sql(query), (user_id, user_id, user_id)).fetchall()
     
     conversations = []
     for row in rows:
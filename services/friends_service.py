@@ -4,7 +4,8 @@ Friends Service - Business logic for social graph operations.
 
 from typing import Optional, Dict, Any, List
 from dataclasses import dataclass
-from db import get_db
+from db import get_db, hold_write_lock, WriteLockTimeout
+from db_writer import WriterBusyError, write_transaction
 
 @dataclass
 class ServiceResult:
@@ -37,11 +38,12 @@ def follow_user(follower_id: int, target_id: int) -> ServiceResult:
         return ServiceResult(success=True, data={"already_following": True})
         
     try:
-        db.execute(
-            "INSERT INTO friends (follower_id, following_id) VALUES (?, ?)",
-            (follower_id, target_id)
-        )
-        db.commit()
+        with hold_write_lock():
+            db.execute(
+                "INSERT INTO friends (follower_id, following_id) VALUES (?, ?)",
+                (follower_id, target_id)
+            )
+            db.commit()
         
         # Trigger notification
         # We can implement this via a callback or importing notification service?
@@ -49,12 +51,12 @@ def follow_user(follower_id: int, target_id: int) -> ServiceResult:
         # Typically one service calling another is fine.
         # Ideally, we return success and let the caller (mutation) handle notifications or use an event system.
         # But for this refactor, let's include it here to centralize logic.
-        from services.notification_service import create_notification
+        from services.notification_service import queue_notification
         
         # Get follower username for notification
         follower = db.execute("SELECT username FROM users WHERE id = ?", (follower_id,)).fetchone()
         
-        create_notification(
+        queue_notification(
             user_id=target_id,
             notif_type="follow",
             title=f"{follower['username']} started following you",
@@ -62,6 +64,8 @@ def follow_user(follower_id: int, target_id: int) -> ServiceResult:
             actor_id=follower_id
         )
         
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
         return ServiceResult(success=False, error=str(e), status=500)
         
@@ -73,11 +77,12 @@ def unfollow_user(follower_id: int, target_id: int) -> ServiceResult:
     Unfollow a user.
     """
     db = get_db()
-    db.execute(
-        "DELETE FROM friends WHERE follower_id = ? AND following_id = ?",
-        (follower_id, target_id)
-    )
-    db.commit()
+    with hold_write_lock():
+        db.execute(
+            "DELETE FROM friends WHERE follower_id = ? AND following_id = ?",
+            (follower_id, target_id)
+        )
+        db.commit()
     return ServiceResult(success=True)
 
 
@@ -88,24 +93,26 @@ def set_top8(user_id: int, friend_ids: List[int]) -> ServiceResult:
     if len(friend_ids) > 8:
         return ServiceResult(success=False, error="Max 8 users", status=400)
         
-    db = get_db()
-    
-    try:
+    def replace_top8(conn):
         # Clear existing
-        db.execute(
+        conn.execute(
             "UPDATE friends SET top8_position = NULL WHERE follower_id = ?",
             (user_id,)
         )
         
         # Set new
         for idx, fid in enumerate(friend_ids, start=1):
-            db.execute(
+            conn.execute(
                 """UPDATE friends 
                    SET top8_position = ? 
                    WHERE follower_id = ? AND following_id = ?""",
                 (idx, user_id, fid)
             )
-        db.commit()
+    
+    try:
+        write_transaction(replace_top8)
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
          return ServiceResult(success=False, error=str(e), status=500)
          
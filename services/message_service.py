@@ -0,0 +1,214 @@
+"""
+Message Service - services/message_service.py
+
+Chat messages had two write paths: POST /send inserted with no room and
+never broadcast, and the socket send_message handler had its own
+validation, sanitizing and error handling. Both now go through one
+MessagePipeline:
+
+    validate -> sanitize -> idempotency -> persist -> remember -> broadcast
+
+- persist goes through the group-commit writer (db_writer); when its
+  queue is BACKPRESSURE_RATIO full, new messages are refused with a 503
+  before any work is done, instead of queueing until they time out
+- idempotency: a send carrying an idempotency key runs once; retries
+  get the original message back and are not broadcast again
+  (idempotency.py, shared by socket and HTTP sends). The key's result
+  is written in the same transaction as the message, and a send that
+  timed out mid-commit keeps its claim rather than letting a retry
+  insert the message a second time
+- remember appends to the room's recent-message ring (db_recent)
+- broadcast is registered by sockets.py (broadcast_messages_with), so
+  HTTP sends reach the room's sockets like socket sends do
+- every stage is timed; stats() feeds /metrics
+
+Usage:
+    from services.message_service import send_message_logic
+    result = send_message_logic("ana", content, room_name="general")
+    result.data["message"]  # core.structs.Message
+"""
+import sqlite3
+import threading
+import time
+
+import msgspec
+import structlog
+
+from core.structs import Message
+from core.types import ServiceResult
+from core.validators import validate_content_length
+from db_recent import remember
+from db_writer import WriteOutcomeUnknown, WriterBusyError, write_pressure, write_transaction
+from db_epoch import now_ms
+from idempotency import IN_PROGRESS, get_idempotency_store, valid_key
+from room_registry import get_room_registry
+from utils.sanitize import clean_html
+
+logger = structlog.get_logger(__name__)
+
+# =============================================================================
+# Settings
+# =============================================================================
+MAX_CONTENT_LENGTH = 10000  # Characters per message, after stripping whitespace
+BACKPRESSURE_RATIO = 0.8  # Refuse messages once the write queue is this full
+IDEMPOTENCY_SCOPE = "message"  # idempotency_keys.scope of chat messages
+STAGES = ("validate", "sanitize", "idempotency", "persist", "remember", "broadcast")
+
+
+class MessagePipeline:
+    """One path for every new chat message; broadcast(room_name, message) fans out."""
+
+    def __init__(self, broadcast=None, idempotency=None, backpressure_ratio=BACKPRESSURE_RATIO):
+        self.broadcast = broadcast
+        self.idempotency = idempotency  # An idempotency.IdempotencyStore (default: the app's)
+        self.backpressure_ratio = backpressure_ratio
+        self._lock = threading.Lock()  # Guards _stats
+        self._stats = {
+            "accepted": 0,
+            "rejected": {"invalid": 0, "busy": 0, "in_progress": 0, "error": 0},
+            "replayed": 0,
+            "seconds": dict.fromkeys(STAGES, 0.0),
+            "runs": dict.fromkeys(STAGES, 0),
+        }
+
+    def send(self, user, content, room_name="general", room_id=None, idempotency_key=None):
+        """Run a message through every stage. ServiceResult.data: {"message": Message}."""
+        timings = []
+        clock = time.perf_counter()
+
+        def lap(stage):
+            nonlocal clock
+            now = time.perf_counter()
+            timings.append((stage, now - clock))
+            clock = now
+
+        # 1. Validate (and shed load before doing any work)
+        content = content.strip() if isinstance(content, str) else ""
+        error = "Empty message" if not content else validate_content_length(content, MAX_CONTENT_LENGTH)
+        if not error and idempotency_key is not None and not valid_key(idempotency_key):
+            error = "Invalid idempotency key"
+        if error:
+            return self._finish(timings, "invalid", ServiceResult(success=False, error=error, status=400))
+        if write_pressure() >= self.backpressure_ratio:
+            return self._finish(timings, "busy", ServiceResult(
+                success=False, error="Server busy, please retry", status=503))
+        if room_id is None:
+            room_id = get_room_registry().resolve_id(room_name)
+        lap("validate")
+
+        # 2. Sanitize
+        content = clean_html(content)
+        lap("sanitize")
+
+        # 3. Idempotency: a retried send returns the message it already created
+        store = None
+        if idempotency_key is not None:
+            store = self.idempotency or get_idempotency_store()
+            try:
+                replay = store.begin(IDEMPOTENCY_SCOPE, user, idempotency_key)
+            except Exception as e:
+                return self._failed(timings, e)
+            lap("idempotency")
+            if replay is IN_PROGRESS:
+                return self._finish(timings, "in_progress", ServiceResult(
+                    success=False, error="This message is still being sent", status=409))
+            if replay is not None:
+                message = msgspec.json.decode(replay.body, type=Message)
+                return self._finish(timings, "replayed", ServiceResult(
+                    success=True, data={"message": message, "replayed": True}))
+
+        # 4. Persist (group-committed: one fsync per batch), with the key's result
+        def persist(conn):
+            row = conn.execute(
+                "INSERT INTO messages(user, content, room_id, created_at_ms) VALUES (?, ?, ?, ?) "
+                "RETURNING id, user, content, created_at, room_id",
+                (user, content, room_id, now_ms()),
+            ).fetchone()
+            message = Message(
+                id=row["id"],
+                user=row["user"],
+                content=row["content"],
+                created_at=row["created_at"],
+                room_id=row["room_id"],
+                deleted=False,
+                edited=False
+            )
+            if store is not None:
+                store.record(conn, IDEMPOTENCY_SCOPE, user, idempotency_key, 200, msgspec.json.encode(message))
+            return row, message
+
+        try:
+            row, message = write_transaction(persist)
+        except WriteOutcomeUnknown as e:
+            # May still commit: the claim stays, so a retry waits for it instead of inserting again
+            return self._failed(timings, e)
+        except Exception as e:
+            if store is not None:
+                store.abort(IDEMPOTENCY_SCOPE, user, idempotency_key)
+            return self._failed(timings, e)
+        if store is not None:
+            store.finish(IDEMPOTENCY_SCOPE, user, idempotency_key, 200, msgspec.json.encode(message),
+                         recorded=True)
+        lap("persist")
+
+        # 5. Remember in the room's recent-message ring
+        remember(row)
+        lap("remember")
+
+        # 6. Broadcast to the room (the struct is encoded once per codec, by msgspec)
+        if self.broadcast is not None:
+            self.broadcast(room_name, message)
+        lap("broadcast")
+        return self._finish(timings, "accepted", ServiceResult(success=True, data={"message": message}))
+
+    def _failed(self, timings, error):
+        if isinstance(error, sqlite3.OperationalError):  # WriterBusyError included
+            if not isinstance(error, WriterBusyError):
+                logger.warning("message_insert_failed", error=str(error))
+            return self._finish(timings, "busy", ServiceResult(
+                success=False, error="Database busy, please retry", status=503))
+        logger.error("message_insert_error", exc_info=error)
+        return self._finish(timings, "error", ServiceResult(
+            success=False, error="Database error", status=500))
+
+    def _finish(self, timings, outcome, result):
+        with self._lock:
+            stats = self._stats
+            if outcome in stats["rejected"]:
+                stats["rejected"][outcome] += 1
+            else:
+                stats[outcome] += 1
+            for stage, seconds in timings:
+                stats["seconds"][stage] += seconds
+                stats["runs"][stage] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = self._stats
+            return {
+                "accepted": stats["accepted"],
+                "rejected": dict(stats["rejected"]),
+                "replayed": stats["replayed"],
+                "seconds": dict(stats["seconds"]),
+                "runs": dict(stats["runs"]),
+            }
+
+
+# One pipeline per process: sockets.py plugs in the broadcast
+pipeline = MessagePipeline()
+
+
+def broadcast_messages_with(broadcast):
+    """Use broadcast(room_name, message) to fan new messages out to sockets."""
+    pipeline.broadcast = broadcast
+
+
+def send_message_logic(user, content, room_name="general", room_id=None, idempotency_key=None):
+    """Create a chat message through the process pipeline."""
+    return pipeline.send(user, content, room_name=room_name, room_id=room_id,
+                         idempotency_key=idempotency_key)
+
+
+def message_pipeline_stats():
+    return pipeline.stats()
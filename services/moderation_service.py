@@ -4,7 +4,8 @@ Moderation Service - Business logic for reporting and resolution.
 
 from typing import Optional, Dict, Any
 from dataclasses import dataclass
-from db import get_db
+from db import get_db, hold_write_lock, WriteLockTimeout
+from db_writer import WriterBusyError, write_transaction
 
 @dataclass
 class ServiceResult:
@@ -22,11 +23,14 @@ def submit_report(reporter_id: int, content_type: str, content_id: str, reason:
         
     db = get_db()
     try:
-        db.execute(
-            "INSERT INTO reports (reporter_id, content_type, content_id, reason) VALUES (?, ?, ?, ?)",
-            (reporter_id, content_type, content_id, reason)
-        )
-        db.commit()
+        with hold_write_lock():
+            db.execute(
+                "INSERT INTO reports (reporter_id, content_type, content_id, reason) VALUES (?, ?, ?, ?)",
+                (reporter_id, content_type, content_id, reason)
+            )
+            db.commit()
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
         return ServiceResult(success=False, error=str(e), status=500)
         
@@ -51,65 +55,148 @@ def resolve_report(
         
     status = 'resolved'
     resolution_note = note
+    banned_user_id = None
     
-    if action == 'dismiss':
-        status = 'dismissed'
-    elif action in ('delete_content', 'ban_user'):
-        status = 'resolved'
+    with hold_write_lock():
+        if action == 'dismiss':
+            status = 'dismissed'
+        elif action in ('delete_content', 'ban_user'):
+            status = 'resolved'
         
-        # --- EXECUTE ACTION ---
-        if action == 'delete_content':
-            if report['content_type'] == 'post':
-                try:
-                    pid = int(report['content_id'])
-                    # Admin force delete
-                    db.execute("DELETE FROM profile_posts WHERE id = ?", (pid,))
-                except ValueError:
-                    pass
-            elif report['content_type'] == 'script':
-                try:
-                    sid = int(report['content_id'])
-                    db.execute("DELETE FROM scripts WHERE id = ?", (sid,))
-                    db.execute("DELETE FROM profile_scripts WHERE script_id = ?", (sid,))
-                except ValueError:
-                    pass
+            # --- EXECUTE ACTION ---
+            if action == 'delete_content':
+                if report['content_type'] == 'post':
+                    try:
+                        pid = int(report['content_id'])
+                        # Admin force delete
+                        db.execute("DELETE FROM profile_posts WHERE id = ?", (pid,))
+                    except ValueError:
+                        pass
+                elif report['content_type'] == 'script':
+                    try:
+                        sid = int(report['content_id'])
+                        db.execute("DELETE FROM scripts WHERE id = ?", (sid,))
+                        db.execute("DELETE FROM profile_scripts WHERE script_id = ?", (sid,))
+                    except ValueError:
+                        pass
                     
-        elif action == 'ban_user':
-            target_user_id = None
-            if report['content_type'] == 'user':
-                try:
-                    target_user_id = int(report['content_id'])
-                except ValueError:
-                    pass
-            elif report['content_type'] == 'post':
-                # Try to find author via profile
-                post_row = db.execute(
-                    "SELECT user_id FROM profiles WHERE id = (SELECT profile_id FROM profile_posts WHERE id = ?)", 
-                    (report['content_id'],)
-                ).fetchone()
-                if post_row:
-                    target_user_id = post_row['user_id']
-            elif report['content_type'] == 'script':
-                script_row = db.execute("SELECT user_id FROM scripts WHERE id = ?", (report['content_id'],)).fetchone()
-                if script_row:
-                    target_user_id = script_row['user_id']
+            elif action == 'ban_user':
+                target_user_id = None
+                if report['content_type'] == 'user':
+                    try:
+                        target_user_id = int(report['content_id'])
+                    except ValueError:
+                        pass
+                elif report['content_type'] == 'post':
+                    # Try to find author via profile
+                    post_row = db.execute(
+                        "SELECT user_id FROM profiles WHERE id = (SELECT profile_id FROM profile_posts WHERE id = ?)", 
+                        (report['content_id'],)
+                    ).fetchone()
+                    if post_row:
+                        target_user_id = post_row['user_id']
+                elif report['content_type'] == 'script':
+                    script_row = db.execute("SELECT user_id FROM scripts WHERE id = ?", (report['content_id'],)).fetchone()
+                    if script_row:
+                        target_user_id = script_row['user_id']
             
-            if target_user_id:
-                db.execute("UPDATE users SET is_banned = 1 WHERE id = ?", (target_user_id,))
-                resolution_note += f" [Action: User {target_user_id} Banned]"
-    else:
-        return ServiceResult(success=False, error="Invalid action", status=400)
+                if target_user_id:
+                    db.execute("UPDATE users SET is_banned = 1 WHERE id = ?", (target_user_id,))
+                    banned_user_id = target_user_id
+                    resolution_note += f" [Action: User {target_user_id} Banned]"
+        else:
+            return ServiceResult(success=False, error="Invalid action", status=400)
         
-    # Update report status
+        # Update report status
+        try:
+            db.execute(
+                """UPDATE reports 
+                   SET status = ?, resolution_note = ?, resolved_by = ?, updated_at = CURRENT_TIMESTAMP 
+                   WHERE id = ?""",
+                (status, resolution_note, staff_id, report_id)
+            )
+            db.commit()
+        except (WriteLockTimeout, WriterBusyError):
+            return ServiceResult(success=False, error="Database busy, please retry", status=503)
+        except Exception as e:
+            return ServiceResult(success=False, error=str(e), status=500)
+
+    if banned_user_id:
+        # Every worker forgets their cached status and drops their sockets
+        from user_status import user_status_changed
+        user_status_changed(banned_user_id, banned=True)
+        
+    return ServiceResult(success=True)
+
+
+def set_user_banned(staff_id: int, user_id: int, banned: bool) -> ServiceResult:
+    """
+    Ban or unban a user (Admin/Staff only).
+    """
+    if user_id == staff_id:
+        return ServiceResult(success=False, error="Cannot ban yourself", status=400)
+        
+    db = get_db()
     try:
-        db.execute(
-            """UPDATE reports 
-               SET status = ?, resolution_note = ?, resolved_by = ?, updated_at = CURRENT_TIMESTAMP 
-               WHERE id = ?""",
-            (status, resolution_note, staff_id, report_id)
-        )
-        db.commit()
+        with hold_write_lock():
+            cur = db.execute("UPDATE users SET is_banned = ? WHERE id = ?", (1 if banned else 0, user_id))
+            db.commit()
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
         return ServiceResult(success=False, error=str(e), status=500)
+    if cur.rowcount == 0:
+        return ServiceResult(success=False, error="User not found", status=404)
+
+    from user_status import user_status_changed
+    user_status_changed(user_id, banned=banned)
+    return ServiceResult(success=True)
+
+
+def delete_user(staff_id: int, user_id: int) -> ServiceResult:
+    """
+    Delete a user and their content (Admin/Staff only).
+
+    Tables that CASCADE from users (profiles and everything on them,
+    scripts, friends, their own notifications) clean up after themselves.
+    The remaining references are cleared first, in the same transaction:
+    rows they authored elsewhere are deleted and shared rows they created
+    lose the attribution.
+    """
+    if user_id == staff_id:
+        return ServiceResult(success=False, error="Cannot delete yourself", status=400)
         
+    db = get_db()
+    if db.execute("SELECT 1 FROM admin_ops WHERE admin_id = ? LIMIT 1", (user_id,)).fetchone():
+        # The audit log is never rewritten; ban former staff instead
+        return ServiceResult(success=False, error="User has admin audit history", status=409)
+
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def purge(conn):
+        if not conn.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone():
+            return False
+        conn.execute("DELETE FROM direct_messages WHERE sender_id = ? OR recipient_id = ?", (user_id, user_id))
+        conn.execute("DELETE FROM notifications WHERE actor_id = ?", (user_id,))
+        conn.execute("DELETE FROM profile_stickers WHERE placed_by = ?", (user_id,))
+        conn.execute("DELETE FROM cat_memories WHERE target_user_id = ?", (user_id,))
+        conn.execute("DELETE FROM cat_relationships WHERE target_user_id = ?", (user_id,))
+        conn.execute("UPDATE rooms SET created_by = NULL WHERE created_by = ?", (user_id,))
+        if 'reports' in tables:  # Created by the Alembic migrations only
+            conn.execute("DELETE FROM reports WHERE reporter_id = ?", (user_id,))
+            conn.execute("UPDATE reports SET resolved_by = NULL WHERE resolved_by = ?", (user_id,))
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        return True
+
+    try:
+        deleted = write_transaction(purge)
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
+    except Exception as e:
+        return ServiceResult(success=False, error=str(e), status=500)
+    if not deleted:
+        return ServiceResult(success=False, error="User not found", status=404)
+
+    from user_status import user_status_changed
+    user_status_changed(user_id, deleted=True)
     return ServiceResult(success=True)
@@ -14,7 +14,7 @@ from dataclasses import dataclass
 from typing import Optional, List, Dict, Any
 from utils.sanitize import clean_html
 
-from db import get_db
+from db import get_db, hold_write_lock
 from services.storage_service import StorageService
 
 # =============================================
@@ -170,6 +170,9 @@ def get_profile_by_user_id(user_id: int, viewer_id: Optional[int] = None, wall_p
     following_count = get_following_count(user_id)
     viewer_is_following = check_following(viewer_id, user_id) if viewer_id and not is_own else False
 
+    # Online right now (any tab, any worker), unless they hide it
+    from sockets import presence
+
     profile_data = {
         "user_id": row["id"],
         "username": row["username"],
@@ -186,6 +189,7 @@ def get_profile_by_user_id(user_id: int, viewer_id: Optional[int] = None, wall_p
         "is_own": is_own,
         "dm_policy": row["dm_policy"] if is_own else None,
         "show_online_status": bool(row["show_online_status"]) if row["show_online_status"] is not None else True,
+        "is_online": row["show_online_status"] != 0 and presence.is_online(row["id"]),
         "voice_intro_path": row["voice_intro_path"],
         "voice_waveform_json": row["voice_waveform_json"],
         "anthem_url": row["anthem_url"] or "",
@@ -277,36 +281,42 @@ def update_profile_fields(user_id: int, data: Dict[str, Any]) -> ServiceResult:
     if not updates:
         return ServiceResult(success=False, error="No valid fields to update", status=400)
     
-    # Check if profile exists
-    existing = db.execute(
-        "SELECT id FROM profiles WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    
-    if existing:
-        # Update existing profile
-        # keys are pre-validated in the update_profile_fields logic above
-        clause_items = []
-        for k in updates.keys():
-            clause_items.append(f"{k} = ?")
+    with hold_write_lock():
+        # Check if profile exists
+        existing = db.execute(
+            "SELECT id FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    
+        if existing:
+            # Update existing profile
+            # keys are pre-validated in the update_profile_fields logic above
+            clause_items = []
+            for k in updates.keys():
+                clause_items.append(f"{k} = ?")
         
-        set_clause = ", ".join(clause_items)
-        sql = f"UPDATE profiles SET {set_clause}, updated_at = datetime('now') WHERE user_id = ?"  # nosec B608
-        values = list(updates.values())
-        values.append(user_id)
+            set_clause = ", ".join(clause_items)
+            sql = f"UPDATE profiles SET {set_clause}, updated_at = datetime('now') WHERE user_id = ?"  # nosec B608
+            values = list(updates.values())
+            values.append(user_id)
         
-        db.execute(sql, values)
-    else:
-        # Create new profile
-        updates["user_id"] = user_id
-        cols = list(updates.keys())
-        columns_str = ", ".join(cols)
-        placeholders = ", ".join("?" for _ in cols)
-        sql = f"INSERT INTO profiles ({columns_str}) VALUES ({placeholders})"  # nosec B608
-        values = list(updates.values())
+            db.execute(sql, values)
+        else:
+            # Create new profile
+            updates["user_id"] = user_id
+            cols = list(updates.keys())
+            columns_str = ", ".join(cols)
+            placeholders = ", ".join("?" for _ in cols)
+            sql = f"INSERT INTO profiles ({columns_str}) VALUES ({placeholders})"  # nosec B608
+            values = list(updates.values())
         
-        db.execute(sql, values)
+            db.execute(sql, values)
     
-    db.commit()
+        db.commit()
+
+    if "show_online_status" in updates:
+        # Show or hide their open sockets in the lobby on every worker
+        from sockets import set_online_visibility
+        set_online_visibility(user_id, updates["show_online_status"])
     return ServiceResult(success=True)
 
 
@@ -329,22 +339,23 @@ def save_avatar(user_id: int, file_data: bytes, extension: str, app_root: str) -
         return ServiceResult(success=False, error=f"Storage error: {str(e)}", status=500)
     
     db = get_db()
-    existing = db.execute(
-        "SELECT id FROM profiles WHERE user_id = ?", (user_id,)
-    ).fetchone()
-    
-    if existing:
-        db.execute(
-            "UPDATE profiles SET avatar_path = ?, avatar_checksum = ?, updated_at = datetime('now') WHERE user_id = ?",
-            (avatar_path, checksum, user_id)
-        )
-    else:
-        db.execute(
-            "INSERT INTO profiles (user_id, avatar_path, avatar_checksum) VALUES (?, ?, ?)",
-            (user_id, avatar_path, checksum)
-        )
+    with hold_write_lock():
+        existing = db.execute(
+            "SELECT id FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    
+        if existing:
+            db.execute(
+                "UPDATE profiles SET avatar_path = ?, avatar_checksum = ?, updated_at = datetime('now') WHERE user_id = ?",
+                (avatar_path, checksum, user_id)
+            )
+        else:
+            db.execute(
+                "INSERT INTO profiles (user_id, avatar_path, avatar_checksum) VALUES (?, ?, ?)",
+                (user_id, avatar_path, checksum)
+            )
     
-    db.commit()
+        db.commit()
     return ServiceResult(success=True, data={"avatar_path": avatar_path})
 
 
@@ -361,17 +372,18 @@ def save_voice_intro(user_id: int, file: Any, app_root: str, waveform_json: str
         return ServiceResult(success=False, error=f"Storage error: {str(e)}", status=500)
     
     db = get_db()
-    existing = db.execute("SELECT id FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
-    
-    if existing:
-        db.execute(
-            """UPDATE profiles 
-               SET voice_intro_path = ?, voice_waveform_json = ?, updated_at = datetime('now') 
-               WHERE user_id = ?""",
-            (path_url, waveform_json, user_id)
-        )
-        db.commit()
-        return ServiceResult(success=True, data={"voice_path": path_url})
+    with hold_write_lock():
+        existing = db.execute("SELECT id FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+    
+        if existing:
+            db.execute(
+                """UPDATE profiles 
+                   SET voice_intro_path = ?, voice_waveform_json = ?, updated_at = datetime('now') 
+                   WHERE user_id = ?""",
+                (path_url, waveform_json, user_id)
+            )
+            db.commit()
+            return ServiceResult(success=True, data={"voice_path": path_url})
     
     return ServiceResult(success=False, error="Profile not found", status=404)
 
@@ -389,10 +401,11 @@ def create_default_profile(user_id: int, username: str) -> ServiceResult:
         ServiceResult indicating success
     """
     db = get_db()
-    db.execute(
-        """INSERT INTO profiles (user_id, display_name) 
-           VALUES (?, ?)""",
-        (user_id, username)
-    )
-    db.commit()
+    with hold_write_lock():
+        db.execute(
+            """INSERT INTO profiles (user_id, display_name) 
+               VALUES (?, ?)""",
+            (user_id, username)
+        )
+        db.commit()
     return ServiceResult(success=True)
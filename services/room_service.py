@@ -3,10 +3,12 @@
 Room Service - services/room_service.py
 
 Business logic for managing chat rooms.
+Reads are served by the worker's room registry (room_registry.py).
 """
 from typing import List, Optional, Dict, Any
-from db import get_db, execute_with_retry
+from db import get_db, hold_write_lock, WriteLockTimeout
 from core.types import ServiceResult
+from room_registry import get_room_registry, room_created
 
 def create_room_logic(user_id: int, name: str, description: str = "") -> ServiceResult:
     """
@@ -24,22 +26,25 @@ def create_room_logic(user_id: int, name: str, description: str = "") -> Service
     # 2. DB Interaction
     db = get_db()
     try:
-        cursor = db.execute(
-            """INSERT INTO rooms (name, description, room_type, is_default, created_by) 
-               VALUES (?, ?, 'text', 1, ?)""",
-            (name_clean, description, user_id)
-        )
-        db.commit()
+        with hold_write_lock():
+            cursor = db.execute(
+                """INSERT INTO rooms (name, description, room_type, is_default, created_by) 
+                   VALUES (?, ?, 'text', 1, ?)""",
+                (name_clean, description, user_id)
+            )
+            db.commit()
         room_id = cursor.lastrowid
+        room = {
+            "id": room_id,
+            "name": name_clean,
+            "description": description,
+            "room_type": "text"
+        }
+        room_created(room)
         
-        return ServiceResult(success=True, data={
-            "room": {
-                "id": room_id,
-                "name": name_clean,
-                "description": description,
-                "room_type": "text"
-            }
-        })
+        return ServiceResult(success=True, data={"room": room})
+    except WriteLockTimeout:
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
         if "UNIQUE constraint" in str(e):
             return ServiceResult(success=False, error="Room already exists", status=409)
@@ -48,26 +53,14 @@ def create_room_logic(user_id: int, name: str, description: str = "") -> Service
 
 def list_all_rooms() -> List[Dict[str, Any]]:
     """
-    List all default rooms.
+    List all default rooms, general and announcements first.
+    Each room also carries "members": users online in it.
     """
-    query = """
-        SELECT id, name, description, room_type, is_default
-        FROM rooms
-        WHERE is_default = 1
-        ORDER BY 
-            CASE WHEN name = 'general' THEN 0
-                 WHEN name = 'announcements' THEN 1
-                 ELSE 2 END,
-            name
-    """
-    rows = execute_with_retry(query, fetchall=True)
-    
-    return [dict(row) for row in rows] if rows else []
+    return get_room_registry().listed()
 
 def get_room_by_name(name: str) -> Optional[Dict[str, Any]]:
     """
     Get a room by name.
     """
-    query = "SELECT id, name, description, room_type FROM rooms WHERE name = ?"
-    row = execute_with_retry(query, (name,), fetchone=True)
-    return dict(row) if row else None
+    room = get_room_registry().get(name)
+    return room.public() if room else None
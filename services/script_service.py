@@ -4,7 +4,7 @@ Script Service - Business logic for Codeground scripts.
 
 from typing import Optional, Dict, Any, List
 from dataclasses import dataclass
-from db import get_db
+from db import get_db, hold_write_lock, WriteLockTimeout
 
 @dataclass
 class ServiceResult:
@@ -36,13 +36,16 @@ def save_script(
             return ServiceResult(success=False, error="Not authorized", status=403)
             
         try:
-            db.execute(
-                """UPDATE scripts 
-                   SET title=?, content=?, script_type=?, is_public=?, updated_at=datetime('now') 
-                   WHERE id=?""",
-                (title, content, script_type, is_public, script_id)
-            )
-            db.commit()
+            with hold_write_lock():
+                db.execute(
+                    """UPDATE scripts 
+                       SET title=?, content=?, script_type=?, is_public=?, updated_at=datetime('now') 
+                       WHERE id=?""",
+                    (title, content, script_type, is_public, script_id)
+                )
+                db.commit()
+        except WriteLockTimeout:
+            return ServiceResult(success=False, error="Database busy, please retry", status=503)
         except Exception as e:
             return ServiceResult(success=False, error=str(e), status=500)
             
@@ -59,19 +62,22 @@ def save_script(
                 parent_id = None # Ignore invalid parent
 
         try:
-            row = db.execute(
-                """INSERT INTO scripts (user_id, title, content, script_type, is_public, parent_id, root_id) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?) 
-                   RETURNING id""",
-                (user_id, title, content, script_type, is_public, parent_id, root_id)
-            ).fetchone()
-            db.commit()
+            with hold_write_lock():
+                row = db.execute(
+                    """INSERT INTO scripts (user_id, title, content, script_type, is_public, parent_id, root_id) 
+                       VALUES (?, ?, ?, ?, ?, ?, ?) 
+                       RETURNING id""",
+                    (user_id, title, content, script_type, is_public, parent_id, root_id)
+                ).fetchone()
+                db.commit()
             return ServiceResult(success=True, data={
                 "id": row['id'], 
                 "message": "Created",
                 "parent_id": parent_id,
                 "root_id": root_id
             })
+        except WriteLockTimeout:
+            return ServiceResult(success=False, error="Database busy, please retry", status=503)
         except Exception as e:
             return ServiceResult(success=False, error=str(e), status=500)
 
@@ -128,6 +134,7 @@ def delete_script(user_id: int, script_id: int) -> ServiceResult:
     if row['user_id'] != user_id:
         return ServiceResult(success=False, error="Not authorized", status=403)
         
-    db.execute("DELETE FROM scripts WHERE id=?", (script_id,))
-    db.commit()
+    with hold_write_lock():
+        db.execute("DELETE FROM scripts WHERE id=?", (script_id,))
+        db.commit()
     return ServiceResult(success=True, data={"deleted": script_id})
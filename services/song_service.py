@@ -4,7 +4,7 @@ Song Service - Business logic for song projects.
 
 from typing import Optional, Dict, Any
 from dataclasses import dataclass
-from db import get_db
+from db import get_db, hold_write_lock, WriteLockTimeout
 
 @dataclass
 class ServiceResult:
@@ -34,13 +34,16 @@ def save_song(
             return ServiceResult(success=False, error="Not authorized", status=403)
             
         try:
-            db.execute(
-                """UPDATE songs 
-                   SET title=?, data_json=?, is_public=?, updated_at=datetime('now') 
-                   WHERE id=?""",
-                (title, data_json, is_public, song_id)
-            )
-            db.commit()
+            with hold_write_lock():
+                db.execute(
+                    """UPDATE songs 
+                       SET title=?, data_json=?, is_public=?, updated_at=datetime('now') 
+                       WHERE id=?""",
+                    (title, data_json, is_public, song_id)
+                )
+                db.commit()
+        except WriteLockTimeout:
+            return ServiceResult(success=False, error="Database busy, please retry", status=503)
         except Exception as e:
              return ServiceResult(success=False, error=str(e), status=500)
              
@@ -48,15 +51,18 @@ def save_song(
     else:
         # Create
         try:
-            cur = db.execute(
-                """INSERT INTO songs (user_id, title, data_json, is_public) 
-                   VALUES (?, ?, ?, ?) 
-                   RETURNING id""",
-                (user_id, title, data_json, is_public)
-            )
-            row = cur.fetchone()
-            db.commit()
+            with hold_write_lock():
+                cur = db.execute(
+                    """INSERT INTO songs (user_id, title, data_json, is_public) 
+                       VALUES (?, ?, ?, ?) 
+                       RETURNING id""",
+                    (user_id, title, data_json, is_public)
+                )
+                row = cur.fetchone()
+                db.commit()
             return ServiceResult(success=True, data={"id": row['id'], "message": "Created"})
+        except WriteLockTimeout:
+            return ServiceResult(success=False, error="Database busy, please retry", status=503)
         except Exception as e:
             return ServiceResult(success=False, error=str(e), status=500)
 
@@ -72,6 +78,7 @@ def delete_song(user_id: int, song_id: int) -> ServiceResult:
     if row['user_id'] != user_id:
         return ServiceResult(success=False, error="Not authorized", status=403)
         
-    db.execute("DELETE FROM songs WHERE id=?", (song_id,))
-    db.commit()
+    with hold_write_lock():
+        db.execute("DELETE FROM songs WHERE id=?", (song_id,))
+        db.commit()
     return ServiceResult(success=True, data={"deleted": song_id})
@@ -13,7 +13,8 @@ from flask import current_app
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
-from db import get_db
+from db import get_db, hold_write_lock, WriteLockTimeout
+from db_writer import WriterBusyError, write
 
 # =============================================
 # CONSTANTS
@@ -124,13 +125,16 @@ def add_sticker(
     # We'll use passed values.
 
     try:
-        db.execute(
-            """INSERT INTO profile_stickers 
-               (id, profile_id, sticker_type, image_path, text_content, x_pos, y_pos, rotation, scale, z_index, placed_by)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (sticker_id, profile_id, sticker_type, final_image_path, text_content, x_pos, y_pos, rotation, scale, z_index, user_id)
-        )
-        db.commit()
+        with hold_write_lock():
+            db.execute(
+                """INSERT INTO profile_stickers 
+                   (id, profile_id, sticker_type, image_path, text_content, x_pos, y_pos, rotation, scale, z_index, placed_by)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (sticker_id, profile_id, sticker_type, final_image_path, text_content, x_pos, y_pos, rotation, scale, z_index, user_id)
+            )
+            db.commit()
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
         return ServiceResult(success=False, error=str(e), status=500)
     
@@ -212,8 +216,9 @@ def update_sticker(
     
     try:
         sql = f"UPDATE profile_stickers SET {', '.join(db_updates)} WHERE id = ?"  # nosec B608
-        db.execute(sql, values)
-        db.commit()
+        write(sql, values)
+    except (WriteLockTimeout, WriterBusyError):
+        return ServiceResult(success=False, error="Database busy, please retry", status=503)
     except Exception as e:
         return ServiceResult(success=False, error=str(e), status=500)
         
@@ -235,15 +240,16 @@ def delete_sticker(user_id: int, sticker_id: str) -> ServiceResult:
     
     # Check permissions (Owner of Profile OR Placer of Sticker)
     # Optimized single query delete
-    result = db.execute(
-        """DELETE FROM profile_stickers 
-           WHERE id = ? AND (
-                 profile_id IN (SELECT id FROM profiles WHERE user_id = ?) 
-                 OR placed_by = ?
-           )""",
-        (sticker_id, user_id, user_id)
-    )
-    db.commit()
+    with hold_write_lock():
+        result = db.execute(
+            """DELETE FROM profile_stickers 
+               WHERE id = ? AND (
+                     profile_id IN (SELECT id FROM profiles WHERE user_id = ?) 
+                     OR placed_by = ?
+               )""",
+            (sticker_id, user_id, user_id)
+        )
+        db.commit()
     
     if result.rowcount == 0:
         # Check if it existed but was unauthorized, or just didn't exist?
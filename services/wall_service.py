@@ -8,7 +8,8 @@ import json  # Keep json for dumps/loads compatibility until full refactor
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Any
 
-from db import get_db
+from db import get_db, hold_write_lock
+from db_epoch import epoch_sql, now_ms
 from core.types import ServiceResult
 
 
@@ -39,12 +40,12 @@ def get_posts_for_profile(profile_id: int, limit: int = 20, offset: int = 0) ->
         List of post dictionaries with parsed JSON payloads
     """
     db = get_db()
-    rows = db.execute(
+    rows = db.execute(epoch_sql(
         """SELECT id, module_type, content_payload, style_payload, display_order, created_at
            FROM profile_posts
            WHERE profile_id = ?
-           ORDER BY display_order ASC, created_at DESC
-           LIMIT ? OFFSET ?""",
+           ORDER BY display_order ASC, created_at_ms DESC
+           LIMIT ? OFFSET ?"""),
         (profile_id, limit, offset)
     ).fetchall()
     
@@ -107,13 +108,14 @@ def add_post(
     except:
         return ServiceResult(success=False, error="Invalid JSON content/style", status=400)
         
-    cursor = db.execute(
-        """INSERT INTO profile_posts (profile_id, module_type, content_payload, style_payload, display_order)
-           VALUES (?, ?, ?, ?, ?)""",
-        (profile_id, module_type, content_json, style_json, display_order)
-    )
-    new_id = cursor.lastrowid
-    db.commit()
+    with hold_write_lock():
+        cursor = db.execute(
+            """INSERT INTO profile_posts (profile_id, module_type, content_payload, style_payload, display_order, created_at_ms)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (profile_id, module_type, content_json, style_json, display_order, now_ms())
+        )
+        new_id = cursor.lastrowid
+        db.commit()
     
     return ServiceResult(success=True, data={"id": new_id})
 
@@ -173,8 +175,9 @@ def update_post(
     values.append(post_id)
     sql = f"UPDATE profile_posts SET {', '.join(updates)}, updated_at = datetime('now') WHERE id = ?"  # nosec B608
     
-    db.execute(sql, values)
-    db.commit()
+    with hold_write_lock():
+        db.execute(sql, values)
+        db.commit()
     
     return ServiceResult(success=True)
 
@@ -192,12 +195,13 @@ def delete_post(user_id: int, post_id: int) -> ServiceResult:
     """
     db = get_db()
     
-    db.execute(
-        """DELETE FROM profile_posts 
-           WHERE id = ? AND profile_id IN (SELECT id FROM profiles WHERE user_id = ?)""",
-        (post_id, user_id)
-    )
-    db.commit()
+    with hold_write_lock():
+        db.execute(
+            """DELETE FROM profile_posts 
+               WHERE id = ? AND profile_id IN (SELECT id FROM profiles WHERE user_id = ?)""",
+            (post_id, user_id)
+        )
+        db.commit()
     return ServiceResult(success=True)
 
 
@@ -223,11 +227,11 @@ def reorder_posts(user_id: int, order: List[int]) -> ServiceResult:
         return ServiceResult(success=False, error="No profile", status=404)
     pid = profile["id"]
     
-    for idx, post_id in enumerate(order):
-        db.execute(
-            "UPDATE profile_posts SET display_order = ? WHERE id = ? AND profile_id = ?",
-            (idx, post_id, pid)
-        )
-        
-    db.commit()
+    with hold_write_lock():
+        for idx, post_id in enumerate(order):
+            db.execute(
+                "UPDATE profile_posts SET display_order = ? WHERE id = ? AND profile_id = ?",
+                (idx, post_id, pid)
+            )
+        db.commit()
     return ServiceResult(success=True)
@@ -0,0 +1,701 @@
+"""
+Socket.IO Bus - socket_bus.py
+
+Production runs several gunicorn workers, and a Socket.IO emit only
+reaches clients connected to the worker that made it. BusManager plugs
+into Flask-SocketIO as its client manager (a python-socketio
+PubSubManager), so room broadcasts, room joins and disconnects are
+relayed to every worker. Backends (SOCKETIO_BUS):
+
+- "unix" (default): no outside service. Workers elect a broker (the
+  holder of <sock>.lock) that serves the Redis pub/sub subset on a Unix
+  socket; if its worker dies, the others reconnect and re-elect
+- "redis://host:port": the same client against Redis, Valkey, KeyDB...
+- "local": an in-process hub (single process, tests)
+- "off": no bus, emits stay on this worker
+
+The bus also carries application topics (publish/subscribe) and each
+worker's authenticated sockets: changes are announced as they happen
+and a full snapshot every PRESENCE_INTERVAL; a worker that stops
+announcing is forgotten after PRESENCE_TTL. cluster_sockets() is the
+merged view; watch_presence() hands every announcement (this worker's
+and its peers') to a listener such as presence.PresenceRegistry.
+
+Like Redis pub/sub, messages published while a worker is reconnecting
+are lost; presence recovers on the next snapshot.
+
+Usage:
+    from socket_bus import publish, subscribe
+    subscribe("disconnect_user", handler)   # handler(payload), on every worker
+    publish("disconnect_user", {"user_id": 7})
+"""
+import atexit
+import fcntl
+import hashlib
+import os
+import queue
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import msgspec
+import socketio
+import structlog
+
+from process_registry import ProcessRegistry
+from socket_codec import CodecManager
+
+# =============================================================================
+# Settings
+# =============================================================================
+BUS_CHANNEL = "neospace"  # Pub/sub channel every worker subscribes to
+RECONNECT_DELAY = 0.5  # Seconds between attempts to reach (or become) the broker
+CONNECT_TIMEOUT = 2.0  # Seconds to open a connection to Redis
+SEND_TIMEOUT = 5  # Seconds the broker waits on a subscriber that stopped reading
+MAX_MESSAGE_BYTES = 8 * 1024 * 1024  # Larger frames are refused by the broker
+PRESENCE_INTERVAL = 15.0  # Seconds between full presence snapshots
+PRESENCE_TTL = 45.0  # A worker silent for this long is dropped from presence
+
+APP_METHOD = "neospace"  # PubSubManager "method" for application topics
+PRESENCE_TOPIC = "presence"
+
+logger = structlog.get_logger(__name__)
+
+
+class BusError(ConnectionError):
+    """The broker answered with an error or an unreadable frame."""
+
+
+# =============================================================================
+# Redis protocol (RESP2) framing
+# =============================================================================
+def encode_command(*args):
+    """One RESP array of bulk strings (also how the broker sends messages)."""
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+
+class RespReader:
+    """Reads RESP replies (or commands) from a connected socket."""
+
+    def __init__(self, sock):
+        self._file = sock.makefile("rb")
+
+    def read(self):
+        line = self._file.readline(MAX_MESSAGE_BYTES)
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("bus connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise BusError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            if size > MAX_MESSAGE_BYTES:
+                raise BusError(f"frame of {size} bytes")
+            data = self._file.read(size + 2)
+            if len(data) < size + 2:
+                raise ConnectionError("bus connection closed")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self.read() for _ in range(count)]
+        raise BusError(f"unexpected frame {line[:20]!r}")
+
+
+# =============================================================================
+# Built-in broker
+# =============================================================================
+class BusBroker:
+    """
+    Serves SUBSCRIBE / PUBLISH / PING (the Redis pub/sub subset the bus
+    uses) on a Unix socket. Only the holder of <path>.lock serves.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.serving = False
+        self._lock_file = None
+        self._server = None
+        self._lock = threading.Lock()  # Guards _channels, _peers, _stats
+        self._channels = defaultdict(set)  # channel -> {peer socket}
+        self._peers = {}  # peer socket -> send lock
+        self._stats = {"connections": 0, "messages": 0}
+
+    def elect(self):
+        """Become the broker if no other process is. Returns True when serving."""
+        if self.serving:
+            return True
+        lock_file = open(f"{self.path}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        try:
+            os.unlink(self.path)  # Left behind by a broker that died
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.path)
+            os.chmod(self.path, 0o600)
+            server.listen(128)
+        except OSError:
+            server.close()
+            lock_file.close()
+            raise
+        self._lock_file, self._server, self.serving = lock_file, server, True
+        threading.Thread(target=self._accept, name="bus-broker", daemon=True).start()
+        logger.info("socket_bus_broker_elected", path=self.path, pid=os.getpid())
+        return True
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return  # close()
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, struct.pack("ll", SEND_TIMEOUT, 0))
+            with self._lock:
+                self._peers[conn] = threading.Lock()
+                self._stats["connections"] += 1
+            threading.Thread(target=self._serve, args=(conn,), name="bus-broker-peer", daemon=True).start()
+
+    def _send(self, conn, data):
+        send_lock = self._peers.get(conn)
+        if send_lock is None:
+            return False
+        try:
+            with send_lock:
+                conn.sendall(data)
+            return True
+        except OSError:
+            self._drop(conn)  # Gone, or stopped reading for SEND_TIMEOUT
+            return False
+
+    def _serve(self, conn):
+        reader = RespReader(conn)
+        subscribed = set()
+        try:
+            while True:
+                command = reader.read()
+                if not isinstance(command, list) or not command:
+                    raise BusError("expected a command")
+                name = command[0].upper()
+                if name == b"PUBLISH" and len(command) == 3:
+                    with self._lock:
+                        targets = list(self._channels.get(command[1], ()))
+                        self._stats["messages"] += 1
+                    frame = encode_command(b"message", command[1], command[2])
+                    delivered = sum(self._send(peer, frame) for peer in targets)
+                    self._send(conn, b":%d\r\n" % delivered)
+                elif name == b"SUBSCRIBE" and len(command) > 1:
+                    for channel in command[1:]:
+                        subscribed.add(channel)
+                        with self._lock:
+                            self._channels[channel].add(conn)
+                        reply = b"*3\r\n$9\r\nsubscribe\r\n$%d\r\n%s\r\n:%d\r\n"
+                        self._send(conn, reply % (len(channel), channel, len(subscribed)))
+                elif name == b"PING":
+                    self._send(conn, b"+PONG\r\n")
+                else:
+                    self._send(conn, b"-ERR unsupported command\r\n")
+        except (OSError, ValueError, AttributeError, BusError):
+            pass  # Disconnected, or not speaking the protocol
+        finally:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        with self._lock:
+            self._peers.pop(conn, None)
+            for members in self._channels.values():
+                members.discard(conn)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "peers": len(self._peers)}
+
+    def close(self):
+        if not self.serving:
+            return
+        self.serving = False
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)  # Wakes accept()
+        except OSError:
+            pass
+        self._server.close()
+        with self._lock:
+            peers = list(self._peers)
+        for conn in peers:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._drop(conn)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._lock_file.close()  # Releases the flock for the next broker
+
+
+# =============================================================================
+# Backends: publish(bytes), listen() -> bytes..., close(), stats()
+# =============================================================================
+class _Backend:
+    kind = None
+
+    def __init__(self, channel):
+        self.channel = channel
+        self._closed = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"published": 0, "received": 0, "dropped": 0, "reconnects": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {"backend": self.kind, "broker": False, **self._stats}
+
+
+class LocalBus(_Backend):
+    """In-process stand-in: every LocalBus with the same name shares one hub."""
+
+    kind = "local"
+    _hubs = defaultdict(set)
+    _hubs_lock = threading.Lock()
+
+    def __init__(self, name="default", channel=BUS_CHANNEL):
+        super().__init__(channel)
+        self._key = (name, channel)
+        self._queue = queue.SimpleQueue()
+        with self._hubs_lock:
+            self._hubs[self._key].add(self._queue)
+
+    def publish(self, data):
+        with self._hubs_lock:
+            members = list(self._hubs[self._key])
+        for member in members:
+            member.put(data)
+        self._count("published")
+        return True
+
+    def listen(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            self._count("received")
+            yield data
+
+    def close(self):
+        with self._hubs_lock:
+            self._hubs[self._key].discard(self._queue)
+        self._closed.set()
+        self._queue.put(None)
+
+
+class RedisBus(_Backend):
+    """Pub/sub over the Redis protocol: one publishing and one subscribed connection."""
+
+    kind = "redis"
+
+    def __init__(self, address, channel=BUS_CHANNEL):
+        super().__init__(channel)
+        self.address = address  # (host, port), or a Unix socket path
+        self._publish_lock = threading.Lock()
+        self._publisher = None  # (sock, reader)
+        self._subscriber = None
+
+    def _open(self):
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+            sock.settimeout(None)
+        return sock, RespReader(sock)
+
+    def _close_publisher(self):
+        if self._publisher is not None:
+            self._publisher[0].close()
+            self._publisher = None
+
+    def publish(self, data):
+        """Send one message; reconnects once. Returns False if it was dropped."""
+        with self._publish_lock:
+            for _ in range(2):
+                if self._closed.is_set():
+                    break
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._open()
+                    sock, reader = self._publisher
+                    sock.sendall(encode_command("PUBLISH", self.channel, data))
+                    reader.read()
+                    self._count("published")
+                    return True
+                except (OSError, BusError):
+                    self._close_publisher()
+        self._count("dropped")
+        return False
+
+    def listen(self):
+        """Yield every message on the channel, reconnecting until close()."""
+        while not self._closed.is_set():
+            try:
+                sock, reader = self._open()
+            except OSError:
+                self._closed.wait(RECONNECT_DELAY)
+                continue
+            self._subscriber = sock
+            try:
+                sock.sendall(encode_command("SUBSCRIBE", self.channel))
+                while True:
+                    reply = reader.read()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        self._count("received")
+                        yield reply[2]
+            except (OSError, BusError) as e:
+                if self._closed.is_set():
+                    return
+                self._count("reconnects")
+                logger.warning("socket_bus_reconnect", backend=self.kind, error=str(e))
+                self._closed.wait(RECONNECT_DELAY)
+            finally:
+                self._subscriber = None
+                sock.close()
+
+    def close(self):
+        self._closed.set()
+        subscriber = self._subscriber
+        if subscriber is not None:
+            try:
+                subscriber.shutdown(socket.SHUT_RDWR)  # Wakes listen()
+            except OSError:
+                pass
+        with self._publish_lock:
+            self._close_publisher()
+
+
+class UnixSocketBus(RedisBus):
+    """RedisBus against the built-in broker, electing one whenever none answers."""
+
+    kind = "unix"
+
+    def __init__(self, path, channel=BUS_CHANNEL):
+        super().__init__(path, channel)
+        self.broker = BusBroker(path)
+
+    def _open(self):
+        try:
+            return super()._open()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if self._closed.is_set() or not self.broker.elect():
+                raise
+            return super()._open()
+
+    def stats(self):
+        return {**super().stats(), "broker": self.broker.serving}
+
+    def close(self):
+        super().close()
+        self.broker.close()
+
+
+# =============================================================================
+# Presence
+# =============================================================================
+class PeerSockets:
+    """Other workers' authenticated sockets, as last announced on the bus."""
+
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        self._hosts = {}  # host_id -> (last heard, {sid: info})
+        self._lock = threading.Lock()
+
+    def apply(self, host_id, update):
+        op = update.get("op")
+        with self._lock:
+            if op == "gone":
+                self._hosts.pop(host_id, None)
+                return
+            _, sockets = self._hosts.get(host_id, (None, {}))
+            if op == "sync":
+                sockets = dict(update.get("sockets") or {})
+            elif op == "set":
+                sockets[update["sid"]] = update["info"]
+            elif op == "del":
+                sockets.pop(update["sid"], None)
+            self._hosts[host_id] = (time.monotonic(), sockets)
+
+    def sockets(self):
+        """{sid: info} across live workers."""
+        cutoff = time.monotonic() - self.ttl
+        merged = {}
+        with self._lock:
+            for host_id, (heard, sockets) in list(self._hosts.items()):
+                if heard < cutoff:
+                    del self._hosts[host_id]
+                    continue
+                merged.update(sockets)
+        return merged
+
+    def stats(self):
+        with self._lock:
+            return {"peers": len(self._hosts), "peer_sockets": sum(len(s) for _, s in self._hosts.values())}
+
+
+# =============================================================================
+# Client manager
+# =============================================================================
+class BusManager(socketio.PubSubManager, CodecManager):
+    """Flask-SocketIO client manager that relays through a bus backend."""
+
+    name = "neospace-bus"
+
+    def __init__(self, backend, write_only=False, logger=None):
+        super().__init__(channel=backend.channel, write_only=write_only, logger=logger)
+        self.backend = backend
+        self.peers = PeerSockets()
+        self._closed = threading.Event()
+        self._presence_lock = threading.Lock()  # Keeps snapshots and announcements in order
+
+    def initialize(self):
+        # Plain threads rather than server.start_background_task: the
+        # listener blocks on a real socket, which would stall an
+        # unpatched gevent/eventlet hub
+        socketio.Manager.initialize(self)
+        if not self.write_only:
+            threading.Thread(target=self._thread, name="socket-bus", daemon=True).start()
+            threading.Thread(target=self._heartbeat, name="socket-bus-presence", daemon=True).start()
+
+    def _publish(self, data):
+        self.backend.publish(msgspec.json.encode(data))
+
+    def _listen(self):
+        for raw in self.backend.listen():
+            try:
+                yield msgspec.json.decode(raw)
+            except msgspec.DecodeError:
+                logger.warning("socket_bus_bad_message", size=len(raw))
+
+    def _thread(self):
+        # PubSubManager._thread, plus application topics and a clean exit on close()
+        handlers = {
+            "emit": self._handle_emit,
+            "disconnect": self._handle_disconnect,
+            "enter_room": self._handle_enter_room,
+            "leave_room": self._handle_leave_room,
+            "close_room": self._handle_close_room,
+        }
+        for message in self._listen():
+            if not isinstance(message, dict):
+                continue
+            method = message.get("method")
+            try:
+                if method == "callback":
+                    self._handle_callback(message)
+                elif message.get("host_id") == self.host_id:
+                    continue
+                elif method == APP_METHOD:
+                    self._handle_app(message)
+                elif method in handlers:
+                    handlers[method](message)
+            except Exception:
+                logger.exception("socket_bus_handler_failed", method=method)
+
+    def _handle_app(self, message):
+        topic, payload = message.get("topic"), message.get("data")
+        if topic != PRESENCE_TOPIC:
+            _deliver(topic, payload)
+            return
+        self.peers.apply(message["host_id"], payload)
+        _notify_presence(message["host_id"], payload)
+        if payload.get("op") == "hello":
+            self.sync_presence()  # A worker (re)started: tell it who is here
+
+    def publish_app(self, topic, payload):
+        self._publish({"method": APP_METHOD, "topic": topic, "data": payload, "host_id": self.host_id})
+
+    def announce(self, update):
+        with self._presence_lock:
+            self.publish_app(PRESENCE_TOPIC, update)
+
+    def sync_presence(self):
+        with self._presence_lock:
+            self.publish_app(PRESENCE_TOPIC, {"op": "sync", "sockets": local_sockets()})
+
+    def _heartbeat(self):
+        self.announce({"op": "hello"})
+        while not self._closed.is_set():
+            self.sync_presence()
+            self._closed.wait(PRESENCE_INTERVAL)
+
+    def stats(self):
+        return {**self.backend.stats(), **self.peers.stats()}
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.announce({"op": "gone"})
+        self.backend.close()
+
+
+# =============================================================================
+# Process-wide bus (one Socket.IO server per worker, recreated after fork)
+# =============================================================================
+_managers = ProcessRegistry()  # One BusManager per worker, under the key None
+_handlers = defaultdict(list)  # topic -> [handler(payload)]
+_presence = None  # () -> {sid: info} for this worker's sockets
+_presence_watchers = []  # [listener(host_id, update)]
+
+
+def bus_path(app):
+    """Unix socket shared by every worker of this deployment."""
+    path = app.config.get("SOCKETIO_BUS_PATH") or f"{os.path.abspath(app.config['DATABASE'])}.bus.sock"
+    if len(path.encode()) > 100:  # sun_path limit
+        digest = hashlib.sha1(path.encode()).hexdigest()[:12]
+        path = os.path.join(tempfile.gettempdir(), f"neospace-{digest}.sock")
+    return path
+
+
+def make_backend(app):
+    """The backend named by SOCKETIO_BUS, or None for "off"."""
+    spec = (app.config.get("SOCKETIO_BUS") or "off").strip()
+    if spec == "off":
+        return None
+    if spec == "local" or (spec == "unix" and app.config.get("DATABASE") == ":memory:"):
+        return LocalBus()
+    if spec == "unix":
+        return UnixSocketBus(bus_path(app))
+    url = urlparse(spec)
+    if url.scheme == "redis":
+        return RedisBus((url.hostname or "localhost", url.port or 6379))
+    if url.scheme == "unix":
+        return RedisBus(url.path)
+    raise ValueError(f"Unknown SOCKETIO_BUS {spec!r} (unix, local, off, redis://host:port, unix:///path)")
+
+
+def attach_bus(app):
+    """Create this worker's client manager (replacing an earlier one). None when disabled."""
+    backend = make_backend(app)
+    manager = BusManager(backend) if backend else None
+    previous = _managers.swap(None, manager)
+    if previous is not None:
+        previous.close()
+    return manager
+
+
+def get_bus():
+    return _managers.get(None)
+
+
+def subscribe(topic, handler):
+    """Run handler(payload) on every worker whenever topic is published."""
+    _handlers[topic].append(handler)
+
+
+def publish(topic, payload):
+    """Deliver payload to topic's handlers here and on every other worker."""
+    _deliver(topic, payload)
+    manager = get_bus()
+    if manager is not None:
+        manager.publish_app(topic, payload)
+
+
+def _deliver(topic, payload):
+    for handler in list(_handlers.get(topic, ())):
+        try:
+            handler(payload)
+        except Exception:
+            logger.exception("socket_bus_subscriber_failed", topic=topic)
+
+
+def share_presence(provider):
+    """Register the () -> {sid: info} snapshot of this worker's sockets."""
+    global _presence
+    _presence = provider
+
+
+def local_sockets():
+    return _presence() if _presence else {}
+
+
+def watch_presence(listener):
+    """Call listener(host_id, update) for every presence update (host_id None: this worker)."""
+    _presence_watchers.append(listener)
+
+
+def _notify_presence(host_id, update):
+    for listener in list(_presence_watchers):
+        try:
+            listener(host_id, update)
+        except Exception:
+            logger.exception("socket_bus_presence_watcher_failed", op=update.get("op"))
+
+
+def _announce(update):
+    _notify_presence(None, update)
+    manager = get_bus()
+    if manager is not None:
+        manager.announce(update)
+
+
+def announce_socket(sid, info):
+    _announce({"op": "set", "sid": sid, "info": info})
+
+
+def retract_socket(sid):
+    _announce({"op": "del", "sid": sid})
+
+
+def cluster_sockets():
+    """{sid: info} for authenticated sockets on every worker."""
+    sockets = {}
+    manager = get_bus()
+    if manager is not None:
+        sockets.update(manager.peers.sockets())
+    sockets.update(local_sockets())
+    return sockets
+
+
+def bus_stats():
+    """Counters for this worker's bus, if one is attached."""
+    manager = get_bus()
+    return manager.stats() if manager else None
+
+
+def shutdown_bus():
+    """Leave the bus (and hand off the broker, if this worker was serving it)."""
+    manager = _managers.swap(None, None)
+    if manager is not None:
+        manager.close()
+
+
+atexit.register(shutdown_bus)
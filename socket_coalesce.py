@@ -0,0 +1,106 @@
+"""
+Message Coalescing - socket_coalesce.py
+
+Every chat send used to be its own "message" emit to the room: one
+packet encode and one write per member per message. Clients that join
+with {batch: true} instead receive a "messages" frame per room every
+window (SOCKETIO_COALESCE_MS): sends are collected, and whatever arrived
+in the window is encoded once and written once per member. A quiet room
+still gets its single message after at most one window.
+
+Socket.IO rooms per chat room:
+- <room>           everyone (typing indicators, room events)
+- <room>#messages  clients that get one "message" event per send
+- <room>#frames    clients that opted into "messages" frames
+
+The flusher runs as a Socket.IO background task (so it works under any
+async mode) and exits once nothing is pending.
+
+Usage:
+    from socket_coalesce import RoomCoalescer
+    coalescer = RoomCoalescer(emit_frame, window=0.025,
+                              start=socketio.start_background_task, sleep=socketio.sleep)
+    coalescer.add("general", message)
+"""
+import time
+from collections import defaultdict
+
+from socket_task import RoomTask
+
+# =============================================================================
+# Settings
+# =============================================================================
+COALESCE_WINDOW = 0.025  # Seconds messages wait for their frame
+MAX_FRAME_MESSAGES = 200  # A frame this full is sent without waiting out the window
+
+
+def messages_room(room):
+    """Socket.IO room of clients that get individual "message" events."""
+    return f"{room}#messages"
+
+
+def frames_room(room):
+    """Socket.IO room of clients that get batched "messages" frames."""
+    return f"{room}#frames"
+
+
+class RoomCoalescer(RoomTask):
+    """Collects messages per room and hands each room's batch to emit(room, messages)."""
+
+    def __init__(self, emit, window=COALESCE_WINDOW, start=None, sleep=time.sleep,
+                 max_messages=MAX_FRAME_MESSAGES):
+        super().__init__(emit, start=start, sleep=sleep)
+        self.window = window
+        self.max_messages = max_messages
+        self._pending = defaultdict(list)  # room -> [message]
+        self._due = {}  # room -> monotonic deadline of its next frame
+        self._stats = {"frames": 0, "messages": 0, "largest_frame": 0}
+
+    def add(self, room, message):
+        with self._lock:
+            self._pending[room].append(message)
+            if len(self._pending[room]) >= self.max_messages:
+                self._due[room] = 0.0
+            else:
+                self._due.setdefault(room, time.monotonic() + self.window)
+            start = self._claim()
+        if start:
+            self._launch()
+
+    def _take(self, rooms):
+        batches = [(room, self._pending.pop(room)) for room in rooms]
+        for room, _ in batches:
+            del self._due[room]
+        return batches
+
+    def _send(self, batches):
+        self._emit_rooms(batches, "coalesce_emit_failed")
+        with self._lock:
+            for _, messages in batches:
+                self._stats["frames"] += 1
+                self._stats["messages"] += len(messages)
+                self._stats["largest_frame"] = max(self._stats["largest_frame"], len(messages))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._due:
+                    self._running = False
+                    return
+                now = time.monotonic()
+                batches = self._take([room for room, due in self._due.items() if due <= now])
+                wait = 0 if batches else min(self._due.values()) - now
+            if batches:
+                self._send(batches)
+            else:
+                self._sleep(wait)
+
+    def flush(self):
+        """Send every pending frame now (tests, shutdown)."""
+        with self._lock:
+            batches = self._take(list(self._due))
+        self._send(batches)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending": sum(len(m) for m in self._pending.values())}
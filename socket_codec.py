@@ -0,0 +1,147 @@
+"""
+Socket Codec - socket_codec.py
+
+Handlers built msgspec structs (core.structs.Message), flattened them
+with msgspec.to_builtins, and python-socketio then re-serialized the
+dicts with the stdlib json module. Socket.IO now runs on msgspec:
+
+- MsgspecJSON is the json module of the server (packets and Engine.IO),
+  so structs are emitted as they are and encoded in one pass
+- clients that connect with ?codec=msgpack (ui/js/chat/SocketCodec.js,
+  the socket.io-msgpack-parser framing) get msgpack: one binary frame
+  per packet, no JSON text, smaller backfill pages
+- CodecManager encodes a broadcast once per codec in use among its
+  recipients (instead of once per broadcast for JSON only); acks and
+  other direct packets follow the recipient's codec too
+
+Decoding needs no negotiation: a msgpack client only sends binary
+frames, and JSON clients only send binary as attachments, which
+python-socketio collects before the packet class sees them.
+
+Usage:
+    from socket_codec import CodecManager, HybridPacket, MsgspecJSON, install_codec
+    socketio.init_app(app, client_manager=CodecManager(), serializer=HybridPacket, json=MsgspecJSON)
+    install_codec(socketio.server)
+"""
+from urllib.parse import parse_qs
+
+import msgspec
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+# =============================================================================
+# Settings
+# =============================================================================
+CODEC_PARAM = "codec"  # Connect query parameter a client picks its codec with
+JSON = "json"
+MSGPACK = "msgpack"
+ENVIRON_KEY = "neospace.codec"  # The codec, cached in the connection's WSGI environ
+
+_json_encoder = msgspec.json.Encoder()
+_msgpack_encoder = msgspec.msgpack.Encoder()
+_msgpack_decoder = msgspec.msgpack.Decoder()
+
+
+class MsgspecJSON:
+    """json-module interface over msgspec (structs encode natively)."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):  # separators etc.: msgspec output is already compact
+        return _json_encoder.encode(obj).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return msgspec.json.decode(s)
+
+
+class HybridPacket(packet.Packet):
+    """Socket.IO packet that also reads and writes socket.io-msgpack-parser frames."""
+
+    json = MsgspecJSON
+
+    def decode(self, encoded_packet):
+        if not isinstance(encoded_packet, (bytes, bytearray)):
+            return super().decode(encoded_packet)
+        fields = _msgpack_decoder.decode(encoded_packet)
+        if not isinstance(fields, dict) or not isinstance(fields.get("type"), int):
+            raise ValueError("Invalid msgpack packet")
+        self.packet_type = fields["type"]
+        self.namespace = fields.get("nsp")
+        self.data = fields.get("data")
+        self.id = fields.get("id")
+        return 0  # Binary travels inline: no attachments
+
+    def encode_msgpack(self):
+        packet_type = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}.get(
+            self.packet_type, self.packet_type)
+        fields = {"type": packet_type, "nsp": self.namespace or "/"}
+        if self.data is not None:
+            fields["data"] = self.data
+        if self.id is not None:
+            fields["id"] = self.id
+        return _msgpack_encoder.encode(fields)
+
+
+def client_codec(server, eio_sid):
+    """JSON or MSGPACK: what the client asked for when it connected."""
+    environ = server.environ.get(eio_sid)
+    if environ is None:
+        return JSON
+    codec = environ.get(ENVIRON_KEY)
+    if codec is None:
+        requested = parse_qs(environ.get("QUERY_STRING", "")).get(CODEC_PARAM)
+        codec = environ[ENVIRON_KEY] = MSGPACK if requested == [MSGPACK] else JSON
+    return codec
+
+
+def _eio_packets(pkt, codec):
+    encoded = pkt.encode_msgpack() if codec == MSGPACK else pkt.encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+
+
+class CodecManager(socketio.Manager):
+    """Client manager that encodes each broadcast once per codec among its recipients."""
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        if callback:  # One packet per recipient anyway (unique ack ids): Server._send_packet
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, to=to, **kwargs)
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+        pkt = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+        encoded = {}  # codec -> Engine.IO packets
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            codec = client_codec(self.server, eio_sid)
+            eio_pkts = encoded.get(codec)
+            if eio_pkts is None:
+                eio_pkts = encoded[codec] = _eio_packets(pkt, codec)
+            for p in eio_pkts:
+                self.server._send_eio_packet(eio_sid, p)
+
+
+def install_codec(server):
+    """Send direct packets (connect, acks, errors) in each client's codec."""
+    send_json = server._send_packet
+
+    def send_packet(eio_sid, pkt):
+        if client_codec(server, eio_sid) == MSGPACK:
+            server.eio.send(eio_sid, pkt.encode_msgpack())
+        else:
+            send_json(eio_sid, pkt)
+
+    server._send_packet = send_packet
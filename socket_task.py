@@ -0,0 +1,68 @@
+"""
+Room Background Tasks - socket_task.py
+
+RoomCoalescer and TypingTracker run a background task only while they
+have work: the first call with something to do starts it, and the task
+exits once nothing is pending. RoomTask holds that bookkeeping and the
+per-room emit, so a room whose emit raises is logged and skipped, and a
+task that dies anyway is restarted by the next call instead of leaving
+the tracker marked as running forever.
+
+Usage:
+    class RoomCoalescer(RoomTask):
+        def add(self, room, message):
+            with self._lock:
+                ...
+                start = self._claim()
+            if start:
+                self._launch()
+
+        def _run(self):      # Clear self._running under self._lock before returning
+            ...
+            self._emit_rooms(batches, "coalesce_emit_failed")
+"""
+import threading
+import time
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class RoomTask:
+    """A background task started on demand that emits per room."""
+
+    def __init__(self, emit, start=None, sleep=time.sleep):
+        self.emit = emit
+        self._start = start or (lambda fn: threading.Thread(target=fn, daemon=True).start())
+        self._sleep = sleep
+        self._lock = threading.Lock()  # Guards _running and the subclass's state
+        self._running = False
+
+    def _claim(self):
+        """With self._lock held: True when the caller has to _launch() the task."""
+        start = not self._running
+        self._running = True
+        return start
+
+    def _launch(self):
+        self._start(self._guarded_run)
+
+    def _guarded_run(self):
+        try:
+            self._run()
+        except BaseException:
+            with self._lock:
+                self._running = False  # The next call with work starts a new task
+            raise
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _emit_rooms(self, items, event):
+        """emit(room, payload) for each (room, payload); a failing room doesn't stop the rest."""
+        for room, payload in items:
+            try:
+                self.emit(room, payload)
+            except Exception:
+                logger.exception(event, room=room)
@@ -0,0 +1,114 @@
+"""
+Typing Presence - socket_typing.py
+
+"typing" / "stop_typing" used to be re-broadcast to the room as they
+arrived, so every typist in a busy room meant fan-out to every member.
+Sockets now only update a per-room record of who is typing (expiring
+after TYPING_TTL if the stop never arrives), and a ticker emits one
+"typing_state" diff per room at most every TYPING_TICK, only when the
+set of names changed:
+
+    {"room": "general", "worker": "web1:4242", "started": ["ana"], "stopped": ["bo"]}
+
+Someone who starts and stops within one tick is never broadcast at all.
+Typing-indicator traffic scales with rooms x ticks rather than with
+keystroke bursts x members. Each worker reports the typists connected
+to it, so clients keep one set of names per worker and show their
+union: ana typing in two tabs on two workers stays shown until both
+have stopped. A socket joining a room is sent each worker's snapshot
+({"room", "worker", "typing": [names]}) to start from.
+
+Usage:
+    from socket_typing import TypingTracker
+    tracker = TypingTracker(emit_state, start=socketio.start_background_task, sleep=socketio.sleep)
+    tracker.start_typing("general", sid, "ana")
+    tracker.snapshot("general")       # What this worker last reported, for a joining socket
+"""
+import os
+import socket
+import time
+from collections import defaultdict
+
+from socket_task import RoomTask
+
+# =============================================================================
+# Settings
+# =============================================================================
+TYPING_TICK = 0.25  # Seconds between typing_state emissions (4 Hz)
+TYPING_TTL = 6.0  # Seconds a typist is shown without a fresh "typing" (client idles out at 2s)
+
+
+def worker_id():
+    """Names this worker process in typing_state payloads (a forked child gets its own)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TypingTracker(RoomTask):
+    """Who is typing per room; emit(room, diff) once per tick for rooms that changed."""
+
+    def __init__(self, emit, tick=TYPING_TICK, ttl=TYPING_TTL, start=None, sleep=time.sleep):
+        super().__init__(emit, start=start, sleep=sleep)
+        self.tick = tick
+        self.ttl = ttl
+        self._typing = defaultdict(dict)  # room -> {sid: (username, expires)}
+        self._shown = {}  # room -> set of names in the last emitted state
+        self._stats = {"updates": 0, "emits": 0}
+
+    def start_typing(self, room, sid, username):
+        with self._lock:
+            self._typing[room][sid] = (username, time.monotonic() + self.ttl)
+            self._stats["updates"] += 1
+            start = self._claim()
+        if start:
+            self._launch()
+
+    def stop_typing(self, room, sid):
+        with self._lock:
+            typists = self._typing.get(room)
+            if typists and typists.pop(sid, None) is not None:
+                self._stats["updates"] += 1
+
+    def diffs(self):
+        """Expire stale typists; {room: diff} for rooms whose names changed since the last call."""
+        now = time.monotonic()
+        changed = {}
+        with self._lock:
+            for room in set(self._typing) | set(self._shown):
+                typists = self._typing.get(room, {})
+                for sid in [sid for sid, (_, expires) in typists.items() if expires <= now]:
+                    del typists[sid]
+                names = {username for username, _ in typists.values()}
+                shown = self._shown.get(room, set())
+                if names != shown:
+                    changed[room] = {
+                        "room": room,
+                        "worker": worker_id(),
+                        "started": sorted(names - shown),
+                        "stopped": sorted(shown - names),
+                    }
+                if names:
+                    self._shown[room] = names
+                else:
+                    self._shown.pop(room, None)
+                    self._typing.pop(room, None)
+            self._stats["emits"] += len(changed)
+        return changed
+
+    def snapshot(self, room):
+        """The names this worker last reported for room, as a typing_state payload."""
+        with self._lock:
+            names = sorted(self._shown.get(room, ()))
+        return {"room": room, "worker": worker_id(), "typing": names}
+
+    def _run(self):
+        while True:
+            self._sleep(self.tick)
+            self._emit_rooms(self.diffs().items(), "typing_emit_failed")
+            with self._lock:
+                if not self._typing and not self._shown:
+                    self._running = False
+                    return
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "typists": sum(len(t) for t in self._typing.values())}
@@ -2,9 +2,18 @@
 from flask_socketio import SocketIO, emit, disconnect, join_room, leave_room
 from flask import g, session, request
 from db import get_db
-from mutations.message_mutations import send_message
+from db_recent import backfill_page
+from socket_bus import (
+    announce_socket, attach_bus, publish, retract_socket, share_presence, subscribe, watch_presence,
+)
+from presence import PRESENCE_ROOM, PresenceRegistry
+from room_registry import count_members_with, get_room_registry
+from user_status import STATUS_TOPIC, get_status_cache, get_user_status, user_status_changed
+from socket_codec import CodecManager, HybridPacket, MsgspecJSON, install_codec
+from socket_coalesce import RoomCoalescer, frames_room, messages_room
+from socket_typing import TypingTracker
+from services.message_service import broadcast_messages_with, send_message_logic
 from core.structs import Message, row_to_message
-import msgspec
 import os
 import html
 
@@ -13,86 +22,201 @@ import html
 
 socketio = SocketIO()
 
+# Batches room messages into "messages" frames for clients that opt in
+# (None when SOCKETIO_COALESCE_MS is 0)
+coalescer = None
+
+# Who is typing per room, emitted as typing_state diffs at a fixed tick
+typing_tracker = None
+
 # Store authenticated socket connections
-# Maps session ID to {user_id, username, room_id, room_name}
+# Maps session ID to {user_id, username, room_id, room_name, visible}
 authenticated_sockets = {}
 
+
+def presence_info(auth_info):
+    """The part of a socket's auth info other workers see (socket_bus presence)."""
+    return {k: auth_info[k] for k in ("user_id", "username", "room_id", "room_name", "visible")}
+
+
+share_presence(lambda: {sid: presence_info(a) for sid, a in list(authenticated_sockets.items())})
+
+
+def _emit_presence_diff(diff):
+    # Every worker computes the same diffs from the bus, so each one only
+    # tells its own subscribers (whose versions come from this registry)
+    socketio.emit("presence_diff", diff, to=PRESENCE_ROOM, ignore_queue=True)
+
+
+# Online users across tabs and workers, pushed to "presence" subscribers
+presence = PresenceRegistry(_emit_presence_diff)
+watch_presence(presence.apply)
+count_members_with(presence.room_members)
+
+
+def set_online_visibility(user_id, visible):
+    """Show or hide a user in presence (profiles.show_online_status), on every worker."""
+    user_status_changed(user_id)  # New connections read the setting from the cache
+    publish("online_visibility", {"user_id": user_id, "visible": bool(visible)})
+
+
+def _apply_online_visibility(payload):
+    for sid, auth_info in list(authenticated_sockets.items()):
+        if auth_info["user_id"] == payload["user_id"]:
+            auth_info["visible"] = payload["visible"]
+            announce_socket(sid, presence_info(auth_info))
+
+
+subscribe("online_visibility", _apply_online_visibility)
+
+
+def disconnect_user(user_id):
+    """Close every socket of a user, on every worker (e.g. after a ban)."""
+    publish("disconnect_user", {"user_id": user_id})
+
+
+def _disconnect_local(payload):
+    for sid, auth_info in list(authenticated_sockets.items()):
+        if auth_info["user_id"] == payload["user_id"]:
+            socketio.server.disconnect(sid, ignore_queue=True)
+
+
+subscribe("disconnect_user", _disconnect_local)
+
+
+def _on_user_status(payload):
+    # Banned or deleted: their sockets go now, not at their next re-check
+    if payload.get("banned") or payload.get("deleted"):
+        _disconnect_local(payload)
+
+
+subscribe(STATUS_TOPIC, _on_user_status)
+
 # WebSocket Rate Limits (requests per window seconds)
 WS_MSG_LIMIT = 60
 WS_MSG_WINDOW = 60
 WS_TYPING_LIMIT = 10
 WS_TYPING_WINDOW = 10
 
-# Rate Limiting Storage
-from collections import defaultdict, deque
+# Rate Limiting: GCRA in the table Flask-Limiter uses, shared by every worker
 import time
+from core.rate_limit import get_limit_table
+from core.security import limiter
+
+
+class SocketRateLimits:
+    """Per-user socket event limits, kept in the shared rate-limit table."""
+
+    @staticmethod
+    def table():
+        return getattr(limiter.storage, "table", None) or get_limit_table()
+
+    def hit(self, user_id, action, limit, window):
+        return self.table().hit(f"ws:{action}:{user_id}", limit, window, action=f"ws:{action}")
+
+    def clear(self):
+        """Forget every limit in the table (tests)."""
+        self.table().clear()
 
-# Map user_id -> default dict of actions -> deque of timestamps
-rate_limits = defaultdict(lambda: defaultdict(deque))
+
+rate_limits = SocketRateLimits()
 
 def check_rate_limit(user_id, action="message", limit=60, window=60):
     """
     Check if user exceeded rate limit for action.
     Returns True if allowed, False if limited.
     """
-    now = time.time()
-    timestamps = rate_limits[user_id][action]
-    
-    # Remove old timestamps
-    while timestamps and now - timestamps[0] > window:
-        timestamps.popleft()
-        
-    if len(timestamps) >= limit:
-        return False
-        
-    timestamps.append(now)
-    return True
+    return rate_limits.hit(user_id, action, limit, window)
 
 
-def get_room_id_by_name(db, room_name):
+def get_room_id_by_name(room_name):
     """Get room ID from name, defaults to 'general' if not found."""
-    row = db.execute(
-        "SELECT id FROM rooms WHERE name = ?",
-        (room_name,)
-    ).fetchone()
-    if row:
-        return row["id"]
-    # Fallback to general
-    row = db.execute("SELECT id FROM rooms WHERE name = 'general'").fetchone()
-    return row["id"] if row else 1
+    return get_room_registry().resolve_id(room_name)
 
 
 # Helper function for session re-validation
 def validate_auth(sid, max_age=3600):  # Default 1 hour re-check
+    """
+    True while the socket's user exists and isn't banned. Checked
+    against the user status cache (invalidated by bans on every worker);
+    after max_age the user is re-read from the database regardless.
+    """
     auth = authenticated_sockets.get(sid)
     if not auth:
         return False
-        
-    # Check if re-validation is needed
+
     now = time.time()
+    cache = get_status_cache()
     if now - auth.get("last_auth", 0) > max_age:
-        # Re-query DB to ensure user still exists and isn't banned
-        db = get_db()
-        user = db.execute(
-            "SELECT id, is_banned FROM users WHERE id = ? AND username = ?",
-            (auth["user_id"], auth["username"])
-        ).fetchone()
-        
-        if not user or user['is_banned']:
-            return False
-            
-        # Update timestamp on success
+        status = cache.refresh(auth["user_id"])
         auth["last_auth"] = now
-        
-    return True
+    else:
+        status = cache.get(auth["user_id"])
+    return status is not None and status.allows(auth["username"])
+
+
+def _emit_frame(room, messages):
+    socketio.emit("messages", {"room": room, "messages": messages}, to=frames_room(room))
+
+
+def _broadcast_message(room_name, msg):
+    socketio.emit("message", msg, to=messages_room(room_name))
+    if coalescer is not None:
+        coalescer.add(room_name, msg)
+
+
+broadcast_messages_with(_broadcast_message)
+
+
+def _emit_typing_state(room, diff):
+    socketio.emit("typing_state", diff, to=room)
+
+
+def _send_typing_snapshot(payload):
+    # Every worker answers a join with the names it reports for the room
+    if typing_tracker is None:
+        return
+    snapshot = typing_tracker.snapshot(payload["room"])
+    if snapshot["typing"]:
+        socketio.emit("typing_state", snapshot, to=payload["sid"])
+
+
+subscribe("typing_snapshot", _send_typing_snapshot)
 
 
 def init_sockets(app):
+    global coalescer, typing_tracker
+    window_ms = app.config.get("SOCKETIO_COALESCE_MS", 25)
+    coalescer = RoomCoalescer(
+        _emit_frame,
+        window=window_ms / 1000,
+        start=socketio.start_background_task,
+        sleep=socketio.sleep,
+    ) if window_ms > 0 else None
+    typing_tracker = TypingTracker(
+        _emit_typing_state,
+        tick=app.config.get("SOCKETIO_TYPING_TICK_MS", 250) / 1000,
+        start=socketio.start_background_task,
+        sleep=socketio.sleep,
+    )
+
+    # Relays emits, room joins and disconnects between workers (SOCKETIO_BUS)
+    bus = attach_bus(app)
+    # msgspec JSON for everyone, msgpack for clients that connect with ?codec=msgpack
     socketio.init_app(
         app,
         cors_allowed_origins=app.config.get("ALLOWED_ORIGINS"),
-        async_mode=app.config.get("SOCKETIO_ASYNC_MODE")
+        async_mode=app.config.get("SOCKETIO_ASYNC_MODE"),
+        client_manager=bus if bus is not None else CodecManager(),
+        serializer=HybridPacket,
+        json=MsgspecJSON
     )
+    install_codec(socketio.server)
+    if bus is not None:
+        # Listen now rather than on the first socket connect: workers
+        # without sockets still get application topics
+        socketio.server.manager_initialized = True
+        bus.initialize()
 
     @socketio.on("connect")
     def connect(auth=None):
@@ -110,11 +234,10 @@ def init_sockets(app):
             disconnect()
             return False
         
-        # Verify user exists and is not banned
-        db = get_db()
-        user = db.execute("SELECT is_banned FROM users WHERE id = ?", (user_id,)).fetchone()
+        # Verify user exists and is not banned (cached; bans invalidate it)
+        user = get_user_status(user_id)
         
-        if not user or user['is_banned']:
+        if user is None or not user.allows():
              session.clear()
              emit("error", {"message": "Connection rejected: Account banned or invalid"})
              disconnect()
@@ -126,8 +249,10 @@ def init_sockets(app):
             "username": username,
             "room_id": 1,  # Default to general
             "room_name": "general",
+            "visible": user.visible,
             "last_auth": time.time()  # Track auth time
         }
+        announce_socket(request.sid, presence_info(authenticated_sockets[request.sid]))
         
         emit("connected", {"ok": True, "username": username})
         return True
@@ -137,19 +262,22 @@ def init_sockets(app):
         """Clean up authenticated socket on disconnect."""
         auth_info = authenticated_sockets.get(request.sid)
         if auth_info:
+            typing_tracker.stop_typing(auth_info["room_name"], request.sid)
             # Leave the room
             leave_room(auth_info["room_name"])
+            leave_room(messages_room(auth_info["room_name"]))
+            leave_room(frames_room(auth_info["room_name"]))
             del authenticated_sockets[request.sid]
-            
-            # Optional: Clean up rate limits if memory is concern, 
-            # but getting user_id here might be tricky if cleaned up too early.
-            # Leaving in memory for now as they are small deques.
+            retract_socket(request.sid)
+            # Rate-limit state needs no cleanup: idle keys replenish and are swept
 
     @socketio.on("join_room")
     def handle_join_room(data):
         """
         Join a specific room/channel.
-        Client emits this after connect with {room: 'room_name'}.
+        Client emits this after connect with {room: 'room_name'}; with
+        batch: true, messages arrive as "messages" frames (lists) instead
+        of one "message" event each.
         """
         if not validate_auth(request.sid):
             emit("error", {"message": "Session expired or invalid"})
@@ -160,25 +288,35 @@ def init_sockets(app):
         
         room_name = data.get("room", "general").lower().strip()
         
-        # Leave previous room if any
+        batched = bool(data.get("batch")) and coalescer is not None
+        
+        # Leave previous room (and its message delivery rooms) if any
         old_room = auth_info.get("room_name")
-        if old_room and old_room != room_name:
-            leave_room(old_room)
+        if old_room:
+            typing_tracker.stop_typing(old_room, request.sid)
+            if old_room != room_name:
+                leave_room(old_room)
+            leave_room(messages_room(old_room))
+            leave_room(frames_room(old_room))
         
-        # Get room ID from database
-        db = get_db()
-        room_id = get_room_id_by_name(db, room_name)
+        # Get room ID from the worker's room registry
+        room_id = get_room_id_by_name(room_name)
         
         # Update socket state
         auth_info["room_id"] = room_id
         auth_info["room_name"] = room_name
+        announce_socket(request.sid, presence_info(auth_info))
         
-        # Join Socket.IO room
+        # Join Socket.IO room, plus where its messages are delivered
         join_room(room_name)
+        join_room(frames_room(room_name) if batched else messages_room(room_name))
+        # Typing diffs only say what changed; start the socket from every worker's names
+        publish("typing_snapshot", {"room": room_name, "sid": request.sid})
         
         emit("room_joined", {
             "room": room_name,
-            "room_id": room_id
+            "room_id": room_id,
+            "batch": batched
         })
 
     @socketio.on("send_message")
@@ -186,11 +324,9 @@ def init_sockets(app):
         """
         Handle message sending via WebSocket.
         Uses server-authenticated username, ignoring any client-provided user.
-        Messages are scoped to the user's current room.
+        Messages are scoped to the user's current room. A resend with the
+        same idempotency_key (after a lost ack) does not post twice.
         """
-        import time
-        import sqlite3
-        
         if not validate_auth(request.sid):
             emit("error", {"message": "Session expired or invalid"})
             disconnect()
@@ -203,7 +339,7 @@ def init_sockets(app):
         user_id = auth_info["user_id"]
         room_id = auth_info.get("room_id", 1)
         room_name = auth_info.get("room_name", "general")
-        content = data.get("content", "").strip()
+        content = data.get("content", "")
 
         config_limit = WS_MSG_LIMIT
         config_window = WS_MSG_WINDOW
@@ -211,79 +347,38 @@ def init_sockets(app):
         # Rate Limiting (60 messages per 60 seconds)
         if not check_rate_limit(user_id, action="message", limit=config_limit, window=config_window):
             emit("error", {"message": "Rate limit exceeded. Slow down!"})
-            return
-        
-        if not content:
-            emit("error", {"message": "Empty message"})
-            return
-        
-        # Sanitize content
-        from utils.sanitize import clean_html
-        safe_content = clean_html(content)
-        
-        # Insert with retry logic for high concurrency
-        MAX_RETRIES = 5
-        RETRY_DELAY_BASE = 0.05
+            return {"ok": False, "error": "Rate limit exceeded. Slow down!", "status": 429}
         
-        db = get_db()
-        row = None
-        last_error = None
-        
-        for attempt in range(MAX_RETRIES):
-            try:
-                row = db.execute(
-                    "INSERT INTO messages(user, content, room_id) VALUES (?, ?, ?) RETURNING id, user, content, created_at, room_id",
-                    (username, safe_content, room_id)
-                ).fetchone()
-                db.commit()
-                break
-            except sqlite3.OperationalError as e:
-                if "locked" in str(e).lower() or "busy" in str(e).lower():
-                    last_error = e
-                    delay = RETRY_DELAY_BASE * (2 ** attempt)
-                    time.sleep(delay)
-                else:
-                    print(f"Error inserting message: {e}")
-                    emit("error", {"message": "Database error"})
-                    return
-            except Exception as e:
-                db.rollback()
-                print(f"Error inserting message: {e}")
-                emit("error", {"message": "Database error"})
-                return
-        
-        if row is None:
-            print(f"Message insert failed after {MAX_RETRIES} retries: {last_error}")
-            emit("error", {"message": "Database busy, please retry"})
-            return
-
-        # Broadcast to room only (msgspec struct for speed)
-        msg = Message(
-            id=row["id"],
-            user=row["user"],
-            content=row["content"],
-            created_at=row["created_at"],
-            room_id=row["room_id"],
-            deleted=False,
-            edited=False
-        )
-        emit("message", msgspec.to_builtins(msg), room=room_name)
+        # validate -> sanitize -> idempotency -> persist -> remember -> broadcast
+        # (services.message_service); the ack tells a retrying client it landed
+        result = send_message_logic(username, content, room_name=room_name, room_id=room_id,
+                                    idempotency_key=data.get("idempotency_key"))
+        if not result.success:
+            if result.status != 409:  # 409: a retry while the first attempt is still in flight
+                emit("error", {"message": result.error})
+            return {"ok": False, "error": result.error, "status": result.status}
+        return {"ok": True, "id": result.data["message"].id}
 
     @socketio.on("request_backfill")
     def backfill(data):
-        """Fetch message history for current room."""
+        """
+        Fetch a page of message history for the current room.
+        {after_id} pages forward, {before_id} pages back, neither (or
+        after_id=0) returns the newest page; limit is capped server-side.
+        """
         auth_info = authenticated_sockets.get(request.sid)
         room_id = auth_info.get("room_id", 1) if auth_info else 1
-        
-        after = int(data.get("after_id", 0))
-        db = get_db()
-        rows = db.execute(
-            """SELECT id, user, content, created_at, edited_at, deleted_at, room_id
-               FROM messages 
-               WHERE id > ? AND deleted_at IS NULL AND room_id = ?
-               ORDER BY id""",
-            (after, room_id)
-        ).fetchall()
+        data = data or {}
+
+        before = data.get("before_id")
+        # Recent pages come from the room's ring; older ones from the database
+        rows, has_more = backfill_page(
+            get_db(),
+            room_id,
+            after_id=int(data.get("after_id") or 0),
+            before_id=int(before) if before is not None else None,
+            limit=data.get("limit"),
+        )
 
         # Use msgspec structs for fast serialization
         msgs = []
@@ -297,12 +392,12 @@ def init_sockets(app):
                 deleted=False,
                 edited=bool(r["edited_at"]),
             )
-            msgs.append(msgspec.to_builtins(msg))
-        emit("backfill", {"phase": "continuity", "messages": msgs})
+            msgs.append(msg)
+        emit("backfill", {"phase": "continuity", "messages": msgs, "has_more": has_more})
 
     @socketio.on("typing")
     def handle_typing(data):
-        """Broadcast typing indicator to room."""
+        """Record that the user is typing (broadcast on the next typing_state tick)."""
         if not validate_auth(request.sid):
             return
 
@@ -313,15 +408,30 @@ def init_sockets(app):
             return
 
         room_name = auth_info.get("room_name", "general")
-        emit("typing", {"user": auth_info["username"]}, room=room_name, include_self=False)
+        typing_tracker.start_typing(room_name, request.sid, auth_info["username"])
 
     @socketio.on("stop_typing")
     def handle_stop_typing(data):
-        """Broadcast stop typing indicator to room."""
+        """Record that the user stopped typing."""
         auth_info = authenticated_sockets.get(request.sid)
         if auth_info:
-            room_name = auth_info.get("room_name", "general")
-            emit("stop_typing", {"user": auth_info["username"]}, room=room_name, include_self=False)
+            typing_tracker.stop_typing(auth_info.get("room_name", "general"), request.sid)
+
+    @socketio.on("presence_subscribe")
+    def presence_subscribe(data=None):
+        """
+        Start receiving "presence_diff" events. Returns the snapshot
+        ({version, users}) the diffs apply to; diffs received before it
+        with a version at or below the snapshot's are already included.
+        """
+        if not validate_auth(request.sid):
+            return {"error": "Session expired or invalid"}
+        join_room(PRESENCE_ROOM)
+        return presence.snapshot()
+
+    @socketio.on("presence_unsubscribe")
+    def presence_unsubscribe(data=None):
+        leave_room(PRESENCE_ROOM)
 
     @socketio.on("latency_check")
     def latency_check(data=None):
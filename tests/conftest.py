@@ -1,10 +1,29 @@
 
+import glob
 import os
 import tempfile
 import pytest
 from app import create_app
 import db as db_module
 
+def _remove_db_files(db_path):
+    """Delete a test database and every file kept next to it (WAL, lock
+    files, rate-limit table, snapshots, write-behind logs, partitions)."""
+    stem = os.path.splitext(db_path)[0]
+    side_files = glob.glob(f"{glob.escape(db_path)}[.-]*") + glob.glob(f"{glob.escape(stem)}.messages-*")
+    for path in [db_path, *side_files]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+@pytest.fixture
+def remove_db_files():
+    """For fixtures that create their own database file."""
+    return _remove_db_files
+
+
 @pytest.fixture
 def app():
     """Create app with isolated test database."""
@@ -16,7 +35,9 @@ def app():
     test_config = {
         'DATABASE': db_path,
         'TESTING': True,
-        'WTF_CSRF_ENABLED': False
+        'WTF_CSRF_ENABLED': False,
+        # Flask-SocketIO's test client refuses pub/sub client managers
+        'SOCKETIO_BUS': 'off'
     }
     
     app = create_app(test_config)
@@ -24,7 +45,8 @@ def app():
     yield app
     
     # Cleanup
-    os.unlink(db_path)
+    db_module.shutdown_pool()
+    _remove_db_files(db_path)
 
 @pytest.fixture
 def client(app):
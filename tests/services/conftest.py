@@ -19,7 +19,7 @@ from db import get_db, init_db
 
 
 @pytest.fixture
-def db_session():
+def db_session(remove_db_files):
     """
     Create an isolated test database with Flask app context.
     Uses a temp file to allow multiple connections if needed.
@@ -45,11 +45,9 @@ def db_session():
         yield get_db()
     
     # Cleanup
+    db_module.shutdown_pool()
     db_module.DB_PATH = original_path
-    try:
-        os.unlink(db_path)
-    except OSError:
-        pass
+    remove_db_files(db_path)
 
 
 @pytest.fixture
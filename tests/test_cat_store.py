@@ -2,6 +2,7 @@
 import pytest
 from services.cats.store import CatStore
 from db import get_db
+from db_writebehind import flush_write_behind
 
 @pytest.fixture
 def base_cats():
@@ -76,6 +77,7 @@ def test_memories_and_relationships(app, base_cats):
         
         # Add positive memory
         CatStore.add_memory(mochi["id"], human_id, "pet", 10.0)
+        flush_write_behind()
         
         affinity = CatStore.get_relationship(mochi["id"], human_id)
         assert affinity == 10.0
@@ -85,6 +87,7 @@ def test_memories_and_relationships(app, base_cats):
         
         # Add negative memory
         CatStore.add_memory(mochi["id"], human_id, "scold", -5.0)
+        flush_write_behind()
         affinity = CatStore.get_relationship(mochi["id"], human_id)
         assert affinity == 5.0
 
@@ -0,0 +1,58 @@
+import sqlite3
+
+import db as db_module
+from db_analyze import analyzed_rows, drifted_tables, refresh_statistics
+
+
+def _db():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.executescript(db_module.SCHEMA)
+    conn.execute("CREATE TABLE follows (id INTEGER PRIMARY KEY, follower_id INTEGER, following_id INTEGER)")
+    conn.execute("CREATE INDEX idx_follower ON follows(follower_id)")
+    conn.execute("CREATE INDEX idx_following ON follows(following_id)")
+    return conn
+
+
+def _fill(conn, rows, follower=lambda i: i % 2):
+    conn.executemany(
+        "INSERT INTO follows (follower_id, following_id) VALUES (?, ?)",
+        [(follower(i), i) for i in range(rows)],
+    )
+
+
+def test_never_analyzed_tables_are_due_once_they_have_rows():
+    conn = _db()
+    _fill(conn, 500)
+    conn.execute("INSERT INTO rooms (name) VALUES ('general')")
+    assert drifted_tables(conn) == [("follows", None, 500)]
+
+
+def test_only_significant_drift_triggers_analyze():
+    conn = _db()
+    _fill(conn, 1000)
+    assert refresh_statistics(conn, statements=[])["analyzed"] == ["follows"]
+    assert analyzed_rows(conn)["follows"] == 1000
+
+    _fill(conn, 150)  # 15%: below DRIFT_RATIO
+    assert drifted_tables(conn) == []
+    _fill(conn, 100)  # 25% since the last ANALYZE
+    assert drifted_tables(conn) == [("follows", 1000, 1250)]
+    assert refresh_statistics(conn, statements=[])["analyzed"] == ["follows"]
+    assert analyzed_rows(conn)["follows"] == 1250
+
+
+def test_plan_changes_are_reported():
+    conn = _db()
+    _fill(conn, 2000, follower=lambda i: 1)  # follower_id is useless, following_id is unique
+    sql = "SELECT * FROM follows WHERE follower_id = ? AND following_id > ?"
+    result = refresh_statistics(conn, statements=[("q1", sql)])
+    assert result["analyzed"] == ["follows"]
+    [change] = result["plan_changes"]
+    assert "idx_follower" in change["before"][0] and "idx_following" in change["after"][0]
+
+
+def test_unplannable_statements_are_skipped():
+    conn = _db()
+    _fill(conn, 200)
+    result = refresh_statistics(conn, statements=[("q1", "SELECT * FROM follows WHERE id IN (?...)")])
+    assert result == {"analyzed": ["follows"], "plan_changes": []}
@@ -0,0 +1,140 @@
+import glob
+import os
+
+import pytest
+
+from db import get_db, get_pool, open_connection
+from db_archive import (
+    DAY_MS,
+    MessageArchiver,
+    archive_horizon,
+    archive_messages,
+    count_archived,
+    reclaim_pages,
+)
+from db_epoch import now_ms
+from db_partitions import count_live_messages, find_message, note_deleted, page_messages, roll_partitions
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO rooms (id, name, retention_days) VALUES (2, 'fast', 1)")
+        yield db
+    for leftover in glob.glob(os.path.splitext(app.config["DATABASE"])[0] + ".messages-*"):
+        os.unlink(leftover)
+
+
+def _insert(db, room_id, age_days, content, deleted=False):
+    db.execute(
+        "INSERT INTO messages (user, content, room_id, created_at_ms, deleted_at) VALUES (?, ?, ?, ?, ?)",
+        ("a", content, room_id, now_ms() - int(age_days * DAY_MS), "2024-01-01" if deleted else None),
+    )
+    db.commit()
+
+
+def _conn():
+    pool = get_pool()
+    return open_connection(pool.db_path, pool.pragmas)
+
+
+def test_moves_deleted_and_expired_per_room(db):
+    _insert(db, 1, 10, "room1 old")    # Default 30 day window: stays
+    _insert(db, 2, 10, "room2 old")    # 1 day window: archived
+    _insert(db, 1, 0, "room1 gone", deleted=True)  # Deleted: archived early
+    _insert(db, 2, 0, "room2 new")
+
+    conn = _conn()
+    assert archive_messages(conn, retention_days=30, chunk_size=1, pause=0) == {"deleted": 1, "expired": 1}
+    conn.close()
+
+    hot = [r["content"] for r in db.execute("SELECT content FROM messages ORDER BY id")]
+    assert hot == ["room1 old", "room2 new"]
+    assert db.execute("SELECT COUNT(*) FROM messages_archive").fetchone()[0] == 2
+    assert count_archived(db) == 1  # Deleted rows are not live
+    assert count_live_messages(db) == 3
+    assert archive_horizon(db, 2) == 2
+    assert archive_horizon(db, 1) is None
+
+
+def test_paging_falls_through_to_archive(db):
+    for i in range(3):
+        _insert(db, 2, 5, f"old {i}")
+    for i in range(3):
+        _insert(db, 2, 0, f"new {i}")
+    conn = _conn()
+    archive_messages(conn, retention_days=30, pause=0)
+    conn.close()
+
+    latest = page_messages(db, room_id=2, before_id=10**9, limit=3)
+    assert [r["content"] for r in latest] == ["new 0", "new 1", "new 2"]
+    older = page_messages(db, room_id=2, before_id=latest[0]["id"], limit=5)
+    assert [r["content"] for r in older] == ["old 0", "old 1", "old 2"]
+    assert [r["content"] for r in page_messages(db, room_id=2)] == [
+        "old 0", "old 1", "old 2", "new 0", "new 1", "new 2",
+    ]
+
+
+def test_find_and_delete_in_archive(db):
+    _insert(db, 2, 5, "archived")
+    conn = _conn()
+    archive_messages(conn, retention_days=30, pause=0)
+    conn.close()
+    message_id = db.execute("SELECT id FROM messages_archive").fetchone()[0]
+    assert count_archived(db) == 1
+
+    table, row = find_message(db, message_id)
+    assert table == "main.messages_archive" and row["user"] == "a"
+
+    # What the delete mutation does
+    db.execute(f"UPDATE {table} SET deleted_at = datetime('now') WHERE id = ?", (message_id,))
+    note_deleted(db, table, row)
+    db.commit()
+
+    assert find_message(db, message_id) == (None, None)
+    assert count_archived(db) == 0 and count_live_messages(db) == 0
+    assert page_messages(db, room_id=2) == []
+
+
+def test_roll_takes_months_from_the_archive(db):
+    _insert(db, 2, 200, "ancient")
+    _insert(db, 2, 0, "fresh")
+    conn = _conn()
+    archive_messages(conn, retention_days=30, pause=0)
+    conn.close()
+    assert count_archived(db) == 1
+
+    moved = roll_partitions(hot_months=2, pause=0)
+    assert sum(moved.values()) == 1
+    assert db.execute("SELECT COUNT(*) FROM messages_archive").fetchone()[0] == 0
+    assert count_archived(db) == 0
+    assert count_live_messages(db) == 2
+    assert [r["content"] for r in page_messages(db, room_id=2)] == ["ancient", "fresh"]
+
+
+def test_reclaims_freed_pages(db):
+    assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # New databases are INCREMENTAL
+    db.executemany(
+        "INSERT INTO messages (user, content) VALUES ('a', ?)", [("x" * 4000,) for _ in range(50)]
+    )
+    db.execute("DELETE FROM messages")
+    db.commit()
+    conn = _conn()
+    assert reclaim_pages(conn) > 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    conn.close()
+
+
+def test_archiver_run_records_throughput(db):
+    _insert(db, 2, 3, "old")
+    archiver = MessageArchiver(get_pool().db_path, retention_days=30, interval=3600, pause=0)
+    try:
+        assert archiver.run_once() == 1
+        stats = archiver.stats()
+        assert stats["runs"] == 1
+        assert stats["archived_expired"] == 1
+        assert stats["last_run_rows"] == 1
+        assert stats["rows_per_second"] > 0
+    finally:
+        archiver.stop()
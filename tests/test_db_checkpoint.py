@@ -0,0 +1,90 @@
+import db as db_module
+from db_checkpoint import CheckpointManager, checkpointer_stats, shutdown_checkpointers, wal_size
+
+
+def _writer(path):
+    conn = db_module.open_connection(path, {**db_module.DEFAULT_PRAGMAS, "wal_autocheckpoint": 0})
+    conn.execute("CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, body TEXT)")
+    return conn
+
+
+def _write(conn, rows=50):
+    conn.executemany("INSERT INTO t (body) VALUES (?)", [("x" * 2000,)] * rows)
+
+
+def test_request_connections_leave_checkpoints_to_the_manager(tmp_path):
+    from app import create_app
+    # TESTING turns the manager off by default
+    app = create_app({"DATABASE": str(tmp_path / "t.db"), "TESTING": True, "DB_CHECKPOINT_ENABLED": True})
+    try:
+        with app.app_context():
+            assert db_module.get_db().execute("PRAGMA wal_autocheckpoint").fetchone()[0] == 0
+            assert checkpointer_stats() is not None
+        assert db_module.open_connection(app.config["DATABASE"]).execute("PRAGMA wal_autocheckpoint").fetchone()[0] == 1000
+    finally:
+        shutdown_checkpointers()
+        db_module.shutdown_pool()
+
+
+def test_passive_checkpoint_waits_for_an_idle_tick(tmp_path):
+    path = str(tmp_path / "wal.db")
+    conn = _writer(path)
+    manager = CheckpointManager(path, interval=3600, passive_max_defer=3)
+    try:
+        assert manager.run_once() == ["PASSIVE"]  # Startup state is unknown: checkpoint once
+        _write(conn)
+        assert manager.run_once() == []  # Commits since the last tick: busy, defer
+        assert manager.run_once() == ["PASSIVE"]  # Quiet tick
+        assert manager.stats()["frames_behind"] == 0
+        assert manager.run_once() == []  # Nothing new to copy
+        for expected in ([], [], ["PASSIVE"]):  # Busy for passive_max_defer ticks
+            _write(conn, 5)
+            assert manager.run_once() == expected
+    finally:
+        manager.stop()
+        conn.close()
+
+
+def test_large_wal_escalates_to_truncate(tmp_path):
+    path = str(tmp_path / "wal.db")
+    conn = _writer(path)
+    manager = CheckpointManager(path, interval=3600, restart_bytes=64 * 1024, truncate_bytes=256 * 1024)
+    try:
+        _write(conn, 200)
+        assert wal_size(path) > 256 * 1024
+        assert manager.run_once() == ["PASSIVE", "TRUNCATE"]
+        assert wal_size(path) == 0
+        assert manager.stats()["checkpoints"]["TRUNCATE"] == 1
+    finally:
+        manager.stop()
+        conn.close()
+
+
+def test_wal_in_use_escalates_to_restart(tmp_path):
+    path = str(tmp_path / "wal.db")
+    conn = _writer(path)
+    manager = CheckpointManager(path, interval=3600, restart_bytes=64 * 1024, truncate_bytes=1 << 30)
+    try:
+        _write(conn, 60)
+        assert manager.run_once() == ["PASSIVE", "RESTART"]
+        stats = manager.stats()
+        assert stats["last_mode"] == "RESTART" and stats["duration_seconds"]["count"] == 2
+    finally:
+        manager.stop()
+        conn.close()
+
+
+def test_only_one_process_checkpoints(tmp_path):
+    path = str(tmp_path / "wal.db")
+    _writer(path).close()
+    first = CheckpointManager(path, interval=3600)
+    second = CheckpointManager(path, interval=3600)  # flock is per open file, like another worker
+    try:
+        assert first.run_once() is not None
+        assert second.run_once() is None
+        first.stop()
+        assert second.run_once() is not None
+        assert second.stats()["leader"]
+    finally:
+        first.stop()
+        second.stop()
@@ -0,0 +1,80 @@
+import sqlite3
+
+import db as db_module
+from db_epoch import add_epoch_columns, backfill_epoch_columns, now_ms
+
+
+def _schema_db():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.executescript(db_module.SCHEMA)
+    return conn
+
+
+def test_trigger_derives_ms_from_text_timestamp():
+    conn = _schema_db()
+    conn.execute("INSERT INTO messages (user, content, created_at) VALUES ('a', 'x', '2024-01-02 03:04:05')")
+    assert conn.execute("SELECT created_at_ms FROM messages").fetchone()[0] == 1704164645000
+
+
+def test_trigger_leaves_explicit_ms_alone():
+    conn = _schema_db()
+    ts = now_ms()
+    conn.execute("INSERT INTO notifications (user_id, type, title, created_at_ms) VALUES (1, 't', 'x', ?)", (ts,))
+    assert conn.execute("SELECT created_at_ms FROM notifications").fetchone()[0] == ts
+
+
+def test_cat_memory_expiry_is_dual_written():
+    conn = _schema_db()
+    conn.execute(
+        "INSERT INTO cat_memories (source_cat_id, target_user_id, memory_type, opinion_modifier, expires_at) "
+        "VALUES (1, 1, 'pet', 1.0, '2030-01-01 00:00:00')"
+    )
+    created, expires = conn.execute("SELECT created_at_ms, expires_at_ms FROM cat_memories").fetchone()
+    assert expires == 1893456000000
+    assert abs(created - now_ms()) < 5000
+
+
+def test_legacy_table_gets_columns_and_chunked_backfill():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, user TEXT, content TEXT, room_id INTEGER, "
+                 "created_at TEXT DEFAULT CURRENT_TIMESTAMP, edited_at TEXT, deleted_at TEXT)")
+    conn.executemany(
+        "INSERT INTO messages (user, created_at) VALUES ('a', ?)",
+        [(f"2024-01-01 00:00:{i:02d}",) for i in range(7)],
+    )
+
+    add_epoch_columns(conn)
+    conn.executescript(db_module.SCHEMA)  # Indexes and triggers now apply cleanly
+
+    assert backfill_epoch_columns(conn, chunk_size=3, pause=0) == 7
+    rows = [r[0] for r in conn.execute("SELECT created_at_ms FROM messages ORDER BY id")]
+    assert rows == [1704067200000 + i * 1000 for i in range(7)]
+    assert backfill_epoch_columns(conn, chunk_size=3, pause=0) == 0
+
+
+def test_reads_stay_on_text_timestamps_until_the_backfill_is_done(app):
+    import db_epoch
+    from queries.notifications import get_all
+    path = app.config["DATABASE"]
+    with app.app_context():
+        conn = db_module.get_db()
+        # A database mid-migration: old TEXT index, rows without created_at_ms, no done marker
+        conn.execute("DELETE FROM schema_meta WHERE key = ?", (db_epoch.BACKFILL_DONE_KEY,))
+        conn.execute("CREATE INDEX idx_notif_user_created ON notifications(user_id, created_at)")
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('u', 'h')")
+        for title, ts in (("new", "2024-03-01 00:00:00"), ("old", "2024-01-01 00:00:00"),
+                          ("mid", "2024-02-01 00:00:00")):
+            conn.execute("INSERT INTO notifications (user_id, type, title, created_at) VALUES (1, 't', ?, ?)",
+                         (title, ts))
+        conn.execute("UPDATE notifications SET created_at_ms = NULL")
+        conn.commit()
+        db_epoch._ready.clear()
+
+        assert not db_epoch.epoch_reads_ready()
+        assert [n["title"] for n in get_all(1)] == ["new", "mid", "old"]
+
+        db_epoch.start_backfill(path).join()
+        assert db_epoch.epoch_reads_ready()
+        assert [n["title"] for n in get_all(1)] == ["new", "mid", "old"]
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_notif_user_created'").fetchone() is None
+        assert db_epoch.start_backfill(path) is None  # Later boots skip the probe
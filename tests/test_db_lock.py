@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from db_lock import Histogram, WriteLock, WriteLockTimeout
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+def test_timeout_is_a_typed_operational_error(lock_path):
+    lock = WriteLock(lock_path)
+    other_worker = WriteLock(lock_path)  # Separate open file: behaves like another process
+    with other_worker.hold(timeout=1):
+        start = time.monotonic()
+        with pytest.raises(WriteLockTimeout) as exc:
+            lock.acquire(time.monotonic() + 0.05)
+        assert time.monotonic() - start < 0.5
+    assert isinstance(exc.value, sqlite3.OperationalError)
+    assert lock.stats()["timeouts"] == 1
+
+    with lock.hold(timeout=0.1):  # Free again once the other worker lets go
+        pass
+
+
+def test_threads_get_the_lock_in_arrival_order(lock_path):
+    lock = WriteLock(lock_path)
+    order = []
+    lock.acquire(time.monotonic() + 1)
+
+    def worker(n):
+        with lock.hold(timeout=5):
+            order.append(n)
+
+    threads = []
+    for n in range(5):
+        t = threading.Thread(target=worker, args=(n,))
+        t.start()
+        threads.append(t)
+        while len(lock._waiters) < n + 1:
+            time.sleep(0.001)
+    lock.release()
+    for t in threads:
+        t.join()
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_reentrant_and_histograms(lock_path):
+    lock = WriteLock(lock_path)
+    with lock.hold(timeout=1):
+        with lock.hold(timeout=1):
+            assert lock.held_by_current_thread()
+        assert lock.held_by_current_thread()
+    assert not lock.held_by_current_thread()
+
+    stats = lock.stats()
+    assert stats["acquired"] == 1
+    assert stats["wait_seconds"]["count"] == 1
+    assert stats["hold_seconds"]["count"] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = Histogram(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 3.0):
+        hist.observe(seconds)
+    snap = hist.snapshot()
+    assert snap["buckets"] == [(0.01, 1), (0.1, 3), (float("inf"), 4)]
+    assert snap["count"] == 4
+
+
+def test_db_retry_fails_fast_with_503(app, client):
+    from db import db_retry
+    from db_lock import get_write_lock
+    from utils.decorators import mutation_handler
+
+    @mutation_handler
+    def mutation():
+        db_retry(lambda: None, timeout=0.05)
+        return "ok", 200
+
+    other_worker = WriteLock(get_write_lock(app.config["DATABASE"]).db_path)
+    with app.test_request_context(), other_worker.hold(timeout=1):
+        _, status = mutation()
+    assert status == 503
+
+
+def test_service_writes_wait_for_the_lock_and_answer_503(app, auth_client):
+    from db_lock import get_write_lock
+
+    app.config["DB_WRITE_LOCK_TIMEOUT_MS"] = 50
+    other_worker = WriteLock(get_write_lock(app.config["DATABASE"]).db_path)
+    with other_worker.hold(timeout=1):
+        res = auth_client.post('/friends/unfollow', json={'user_id': 2})
+    assert res.status_code == 503
+    assert res.get_json()["error"] == "Database busy, please retry"
+
+    res = auth_client.post('/friends/unfollow', json={'user_id': 2})
+    assert res.status_code == 200
@@ -0,0 +1,110 @@
+import glob
+import os
+
+import pytest
+
+from db import get_db, get_pool
+from db_partitions import (
+    count_live_messages,
+    drop_partition,
+    find_message,
+    list_partitions,
+    month_bounds,
+    move_partition,
+    note_deleted,
+    page_messages,
+    partition_path,
+    roll_partitions,
+)
+
+NOW = month_bounds("2024-04")[0] + 14 * 86400000  # 2024-04-15
+
+
+@pytest.fixture
+def rolled(app):
+    db_path = app.config["DATABASE"]
+    with app.app_context():
+        db = get_db()
+        # Two messages per month, ids in time order, alternating rooms
+        for month in ("2024-01", "2024-02", "2024-03", "2024-04"):
+            start, _ = month_bounds(month)
+            for i in range(2):
+                db.execute(
+                    "INSERT INTO messages (user, content, room_id, created_at_ms) VALUES (?, ?, ?, ?)",
+                    ("a", f"{month}/{i}", 1 + i, start + i * 1000),
+                )
+        db.commit()
+
+        moved = roll_partitions(hot_months=2, now_ms=NOW, chunk_size=1, pause=0)
+        assert moved == {"2024-01": 2, "2024-02": 2}
+        yield db
+    for leftover in glob.glob(os.path.splitext(db_path)[0] + ".messages-*"):
+        os.unlink(leftover)
+
+
+def test_roll_moves_old_months_into_shards(rolled, app):
+    assert [p["month"] for p in list_partitions(rolled)] == ["2024-01", "2024-02"]
+    assert rolled.execute("SELECT COUNT(*) FROM main.messages").fetchone()[0] == 4
+    assert os.path.exists(partition_path(app.config["DATABASE"], "2024-01"))
+    # Rolling again is a no-op
+    assert roll_partitions(hot_months=2, now_ms=NOW) == {}
+
+
+def test_paging_spans_partitions(rolled):
+    contents = [r["content"] for r in page_messages(rolled)]
+    assert contents == [f"{m}/{i}" for m in ("2024-01", "2024-02", "2024-03", "2024-04") for i in range(2)]
+
+    first = page_messages(rolled, limit=3)
+    rest = page_messages(rolled, after_id=first[-1]["id"], limit=10)
+    assert [r["id"] for r in first + rest] == [r["id"] for r in page_messages(rolled)]
+
+    older = page_messages(rolled, before_id=rest[-1]["id"], limit=4)
+    assert [r["content"] for r in older] == ["2024-02/1", "2024-03/0", "2024-03/1", "2024-04/0"]
+
+    room = page_messages(rolled, room_id=2)
+    assert [r["content"] for r in room] == [f"{m}/1" for m in ("2024-01", "2024-02", "2024-03", "2024-04")]
+
+
+def test_find_and_delete_in_partition(rolled):
+    oldest = page_messages(rolled, limit=1)[0]
+    table, row = find_message(rolled, oldest["id"])
+    assert table == "p_2024_01.messages"
+    assert row["user"] == "a"
+    assert count_live_messages(rolled) == 8
+
+    # What the delete mutation does
+    rolled.execute(f"UPDATE {table} SET deleted_at = datetime('now') WHERE id = ?", (oldest["id"],))
+    note_deleted(rolled, table, row)
+    rolled.commit()
+
+    assert find_message(rolled, oldest["id"]) == (None, None)
+    assert count_live_messages(rolled) == 7
+    assert oldest["id"] not in [r["id"] for r in page_messages(rolled)]
+
+
+def test_drop_partition_is_a_file_delete(rolled, app):
+    path = partition_path(app.config["DATABASE"], "2024-01")
+    assert drop_partition("2024-01") is True
+    assert not os.path.exists(path)
+    assert [p["month"] for p in list_partitions(rolled)] == ["2024-02"]
+    assert page_messages(rolled)[0]["content"] == "2024-02/0"
+    assert drop_partition("2024-01") is False
+
+
+def test_drop_and_move_retire_connections_that_attached_the_file(rolled, app, tmp_path):
+    pool = get_pool(app.config["DATABASE"])
+    idle, leased = pool.get_connection(), pool.get_connection()
+    page_messages(idle)  # Both attach the partitions
+    page_messages(leased)
+    pool.return_connection(idle)
+
+    target = move_partition("2024-02", str(tmp_path))
+    assert target == str(tmp_path / os.path.basename(partition_path(app.config["DATABASE"], "2024-02")))
+    assert idle not in list(pool._pool.queue)  # Closed rather than kept on the old path
+    assert [r["content"] for r in page_messages(rolled)][:3] == ["2024-01/0", "2024-01/1", "2024-02/0"]
+
+    assert drop_partition("2024-01") is True
+    assert page_messages(rolled)[0]["content"] == "2024-02/0"
+    recycled = pool.stats()["recycled"]
+    pool.return_connection(leased)  # Leased across both: retired on return
+    assert pool.stats()["recycled"] == recycled + 1
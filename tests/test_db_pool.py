@@ -1,5 +1,6 @@
 import pytest
 import logging
+import time
 from db import ConnectionPool
 
 def test_pool_exhaustion(caplog):
@@ -37,3 +38,89 @@ def test_pool_exhaustion(caplog):
     pool.return_connection(conn1)
     pool.return_connection(conn2)
     pool.close_all()
+
+def test_pool_overflow_is_bounded():
+    """Once the overflow allowance is used up, leases fail fast."""
+    from db import PoolExhaustedError
+
+    pool = ConnectionPool(":memory:", pool_size=1, max_overflow=1)
+    conn1 = pool.get_connection(timeout=0.05)
+    conn2 = pool.get_connection(timeout=0.05)
+    assert conn2.is_overflow
+
+    with pytest.raises(PoolExhaustedError):
+        pool.get_connection(timeout=0.05)
+    assert pool.stats()["rejected"] == 1
+
+    # Returning the overflow connection frees its slot
+    pool.return_connection(conn2)
+    conn3 = pool.get_connection(timeout=0.05)
+    assert conn3 is not None
+
+    pool.return_connection(conn1)
+    pool.return_connection(conn3)
+    pool.close_all()
+
+
+def test_pool_reuses_and_rolls_back():
+    """Returned connections are reused, never mid-transaction."""
+    pool = ConnectionPool(":memory:", pool_size=1)
+    conn = pool.get_connection(timeout=0.05)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("BEGIN")
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.return_connection(conn)
+
+    again = pool.get_connection(timeout=0.05)
+    assert again is conn
+    assert not again.in_transaction
+    assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    pool.return_connection(again)
+    pool.close_all()
+
+
+def test_pool_recycles_old_connections():
+    """Connections past max_lifetime are replaced on return."""
+    pool = ConnectionPool(":memory:", pool_size=1, max_lifetime=0.01)
+    conn = pool.get_connection(timeout=0.05)
+    time.sleep(0.02)
+    pool.return_connection(conn)
+
+    fresh = pool.get_connection(timeout=0.05)
+    assert fresh is not conn
+    assert pool.stats()["recycled"] == 1
+
+    pool.return_connection(fresh)
+    pool.close_all()
+
+
+def test_recycle_retires_idle_and_leased_connections():
+    """recycle() closes idle connections now and leased ones on return."""
+    pool = ConnectionPool(":memory:", pool_size=2)
+    idle = pool.get_connection(timeout=0.05)
+    leased = pool.get_connection(timeout=0.05)
+    pool.return_connection(idle)
+    pool.recycle()
+    assert pool.stats()["idle"] == 0
+    pool.return_connection(leased)
+    assert pool.stats()["open"] == 0
+
+    fresh = pool.get_connection(timeout=0.05)
+    assert fresh is not idle and fresh is not leased
+    assert pool.stats()["recycled"] == 2
+
+    pool.return_connection(fresh)
+    pool.close_all()
+
+
+def test_get_db_leases_from_pool(app):
+    """get_db() leases a pooled connection and close_db() returns it."""
+    from db import get_db, get_pool
+
+    with app.app_context():
+        first = get_db()
+        assert first.pool is get_pool()
+
+    with app.app_context():
+        assert get_db() is first
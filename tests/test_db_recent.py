@@ -0,0 +1,136 @@
+import sqlite3
+
+import db as db_module
+from db_recent import BACKFILL_MAX, RecentMessages
+
+
+def _db(messages=0, room_id=1):
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(db_module.SCHEMA)
+    _insert(conn, messages, room_id)
+    return conn
+
+
+def _insert(conn, count, room_id=1):
+    conn.executemany(
+        "INSERT INTO messages (user, content, room_id) VALUES ('a', ?, ?)",
+        [(f"m{i}", room_id) for i in range(count)],
+    )
+
+
+def _ids(rows):
+    return [r["id"] for r in rows]
+
+
+def test_newest_page_comes_from_the_ring():
+    conn = _db(30)
+    cache = RecentMessages(":memory:", ring_size=20)
+    rows, has_more = cache.page(conn, 1, limit=5)
+    assert _ids(rows) == [26, 27, 28, 29, 30] and has_more
+    rows, _ = cache.page(conn, 1, after_id=25, limit=3)
+    assert _ids(rows) == [26, 27, 28]
+    assert cache.stats() == {"hits": 2, "misses": 0, "seeds": 1, "rooms": 1, "cached": 20}
+
+
+def test_sends_are_appended_without_touching_the_database():
+    conn = _db(5)
+    cache = RecentMessages(":memory:", ring_size=20)
+    cache.page(conn, 1)
+    cache.remember({"id": 6, "user": "b", "content": "hi", "created_at": "now", "room_id": 1})
+    rows, has_more = cache.page(conn, 1, after_id=5)
+    assert _ids(rows) == [6] and rows[0]["content"] == "hi" and not has_more
+    assert cache.stats()["misses"] == 0
+
+
+def test_pages_below_the_ring_floor_go_to_the_database():
+    conn = _db(50)
+    cache = RecentMessages(":memory:", ring_size=10)
+    rows, has_more = cache.page(conn, 1, before_id=41, limit=5)
+    assert _ids(rows) == [36, 37, 38, 39, 40] and has_more
+    rows, has_more = cache.page(conn, 1, after_id=3, limit=4)
+    assert _ids(rows) == [4, 5, 6, 7] and has_more
+    assert cache.stats()["misses"] == 2
+    rows, _ = cache.page(conn, 1, after_id=1, limit=10_000)
+    assert len(rows) == 49 <= BACKFILL_MAX
+
+
+def test_edits_and_deletes_update_the_cached_copy():
+    conn = _db(3)
+    cache = RecentMessages(":memory:")
+    cache.page(conn, 1)
+    cache.update(2, content="fixed")
+    cache.update(3, deleted=True)
+    rows, _ = cache.page(conn, 1)
+    assert [(r["id"], r["content"], bool(r["edited_at"])) for r in rows] == [(1, "m0", False), (2, "fixed", True)]
+
+
+def test_out_of_order_sends_are_kept_in_id_order():
+    conn = _db(5)
+    cache = RecentMessages(":memory:", ring_size=8)
+    cache.page(conn, 1)
+    for message_id in (8, 6, 7, 6):  # 6 and 7 committed first but arrived late; 6 twice
+        cache.remember({"id": message_id, "user": "b", "content": "hi", "created_at": "now", "room_id": 1})
+    rows, has_more = cache.page(conn, 1, after_id=5)
+    assert _ids(rows) == [6, 7, 8] and not has_more
+
+    cache.remember({"id": 9, "user": "b", "content": "hi", "created_at": "now", "room_id": 1})
+    rows, has_more = cache.page(conn, 1, limit=8)
+    assert _ids(rows) == [2, 3, 4, 5, 6, 7, 8, 9] and has_more  # 1 fell off; the floor moved past it
+
+
+def test_a_reseed_that_keeps_newer_sends_moves_the_floor():
+    conn = _db(12)
+    cache = RecentMessages(":memory:", ring_size=10, ttl=0)  # Every page reseeds
+    cache.page(conn, 1)
+    for message_id in (13, 14, 15):  # Sent while the next seed query runs
+        cache.remember({"id": message_id, "user": "b", "content": "hi", "created_at": "now", "room_id": 1})
+    cache.page(conn, 1)  # Rows 3-12 plus 13-15: 3, 4 and 5 fall off
+    rows, has_more = cache.page(conn, 1, after_id=3, limit=4)
+    assert _ids(rows) == [4, 5, 6, 7] and has_more
+
+
+def test_other_workers_changes_arrive_over_the_bus(app):
+    import socket_bus
+    from db_recent import RECENT_TOPIC, backfill_page, get_recent
+    with app.app_context():
+        conn = db_module.get_db()
+        _insert(conn, 3)
+        conn.commit()
+        backfill_page(conn, 1)
+        path = get_recent().db_path
+
+        # What the bus listener delivers for another worker's send, edit and delete
+        peer = {"id": 4, "user": "b", "content": "elsewhere", "created_at": "now", "room_id": 1, "edited_at": None}
+        socket_bus._deliver(RECENT_TOPIC, {"path": path, "message": peer})
+        socket_bus._deliver(RECENT_TOPIC, {"path": path, "id": 2, "content": "fixed"})
+        socket_bus._deliver(RECENT_TOPIC, {"path": path, "id": 3, "deleted": True})
+
+        rows, has_more = backfill_page(conn, 1, after_id=1)
+        assert [(r["id"], r["content"]) for r in rows] == [(2, "fixed"), (4, "elsewhere")] and not has_more
+        assert get_recent().stats()["misses"] == 0
+
+
+def test_socket_backfill_is_capped_and_paged(app, client):
+    from sockets import socketio
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('reader', 'hash')")
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'reader'").fetchone()["id"]
+        _insert(conn, 300)
+        conn.commit()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = "reader"
+
+    socket_client = socketio.test_client(app, flask_test_client=client)
+    socket_client.get_received()
+    socket_client.emit("request_backfill", {"after_id": 0, "limit": 1000})
+    [payload] = [m["args"][0] for m in socket_client.get_received() if m["name"] == "backfill"]
+    assert len(payload["messages"]) == BACKFILL_MAX and payload["has_more"]
+    assert payload["messages"][-1]["id"] == 300
+
+    socket_client.emit("request_backfill", {"before_id": payload["messages"][0]["id"], "limit": 50})
+    [payload] = [m["args"][0] for m in socket_client.get_received() if m["name"] == "backfill"]
+    assert [m["id"] for m in payload["messages"]] == list(range(51, 101)) and payload["has_more"]
+    socket_client.disconnect()
@@ -0,0 +1,134 @@
+import glob
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+import db as db_module
+import db_snapshot
+from db_snapshot import SnapshotReplica, get_snapshot
+
+
+@pytest.fixture
+def db_path():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.execute("INSERT INTO t (v) VALUES ('a')")
+    conn.commit()
+    conn.close()
+    yield path
+    db_module.shutdown_pool()
+    for leftover in glob.glob(f"{path}*"):
+        os.unlink(leftover)
+
+
+def _insert(path, value):
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO t (v) VALUES (?)", (value,))
+    conn.commit()
+    conn.close()
+
+
+def test_refresh_only_copies_after_commits(db_path):
+    replica = SnapshotReplica(db_path, refresh_interval=60)
+    replica.refresh()  # Whichever of this and the thread's first refresh runs second skips
+    assert replica.refresh() is False
+
+    conn, staleness = replica.lease()
+    assert staleness < 1.0
+    assert [r["v"] for r in conn.execute("SELECT v FROM t")] == ["a"]
+
+    _insert(db_path, "b")
+    # Old lease still reads the copy it started on
+    assert [r["v"] for r in conn.execute("SELECT v FROM t")] == ["a"]
+
+    assert replica.refresh() is True
+    conn.pool.return_connection(conn)
+    new_conn, _ = replica.lease()
+    assert [r["v"] for r in new_conn.execute("SELECT v FROM t ORDER BY id")] == ["a", "b"]
+    new_conn.pool.return_connection(new_conn)
+
+    replica.stop()
+    assert glob.glob(f"{db_path}.snapshot-*") == []
+
+
+def test_snapshot_is_read_only(db_path):
+    replica = SnapshotReplica(db_path, refresh_interval=60)
+    replica.refresh()
+    conn, _ = replica.lease()
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO t (v) VALUES ('x')")
+    conn.pool.return_connection(conn)
+    replica.stop()
+
+
+def test_stale_snapshot_is_not_served(db_path):
+    replica = SnapshotReplica(db_path, refresh_interval=60, max_staleness=0.0)
+    replica.refresh()
+    assert replica.lease() is None
+    assert replica.stats()["fallbacks"] == 1
+    replica.stop()
+
+
+def test_workers_share_one_copy(db_path):
+    leader = SnapshotReplica(db_path, refresh_interval=60)
+    leader.refresh()
+    follower = SnapshotReplica(db_path, refresh_interval=60)
+    follower.refresh()
+    assert leader.stats()["leader"] and not follower.stats()["leader"]
+    assert len(glob.glob(f"{db_path}.snapshot-*.db")) == 1
+
+    _insert(db_path, "b")
+    assert leader.refresh() is True
+    assert follower.refresh() is True
+    assert follower.stats()["refreshes"] == 0
+    conn, _ = follower.lease()
+    assert [r["v"] for r in conn.execute("SELECT v FROM t ORDER BY id")] == ["a", "b"]
+
+    # The follower takes over once the refresher stops; its lease keeps working
+    leader.stop()
+    _insert(db_path, "c")
+    assert follower.refresh() is True
+    assert follower.stats()["leader"]
+    assert [r["v"] for r in conn.execute("SELECT v FROM t ORDER BY id")] == ["a", "b"]
+    conn.pool.return_connection(conn)
+    follower.stop()
+    assert glob.glob(f"{db_path}.snapshot*") == [f"{db_path}.snapshot.lock"]
+
+
+def test_expensive_copies_are_spaced_out(db_path, monkeypatch):
+    monkeypatch.setattr(db_snapshot, "COPY_COST_RATIO", 10 ** 9)
+    replica = SnapshotReplica(db_path, refresh_interval=60)
+    replica.refresh()
+    _insert(db_path, "b")
+    assert replica.refresh() is False
+    assert replica.stats()["deferred"] >= 1
+    assert replica.refresh(force=True) is True
+    replica.stop()
+
+
+def test_heavy_reads_use_snapshot_with_staleness_header(app, auth_client):
+    app.config["DB_SNAPSHOT_ENABLED"] = True
+    with app.app_context():
+        replica = get_snapshot()
+        replica.refresh(force=True)
+
+    res = auth_client.get("/search/?q=testuser&type=users")
+    assert res.status_code == 200
+    assert float(res.headers["X-Data-Staleness"]) >= 0
+    assert replica.stats()["leases"] >= 1
+
+    # Ordinary endpoints never touch the snapshot
+    res = auth_client.get("/notifications/unread-count")
+    assert "X-Data-Staleness" not in res.headers
+
+
+def test_heavy_reads_fall_back_when_disabled(app, auth_client):
+    res = auth_client.get("/search/?q=testuser&type=users")
+    assert res.status_code == 200
+    assert res.get_json()["results"][0]["username"] == "testuser"
+    assert "X-Data-Staleness" not in res.headers
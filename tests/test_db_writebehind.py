@@ -0,0 +1,105 @@
+import json
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+import db as db_module
+from db_writebehind import WriteBehindQueue
+
+
+@pytest.fixture
+def db_path(remove_db_files):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE log (id INTEGER PRIMARY KEY, v TEXT UNIQUE)")
+    conn.commit()
+    conn.close()
+    yield path
+    db_module.shutdown_pool()
+    remove_db_files(path)
+
+
+def _values(path):
+    conn = sqlite3.connect(path)
+    rows = [r[0] for r in conn.execute("SELECT v FROM log ORDER BY id")]
+    conn.close()
+    return rows
+
+
+def test_entries_are_spooled_then_applied(db_path):
+    wbq = WriteBehindQueue(db_path, max_lag=60)
+    wbq.enqueue("INSERT INTO log (v) VALUES (?)", ("a",))
+    wbq.enqueue("INSERT INTO log (v) VALUES (?)", ("b",))
+
+    # Spooled to disk, not yet applied
+    with open(wbq.spool_path) as f:
+        assert len(f.readlines()) == 2
+    assert _values(db_path) == []
+
+    assert wbq.flush() == 2
+    assert _values(db_path) == ["a", "b"]
+    assert os.path.getsize(wbq.spool_path) == 0
+
+    wbq.stop()
+    assert not os.path.exists(wbq.spool_path)
+
+
+def test_bad_row_is_dropped_alone(db_path):
+    wbq = WriteBehindQueue(db_path, max_lag=60)
+    for v in ("x", "x", "y"):
+        wbq.enqueue("INSERT INTO log (v) VALUES (?)", (v,))
+
+    assert wbq.flush() == 2
+    assert wbq.stats()["dropped"] == 1
+    assert _values(db_path) == ["x", "y"]
+    wbq.stop()
+
+
+def test_orphaned_spool_is_replayed(db_path):
+    # A spool left by a worker PID that no longer exists
+    orphan = f"{db_path}.wb-999999999.log"
+    with open(orphan, "w") as f:
+        f.write(json.dumps(["INSERT INTO log (v) VALUES (?)", ["recovered"]]) + "\n")
+
+    wbq = WriteBehindQueue(db_path, max_lag=60)
+    assert not os.path.exists(orphan)
+    wbq.flush()
+    assert _values(db_path) == ["recovered"]
+    wbq.stop()
+
+
+def test_restart_with_a_reused_pid_replays_the_old_spool(db_path):
+    # A previous process that had our PID died with an entry spooled
+    stale = f"{db_path}.wb-{os.getpid()}-0123456789ab.log"
+    with open(stale, "w") as f:
+        f.write(json.dumps(["INSERT INTO log (v) VALUES (?)", ["before restart"]]) + "\n")
+
+    wbq = WriteBehindQueue(db_path, max_lag=60)
+    other = WriteBehindQueue(db_path, max_lag=60)  # A live queue's spool is never adopted
+    assert wbq.spool_path != stale and not os.path.exists(stale)
+    assert other.stats()["enqueued"] == 0
+    wbq.flush()
+    assert _values(db_path) == ["before restart"]
+    wbq.stop()
+    other.stop()
+
+
+def test_crash_during_rewrite_keeps_the_old_spool(db_path, monkeypatch):
+    import db_writebehind
+    wbq = WriteBehindQueue(db_path, max_lag=60)
+    wbq.enqueue("INSERT INTO log (v) VALUES (?)", ("a",))
+
+    def crash(src, dst):
+        raise OSError("power cut")
+
+    monkeypatch.setattr(db_writebehind.os, "replace", crash)
+    with pytest.raises(OSError):
+        wbq.flush()
+    with open(wbq.spool_path) as f:
+        assert len(f.readlines()) == 1  # Replayed (at-least-once), never lost
+    monkeypatch.undo()
+    wbq.stop()
+    os.unlink(f"{wbq.spool_path}.tmp")
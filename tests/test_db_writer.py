@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from db_writer import GroupCommitWriter, WriteOutcomeUnknown, WriterBusyError
+
+
+@pytest.fixture
+def writer(remove_db_files):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT UNIQUE)")
+    conn.commit()
+    conn.close()
+
+    w = GroupCommitWriter(path, batch_window=0.02)
+    yield w
+    w.stop()
+    remove_db_files(path)
+
+
+def test_each_caller_gets_its_own_row(writer):
+    """Concurrent inserts are batched but results stay per-caller."""
+    results = {}
+
+    def insert(i):
+        row = writer.execute("INSERT INTO t (v) VALUES (?) RETURNING id, v", (f"v{i}",), fetch="one")
+        results[i] = row
+
+    threads = [threading.Thread(target=insert, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert {row["v"] for row in results.values()} == {f"v{i}" for i in range(20)}
+    assert len({row["id"] for row in results.values()}) == 20
+
+    stats = writer.stats()
+    assert stats["operations"] == 20
+    assert stats["batches"] < 20
+
+
+def test_failed_operation_does_not_poison_batch(writer):
+    """A constraint error only fails its own operation."""
+    writer.execute("INSERT INTO t (v) VALUES ('dup')")
+
+    bad = writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('dup')"))
+    good = writer.submit(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('ok')").lastrowid)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result(timeout=5)
+    assert good.result(timeout=5) is not None
+
+    rows = writer.execute("SELECT v FROM t ORDER BY v", fetch="all")
+    assert [r["v"] for r in rows] == ["dup", "ok"]
+
+
+def test_writes_are_committed_before_results(writer):
+    """Another connection sees the row as soon as the caller does."""
+    result = writer.execute("INSERT INTO t (v) VALUES ('seen')")
+    conn = sqlite3.connect(writer.db_path)
+    count = conn.execute("SELECT COUNT(*) FROM t WHERE id = ?", (result.lastrowid,)).fetchone()[0]
+    conn.close()
+    assert count == 1
+
+
+def test_full_queue_applies_backpressure(remove_db_files):
+    """Callers get a WriterBusyError instead of queueing without bound."""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    gate = threading.Event()
+    w = GroupCommitWriter(path, max_queue=1)
+    try:
+        w.submit(lambda conn: gate.wait(5))
+        # Give the writer a moment to pick up the blocking op
+        for _ in range(100):
+            if w.depth() == 0:
+                break
+            threading.Event().wait(0.01)
+        w.submit(lambda conn: None)
+        with pytest.raises(WriterBusyError):
+            w.submit(lambda conn: None)
+        assert w.stats()["rejected"] == 1
+    finally:
+        gate.set()
+        w.stop()
+        remove_db_files(path)
+
+
+def test_timeout_inside_a_committing_batch_is_not_reported_as_unwritten(writer):
+    release = threading.Event()
+
+    def slow(value):
+        def op(conn):
+            conn.execute("INSERT INTO t (v) VALUES (?)", (value,))
+            release.wait(5)
+        return op
+
+    with pytest.raises(WriteOutcomeUnknown):
+        writer.run(slow("first"), timeout=0.1)
+    release.set()
+    # It committed after all
+    assert writer.execute("SELECT v FROM t", fetch="all")[0]["v"] == "first"
+
+    # An operation that never started is plainly not written
+    release.clear()
+    blocker = writer.submit(slow("second"))
+    with pytest.raises(WriterBusyError) as excinfo:
+        writer.run(lambda conn: conn.execute("INSERT INTO t (v) VALUES ('late')"), timeout=0.1)
+    assert not isinstance(excinfo.value, WriteOutcomeUnknown)
+    release.set()
+    blocker.result(timeout=5)
+    assert [r["v"] for r in writer.execute("SELECT v FROM t ORDER BY v", fetch="all")] == ["first", "second"]
+
+
+def test_a_dead_writer_fails_fast_and_is_replaced(app, monkeypatch):
+    import db_writer
+
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("unable to open database file")
+
+    with app.app_context():
+        db_writer.shutdown_writers()
+        monkeypatch.setattr(db_writer, "open_connection", broken)
+        dead = db_writer.get_writer()
+        dead._thread.join(5)
+        with pytest.raises(WriterBusyError):
+            dead.execute("SELECT 1")
+        monkeypatch.undo()
+
+        assert db_writer.get_writer() is not dead
+        assert db_writer.write("SELECT 1 AS one", fetch="one")["one"] == 1
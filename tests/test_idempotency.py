@@ -0,0 +1,148 @@
+import uuid
+
+from idempotency import IN_PROGRESS, IdempotencyStore
+
+
+class _Table:
+    """Just enough of idempotency_keys for the store, in memory."""
+
+    def __init__(self):
+        import sqlite3
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(
+            "CREATE TABLE idempotency_keys (scope TEXT, owner TEXT, key TEXT, status INTEGER, "
+            "response BLOB, created_at_ms INTEGER, PRIMARY KEY (scope, owner, key))")
+
+    def read(self, sql, params):
+        return self.conn.execute(sql, params).fetchone()
+
+    def write(self, sql, params):
+        return self.conn.execute(sql, params)
+
+
+def test_keys_run_once_and_replay_across_workers():
+    table = _Table()
+    first, second = IdempotencyStore(table.read, table.write), IdempotencyStore(table.read, table.write)
+    assert first.begin("dm", 1, "k") is None
+    assert second.begin("dm", 1, "k") is IN_PROGRESS  # Retry while the first is in flight
+    first.finish("dm", 1, "k", 200, b'{"ok":true,"id":5}')
+    replay = second.begin("dm", 1, "k")  # Another worker: read back from the table
+    assert (replay.status, replay.body) == (200, b'{"ok":true,"id":5}')
+    assert first.begin("dm", 1, "k").body == replay.body and first.stats()["replays"] == 1
+    assert first.begin("dm", 2, "k") is None and first.begin("wall_post", 1, "k") is None  # Per user, per scope
+
+
+def test_failed_attempts_release_their_key():
+    table = _Table()
+    store = IdempotencyStore(table.read, table.write)
+    assert store.begin("dm", 1, "k") is None
+    store.abort("dm", 1, "k")
+    assert store.begin("dm", 1, "k") is None
+
+
+def _login(app, username):
+    from db import get_db
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES (?, 'hash')", (username,))
+        user_id = db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()["id"]
+        db.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+    return client, user_id
+
+
+def test_http_retries_get_the_first_response(app):
+    from db import get_db
+    http, _ = _login(app, "ana")
+    _, bo_id = _login(app, "bo")
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    first = http.post("/dm/send", json={"recipient_id": bo_id, "content": "hi"}, headers=headers)
+    again = http.post("/dm/send", json={"recipient_id": bo_id, "content": "hi"}, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.get_json() == first.get_json() and again.headers["Idempotent-Replayed"] == "true"
+
+    key = {"Idempotency-Key": str(uuid.uuid4())}
+    ids = {http.post("/send", json={"content": "once"}, headers=key).get_json()["id"] for _ in range(3)}
+    assert len(ids) == 1
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM direct_messages").fetchone()[0] == 1
+        assert get_db().execute("SELECT COUNT(*) FROM messages WHERE content = 'once'").fetchone()[0] == 1
+    assert http.post("/send", json={"content": "x"}, headers={"Idempotency-Key": ""}).status_code == 400
+
+
+def test_socket_resends_are_acked_without_a_second_broadcast(app):
+    from sockets import rate_limits, socketio
+    rate_limits.clear()
+    http, _ = _login(app, "ana")
+    sock = socketio.test_client(app, flask_test_client=http)
+    sock.emit("join_room", {"room": "general"})
+    sock.get_received()
+    payload = {"content": "hello", "idempotency_key": str(uuid.uuid4())}
+    acks = [sock.emit("send_message", payload, callback=True) for _ in range(2)]
+    assert acks[0] == acks[1] and acks[0]["ok"]
+    assert len([m for m in sock.get_received() if m["name"] == "message"]) == 1
+    sock.disconnect()
+
+
+def test_a_send_that_timed_out_mid_commit_is_not_inserted_again(app, monkeypatch):
+    import db_writer
+    from db import get_db
+    from services import message_service
+    from services.message_service import send_message_logic
+
+    real = db_writer.write_transaction
+    calls = []
+
+    def committed_then_timed_out(op, timeout=db_writer.WRITE_TIMEOUT):
+        calls.append(op)
+        if len(calls) == 1:
+            real(op, timeout)
+            raise db_writer.WriteOutcomeUnknown("Database write timed out while committing")
+        return real(op, timeout)
+
+    monkeypatch.setattr(message_service, "write_transaction", committed_then_timed_out)
+    key = str(uuid.uuid4())
+    with app.test_request_context():
+        assert send_message_logic("ana", "once", idempotency_key=key).status == 503
+        # The key's result committed with the message: the retry replays it
+        retry = send_message_logic("ana", "once", idempotency_key=key)
+        assert retry.success and retry.data["replayed"]
+        assert get_db().execute("SELECT COUNT(*) FROM messages WHERE content = 'once'").fetchone()[0] == 1
+
+    def timed_out(op, timeout=db_writer.WRITE_TIMEOUT):
+        raise db_writer.WriteOutcomeUnknown("Database write timed out while committing")
+
+    monkeypatch.setattr(message_service, "write_transaction", timed_out)
+    key = str(uuid.uuid4())
+    with app.test_request_context():
+        assert send_message_logic("ana", "maybe", idempotency_key=key).status == 503
+        # Outcome unknown: the claim is kept, so the retry does not insert
+        assert send_message_logic("ana", "maybe", idempotency_key=key).status == 409
+
+
+def test_keyed_endpoints_keep_the_claim_when_a_write_outcome_is_unknown(app, monkeypatch):
+    import db_writer
+    from services import dm_service
+
+    class _TimedOut:
+        def run(self, op, timeout=None):
+            raise db_writer.WriteOutcomeUnknown("Database write timed out while committing")
+
+    def send_message(sender_id, recipient_id, content):
+        real = db_writer.get_writer
+        db_writer.get_writer = lambda path=None: _TimedOut()
+        try:
+            db_writer.write("UPDATE users SET bio = bio WHERE id = ?", (sender_id,))
+        finally:
+            db_writer.get_writer = real
+
+    http, _ = _login(app, "ana")
+    _, bo_id = _login(app, "bo")
+    monkeypatch.setattr(dm_service, "send_message", send_message)
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    assert http.post("/dm/send", json={"recipient_id": bo_id, "content": "hi"}, headers=headers).status_code == 503
+    assert http.post("/dm/send", json={"recipient_id": bo_id, "content": "hi"}, headers=headers).status_code == 409
@@ -0,0 +1,73 @@
+from services import message_service
+from services.message_service import MessagePipeline
+
+
+def _login(app, username):
+    from db import get_db
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES (?, 'hash')", (username,))
+        user_id = db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()["id"]
+        db.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+    return client
+
+
+def test_http_sends_land_in_the_room_and_reach_its_sockets(app):
+    from sockets import rate_limits, socketio
+    from services.room_service import create_room_logic
+    rate_limits.clear()
+    http = _login(app, "ana")
+    with app.app_context():
+        create_room_logic(1, "general")
+        room_id = create_room_logic(1, "music").data["room"]["id"]
+    listener = socketio.test_client(app, flask_test_client=_login(app, "bo"))
+    listener.emit("join_room", {"room": "music"})
+    listener.get_received()
+
+    res = http.post("/send", json={"content": "  <b>hi</b> <script>x</script> ", "room": "music"})
+    assert res.status_code == 200
+    # The test client unwraps "message" events: args is the payload itself
+    messages = [m["args"] for m in listener.get_received() if m["name"] == "message"]
+    assert [(m["id"], m["content"], m["room_id"]) for m in messages] == [
+        (res.get_json()["id"], "<b>hi</b> x", room_id)]
+    listener.disconnect()
+
+
+def test_socket_and_http_share_validation(app):
+    from sockets import rate_limits, socketio
+    rate_limits.clear()
+    http = _login(app, "ana")
+    assert http.post("/send", json={"content": "   "}).get_json()["error"] == "Empty message"
+    assert http.post("/send", json={"content": "x" * 10001}).status_code == 400
+    sock = socketio.test_client(app, flask_test_client=http)
+    sock.get_received()
+    sock.emit("send_message", {"content": "   "})
+    assert [m["args"][0] for m in sock.get_received() if m["name"] == "error"] == [{"message": "Empty message"}]
+    sock.disconnect()
+
+
+def test_a_full_write_queue_sheds_messages_before_any_work(app, monkeypatch):
+    from db import get_db
+    monkeypatch.setattr(message_service, "write_pressure", lambda: 0.9)
+    res = _login(app, "ana").post("/send", json={"content": "hello"})
+    assert res.status_code == 503
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM messages WHERE user = 'ana'").fetchone()[0] == 0
+
+
+def test_stages_are_timed_and_retries_replay(app):
+    sent = []
+    pipeline = MessagePipeline(broadcast=lambda room, message: sent.append(room))
+    with app.app_context():
+        first = pipeline.send("ana", "hello", idempotency_key="k1")
+        again = pipeline.send("ana", "hello", idempotency_key="k1")
+    assert again.data["replayed"] and again.data["message"] == first.data["message"]
+    assert sent == ["general"]  # The retry is not broadcast again
+    stats = pipeline.stats()
+    assert (stats["accepted"], stats["replayed"]) == (1, 1)
+    assert stats["runs"] == {"validate": 2, "sanitize": 2, "idempotency": 2, "persist": 1,
+                             "remember": 1, "broadcast": 1}
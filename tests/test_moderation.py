@@ -0,0 +1,98 @@
+import sqlalchemy as sa
+
+import db as db_module
+import db_schema
+
+
+def _user(app, username, staff=False):
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash, is_staff) VALUES (?, 'hash', ?)",
+                     (username, int(staff)))
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()["id"]
+        conn.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+    return client, user_id
+
+
+def _with_reports(app):
+    # reports is only created by the Alembic migrations, not db.SCHEMA
+    engine = sa.create_engine(f"sqlite:///{app.config['DATABASE']}")
+    db_schema.reports.create(engine, checkfirst=True)
+    engine.dispose()
+
+
+def test_submit_then_ban_resolves_the_report(app):
+    _with_reports(app)
+    staff, _ = _user(app, "mod", staff=True)
+    reporter, _ = _user(app, "witness")
+    _, troll_id = _user(app, "troll")
+
+    res = reporter.post("/admin/report", json={
+        "content_type": "user", "content_id": str(troll_id), "reason": "spam"})
+    assert res.status_code == 200 and res.get_json()["success"]
+    assert reporter.post("/admin/report", json={
+        "content_type": "planet", "content_id": "1", "reason": "?"}).status_code == 400
+
+    with app.app_context():
+        report_id = db_module.get_db().execute("SELECT id FROM reports").fetchone()["id"]
+    assert staff.post("/admin/resolve", json={"report_id": report_id, "action": "ban_user"}).status_code == 200
+
+    with app.app_context():
+        conn = db_module.get_db()
+        assert conn.execute("SELECT is_banned FROM users WHERE id = ?", (troll_id,)).fetchone()[0] == 1
+        assert conn.execute("SELECT status FROM reports WHERE id = ?", (report_id,)).fetchone()[0] == "resolved"
+
+
+def test_deleting_a_user_clears_everything_that_points_at_them(app):
+    _with_reports(app)
+    staff, staff_id = _user(app, "mod", staff=True)
+    _, friend_id = _user(app, "friend")
+    _, troll_id = _user(app, "troll")
+    with app.app_context():
+        conn = db_module.get_db()
+        for uid in (friend_id, troll_id):
+            conn.execute("INSERT INTO profiles (user_id, display_name) VALUES (?, 'x')", (uid,))
+        troll_profile, friend_profile = (
+            conn.execute("SELECT id FROM profiles WHERE user_id = ?", (uid,)).fetchone()["id"]
+            for uid in (troll_id, friend_id))
+        conn.execute("INSERT INTO profile_posts (profile_id, module_type, content_payload) VALUES (?, 'text', '{}')",
+                     (troll_profile,))
+        conn.execute("INSERT INTO profile_stickers (id, profile_id, sticker_type, x_pos, y_pos, placed_by) "
+                     "VALUES ('s1', ?, 'emoji', 1, 1, ?)", (friend_profile, troll_id))
+        conn.execute("INSERT INTO direct_messages (conversation_id, sender_id, recipient_id, content_encrypted, "
+                     "content_iv, content_tag) VALUES ('c', ?, ?, x'00', x'00', x'00')", (troll_id, friend_id))
+        conn.execute("INSERT INTO notifications (user_id, type, title, actor_id) VALUES (?, 'dm', 'hi', ?)",
+                     (friend_id, troll_id))
+        conn.execute("INSERT INTO rooms (name, created_by) VALUES ('trollhole', ?)", (troll_id,))
+        conn.execute("INSERT INTO cat_memories (target_user_id, memory_type) VALUES (?, 'grudge')", (troll_id,))
+        conn.execute("INSERT INTO reports (reporter_id, content_type, content_id) VALUES (?, 'user', ?)",
+                     (troll_id, str(friend_id)))
+        conn.execute("INSERT INTO admin_ops (admin_id, action) VALUES (?, 'ban_user')", (staff_id,))
+        conn.commit()
+
+    assert staff.delete(f"/admin/users/{troll_id}").status_code == 200
+    assert staff.delete(f"/admin/users/{troll_id}").status_code == 404
+
+    with app.app_context():
+        conn = db_module.get_db()
+        for sql in ("SELECT COUNT(*) FROM users WHERE id = ?",
+                    "SELECT COUNT(*) FROM profiles WHERE user_id = ?",
+                    "SELECT COUNT(*) FROM profile_stickers WHERE placed_by = ?",
+                    "SELECT COUNT(*) FROM direct_messages WHERE sender_id = ?",
+                    "SELECT COUNT(*) FROM notifications WHERE actor_id = ?",
+                    "SELECT COUNT(*) FROM reports WHERE reporter_id = ?"):
+            assert conn.execute(sql, (troll_id,)).fetchone()[0] == 0, sql
+        assert conn.execute("SELECT COUNT(*) FROM profile_posts").fetchone()[0] == 0
+        assert conn.execute("SELECT created_by FROM rooms WHERE name = 'trollhole'").fetchone()[0] is None
+
+    # Staff with an audit trail are banned, not deleted
+    other, other_id = _user(app, "mod2", staff=True)
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO admin_ops (admin_id, action) VALUES (?, 'ban_user')", (other_id,))
+        conn.commit()
+    assert staff.delete(f"/admin/users/{other_id}").status_code == 409
@@ -44,6 +44,10 @@ class TestNotificationsAPI:
         # Follow them (as user 1)
         auth_client.post('/friends/follow', json={'user_id': 2})
         
+        # The follow notification is queued write-behind
+        from db_writebehind import flush_write_behind
+        flush_write_behind()
+        
         # Check user 2's notifications (need to login as user 2)
         # For now, just verify the endpoint works - full test would need second auth
         with app.app_context():
@@ -3,6 +3,7 @@ from flask import Flask, g, request
 from app import create_app
 from db import get_db, init_db
 from utils.decorators import log_admin_action
+from db_writebehind import flush_write_behind
 
 import tempfile
 import os
@@ -55,18 +56,21 @@ def test_audit_log_decorator(app):
         # 1. No user logged in -> No log
         g.user = None
         dummy_action()
+        flush_write_behind()
         count = db.execute("SELECT COUNT(*) FROM admin_ops").fetchone()[0]
         assert count == 0
         
         # 2. Regular user -> No log
         g.user = {'id': 2, 'is_staff': 0}
         dummy_action()
+        flush_write_behind()
         count = db.execute("SELECT COUNT(*) FROM admin_ops").fetchone()[0]
         assert count == 0
         
         # 3. Staff user -> Log!
         g.user = {'id': 1, 'is_staff': 1}
         dummy_action()
+        flush_write_behind()
         row = db.execute("SELECT * FROM admin_ops").fetchone()
         assert row is not None
         assert row['action'] == 'test_action'
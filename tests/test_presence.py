@@ -0,0 +1,95 @@
+from presence import PresenceRegistry
+
+
+def _info(user_id, room="general", visible=True):
+    return {"user_id": user_id, "username": f"user{user_id}", "room_id": 1, "room_name": room, "visible": visible}
+
+
+def _registry(**kwargs):
+    diffs = []
+    return PresenceRegistry(diffs.append, **kwargs), diffs
+
+
+def test_tabs_and_workers_share_one_record():
+    registry, diffs = _registry()
+    registry.apply(None, {"op": "set", "sid": "a", "info": _info(7)})
+    registry.apply("peer", {"op": "set", "sid": "b", "info": _info(7)})  # Second tab, other worker
+    assert diffs == [{"version": 1, "joined": [{"id": 7, "username": "user7", "room": "general"}],
+                      "left": [], "moved": []}]
+    registry.apply(None, {"op": "del", "sid": "a"})
+    assert len(diffs) == 1  # Still online in the other tab
+    registry.apply("peer", {"op": "gone"})
+    assert diffs[-1] == {"version": 2, "joined": [], "left": [7], "moved": []}
+    assert registry.stats()["sockets"] == 0
+
+
+def test_room_changes_and_syncs_produce_diffs():
+    registry, diffs = _registry()
+    registry.apply("peer", {"op": "sync", "sockets": {"a": _info(1), "b": _info(2)}})
+    assert diffs[-1]["version"] == 1 and len(diffs[-1]["joined"]) == 2
+    registry.apply("peer", {"op": "sync", "sockets": {"a": _info(1), "b": _info(2)}})
+    assert len(diffs) == 1  # Periodic snapshots change nothing
+    registry.apply("peer", {"op": "sync", "sockets": {"b": _info(2, room="music")}})
+    assert diffs[-1] == {"version": 2, "joined": [], "left": [1],
+                         "moved": [{"id": 2, "username": "user2", "room": "music"}]}
+
+
+def test_hidden_users_are_left_out():
+    registry, diffs = _registry()
+    registry.apply(None, {"op": "set", "sid": "a", "info": _info(1, visible=False)})
+    assert diffs == [] and registry.snapshot() == {"version": 0, "users": []}
+    assert not registry.is_online(1)
+    registry.apply(None, {"op": "set", "sid": "a", "info": _info(1)})  # show_online_status turned on
+    assert diffs[-1]["joined"] == [{"id": 1, "username": "user1", "room": "general"}]
+    assert registry.is_online(1)
+
+
+def test_silent_workers_expire_and_snapshots_are_cached():
+    registry, diffs = _registry(ttl=0.0)
+    registry.apply("peer", {"op": "set", "sid": "a", "info": _info(1)})
+    snapshot = registry.snapshot()  # The peer has been silent for longer than the TTL
+    assert snapshot == {"version": 2, "users": []} and diffs[-1]["left"] == [1]
+    assert registry.snapshot() is snapshot
+    assert registry.stats()["snapshots"] == 1
+
+
+def _login(app, username, show_online_status=1):
+    import db as db_module
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, 'hash')", (username,))
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()["id"]
+        conn.execute("INSERT INTO profiles (user_id, show_online_status) VALUES (?, ?)",
+                     (user_id, show_online_status))
+        conn.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+    return client, user_id
+
+
+def test_subscribers_get_a_snapshot_then_diffs(app):
+    import sockets
+    watcher_http, watcher_id = _login(app, "watcher")
+    watcher = sockets.socketio.test_client(app, flask_test_client=watcher_http)
+    snapshot = watcher.emit("presence_subscribe", {}, callback=True)
+    assert [u["id"] for u in snapshot["users"]] == [watcher_id]
+    assert watcher_http.get("/lobby/users").get_json() == snapshot
+
+    hidden = sockets.socketio.test_client(app, flask_test_client=_login(app, "hidden", show_online_status=0)[0])
+    bo_http, bo_id = _login(app, "bo")
+    bo = sockets.socketio.test_client(app, flask_test_client=bo_http)
+    bo.emit("join_room", {"room": "music"})
+    assert bo_http.post("/profile/update", json={"show_online_status": False}).status_code == 200
+    bo.disconnect()
+    hidden.disconnect()
+
+    diffs = [m["args"][0] for m in watcher.get_received() if m["name"] == "presence_diff"]
+    version = snapshot["version"]
+    assert diffs == [
+        {"version": version + 1, "joined": [{"id": bo_id, "username": "bo", "room": "general"}], "left": [], "moved": []},
+        {"version": version + 2, "joined": [], "left": [], "moved": [{"id": bo_id, "username": "bo", "room": "music"}]},
+        {"version": version + 3, "joined": [], "left": [bo_id], "moved": []},  # Went invisible
+    ]
+    watcher.disconnect()
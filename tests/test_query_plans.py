@@ -0,0 +1,126 @@
+from core.query_plans import (
+    ACCEPTED_FINDINGS,
+    Statement,
+    build_database,
+    check_statement,
+    check_statements,
+    collect_statements,
+    explain,
+    render_migration,
+    suggest_index,
+)
+
+
+def test_hot_queries_have_no_unaccepted_plan_regressions():
+    conn = build_database()
+    statements = collect_statements()
+    assert len(statements) > 50
+
+    findings, errors = check_statements(conn, statements)
+    assert errors == []
+    open_findings = [
+        f"{f.statement.location} ({f.statement_id}): {f.detail} -> {f.suggestion}"
+        for f in findings if not f.accepted
+    ]
+    assert open_findings == []
+
+
+def test_accepted_findings_are_still_present():
+    # A stale entry means the query changed or got fixed; drop it from the list
+    conn = build_database()
+    findings, _ = check_statements(conn, collect_statements())
+    assert {f.statement_id for f in findings if f.accepted} == set(ACCEPTED_FINDINGS)
+
+
+def test_known_cases_are_indexed():
+    conn = build_database()
+    by_location = {}
+    for stmt in collect_statements():
+        by_location.setdefault(stmt.location.split(":")[0], []).append(stmt)
+
+    for path in ("queries/notifications.py", "queries/search.py"):
+        for stmt in by_location[path]:
+            findings = [f for f in check_statement(conn, stmt) if not f.accepted]
+            assert findings == [], stmt.sql
+
+
+def test_plans_use_representative_statistics():
+    conn = build_database()
+    assert conn.execute(
+        "SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_notif_user_unread_ms'"
+    ).fetchone() == ("500000 25 12 1",)
+    # room_id has ~50 values, user ~20k: without statistics the planner can't tell
+    sql = "SELECT id FROM messages WHERE room_id = ? AND user = ?"
+    assert explain(conn, sql) == ["SEARCH messages USING INDEX idx_messages_user (user=?)"]
+
+
+def test_flags_scan_and_sort_with_suggestion():
+    conn = build_database()
+    conn.execute("DROP INDEX idx_notif_user_unread_ms")
+    conn.execute("DROP INDEX idx_notif_user_created_ms")
+    stmt = Statement(
+        "SELECT id FROM notifications WHERE user_id = ? AND is_read = 0 ORDER BY created_at_ms DESC",
+        "test:1",
+    )
+    findings = check_statement(conn, stmt)
+    assert [f.kind for f in findings] == ["scan", "temp_btree"]
+    assert {f.suggestion for f in findings} == {
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_id_is_read_created_at_ms "
+        "ON notifications(user_id, is_read, created_at_ms)"
+    }
+
+    stmt = Statement("SELECT id FROM profile_posts WHERE content_payload = ?", "test:2")
+    findings = check_statement(conn, stmt)
+    assert findings[0].kind == "scan"
+    assert findings[0].table == "profile_posts"
+
+
+def test_collector_stitches_built_queries(tmp_path):
+    (tmp_path / "mod.py").write_text(
+        'def f(before):\n'
+        '    """SELECT docstrings are ignored."""\n'
+        '    query = "SELECT id FROM messages WHERE room_id = ?"\n'
+        '    if before:\n'
+        '        query += " AND id < ?"\n'
+        '    query += " ORDER BY id DESC"\n'
+        '    return query\n'
+    )
+    statements = collect_statements(sources=("mod.py",), root=str(tmp_path))
+    assert [s.sql for s in statements] == [
+        "SELECT id FROM messages WHERE room_id = ? AND id < ? ORDER BY id DESC"
+    ]
+
+
+def test_only_runtime_built_fragments_may_fail_to_parse(tmp_path):
+    (tmp_path / "mod.py").write_text(
+        'def f(table, cols):\n'
+        '    a = f"SELECT id FROM {table} WHERE id = ?"\n'
+        '    b = "UPDATE users SET " + cols + " WHERE id = ?"\n'
+        '    c = "SELECT id FORM users"\n'
+    )
+    statements = collect_statements(sources=("mod.py",), root=str(tmp_path))
+    assert [(s.sql, s.fragment) for s in statements] == [
+        ("SELECT id FROM ", True),
+        ("UPDATE users SET ", True),
+        ("SELECT id FORM users", False),
+    ]
+    _, errors = check_statements(build_database(), statements)
+    assert [(stmt.location, "syntax error" in error) for stmt, error in errors] == [("mod.py:4", True)]
+
+
+def test_suggest_index_ignores_unknown_columns():
+    conn = build_database()
+    sql = "SELECT * FROM friends f WHERE f.follower_id = ? ORDER BY f.nope"
+    assert suggest_index(sql, "f", "friends", conn) == (
+        "CREATE INDEX IF NOT EXISTS idx_friends_follower_id ON friends(follower_id)"
+    )
+
+
+def test_render_migration():
+    text = render_migration(
+        ["CREATE INDEX IF NOT EXISTS idx_t_a_b ON t(a, b)"], "abc123", "def456"
+    )
+    assert "down_revision: Union[str, None] = 'def456'" in text
+    assert "op.create_index('idx_t_a_b', 't', ['a', 'b'], unique=False, if_not_exists=True)" in text
+    assert "op.drop_index('idx_t_a_b', table_name='t', if_exists=True)" in text
+    compile(text, "migration.py", "exec")
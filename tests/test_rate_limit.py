@@ -0,0 +1,51 @@
+from core.rate_limit import GCRARateLimiter, LimitTable
+
+
+def test_gcra_allows_a_burst_then_one_per_interval(tmp_path):
+    table = LimitTable(str(tmp_path / "limits"), buckets=64)
+    now = 1000.0
+    assert [table.gcra("k", 5, 10, now=now)[0] for _ in range(6)] == [True] * 5 + [False]
+    assert table.gcra("k", 5, 10, now=now + 1.9)[0] is False
+    allowed, remaining, _ = table.gcra("k", 5, 10, now=now + 2.0)  # One interval (10s / 5) later
+    assert allowed and remaining == 0
+    assert table.gcra("k", 5, 10, now=now + 12.0, consume=False)[1] == 5  # Fully replenished
+
+
+def test_workers_share_the_table(tmp_path):
+    path = str(tmp_path / "limits")
+    first, second = LimitTable(path, buckets=64), LimitTable(path, buckets=64)  # Two workers' mappings
+    assert first.hit("ws:message:7", 2, 60) and second.hit("ws:message:7", 2, 60)
+    assert not first.hit("ws:message:7", 2, 60, action="ws:message")
+    assert first.stats()["rejections"] == {"ws:message": 1}
+
+
+def test_state_is_bounded_and_idle_keys_are_swept():
+    table = LimitTable(buckets=1)  # One bucket: 8 slots in total
+    for i in range(9):
+        table.gcra(f"user{i}", 10, 60, now=1000.0)
+    assert table.stats()["evictions"] == 1
+    assert table.sweep(now=1000.0) == 8
+    assert table.sweep(now=1100.0) == 0  # All replenished after the period
+    assert table.stats()["live_keys"] == 0
+
+
+def test_socket_events_use_the_shared_limiter(app):
+    from core.security import limiter
+    from sockets import check_rate_limit, rate_limits
+    with app.app_context():
+        rate_limits.clear()
+        assert [check_rate_limit(1, "typing", limit=3, window=10) for _ in range(4)] == [True, True, True, False]
+        assert check_rate_limit(2, "typing", limit=3, window=10)  # Per user
+        table = rate_limits.table()
+        assert table is limiter.storage.table
+        assert table.stats()["rejections"]["ws:typing"] == 1
+
+
+def test_http_limits_run_gcra_on_the_table(app, client):
+    from core.security import limiter
+    limiter.reset()
+    assert isinstance(limiter.limiter, GCRARateLimiter)
+    statuses = [client.post("/auth/register", json={"username": f"u{i}", "password": "pw"}).status_code
+                for i in range(6)]
+    assert statuses[-1] == 429 and 429 not in statuses[:5]
+    assert limiter.storage.table.stats()["rejections"]["http:auth.register"] == 1
@@ -0,0 +1,64 @@
+from presence import PresenceRegistry
+from room_registry import RoomRegistry
+
+
+def _row(id, name, is_default=1):
+    return {"id": id, "name": name, "description": "", "room_type": "text", "is_default": is_default}
+
+
+ROWS = [_row(3, "music"), _row(1, "general"), _row(2, "announcements"), _row(4, "staff", 0)]
+
+
+def test_rooms_are_loaded_once_and_unknown_names_fall_back():
+    loads = []
+    registry = RoomRegistry(lambda: loads.append(1) or ROWS)
+    assert registry.resolve_id("music") == 3 and registry.resolve_id("music") == 3
+    assert registry.resolve_id("nope") == 1 and registry.resolve_id("nope") == 1  # Reload throttled
+    assert len(loads) == 1
+    assert registry.stats()["rooms"] == 4
+
+
+def test_listing_orders_pinned_rooms_first_and_counts_members():
+    presence = PresenceRegistry()
+    registry = RoomRegistry(lambda: ROWS, members=presence.room_members)
+    for sid, user_id, room in (("a", 7, "music"), ("b", 7, "music"), ("c", 8, "music"), ("d", 9, "general")):
+        presence.apply(None, {"op": "set", "sid": sid,
+                              "info": {"user_id": user_id, "username": f"u{user_id}", "room_name": room}})
+    listed = registry.listed()
+    assert [(room["name"], room["members"]) for room in listed] == [
+        ("general", 1), ("announcements", 0), ("music", 2)]  # Two tabs count once; staff is not listed
+    presence.apply(None, {"op": "del", "sid": "c"})
+    presence.apply(None, {"op": "set", "sid": "a",
+                          "info": {"user_id": 7, "username": "u7", "room_name": "general"}})
+    assert {room["name"]: room["members"] for room in registry.listed()} == {
+        "general": 2, "announcements": 0, "music": 1}
+
+
+def test_a_reload_racing_a_new_room_keeps_it():
+    from room_registry import Room
+    registry = RoomRegistry(lambda: ROWS)
+    registry.reload()
+
+    def load():
+        registry.add(Room(5, "late", "", "text", True))  # Created while the reload is in flight
+        return ROWS
+
+    registry._load = load
+    registry.reload()
+    assert registry.get("late").id == 5 and registry.stats()["stale_loads"] == 1
+
+
+def test_created_rooms_are_served_without_queries(app):
+    from services import room_service
+    from room_registry import get_room_registry
+    from db import get_db
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('ana', 'hash')")
+        db.commit()
+        before = {room["name"] for room in room_service.list_all_rooms()}
+        loads = get_room_registry().stats()["loads"]
+        assert room_service.create_room_logic(1, "Neo Room").success
+        assert room_service.get_room_by_name("neo-room")["name"] == "neo-room"
+        assert {room["name"] for room in room_service.list_all_rooms()} == before | {"neo-room"}
+        assert get_room_registry().stats()["loads"] == loads
@@ -38,3 +38,42 @@ def test_clean_html_entities():
     # <b> is allowed, so it stays.
     assert "<b>bold</b>" in clean_html("<b>bold</b>")
     assert "&lt;script&gt;" not in clean_html("<script>") # should be stripped if strip=True
+
+def test_plain_text_skips_the_parser():
+    from utils.sanitize import sanitize_stats
+    before = sanitize_stats()
+    text = 'just "plain" text, tabs\tand\nnewlines é😀'
+    assert clean_html(text) is text and escape_text(text) is text
+    after = sanitize_stats()
+    assert after["parsed"] == before["parsed"]
+    assert after["fast_path"] == before["fast_path"] + 2
+
+def test_fast_path_matches_the_parser():
+    # Everything the parser would rewrite takes the slow path
+    for text in ["a\r\nb", "x\x00y", "x\x01y", "a\x0cb", "1 < 2", "a & b", "a > b"]:
+        assert clean_html(text) != text
+    assert clean_html("a\r\nb") == "a\nb"
+    assert clean_html("a & b") == "a &amp; b"
+
+def test_repeated_inputs_are_memoized():
+    from utils.sanitize import sanitize_stats
+    spam = "<b>buy</b> <script>now</script>"
+    first = clean_html(spam)
+    before = sanitize_stats()
+    assert clean_html(spam) == first == "<b>buy</b> now"
+    after = sanitize_stats()
+    assert after["memo_hits"] == before["memo_hits"] + 1 and after["parsed"] == before["parsed"]
+
+def test_clean_html_many_keeps_order():
+    from utils.sanitize import clean_html_many
+    rows = ["<i>a</i>", "plain", "<script>x</script>", "<i>a</i>", ""]
+    assert clean_html_many(rows) == ["<i>a</i>", "plain", "x", "<i>a</i>", ""]
+
+def test_cleaners_are_per_thread():
+    import threading
+    from utils import sanitize
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(sanitize._cleaners()))
+    thread.start()
+    thread.join()
+    assert seen[0] is not sanitize._cleaners() and sanitize._cleaners() is sanitize._cleaners()
@@ -7,8 +7,7 @@ class TestFullSiteSmoke:
 
     @pytest.fixture
     def client(self):
-        app = create_app()
-        app.config['TESTING'] = True
+        app = create_app({'TESTING': True})
         with app.test_client() as client:
             yield client
 
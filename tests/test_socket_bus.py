@@ -0,0 +1,140 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import socket_bus
+from socket_bus import BusManager, LocalBus, RespReader, UnixSocketBus, encode_command
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _collect(bus):
+    received = []
+    threading.Thread(target=lambda: received.extend(bus.listen()), daemon=True).start()
+    return received
+
+
+def _manager(hub):
+    manager = BusManager(LocalBus(hub))
+    threading.Thread(target=manager._thread, daemon=True).start()
+    return manager
+
+
+def test_resp_frames_round_trip():
+    left, right = socket.socketpair()
+    try:
+        left.sendall(encode_command("PUBLISH", "chan", b"\x00bytes\r\n") + b":3\r\n-ERR nope\r\n")
+        reader = RespReader(right)
+        assert reader.read() == [b"PUBLISH", b"chan", b"\x00bytes\r\n"]
+        assert reader.read() == 3
+        with pytest.raises(socket_bus.BusError, match="ERR nope"):
+            reader.read()
+    finally:
+        left.close()
+        right.close()
+
+
+def test_workers_elect_one_broker_and_relay(tmp_path):
+    path = str(tmp_path / "bus.sock")
+    first, second = UnixSocketBus(path), UnixSocketBus(path)
+    try:
+        received = _collect(second)
+        assert _wait_for(lambda: first.publish(b"hello") and received)
+        assert received[0] == b"hello"
+        assert [first.stats()["broker"], second.stats()["broker"]].count(True) == 1
+        assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+    finally:
+        first.close()
+        second.close()
+
+
+def test_broker_hands_over_when_its_worker_exits(tmp_path):
+    path = str(tmp_path / "bus.sock")
+    broker_bus, worker = UnixSocketBus(path), UnixSocketBus(path)
+    try:
+        broker_bus.broker.elect()
+        received = _collect(worker)
+        assert _wait_for(lambda: worker.publish(b"before") and received)
+        broker_bus.close()  # Its worker is gone: the socket closes, the flock is released
+        assert _wait_for(lambda: worker.publish(b"after") and b"after" in received)
+        assert worker.stats()["broker"] and worker.stats()["reconnects"] >= 1
+    finally:
+        broker_bus.close()
+        worker.close()
+
+
+def test_topics_reach_every_worker():
+    first, second = _manager("topics"), _manager("topics")
+    seen = []
+    socket_bus.subscribe("test_topic", seen.append)
+    try:
+        first.publish_app("test_topic", {"n": 1})
+        assert _wait_for(lambda: seen == [{"n": 1}])  # Delivered once: not echoed back to the sender
+        time.sleep(0.05)
+        assert seen == [{"n": 1}]
+    finally:
+        socket_bus._handlers.pop("test_topic")
+        first.close()
+        second.close()
+
+
+def test_emits_are_relayed_to_other_workers():
+    first, second = BusManager(LocalBus("emit")), BusManager(LocalBus("emit"))
+    relayed = []
+    second._handle_emit = relayed.append
+    threading.Thread(target=second._thread, daemon=True).start()
+    try:
+        first._publish({"method": "emit", "event": "message", "data": [{"id": 1}], "namespace": "/",
+                        "room": "general", "skip_sid": None, "callback": None, "host_id": first.host_id})
+        assert _wait_for(lambda: relayed)
+        assert relayed[0]["room"] == "general" and relayed[0]["data"] == [{"id": 1}]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_presence_merges_workers_and_expires_silent_ones(monkeypatch):
+    first, second = _manager("presence"), _manager("presence")
+    monkeypatch.setattr(socket_bus, "get_bus", lambda: second)
+    info = {"user_id": 7, "username": "remote", "room_id": 1, "room_name": "general"}
+    try:
+        first.announce({"op": "set", "sid": "abc", "info": info})
+        assert _wait_for(lambda: socket_bus.cluster_sockets().get("abc") == info)
+        first.announce({"op": "del", "sid": "abc"})
+        assert _wait_for(lambda: "abc" not in socket_bus.cluster_sockets())
+
+        first.announce({"op": "sync", "sockets": {"xyz": info}})
+        assert _wait_for(lambda: "xyz" in socket_bus.cluster_sockets())
+        second.peers.ttl = 0
+        assert "xyz" not in socket_bus.cluster_sockets()
+    finally:
+        first.close()
+        second.close()
+
+
+def test_disconnect_user_closes_their_sockets(app, client):
+    import db as db_module
+    from sockets import disconnect_user, socketio
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('banned', 'hash')")
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'banned'").fetchone()["id"]
+        conn.commit()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = "banned"
+
+    socket_client = socketio.test_client(app, flask_test_client=client)
+    assert socket_client.is_connected()
+    disconnect_user(user_id)
+    assert not socket_client.is_connected()
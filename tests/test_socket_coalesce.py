@@ -0,0 +1,108 @@
+import time
+
+from socket_coalesce import RoomCoalescer
+
+
+def _coalescer(**kwargs):
+    frames = []
+    coalescer = RoomCoalescer(lambda room, messages: frames.append((room, messages)), **kwargs)
+    return coalescer, frames
+
+
+def test_flush_sends_one_frame_per_room():
+    coalescer, frames = _coalescer(start=lambda fn: None)
+    for i in range(3):
+        coalescer.add("general", {"id": i})
+    coalescer.add("random", {"id": 9})
+    assert coalescer.stats()["pending"] == 4
+    coalescer.flush()
+    assert sorted(frames) == [("general", [{"id": 0}, {"id": 1}, {"id": 2}]), ("random", [{"id": 9}])]
+    assert coalescer.stats() == {"frames": 2, "messages": 4, "largest_frame": 3, "pending": 0}
+
+
+def test_messages_in_one_window_share_a_frame():
+    coalescer, frames = _coalescer(window=0.05)
+    for i in range(5):
+        coalescer.add("general", {"id": i})
+    deadline = time.monotonic() + 2
+    while not frames and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert frames == [("general", [{"id": i} for i in range(5)])]
+    assert not coalescer._running  # The flusher exits once nothing is pending
+
+
+def test_full_frame_does_not_wait_for_the_window():
+    started = []
+    coalescer, frames = _coalescer(window=60, max_messages=2, start=started.append)
+    coalescer.add("general", {"id": 1})
+    coalescer.add("general", {"id": 2})
+    started[0]()  # Run the flusher inline: the frame is due now, not in 60s
+    assert frames == [("general", [{"id": 1}, {"id": 2}])]
+
+
+def test_a_failing_emit_does_not_stall_the_flusher():
+    started, frames = [], []
+
+    def emit(room, messages):
+        if room == "broken":
+            raise RuntimeError("socket gone")
+        frames.append(room)
+
+    coalescer = RoomCoalescer(emit, window=0, start=started.append)
+    coalescer.add("broken", {"id": 1})
+    coalescer.add("general", {"id": 2})
+    started.pop()()
+    assert frames == ["general"] and not coalescer._running
+
+    coalescer = RoomCoalescer(emit, window=0, start=started.append, sleep=lambda s: 1 / 0)
+    coalescer._due["late"] = time.monotonic() + 60
+    coalescer._pending["late"] = [{"id": 3}]
+    coalescer._running = True
+    try:
+        coalescer._guarded_run()
+    except ZeroDivisionError:
+        pass
+    assert not coalescer._running  # A crashed flusher is replaced by the next add()
+    coalescer.add("general", {"id": 4})
+    assert len(started) == 1
+
+
+def _login(app, username):
+    import db as db_module
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, 'hash')", (username,))
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()["id"]
+        conn.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+    return client
+
+
+def test_only_opted_in_clients_get_frames(app):
+    import sockets
+    legacy = sockets.socketio.test_client(app, flask_test_client=_login(app, "legacy"))
+    batched = sockets.socketio.test_client(app, flask_test_client=_login(app, "batched"))
+    legacy.emit("join_room", {"room": "general"})
+    batched.emit("join_room", {"room": "general", "batch": True})
+    [joined] = [m["args"][0] for m in batched.get_received() if m["name"] == "room_joined"]
+    assert joined["batch"]
+    legacy.get_received()
+
+    for i in range(3):
+        legacy.emit("send_message", {"content": f"hello {i}"})
+    sockets.coalescer.flush()
+
+    # The test client keeps "message" events unwrapped (args is the payload)
+    assert [m["args"]["content"] for m in legacy.get_received() if m["name"] == "message"] == [
+        "hello 0", "hello 1", "hello 2"]
+    received = batched.get_received()
+    assert not [m for m in received if m["name"] == "message"]
+    [frame] = [m["args"][0] for m in received if m["name"] == "messages"]
+    assert frame["room"] == "general" and [m["content"] for m in frame["messages"]] == [
+        "hello 0", "hello 1", "hello 2"]
+    legacy.disconnect()
+    batched.disconnect()
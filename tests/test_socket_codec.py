@@ -0,0 +1,70 @@
+import msgspec
+from socketio import packet
+
+from core.structs import Message
+from socket_codec import MSGPACK, CodecManager, HybridPacket, client_codec, install_codec
+
+MESSAGE = Message(id=1, user="ana", content="hi", created_at="2026-01-01 00:00:00", room_id=1,
+                  deleted=False, edited=False)
+
+
+def test_structs_encode_without_to_builtins():
+    pkt = HybridPacket(packet.EVENT, data=["message", MESSAGE])
+    assert pkt.encode() == '2["message",' + msgspec.json.encode(MESSAGE).decode() + "]"
+    decoded = msgspec.msgpack.decode(pkt.encode_msgpack())
+    assert decoded == {"type": packet.EVENT, "nsp": "/", "data": ["message", msgspec.to_builtins(MESSAGE)]}
+
+
+def test_msgpack_packets_from_clients_decode():
+    frame = msgspec.msgpack.encode({"type": packet.EVENT, "nsp": "/", "data": ["send_message", {"content": "x"}], "id": 4})
+    pkt = HybridPacket(encoded_packet=frame)
+    assert (pkt.packet_type, pkt.namespace, pkt.data, pkt.id) == (
+        packet.EVENT, "/", ["send_message", {"content": "x"}], 4)
+    assert HybridPacket(encoded_packet='2["typing",{}]').data == ["typing", {}]  # JSON clients unchanged
+
+
+class FakeServer:
+    packet_class = HybridPacket
+
+    def __init__(self):
+        self.environ = {"e1": {"QUERY_STRING": "EIO=4&codec=msgpack"}, "e2": {"QUERY_STRING": "EIO=4"},
+                        "e3": {"QUERY_STRING": "codec=msgpack"}}
+        self.sent = []
+        self.ids = 0
+        self.eio = self
+
+    def generate_id(self):
+        self.ids += 1
+        return f"s{self.ids}"
+
+    def send(self, eio_sid, data):
+        self.sent.append((eio_sid, data))
+
+    def _send_packet(self, eio_sid, pkt):
+        self.sent.append((eio_sid, pkt.encode()))
+
+    def _send_eio_packet(self, eio_sid, eio_pkt):
+        self.sent.append((eio_sid, eio_pkt))
+
+
+def test_broadcasts_are_encoded_once_per_codec():
+    server = FakeServer()
+    manager = CodecManager()
+    manager.set_server(server)
+    manager.initialize()
+    for eio_sid in ("e1", "e2", "e3"):
+        manager.connect(eio_sid, "/")
+    manager.emit("message", MESSAGE, "/")
+    by_sid = {eio_sid: eio_pkt for eio_sid, eio_pkt in server.sent}
+    assert by_sid["e1"] is by_sid["e3"]  # Both msgpack clients share one encoded frame
+    assert isinstance(by_sid["e1"].data, bytes) and isinstance(by_sid["e2"].data, str)
+    assert client_codec(server, "e1") == MSGPACK and server.environ["e1"]["neospace.codec"] == MSGPACK
+
+
+def test_direct_packets_follow_the_client_codec():
+    server = FakeServer()
+    install_codec(server)
+    server._send_packet("e1", HybridPacket(packet.ACK, data=[{"ts": 5}], id=2))
+    server._send_packet("e2", HybridPacket(packet.ACK, data=[{"ts": 5}], id=2))
+    assert msgspec.msgpack.decode(server.sent[0][1]) == {"type": packet.ACK, "nsp": "/", "data": [{"ts": 5}], "id": 2}
+    assert server.sent[1][1] == '32[{"ts":5}]'
@@ -174,11 +174,11 @@ class TestCoreInvariants:
 class TestEdgeCases:
     """Edge case and boundary tests."""
 
-    def test_empty_content_allowed(self, auth_client):
-        """Empty message content is currently allowed."""
+    def test_empty_content_rejected(self, auth_client):
+        """Empty message content is rejected, as on the socket."""
         res = auth_client.post("/send", json={"content": ""})
-        # Currently allowed - empty string is valid
-        assert res.status_code == 200
+        # Same validation as send_message (services.message_service)
+        assert res.status_code == 400
 
     def test_very_long_content(self, auth_client, app):
         """Very long messages should be stored correctly."""
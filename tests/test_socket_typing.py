@@ -0,0 +1,119 @@
+import time
+
+from socket_typing import TypingTracker, worker_id
+
+WORKER = worker_id()
+
+
+def _tracker(**kwargs):
+    return TypingTracker(lambda room, diff: None, start=lambda fn: None, **kwargs)
+
+
+def test_diff_is_emitted_only_when_the_names_change():
+    tracker = _tracker()
+    tracker.start_typing("general", "s1", "ana")
+    tracker.start_typing("general", "s2", "bo")
+    assert tracker.diffs() == {"general": {"room": "general", "worker": WORKER, "started": ["ana", "bo"], "stopped": []}}
+    tracker.start_typing("general", "s1", "ana")  # Another burst: same set, nothing to send
+    assert tracker.diffs() == {}
+    tracker.stop_typing("general", "s2")
+    assert tracker.diffs() == {"general": {"room": "general", "worker": WORKER, "started": [], "stopped": ["bo"]}}
+    assert tracker.stats() == {"updates": 4, "emits": 2, "typists": 1}
+
+
+def test_start_and_stop_within_one_tick_is_never_broadcast():
+    tracker = _tracker()
+    tracker.start_typing("general", "s1", "ana")
+    tracker.stop_typing("general", "s1")
+    assert tracker.diffs() == {}
+    assert tracker.stats()["typists"] == 0
+
+
+def test_typists_expire_without_a_stop():
+    tracker = _tracker(ttl=0.05)
+    tracker.start_typing("general", "s1", "ana")
+    assert tracker.diffs()["general"]["started"] == ["ana"]
+    time.sleep(0.1)
+    assert tracker.diffs() == {"general": {"room": "general", "worker": WORKER, "started": [], "stopped": ["ana"]}}
+
+
+def test_two_tabs_of_one_user_show_one_name():
+    tracker = _tracker()
+    tracker.start_typing("general", "tab1", "ana")
+    tracker.start_typing("general", "tab2", "ana")
+    assert tracker.diffs()["general"]["started"] == ["ana"]
+    tracker.stop_typing("general", "tab1")
+    assert tracker.diffs() == {}  # Still typing in the other tab
+
+
+def test_snapshot_is_what_this_worker_last_reported():
+    tracker = _tracker()
+    tracker.start_typing("general", "s1", "bo")
+    tracker.start_typing("general", "s2", "ana")
+    assert tracker.snapshot("general")["typing"] == []  # Not reported yet: the next diff starts them
+    tracker.diffs()
+    assert tracker.snapshot("general") == {"room": "general", "worker": WORKER, "typing": ["ana", "bo"]}
+    assert tracker.snapshot("music")["typing"] == []
+
+
+def test_ticker_sends_one_state_per_tick_and_stops_when_idle():
+    emitted = []
+    tracker = TypingTracker(lambda room, diff: emitted.append(diff), tick=0.02)
+    for burst in range(20):
+        tracker.start_typing("general", f"s{burst % 3}", f"user{burst % 3}")
+    deadline = time.monotonic() + 2
+    while not emitted and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for sid in ("s0", "s1", "s2"):
+        tracker.stop_typing("general", sid)
+    while tracker._running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert emitted == [
+        {"room": "general", "worker": WORKER, "started": ["user0", "user1", "user2"], "stopped": []},
+        {"room": "general", "worker": WORKER, "started": [], "stopped": ["user0", "user1", "user2"]},
+    ]
+    assert not tracker._running
+
+
+def test_a_failing_emit_does_not_stop_the_ticker():
+    emitted, started = [], []
+
+    def emit(room, diff):
+        if room == "broken":
+            raise RuntimeError("socket gone")
+        emitted.append(room)
+
+    ticks = iter([None, None])
+    tracker = TypingTracker(emit, start=started.append, sleep=lambda s: next(ticks))
+    tracker.start_typing("broken", "s1", "ana")
+    tracker.start_typing("general", "s2", "bo")
+    try:
+        started.pop()()  # Second tick still has typists; the third sleep raises StopIteration
+    except StopIteration:
+        pass
+    assert emitted == ["general"]
+    assert not tracker._running  # A crashed ticker is replaced by the next start_typing()
+    tracker.start_typing("general", "s2", "bo")
+    assert len(started) == 1
+
+
+def test_a_joining_socket_gets_the_typing_snapshot(app):
+    import db as db_module
+    import sockets
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('bo', 'hash')")
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'bo'").fetchone()["id"]
+    http = app.test_client()
+    with http.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = "bo"
+
+    sockets.typing_tracker.start_typing("general", "ana-tab", "ana")
+    sockets.typing_tracker.diffs()  # Reported to the room before bo arrives
+    client = sockets.socketio.test_client(app, flask_test_client=http)
+    client.emit("join_room", {"room": "general"})
+    states = [m["args"][0] for m in client.get_received() if m["name"] == "typing_state"]
+    assert states == [{"room": "general", "worker": WORKER, "typing": ["ana"]}]
+    sockets.typing_tracker.stop_typing("general", "ana-tab")
+    client.disconnect()
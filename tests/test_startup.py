@@ -0,0 +1,77 @@
+import os
+
+import db as db_module
+
+
+def test_second_init_skips_schema_ddl(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr("db_epoch.add_epoch_columns", lambda db: calls.append("ddl"))
+    with app.app_context():
+        assert db_module.schema_is_current(db_module.get_db())
+        db_module.init_db()
+    assert calls == []
+
+
+def test_changed_schema_is_reapplied(app):
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("UPDATE schema_meta SET value = 'stale' WHERE key = 'schema_hash'")
+        conn.commit()
+        assert not db_module.schema_is_current(conn)
+        db_module.init_db()
+        assert db_module.schema_is_current(db_module.get_db())
+
+
+def test_startup_timing_is_recorded(app, client):
+    timing = app.extensions["startup_timing"]
+    assert {"config", "database", "blueprints", "sockets"} <= set(timing["phases"])
+    assert timing["total"] >= sum(timing["phases"].values()) * 0.99
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'neospace_startup_phase_seconds{phase="database"}' in body
+
+
+def test_deferred_blueprints_load_on_first_hit(auth_client):
+    assert auth_client.get("/cats/").status_code == 200
+    assert auth_client.get("/cats/nope").status_code == 404
+    assert auth_client.get("/cats/speak").status_code == 405
+    assert auth_client.get("/admin").status_code == 308  # Same slash redirect as an eager blueprint
+
+
+def test_deferred_routes_report_their_own_endpoint(auth_client):
+    from core.telemetry import registry
+    registry.reset()
+    assert auth_client.get("/cats/").status_code == 200
+    scopes = {s["scope"] for s in registry.snapshot()["scopes"]}
+    assert "http:cats.list_cats" in scopes
+    assert not any(scope.startswith("http:lazy_") for scope in scopes)
+
+
+def test_eager_blueprints_when_lazy_loading_disabled(tmp_path):
+    from app import create_app
+    app = create_app({"DATABASE": str(tmp_path / "eager.db"), "TESTING": True, "LAZY_BLUEPRINTS": False})
+    try:
+        assert any(e.startswith("song.") for e in app.view_functions)
+        assert not any(e.startswith("lazy_") for e in app.view_functions)
+    finally:
+        db_module.shutdown_pool()
+
+
+def test_testing_apps_keep_no_files_next_to_the_database(tmp_path):
+    from app import create_app
+    app = create_app({"DATABASE": str(tmp_path / "t.db"), "TESTING": True})
+    try:
+        assert app.config["DB_CHECKPOINT_ENABLED"] is False
+        assert app.config["SOCKETIO_BUS"] == "off"
+        assert app.test_client().get("/auth/login").status_code == 200
+        leftovers = [name for name in os.listdir(tmp_path)
+                     if name.endswith((".ratelimit", ".checkpoint.lock", ".bus.sock", ".bus.sock.lock"))]
+        assert leftovers == []
+    finally:
+        db_module.shutdown_pool()
+
+    # A test that needs one of them asks for it
+    app = create_app({"DATABASE": str(tmp_path / "t.db"), "TESTING": True, "SOCKETIO_BUS": "local"})
+    try:
+        assert app.config["SOCKETIO_BUS"] == "local"
+    finally:
+        db_module.shutdown_pool()
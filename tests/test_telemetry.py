@@ -0,0 +1,59 @@
+import sqlite3
+
+from core.telemetry import QueryRegistry, TelemetryCursor, fingerprint
+import core.telemetry as telemetry
+
+
+def test_fingerprint_normalizes_literals():
+    a = fingerprint("SELECT * FROM users WHERE id = 5 AND name = 'bob'")
+    b = fingerprint("SELECT  *  FROM users\n WHERE id = 42 AND name = 'alice'")
+    assert a == b == "SELECT * FROM users WHERE id = ? AND name = ?"
+    assert fingerprint("SELECT * FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (?...)"
+
+
+def test_registry_percentiles_and_scopes():
+    reg = QueryRegistry()
+    for ms in range(1, 101):
+        reg.record("SELECT 1", ms / 1000.0, rows=1)
+    reg.record_retry("SELECT 1")
+    reg.record_scope("http:index", 3)
+    reg.record_scope("http:index", 5)
+
+    snap = reg.snapshot()
+    q = snap["queries"][0]
+    assert q["count"] == 100
+    assert q["rows"] == 100
+    assert q["busy_retries"] == 1
+    assert 49 <= q["p50_ms"] <= 51
+    assert 94 <= q["p95_ms"] <= 96
+    assert snap["scopes"][0] == {
+        "scope": "http:index", "count": 2, "queries": 8, "avg_queries": 4.0, "max_queries": 5
+    }
+
+
+def test_cursor_records_rows_on_fetch(monkeypatch):
+    reg = QueryRegistry()
+    monkeypatch.setattr(telemetry, "registry", reg)
+
+    conn = sqlite3.connect(":memory:")
+    cur = conn.cursor(TelemetryCursor)
+    cur.execute("CREATE TABLE t (x INTEGER)")
+    cur.executemany("INSERT INTO t VALUES (?)", [(1,), (2,), (3,)])
+    assert cur.execute("SELECT x FROM t WHERE x > 0").fetchall() == [(1,), (2,), (3,)]
+
+    by_sql = {q["sql"]: q for q in reg.snapshot()["queries"]}
+    assert by_sql["SELECT x FROM t WHERE x > ?"]["rows"] == 3
+    assert by_sql["INSERT INTO t VALUES (?)"]["count"] == 1
+    conn.close()
+
+
+def test_requests_record_query_counts(app, client):
+    from core.telemetry import registry
+    registry.reset()
+    client.post('/auth/register', json={'username': 'telemetry_user', 'password': 'password123'})
+
+    scopes = {s["scope"]: s for s in registry.snapshot()["scopes"]}
+    assert scopes["http:auth.register"]["queries"] > 0
+
+    res = client.get('/metrics')
+    assert b'neospace_db_query_seconds_total{query=' in res.data
@@ -0,0 +1,80 @@
+from user_status import UserStatusCache
+
+
+def _row(username="ana", banned=0):
+    return {"username": username, "is_banned": banned, "show_online_status": 1}
+
+
+def test_lookups_are_cached_until_invalidated():
+    loads = []
+    cache = UserStatusCache(lambda user_id: loads.append(user_id) or _row())
+    assert cache.get(1).allows("ana") and cache.get(1).allows("ana")
+    assert loads == [1]
+    cache.invalidate(1)
+    assert cache.get(1).username == "ana" and loads == [1, 1]
+    assert not cache.get(1).allows("bo")  # Socket username must match
+    assert cache.stats()["hits"] == 2
+
+
+def test_a_load_racing_a_ban_is_not_cached():
+    rows = iter([_row(banned=0), _row(banned=1)])
+
+    def load(user_id):
+        row = next(rows)
+        if not row["is_banned"]:
+            cache.invalidate(user_id)  # The ban commits while the old row is in flight
+        return row
+
+    cache = UserStatusCache(load)
+    assert cache.get(1).allows()  # This caller saw the pre-ban row...
+    assert not cache.get(1).allows()  # ...but nobody after it does
+    assert cache.stats()["stale_loads"] == 1
+
+
+def test_entries_are_bounded_and_missing_users_are_not_cached():
+    cache = UserStatusCache(lambda user_id: _row(f"u{user_id}") if user_id < 10 else None, max_entries=2)
+    for user_id in (1, 2, 3):
+        cache.get(user_id)
+    assert cache.stats()["entries"] == 2
+    assert cache.get(99) is None and cache.stats()["entries"] == 2
+
+
+def _user(app, username, staff=False):
+    import db as db_module
+    with app.app_context():
+        conn = db_module.get_db()
+        conn.execute("INSERT INTO users (username, password_hash, is_staff) VALUES (?, 'hash', ?)",
+                     (username, int(staff)))
+        user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()["id"]
+        conn.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+    return client, user_id
+
+
+def test_bans_disconnect_at_once_and_connects_use_the_cache(app):
+    from sockets import socketio
+    from user_status import get_status_cache
+    staff, _ = _user(app, "mod", staff=True)
+    http, user_id = _user(app, "troll")
+    first = socketio.test_client(app, flask_test_client=http)
+    second = socketio.test_client(app, flask_test_client=http)  # Reconnect storm: one query
+    assert first.is_connected() and second.is_connected()
+    with app.app_context():
+        assert get_status_cache().stats()["misses"] == 1
+
+    assert staff.post(f"/admin/users/{user_id}/ban").status_code == 200
+    assert not first.is_connected() and not second.is_connected()
+    assert not socketio.test_client(app, flask_test_client=http).is_connected()
+
+    assert staff.delete(f"/admin/users/{user_id}/ban").status_code == 200
+    with http.session_transaction() as sess:  # Rejected connects clear the session
+        sess["user_id"] = user_id
+        sess["username"] = "troll"
+    third = socketio.test_client(app, flask_test_client=http)
+    assert third.is_connected()
+
+    assert staff.delete(f"/admin/users/{user_id}").status_code == 200
+    assert not third.is_connected()
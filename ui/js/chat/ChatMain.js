@@ -39,14 +39,17 @@ function init() {
             UI.updateScrollButton();
             UI.updateUnreadCount();
         },
-        onTyping: ({ user }) => {
-            if (user !== state.currentUser && user) {
-                state.typingUsersList.add(user);
-                UI.updateTypingUI();
-            }
-        },
-        onStopTyping: ({ user }) => {
-            state.typingUsersList.delete(user);
+        onTypingState: ({ worker, typing, started, stopped }) => {
+            // A snapshot replaces what this worker reported; a diff updates it
+            const names = typing ? new Set(typing) : (state.typingByWorker.get(worker) || new Set());
+            (started || []).forEach(user => names.add(user));
+            (stopped || []).forEach(user => names.delete(user));
+            state.typingByWorker.set(worker, names);
+            // Shown while any worker still reports them (e.g. two tabs on two workers)
+            state.typingUsersList.clear();
+            state.typingByWorker.forEach(workerNames => workerNames.forEach(user => {
+                if (user !== state.currentUser) state.typingUsersList.add(user);
+            }));
             UI.updateTypingUI();
         }
     });
@@ -4,6 +4,7 @@
  */
 
 import { state } from './ChatState.js';
+import { msgpackParser } from './SocketCodec.js';
 
 export function initSocket(callbacks) {
     console.log('ChatSocket initializing...');
@@ -18,7 +19,10 @@ export function initSocket(callbacks) {
                 reconnectionDelayMax: 10000,  // Cap at 10s (don't hammer server)
                 reconnectionAttempts: Infinity,
                 randomizationFactor: 0.5,
-                timeout: 20000
+                timeout: 20000,
+                // Binary msgpack frames instead of JSON text (see socket_codec.py)
+                parser: msgpackParser,
+                query: { codec: 'msgpack' }
             });
         }
 
@@ -29,8 +33,11 @@ export function initSocket(callbacks) {
         });
 
         s.on('connected', (data) => {
-            // Join room
-            s.emit('join_room', { room: state.currentRoom });
+            // Each worker sends its typing snapshot once we have joined
+            state.typingByWorker.clear();
+            state.typingUsersList.clear();
+            // Join room; batch: messages arrive as one 'messages' frame per ~25ms
+            s.emit('join_room', { room: state.currentRoom, batch: true });
             if (data && data.username) {
                 state.currentUser = data.username;
                 localStorage.setItem('neospace_username', state.currentUser);
@@ -66,16 +73,16 @@ export function initSocket(callbacks) {
             if (callbacks.onMessage) callbacks.onMessage(msg);
         });
 
-        s.on('backfill', (payload) => {
-            if (callbacks.onBackfill) callbacks.onBackfill(payload);
+        s.on('messages', (frame) => {
+            if (callbacks.onMessage) frame.messages.forEach((msg) => callbacks.onMessage(msg));
         });
 
-        s.on('typing', (data) => {
-            if (callbacks.onTyping) callbacks.onTyping(data);
+        s.on('backfill', (payload) => {
+            if (callbacks.onBackfill) callbacks.onBackfill(payload);
         });
 
-        s.on('stop_typing', (data) => {
-            if (callbacks.onStopTyping) callbacks.onStopTyping(data);
+        s.on('typing_state', (diff) => {
+            if (callbacks.onTypingState) callbacks.onTypingState(diff);
         });
 
     } catch (e) {
@@ -83,10 +90,21 @@ export function initSocket(callbacks) {
     }
 }
 
+// Unacknowledged sends are re-sent with the same idempotency key: the
+// server posts each key once and acks the retries with the first result
+const SEND_ACK_TIMEOUT = 5000;
+const SEND_ATTEMPTS = 4;
+
 export function sendMessage(content) {
     if (!state.socket) return;
     const user = state.currentUser || 'anonymous';
-    state.socket.emit('send_message', { user, content });
+    const payload = { user, content, idempotency_key: newIdempotencyKey() };
+    const attempt = (n) => {
+        state.socket.timeout(SEND_ACK_TIMEOUT).emit('send_message', payload, (err) => {
+            if (err && n + 1 < SEND_ATTEMPTS) attempt(n + 1);
+        });
+    };
+    attempt(0);
 }
 
 export function sendTyping(isTyping) {
@@ -9,6 +9,7 @@ export const state = {
     messageIds: new Set(),
     isLoading: false,
     typingUsersList: new Set(),
+    typingByWorker: new Map(), // worker -> Set of names it reports typing
     socket: null, // Socket.io instance
     isTyping: false,
     typingTimeout: null,
@@ -23,4 +24,5 @@ export function cleanupChat() {
     }
     state.messageIds.clear();
     state.typingUsersList.clear();
+    state.typingByWorker.clear();
 }
@@ -0,0 +1,203 @@
+/**
+ * SocketCodec.js
+ * msgpack parser for socket.io-client (socket.io-msgpack-parser framing).
+ *
+ * Pass it as io({ parser: msgpackParser, query: { codec: 'msgpack' } }):
+ * the query tells the server (socket_codec.py) to answer in msgpack, so
+ * every packet is one binary frame instead of JSON text.
+ */
+
+const PacketType = { CONNECT: 0, DISCONNECT: 1, EVENT: 2, ACK: 3, CONNECT_ERROR: 4 };
+
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
+
+// --- encoding ---------------------------------------------------------------
+
+class Writer {
+    constructor() {
+        this.buffer = new Uint8Array(256);
+        this.view = new DataView(this.buffer.buffer);
+        this.length = 0;
+    }
+
+    reserve(n) {
+        if (this.length + n <= this.buffer.length) return;
+        let size = this.buffer.length * 2;
+        while (size < this.length + n) size *= 2;
+        const grown = new Uint8Array(size);
+        grown.set(this.buffer.subarray(0, this.length));
+        this.buffer = grown;
+        this.view = new DataView(grown.buffer);
+    }
+
+    byte(b) { this.reserve(1); this.buffer[this.length++] = b; }
+    u16(v) { this.reserve(2); this.view.setUint16(this.length, v); this.length += 2; }
+    u32(v) { this.reserve(4); this.view.setUint32(this.length, v); this.length += 4; }
+    bytes(b) { this.reserve(b.length); this.buffer.set(b, this.length); this.length += b.length; }
+
+    header(len, fix, fixMax, c8, c16, c32) {
+        if (fix !== null && len <= fixMax) this.byte(fix | len);
+        else if (c8 !== null && len < 0x100) { this.byte(c8); this.byte(len); }
+        else if (len < 0x10000) { this.byte(c16); this.u16(len); }
+        else { this.byte(c32); this.u32(len); }
+    }
+
+    value(v) {
+        if (v === null || v === undefined) this.byte(0xc0);
+        else if (v === false) this.byte(0xc2);
+        else if (v === true) this.byte(0xc3);
+        else if (typeof v === 'number') this.number(v);
+        else if (typeof v === 'string') {
+            const b = textEncoder.encode(v);
+            this.header(b.length, 0xa0, 31, 0xd9, 0xda, 0xdb);
+            this.bytes(b);
+        } else if (v instanceof ArrayBuffer || ArrayBuffer.isView(v)) {
+            const b = v instanceof ArrayBuffer ? new Uint8Array(v) : new Uint8Array(v.buffer, v.byteOffset, v.byteLength);
+            this.header(b.length, null, 0, 0xc4, 0xc5, 0xc6);
+            this.bytes(b);
+        } else if (Array.isArray(v)) {
+            this.header(v.length, 0x90, 15, null, 0xdc, 0xdd);
+            v.forEach(item => this.value(item));
+        } else if (typeof v.toJSON === 'function') {
+            this.value(v.toJSON());
+        } else {
+            const keys = Object.keys(v).filter(k => v[k] !== undefined);
+            this.header(keys.length, 0x80, 15, null, 0xde, 0xdf);
+            keys.forEach(k => { this.value(k); this.value(v[k]); });
+        }
+    }
+
+    number(n) {
+        if (Number.isInteger(n) && n >= 0 && n < 0x100000000) {
+            if (n < 0x80) this.byte(n);
+            else if (n < 0x100) { this.byte(0xcc); this.byte(n); }
+            else if (n < 0x10000) { this.byte(0xcd); this.u16(n); }
+            else { this.byte(0xce); this.u32(n); }
+        } else if (Number.isInteger(n) && n < 0 && n >= -0x80000000) {
+            if (n >= -32) this.byte(n & 0xff);
+            else { this.byte(0xd2); this.reserve(4); this.view.setInt32(this.length, n); this.length += 4; }
+        } else if (Number.isSafeInteger(n)) {
+            this.byte(n > 0 ? 0xcf : 0xd3);
+            this.reserve(8);
+            if (n > 0) this.view.setBigUint64(this.length, BigInt(n));
+            else this.view.setBigInt64(this.length, BigInt(n));
+            this.length += 8;
+        } else {
+            this.byte(0xcb);
+            this.reserve(8);
+            this.view.setFloat64(this.length, n);
+            this.length += 8;
+        }
+    }
+
+    result() { return this.buffer.slice(0, this.length); }
+}
+
+export function encode(value) {
+    const writer = new Writer();
+    writer.value(value);
+    return writer.result();
+}
+
+// --- decoding ---------------------------------------------------------------
+
+class Reader {
+    constructor(bytes) {
+        this.bytes = bytes;
+        this.view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        this.offset = 0;
+    }
+
+    take(n) {
+        if (this.offset + n > this.bytes.length) throw new Error('msgpack: truncated');
+        const start = this.offset;
+        this.offset += n;
+        return start;
+    }
+
+    str(n) { const s = this.take(n); return textDecoder.decode(this.bytes.subarray(s, s + n)); }
+    bin(n) { const s = this.take(n); return this.bytes.slice(s, s + n).buffer; }
+    array(n) { const a = new Array(n); for (let i = 0; i < n; i++) a[i] = this.value(); return a; }
+    map(n) { const m = {}; for (let i = 0; i < n; i++) { const k = this.value(); m[k] = this.value(); } return m; }
+
+    value() {
+        const b = this.bytes[this.take(1)];
+        if (b < 0x80) return b;
+        if (b < 0x90) return this.map(b & 0x0f);
+        if (b < 0xa0) return this.array(b & 0x0f);
+        if (b < 0xc0) return this.str(b & 0x1f);
+        if (b >= 0xe0) return b - 0x100;
+        const v = this.view;
+        switch (b) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return this.bin(v.getUint8(this.take(1)));
+            case 0xc5: return this.bin(v.getUint16(this.take(2)));
+            case 0xc6: return this.bin(v.getUint32(this.take(4)));
+            case 0xca: return v.getFloat32(this.take(4));
+            case 0xcb: return v.getFloat64(this.take(8));
+            case 0xcc: return v.getUint8(this.take(1));
+            case 0xcd: return v.getUint16(this.take(2));
+            case 0xce: return v.getUint32(this.take(4));
+            case 0xcf: return Number(v.getBigUint64(this.take(8)));
+            case 0xd0: return v.getInt8(this.take(1));
+            case 0xd1: return v.getInt16(this.take(2));
+            case 0xd2: return v.getInt32(this.take(4));
+            case 0xd3: return Number(v.getBigInt64(this.take(8)));
+            case 0xd9: return this.str(v.getUint8(this.take(1)));
+            case 0xda: return this.str(v.getUint16(this.take(2)));
+            case 0xdb: return this.str(v.getUint32(this.take(4)));
+            case 0xdc: return this.array(v.getUint16(this.take(2)));
+            case 0xdd: return this.array(v.getUint32(this.take(4)));
+            case 0xde: return this.map(v.getUint16(this.take(2)));
+            case 0xdf: return this.map(v.getUint32(this.take(4)));
+            default: throw new Error('msgpack: unsupported type 0x' + b.toString(16));
+        }
+    }
+}
+
+export function decode(data) {
+    const bytes = data instanceof Uint8Array ? data : new Uint8Array(data);
+    return new Reader(bytes).value();
+}
+
+// --- socket.io parser -------------------------------------------------------
+
+class Encoder {
+    encode(packet) {
+        return [encode(packet)];
+    }
+}
+
+class Decoder {
+    constructor() {
+        this.listeners = {};
+    }
+
+    on(event, fn) {
+        (this.listeners[event] = this.listeners[event] || []).push(fn);
+        return this;
+    }
+
+    off(event, fn) {
+        const fns = this.listeners[event];
+        if (fns) this.listeners[event] = fn ? fns.filter(f => f !== fn) : [];
+        return this;
+    }
+
+    add(chunk) {
+        const packet = decode(chunk);
+        const valid = packet && typeof packet.type === 'number' && typeof packet.nsp === 'string' &&
+            Object.values(PacketType).includes(packet.type);
+        if (!valid) throw new Error('invalid msgpack packet');
+        (this.listeners.decoded || []).slice().forEach(fn => fn(packet));
+    }
+
+    destroy() {
+        this.listeners = {};
+    }
+}
+
+export const msgpackParser = { protocol: 5, PacketType, Encoder, Decoder };
@@ -0,0 +1,17 @@
+/**
+ * idempotency.js
+ * Keys for create requests that may be retried (see idempotency.py).
+ *
+ * Generate one key per user action and reuse it for every retry of that
+ * action: the server runs the first request carrying it and answers the
+ * rest with the first response, so a retry never posts twice.
+ *
+ *   fetch('/dm/send', { headers: { 'Idempotency-Key': newIdempotencyKey() }, ... })
+ */
+
+window.newIdempotencyKey = window.newIdempotencyKey || function () {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();  // Secure contexts only
+    const bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    return Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+};
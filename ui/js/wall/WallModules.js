@@ -475,12 +475,15 @@ export function setupModuleForm(callbacks) {
                     payload.display_order = 999;
                 }
 
+                const headers = {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': document.querySelector('meta[name="csrf-token"]')?.getAttribute('content')
+                };
+                if (!editId) headers['Idempotency-Key'] = newIdempotencyKey();  // Creates only
+
                 const res = await fetch(endpoint, {
                     method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': document.querySelector('meta[name="csrf-token"]')?.getAttribute('content')
-                    },
+                    headers,
                     body: JSON.stringify(payload)
                 });
                 const data = await res.json();
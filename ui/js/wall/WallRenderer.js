@@ -72,7 +72,7 @@ export function renderProfile(data) {
         if (addModBtn) addModBtn.classList.remove('hidden');
     }
 
-    if (data.show_online_status) {
+    if (data.is_online) {
         const onlineEl = document.getElementById('online-indicator');
         if (onlineEl) onlineEl.classList.remove('hidden');
     }
@@ -410,7 +410,8 @@ export default class WallStickers {
             const res = await fetch('/wall/sticker/add', {
                 method: 'POST',
                 headers: {
-                    'X-CSRFToken': this.getCsrfToken()
+                    'X-CSRFToken': this.getCsrfToken(),
+                    'Idempotency-Key': newIdempotencyKey()
                 },
                 body: formData
             });
@@ -0,0 +1,160 @@
+"""
+User Status Cache - user_status.py
+
+Sockets queried users.is_banned on every connect and re-checked open
+sockets once an hour, so a reconnect storm cost a query per socket and
+a ban left the user's sockets live until their next re-check.
+UserStatusCache keeps what socket auth needs per user (username, banned,
+show_online_status) in memory:
+
+- ban, unban and delete call user_status_changed() after their commit;
+  it is published on the socket bus, every worker drops the user's entry
+  and sockets.py disconnects a banned or deleted user's sockets at once
+- entries are version-stamped: every invalidation bumps the cache's
+  version, and a load that started before a bump is returned but not
+  stored, so a read racing a ban never caches the pre-ban row
+- STATUS_TTL bounds staleness if a bus message is lost (a worker
+  reconnecting) or the table is edited by hand; MAX_ENTRIES bounds memory
+
+Usage:
+    from user_status import get_user_status, user_status_changed
+    status = get_user_status(user_id)   # None: no such user
+    user_status_changed(user_id, banned=True)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from process_registry import ProcessRegistry
+from socket_bus import publish, subscribe
+
+# =============================================================================
+# Settings
+# =============================================================================
+STATUS_TTL = 3600.0  # Seconds an entry is trusted without an invalidation
+MAX_ENTRIES = 65536  # Least recently used entries are dropped beyond this
+STATUS_TOPIC = "user_status"  # Socket bus topic of ban / unban / delete
+
+
+class UserStatus:
+    """What socket auth needs to know about one user."""
+
+    __slots__ = ("user_id", "username", "banned", "visible", "version", "expires")
+
+    def __init__(self, user_id, username, banned, visible, version, expires):
+        self.user_id = user_id
+        self.username = username
+        self.banned = banned
+        self.visible = visible
+        self.version = version
+        self.expires = expires
+
+    def allows(self, username=None):
+        """True if the user may hold a socket (under this username, if given)."""
+        return not self.banned and (username is None or username == self.username)
+
+
+class UserStatusCache:
+    """LRU of UserStatus by user id; load(user_id) returns a users row or None."""
+
+    def __init__(self, load, ttl=STATUS_TTL, max_entries=MAX_ENTRIES):
+        self._load = load
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()  # Guards everything below
+        self._entries = OrderedDict()  # user_id -> UserStatus, least recently used first
+        self.version = 0  # Bumped by every invalidation
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "stale_loads": 0}
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            status = self._entries.get(user_id)
+            if status is not None and status.expires > now:
+                self._entries.move_to_end(user_id)
+                self._stats["hits"] += 1
+                return status
+        return self.refresh(user_id)
+
+    def refresh(self, user_id):
+        """Load the user from the database now (and cache it unless invalidated meanwhile)."""
+        with self._lock:
+            version = self.version
+            self._stats["misses"] += 1
+        row = self._load(user_id)
+        if row is None:
+            return None  # Not cached: ids are never reused
+        status = UserStatus(
+            user_id, row["username"], bool(row["is_banned"]), bool(row["show_online_status"]),
+            version, time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            if self.version != version:
+                self._stats["stale_loads"] += 1
+                return status
+            self._entries[user_id] = status
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return status
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or (None) everyone."""
+        with self._lock:
+            self.version += 1
+            self._stats["invalidations"] += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "version": self.version}
+
+
+def _load_user(user_id):
+    from db import get_db
+    return get_db().execute(
+        "SELECT u.username, u.is_banned, COALESCE(p.show_online_status, 1) AS show_online_status "
+        "FROM users u LEFT JOIN profiles p ON p.user_id = u.id WHERE u.id = ?",
+        (user_id,)
+    ).fetchone()
+
+
+# =============================================================================
+# Process-wide caches (one per database, recreated after fork)
+# =============================================================================
+_caches = ProcessRegistry()
+
+
+def get_status_cache(path=None):
+    """The cache for a database in this process (default: the current app's)."""
+    return _caches.get_or_create(path or current_app.config["DATABASE"],
+                                 lambda: UserStatusCache(_load_user))
+
+
+def get_user_status(user_id):
+    """UserStatus of a user (None if they do not exist), from the cache when fresh."""
+    return get_status_cache().get(user_id)
+
+
+def user_status_changed(user_id, banned=False, deleted=False):
+    """Call after committing a ban, unban, delete or visibility change: invalidates every worker."""
+    publish(STATUS_TOPIC, {"user_id": user_id, "banned": banned, "deleted": deleted})
+
+
+def _invalidate(payload):
+    for cache in _caches.values():
+        cache.invalidate(payload["user_id"])
+
+
+subscribe(STATUS_TOPIC, _invalidate)
+
+
+def user_status_stats():
+    """Counters for this process's most recently created cache, if any."""
+    cache = _caches.latest()
+    return cache.stats() if cache else None
@@ -1,14 +1,15 @@
 from functools import wraps
-from flask import jsonify, g, request
+from flask import Response, jsonify, g, make_response, request
 import sqlite3
 from core.responses import error_response
-from db import db_retry, get_db
+from db_writebehind import write_behind
+from db_writer import write_outcome_unknown
 
 def mutation_handler(f):
     """
     Decorator for mutation functions that handles:
-    - Retries for database locks (via db_retry)
-    - OperationalError handling (503 Service Unavailable)
+    - OperationalError handling (503 Service Unavailable), including
+      WriteLockTimeout when db_retry can't get the write lock in time
     - Generic exception handling (500 Internal Server Error)
     
     Usage:
@@ -20,14 +21,9 @@ def mutation_handler(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         try:
-            # We wrap the execution in db_retry to handle immediate lock contention
-            # If f() itself calls db_retry, it's redundant but harmless.
-            # Ideally f() should just contain the logic and let this handle the retry loop.
-            # However, since our existing code structure often defines inner functions for retry,
-            # we'll just wrap the call to f.
             return f(*args, **kwargs)
         except sqlite3.OperationalError as e:
-            # If db_retry failed after max attempts, or if it wasn't used inside f
+            # Write lock deadline missed, or SQLite itself reported busy
             return error_response("Database busy, please retry", 503)
         except Exception as e:
             # Catch-all for other errors
@@ -49,17 +45,16 @@ def log_admin_action(action_name):
             response = f(*args, **kwargs)
             
             # Log after successful execution (or if it returns a response object)
+            # Queued write-behind: the audit row never blocks the admin response
             try:
                 if g.user and g.user.get('is_staff'):
-                    db = get_db()
                     target = request.form.get('target', request.args.get('target', 'unknown'))
                     details = str(request.form.to_dict()) if request.form else "No form data"
                     
-                    db.execute(
+                    write_behind(
                         "INSERT INTO admin_ops (admin_id, action, target, details, ip_address) VALUES (?, ?, ?, ?, ?)",
                         (g.user['id'], action_name, target, details, request.remote_addr)
                     )
-                    db.commit()
             except Exception as e:
                 # Don't fail the request if logging fails, but log to stderr
                 print(f"[AuditLog Error] Failed to log {action_name}: {e}")
@@ -67,3 +62,46 @@ def log_admin_action(action_name):
             return response
         return wrapper
     return decorator
+
+def idempotent(scope):
+    """
+    Decorator for create endpoints that honours the Idempotency-Key header.
+    The first request with a key runs; repeats of it (same user, same key)
+    get its response back instead of writing again, with an
+    Idempotent-Replayed header. Only successful responses are kept; a
+    failed attempt releases the key, unless one of its writes timed out
+    mid-commit (it may have landed), in which case retries get a 409
+    until the claim expires.
+    Usage: @idempotent("wall_post")
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            from idempotency import HEADER, IN_PROGRESS, get_idempotency_store, valid_key
+            key = request.headers.get(HEADER)
+            if key is None or g.user is None:
+                return f(*args, **kwargs)
+            if not valid_key(key):
+                return error_response(f"Invalid {HEADER}", 400)
+
+            store = get_idempotency_store()
+            owner = g.user['id']
+            replay = store.begin(scope, owner, key)
+            if replay is IN_PROGRESS:
+                return error_response("A request with this key is still in progress", 409)
+            if replay is not None:
+                return Response(replay.body, replay.status, mimetype="application/json",
+                                headers={"Idempotent-Replayed": "true"})
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                if not write_outcome_unknown():
+                    store.abort(scope, owner, key)
+                raise
+            if 200 <= response.status_code < 300 and response.is_json:
+                store.finish(scope, owner, key, response.status_code, response.get_data())
+            elif not write_outcome_unknown():
+                store.abort(scope, owner, key)
+            return response
+        return wrapper
+    return decorator
@@ -1,14 +1,35 @@
 """
 HTML Sanitization Utility.
 Server-side defense against XSS for user-generated content.
+
+clean_html used to build a CSSSanitizer and a bleach Cleaner (with its
+html5lib parser and serializer) on every call, and it runs on every chat
+message. Now:
+
+- each thread reuses its own prebuilt Cleaners (they keep parser state,
+  so they are not shared between threads)
+- text with nothing the parser would change (no <, >, &, \\r or C0
+  control characters) is returned as is, without parsing
+- results for recent inputs are memoized (LRU): repeated lines, pasted
+  spam and copy-paste bursts are cleaned once
+- clean_html_many() cleans a batch (imports), each distinct input once
+
+Usage:
+    from utils.sanitize import clean_html, clean_html_many
+    safe = clean_html(content)
+    safe_rows = clean_html_many(contents)
 """
 
+import re
+import threading
+from functools import lru_cache
+
 import bleach
 from bleach.css_sanitizer import CSSSanitizer
 
 # Allowed HTML tags for user content (e.g., bios, messages)
 ALLOWED_TAGS = [
-    'b', 'i', 'u', 's', 'strong', 'em', 
+    'b', 'i', 'u', 's', 'strong', 'em',
     'a', 'code', 'pre', 'br',
     'ul', 'ol', 'li',
     'blockquote', 'p',
@@ -25,60 +46,131 @@ ALLOWED_ATTRIBUTES = {
 # Allowed URL schemes for links
 ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
 
+# =============================================================================
+# Settings
+# =============================================================================
+MEMO_SIZE = 2048  # Recent inputs whose cleaned output is kept, per function
+MEMO_MAX_LENGTH = 1024  # Longer inputs are cleaned every time (bounds memo memory)
+
+# Characters bleach's parser rewrites: markup, entities, \r (-> \n) and
+# C0 controls (dropped or replaced by "?"). Text without them comes back
+# unchanged from both cleaners below.
+_NEEDS_PARSER = re.compile(r"[<>&\r\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_local = threading.local()
+_stats = {"fast_path": 0, "parsed": 0}  # Approximate under threads (no lock on the hot path)
+
+
+def _cleaners():
+    cleaners = getattr(_local, "cleaners", None)
+    if cleaners is None:
+        cleaners = _local.cleaners = (
+            bleach.Cleaner(
+                tags=ALLOWED_TAGS,
+                attributes=ALLOWED_ATTRIBUTES,
+                protocols=ALLOWED_PROTOCOLS,
+                css_sanitizer=CSSSanitizer(),
+                strip=True
+            ),
+            bleach.Cleaner(tags=[], strip=True),
+        )
+    return cleaners
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _clean_html_memo(content):
+    return _clean_html_parsed(content)
+
+
+def _clean_html_parsed(content):
+    _stats["parsed"] += 1
+    return _cleaners()[0].clean(content)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _escape_text_memo(content):
+    return _escape_text_parsed(content)
+
+
+def _escape_text_parsed(content):
+    _stats["parsed"] += 1
+    return _cleaners()[1].clean(content)
+
 
 def clean_html(content: str) -> str:
     """
     Sanitize HTML content, stripping dangerous tags and attributes.
-    
+
     Args:
         content: Raw HTML string from user input
-    
+
     Returns:
         Sanitized HTML string
     """
     if not content:
         return ""
-    
-    return bleach.clean(
-        content,
-        tags=ALLOWED_TAGS,
-        attributes=ALLOWED_ATTRIBUTES,
-        protocols=ALLOWED_PROTOCOLS,
-        css_sanitizer=CSSSanitizer(),
-        strip=True
-    )
+    if not _NEEDS_PARSER.search(content):
+        _stats["fast_path"] += 1
+        return content
+    if len(content) > MEMO_MAX_LENGTH:
+        return _clean_html_parsed(content)
+    return _clean_html_memo(content)
+
+
+def clean_html_many(contents):
+    """
+    Sanitize a batch of HTML strings (imports, backfills).
+
+    Args:
+        contents: Iterable of raw HTML strings
+
+    Returns:
+        List of sanitized strings, in order
+    """
+    cleaned = {}
+    results = []
+    for content in contents:
+        result = cleaned.get(content)
+        if result is None:
+            result = cleaned[content] = clean_html(content)
+        results.append(result)
+    return results
 
 
 def escape_text(content: str) -> str:
     """
     Escape all HTML in content (no tags allowed).
     Use for plain text fields like usernames, titles.
-    
+
     Args:
         content: Raw text string
-    
+
     Returns:
         HTML-escaped string
     """
     if not content:
         return ""
-    
-    return bleach.clean(content, tags=[], strip=True)
+    if not _NEEDS_PARSER.search(content):
+        _stats["fast_path"] += 1
+        return content
+    if len(content) > MEMO_MAX_LENGTH:
+        return _escape_text_parsed(content)
+    return _escape_text_memo(content)
 
 
 def linkify_text(content: str) -> str:
     """
     Auto-link URLs in plain text content.
-    
+
     Args:
         content: Text that may contain URLs
-    
+
     Returns:
         Text with URLs wrapped in anchor tags
     """
     if not content:
         return ""
-    
+
     return bleach.linkify(content, callbacks=[_add_noopener])
 
 
@@ -87,3 +179,15 @@ def _add_noopener(attrs, new=False):
     attrs[(None, 'rel')] = 'noopener noreferrer'
     attrs[(None, 'target')] = '_blank'
     return attrs
+
+
+def sanitize_stats():
+    """How clean_html / escape_text calls were served in this process."""
+    memo = _clean_html_memo.cache_info()
+    escape_memo = _escape_text_memo.cache_info()
+    return {
+        "fast_path": _stats["fast_path"],
+        "memo_hits": memo.hits + escape_memo.hits,
+        "parsed": _stats["parsed"],
+        "memoized": memo.currsize + escape_memo.currsize,
+    }